@@ -9,12 +9,14 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import Sum, Count, Max
+from django.db.models import Sum, Count
 from decimal import Decimal
 
+from apps.inventory.stock_locks import retry_on_stock_contention
 from apps.tenants.permissions import TenantFilterMixin, HasTenantModuleAccess
 from apps.customers.models import Customer
 from apps.sales.models import Sale, SaleItem
+from apps.sales.receipt_numbers import next_receipt_number
 from apps.products.models import Product, ProductUnit
 from apps.shifts.models import Shift
 
@@ -413,6 +415,7 @@ class TabViewSet(TenantFilterMixin, viewsets.ModelViewSet):
         })
     
     # ==================== CLOSE TAB ====================
+    @retry_on_stock_contention
     @action(detail=True, methods=['post'])
     def close(self, request, pk=None):
         """
@@ -441,162 +444,153 @@ class TabViewSet(TenantFilterMixin, viewsets.ModelViewSet):
         tenant = self.require_tenant(request)
         outlet = self.get_outlet_for_request(request)
         
-        with transaction.atomic():
-            # Apply any additional discount
-            additional_discount = data.get('discount', Decimal('0'))
-            if data.get('discount_type') == 'percentage':
-                additional_discount = (tab.subtotal * additional_discount) / 100
+        # Apply any additional discount
+        additional_discount = data.get('discount', Decimal('0'))
+        if data.get('discount_type') == 'percentage':
+            additional_discount = (tab.subtotal * additional_discount) / 100
             
-            tab.discount = additional_discount
-            tab.recalculate_totals()
+        tab.discount = additional_discount
+        tab.recalculate_totals()
             
-            # Get active shift
-            shift = Shift.objects.filter(
-                outlet=outlet,
-                status='open'
-            ).first()
+        # Get active shift
+        shift = Shift.objects.filter(
+            outlet=outlet,
+            status='open'
+        ).first()
             
-            # Generate receipt number
-            receipt_number = self._generate_receipt_number(tenant)
+        # Generate receipt number
+        receipt_number = self._generate_receipt_number(tenant, outlet)
             
-            # Calculate payment details
-            payment_method = data.get('payment_method') or 'cash'
-            payment_lines = data.get('payment_lines') or []
-            cash_received = data.get('cash_received')
-            change_given = Decimal('0')
+        # Calculate payment details
+        payment_method = data.get('payment_method') or 'cash'
+        payment_lines = data.get('payment_lines') or []
+        cash_received = data.get('cash_received')
+        change_given = Decimal('0')
 
-            if payment_lines:
-                payment_method = 'mixed' if len(payment_lines) > 1 else str(payment_lines[0].get('payment_method') or payment_method)
+        if payment_lines:
+            payment_method = 'mixed' if len(payment_lines) > 1 else str(payment_lines[0].get('payment_method') or payment_method)
 
-            if payment_method == 'cash' and cash_received:
-                change_given = cash_received - tab.total
+        if payment_method == 'cash' and cash_received:
+            change_given = cash_received - tab.total
 
-            # Payment status for credit
-            payment_status = 'paid'
-            amount_paid = tab.total
-            cash_amount = Decimal('0')
-            card_amount = Decimal('0')
-            mobile_amount = Decimal('0')
-            bank_transfer_amount = Decimal('0')
-            other_amount = Decimal('0')
-            tab_amount = Decimal('0')
-            credit_amount = Decimal('0')
-            if payment_method == 'credit':
-                payment_status = 'unpaid'
-                amount_paid = Decimal('0')
-            elif payment_method == 'cash':
-                cash_amount = tab.total
-            elif payment_method == 'card':
-                card_amount = tab.total
-            elif payment_method in ['mobile', 'airtel', 'tnm']:
-                mobile_amount = tab.total
-            elif payment_method in ['first_capital_bank', 'national_bank', 'standard_bank']:
-                bank_transfer_amount = tab.total
-            elif payment_method == 'tab':
-                tab_amount = tab.total
-            elif payment_method == 'credit':
-                credit_amount = tab.total
-            elif payment_method == 'other':
-                other_amount = tab.total
-            elif payment_method == 'mixed' and payment_lines:
-                for line in payment_lines:
-                    line_method = str(line.get('payment_method') or '').strip()
-                    line_amount = Decimal(str(line.get('amount') or '0')).quantize(Decimal('0.01'))
-                    if line_method == 'cash':
-                        cash_amount += line_amount
-                    elif line_method == 'card':
-                        card_amount += line_amount
-                    elif line_method in ['mobile', 'airtel', 'tnm']:
-                        mobile_amount += line_amount
-                    elif line_method in ['first_capital_bank', 'national_bank', 'standard_bank']:
-                        bank_transfer_amount += line_amount
-                    elif line_method == 'tab':
-                        tab_amount += line_amount
-                    elif line_method == 'credit':
-                        credit_amount += line_amount
-                    else:
-                        other_amount += line_amount
+        # Payment status for credit
+        payment_status = 'paid'
+        amount_paid = tab.total
+        cash_amount = Decimal('0')
+        card_amount = Decimal('0')
+        mobile_amount = Decimal('0')
+        bank_transfer_amount = Decimal('0')
+        other_amount = Decimal('0')
+        tab_amount = Decimal('0')
+        credit_amount = Decimal('0')
+        if payment_method == 'credit':
+            payment_status = 'unpaid'
+            amount_paid = Decimal('0')
+        elif payment_method == 'cash':
+            cash_amount = tab.total
+        elif payment_method == 'card':
+            card_amount = tab.total
+        elif payment_method in ['mobile', 'airtel', 'tnm']:
+            mobile_amount = tab.total
+        elif payment_method in ['first_capital_bank', 'national_bank', 'standard_bank']:
+            bank_transfer_amount = tab.total
+        elif payment_method == 'tab':
+            tab_amount = tab.total
+        elif payment_method == 'credit':
+            credit_amount = tab.total
+        elif payment_method == 'other':
+            other_amount = tab.total
+        elif payment_method == 'mixed' and payment_lines:
+            for line in payment_lines:
+                line_method = str(line.get('payment_method') or '').strip()
+                line_amount = Decimal(str(line.get('amount') or '0')).quantize(Decimal('0.01'))
+                if line_method == 'cash':
+                    cash_amount += line_amount
+                elif line_method == 'card':
+                    card_amount += line_amount
+                elif line_method in ['mobile', 'airtel', 'tnm']:
+                    mobile_amount += line_amount
+                elif line_method in ['first_capital_bank', 'national_bank', 'standard_bank']:
+                    bank_transfer_amount += line_amount
+                elif line_method == 'tab':
+                    tab_amount += line_amount
+                elif line_method == 'credit':
+                    credit_amount += line_amount
+                else:
+                    other_amount += line_amount
 
-            if payment_lines:
-                sale_payment_lines = [
-                    {
-                        'payment_method': str(line.get('payment_method') or '').strip(),
-                        'amount': str(Decimal(str(line.get('amount') or '0')).quantize(Decimal('0.01'))),
-                        'other_payment_method_name': line.get('other_payment_method_name') or None,
-                    }
-                    for line in payment_lines
-                ]
-            else:
-                sale_payment_lines = [{
-                    'payment_method': payment_method,
-                    'amount': str(tab.total.quantize(Decimal('0.01'))),
-                }]
+        if payment_lines:
+            sale_payment_lines = [
+                {
+                    'payment_method': str(line.get('payment_method') or '').strip(),
+                    'amount': str(Decimal(str(line.get('amount') or '0')).quantize(Decimal('0.01'))),
+                    'other_payment_method_name': line.get('other_payment_method_name') or None,
+                }
+                for line in payment_lines
+            ]
+        else:
+            sale_payment_lines = [{
+                'payment_method': payment_method,
+                'amount': str(tab.total.quantize(Decimal('0.01'))),
+            }]
 
-            # Create sale record
-            sale = Sale.objects.create(
-                tenant=tenant,
-                outlet=outlet,
-                user=request.user,
-                shift=shift,
-                customer=tab.customer,
-                receipt_number=receipt_number,
-                subtotal=tab.subtotal,
-                discount=tab.discount,
-                tax=tab.tax,
-                total=tab.total,
-                payment_method=payment_method,
-                payment_lines=sale_payment_lines,
-                status='completed',
-                cash_received=cash_received,
-                change_given=change_given,
-                due_date=data.get('due_date'),
-                amount_paid=amount_paid,
-                payment_status=payment_status,
-                cash_amount=cash_amount,
-                card_amount=card_amount,
-                mobile_amount=mobile_amount,
-                bank_transfer_amount=bank_transfer_amount,
-                other_amount=other_amount,
-                tab_amount=tab_amount,
-                credit_amount=credit_amount,
-                notes=f"From Tab #{tab.tab_number}. {data.get('notes', '')}",
-            )
+        # Create sale record
+        sale = Sale.objects.create(
+            tenant=tenant,
+            outlet=outlet,
+            user=request.user,
+            shift=shift,
+            customer=tab.customer,
+            receipt_number=receipt_number,
+            subtotal=tab.subtotal,
+            discount=tab.discount,
+            tax=tab.tax,
+            total=tab.total,
+            payment_method=payment_method,
+            payment_lines=sale_payment_lines,
+            status='completed',
+            cash_received=cash_received,
+            change_given=change_given,
+            due_date=data.get('due_date'),
+            amount_paid=amount_paid,
+            payment_status=payment_status,
+            cash_amount=cash_amount,
+            card_amount=card_amount,
+            mobile_amount=mobile_amount,
+            bank_transfer_amount=bank_transfer_amount,
+            other_amount=other_amount,
+            tab_amount=tab_amount,
+            credit_amount=credit_amount,
+            notes=f"From Tab #{tab.tab_number}. {data.get('notes', '')}",
+        )
             
-            # Create sale items from tab items
-            for tab_item in tab.items.filter(is_voided=False):
-                SaleItem.objects.create(
-                    sale=sale,
-                    product=tab_item.product,
-                    unit=tab_item.unit,
-                    quantity=tab_item.quantity,
-                    price=tab_item.price,
-                    discount=tab_item.discount,
-                    total=tab_item.total,
-                    notes=tab_item.notes,
-                )
-
-            sale_id = sale.id
-
-            def _generate_receipt_after_commit():
-                try:
-                    from apps.sales.services import ReceiptService
-                    committed_sale = Sale.objects.get(id=sale_id)
-                    ReceiptService.generate_receipt(committed_sale, format='pdf', user=request.user)
-                except Exception as e:
-                    logger.error(f"Failed to auto-generate receipt for tab sale {sale_id}: {str(e)}")
+        # Create sale items from tab items
+        for tab_item in tab.items.filter(is_voided=False):
+            SaleItem.objects.create(
+                sale=sale,
+                product=tab_item.product,
+                unit=tab_item.unit,
+                quantity=tab_item.quantity,
+                price=tab_item.price,
+                discount=tab_item.discount,
+                total=tab_item.total,
+                notes=tab_item.notes,
+            )
 
-            transaction.on_commit(_generate_receipt_after_commit)
+        # Rendered by the job worker once the sale commits
+        from apps.sales.jobs import enqueue_receipt
+        enqueue_receipt(sale, format='pdf', user=request.user)
             
-            # Close the tab
-            tab.status = 'closed'
-            tab.closed_by = request.user
-            tab.closed_at = timezone.now()
-            tab.sale = sale
-            tab.save()
+        # Close the tab
+        tab.status = 'closed'
+        tab.closed_by = request.user
+        tab.closed_at = timezone.now()
+        tab.sale = sale
+        tab.save()
             
-            # Release the table
-            if tab.table:
-                tab.table.close_tab()
+        # Release the table
+        if tab.table:
+            tab.table.close_tab()
         
         return Response({
             'tab': TabSerializer(tab).data,
@@ -609,24 +603,9 @@ class TabViewSet(TenantFilterMixin, viewsets.ModelViewSet):
             }
         })
     
-    def _generate_receipt_number(self, tenant):
-        """Generate unique receipt number"""
-        # Numeric-only receipt numbers (no date/prefix). Use global max to keep uniqueness.
-        recent_numbers = Sale.objects.order_by('-created_at').values_list('receipt_number', flat=True)[:1000]
-        max_numeric = 0
-        for number in recent_numbers:
-            if number and str(number).isdigit():
-                max_numeric = max(max_numeric, int(number))
-
-        if max_numeric == 0:
-            max_id = Sale.objects.aggregate(max_id=Max('id')).get('max_id') or 0
-            max_numeric = max_id
-
-        next_number = max_numeric + 1
-        while Sale.objects.filter(receipt_number=str(next_number)).exists():
-            next_number += 1
-
-        return str(next_number)
+    def _generate_receipt_number(self, tenant, outlet):
+        """Take the next receipt number from the outlet's receipt sequence"""
+        return next_receipt_number(tenant, outlet)
     
     # ==================== TRANSFER TAB ====================
     @action(detail=True, methods=['post'])
@@ -6,6 +6,8 @@ from django.utils import timezone
 from rest_framework import serializers
 
 from apps.inventory.stock_helpers import deduct_stock, get_sellable_stock
+from apps.inventory.stock_locks import retry_on_stock_contention
+from apps.sales.models import SaleItem
 
 from .models import DeliveryOrder, DeliveryOrderItem, Driver, Trip, Vehicle
 
@@ -156,7 +158,7 @@ class DistributionService:
         if delivery_order.reserved_deducted_at:
             return
 
-        items = DeliveryOrderItem.objects.select_for_update().select_related('product').filter(
+        items = DeliveryOrderItem.objects.select_for_update().select_related('product', 'sale_item').filter(
             delivery_order=delivery_order,
             is_released=False,
             is_deducted=False,
@@ -165,6 +167,7 @@ class DistributionService:
         if not items.exists():
             raise serializers.ValidationError({'stock': 'No reserved stock to deduct for this delivery order.'})
 
+        realized = []
         for item in items:
             product = item.product
             if int(get_sellable_stock(product, delivery_order.warehouse)) < int(item.quantity):
@@ -177,24 +180,32 @@ class DistributionService:
                     }
                 )
 
-            deduct_stock(
+            _, consumed_cost = deduct_stock(
                 product=product,
                 outlet=delivery_order.warehouse,
                 user=user,
                 quantity=item.quantity,
                 reference_id=f'delivery-order:{delivery_order.id}',
                 reason=f'Delivery confirmation for sale {delivery_order.sales_order.receipt_number}',
+                with_cost=True,
             )
+            if item.sale_item is not None:
+                realized.append((item.sale_item, consumed_cost))
 
             item.is_deducted = True
             item.save(update_fields=['is_deducted', 'updated_at'])
 
+        SaleItem.objects.record_realized_costs(realized)
+
         delivery_order.reserved_deducted_at = timezone.now()
         delivery_order.save(update_fields=['reserved_deducted_at', 'updated_at'])
 
     @staticmethod
-    @transaction.atomic
+    @retry_on_stock_contention
     def confirm_delivery(delivery_order: DeliveryOrder, user, fuel_cost=None, distance_km=None):
+        # A retried attempt must start from the stored order, not the rolled-back one in memory
+        delivery_order.refresh_from_db()
+
         if delivery_order.delivery_status == DeliveryOrder.STATUS_CANCELLED:
             raise serializers.ValidationError({'delivery_status': 'Cannot confirm a cancelled delivery order.'})
 
@@ -0,0 +1,227 @@
+"""
+Goods receipt pipeline shared by inventory receive and purchase order receive
+Parses JSON or CSV delivery notes and books every line in one bulk pass
+"""
+import csv
+import io
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from apps.inventory.stock_helpers import add_stock_for_lines
+from apps.inventory.stock_locks import lock_products
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on lines booked by one receipt
+MAX_RECEIPT_LINES = 2000
+
+DELIVERY_NOTE_COLUMNS = ('product_id', 'sku', 'barcode', 'quantity', 'cost', 'batch_number', 'expiry_date')
+
+
+def parse_delivery_note(data, files=None):
+    """Return the list of receipt lines carried by a request.
+
+    Lines come from the 'items' list, or from a 'delivery_note' given as an
+    uploaded CSV file, CSV text or a JSON list. CSV headers are matched
+    case-insensitively against DELIVERY_NOTE_COLUMNS.
+
+    Raises:
+        ValueError: If the delivery note cannot be read
+    """
+    note = (files or {}).get('delivery_note') or data.get('delivery_note')
+    if note is None:
+        items = data.get('items', [])
+        return items if isinstance(items, list) else []
+    if isinstance(note, list):
+        return note
+
+    if hasattr(note, 'read'):
+        note = note.read()
+    if isinstance(note, bytes):
+        try:
+            note = note.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ValueError("delivery_note must be UTF-8 encoded CSV")
+
+    reader = csv.DictReader(io.StringIO(str(note)))
+    if not reader.fieldnames:
+        raise ValueError("delivery_note has no header row")
+    headers = {name: (name or '').strip().lower() for name in reader.fieldnames}
+    if 'quantity' not in headers.values():
+        raise ValueError("delivery_note needs a quantity column")
+
+    lines = []
+    for row in reader:
+        line = {
+            headers[name]: value.strip()
+            for name, value in row.items()
+            if name in headers and headers[name] in DELIVERY_NOTE_COLUMNS and isinstance(value, str) and value.strip()
+        }
+        if line:
+            lines.append(line)
+    return lines
+
+
+def _parse_expiry(value):
+    if not value:
+        return timezone.now().date() + timedelta(days=365)
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    return value
+
+
+def receive_goods(tenant, outlet, items, user=None, reference_id='', reason='', batch_prefix='PUR'):
+    """
+    Book a supplier delivery into stock in one pass
+    Products are resolved without locks by one query per identifier kind
+    (product_id, sku, barcode), then locked together in ascending id order
+    and every valid line goes through add_stock_for_lines: one batch upsert,
+    one movement insert and one snapshot refresh per product.
+
+    Args:
+        tenant: Tenant instance
+        outlet: Outlet instance receiving the goods
+        items: list of dicts with quantity, one of product_id/sku/barcode and
+            optional cost, batch_number and expiry_date (YYYY-MM-DD)
+        user: User instance
+        reference_id: str - reference recorded on every purchase movement
+        reason: str - reason recorded on every purchase movement
+        batch_prefix: str - prefix of generated batch numbers
+
+    Returns:
+        (movements, errors): created purchase StockMovements and
+        [{'line', 'product_id', 'error'}] for lines that were skipped
+    """
+    from apps.products.models import Product
+
+    errors = []
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"line": index, "product_id": None, "error": "Each line must be an object"})
+            continue
+        product_id = item.get('product_id')
+        sku = str(item.get('sku') or '').strip()
+        barcode = str(item.get('barcode') or '').strip()
+        quantity = item.get('quantity')
+
+        if not (product_id or sku or barcode) or not quantity:
+            errors.append({"line": index, "product_id": product_id, "error": "product_id and quantity are required"})
+            continue
+        try:
+            quantity = int(quantity)
+        except (ValueError, TypeError):
+            errors.append({"line": index, "product_id": product_id, "error": "quantity must be a valid integer"})
+            continue
+        if quantity <= 0:
+            errors.append({"line": index, "product_id": product_id, "error": "quantity must be positive"})
+            continue
+
+        cost = item.get('cost')
+        cost_decimal = None
+        if cost not in (None, ''):
+            try:
+                cost_decimal = Decimal(str(cost))
+                if cost_decimal < 0:
+                    raise ValueError("cost must not be negative")
+            except (InvalidOperation, ValueError, TypeError):
+                errors.append({"line": index, "product_id": product_id, "error": "cost must be a valid non-negative decimal"})
+                continue
+
+        try:
+            expiry_date = _parse_expiry(item.get('expiry_date'))
+        except (ValueError, TypeError):
+            errors.append({"line": index, "product_id": product_id, "error": "expiry_date must be YYYY-MM-DD"})
+            continue
+
+        try:
+            product_id = int(product_id) if product_id not in (None, '') else None
+        except (ValueError, TypeError):
+            errors.append({"line": index, "product_id": product_id, "error": "Product not found"})
+            continue
+
+        parsed.append({
+            'line': index,
+            'product_id': product_id,
+            'sku': sku,
+            'barcode_key': barcode.upper(),
+            'quantity': quantity,
+            'cost_price': cost_decimal,
+            'batch_number': item.get('batch_number') or None,
+            'expiry_date': expiry_date,
+        })
+
+    movements = []
+    with transaction.atomic():
+        # Products are looked up tenant-wide by id (as before) and per outlet by sku/barcode
+        by_id = Product.objects.filter(tenant=tenant).in_bulk(
+            {line['product_id'] for line in parsed if line['product_id']}
+        )
+        outlet_products = Product.objects.filter(tenant=tenant, outlet=outlet)
+        by_sku = {}
+        skus = {line['sku'] for line in parsed if not line['product_id'] and line['sku']}
+        if skus:
+            for product in outlet_products.filter(sku__in=skus).order_by('id'):
+                by_sku.setdefault(product.sku, []).append(product)
+        by_barcode = {}
+        barcode_keys = {
+            line['barcode_key'] for line in parsed
+            if not line['product_id'] and not line['sku'] and line['barcode_key']
+        }
+        if barcode_keys:
+            for product in outlet_products.annotate(barcode_key=Upper('barcode')).filter(
+                barcode_key__in=barcode_keys
+            ).order_by('id'):
+                by_barcode.setdefault(product.barcode_key, []).append(product)
+
+        stamp = timezone.now().strftime('%Y%m%d%H%M%S')
+        receipt_lines = []
+        for line in parsed:
+            if line['product_id']:
+                matches = [by_id[line['product_id']]] if line['product_id'] in by_id else []
+            elif line['sku']:
+                matches = by_sku.get(line['sku'], [])
+            else:
+                matches = by_barcode.get(line['barcode_key'], [])
+            if len(matches) != 1:
+                errors.append({
+                    "line": line['line'],
+                    "product_id": line['product_id'],
+                    "error": "Product not found" if not matches else "Product reference matches more than one product",
+                })
+                continue
+
+            product = matches[0]
+            receipt_lines.append({
+                'product': product,
+                'quantity': line['quantity'],
+                'batch_number': line['batch_number'] or f"{batch_prefix}-{stamp}-{product.id}",
+                'expiry_date': line['expiry_date'],
+                'cost_price': line['cost_price'],
+            })
+
+        # One lock pass over the union of ids, skus and barcodes keeps the id order
+        locked = lock_products([line['product'] for line in receipt_lines])
+        for line in receipt_lines:
+            line['product'] = locked[line['product'].id]
+
+        if receipt_lines:
+            movements = add_stock_for_lines(
+                receipt_lines,
+                outlet,
+                user=user,
+                reference_id=reference_id,
+                reason=reason or "Purchase",
+                movement_type='purchase',
+            )
+
+    errors.sort(key=lambda error: error['line'])
+    logger.info(
+        f"Goods receipt at {outlet.name}: {len(movements)} lines booked, {len(errors)} skipped"
+    )
+    return movements, errors
@@ -0,0 +1,32 @@
+"""
+Background jobs for inventory
+"""
+import logging
+
+from apps.jobs.queue import enqueue
+from apps.jobs.registry import register
+
+logger = logging.getLogger(__name__)
+
+
+@register('inventory.complete_stock_take')
+def complete_stock_take(stock_take_id, user_id=None):
+    """Apply a stock take in chunks; each chunk commits, so a rerun resumes where the last stopped."""
+    from django.contrib.auth import get_user_model
+    from .models import StockTake
+    from .stock_helpers import complete_stock_take as apply_stock_take
+
+    stock_take = StockTake.objects.select_related('outlet', 'user').filter(pk=stock_take_id).first()
+    if stock_take is None or stock_take.status not in ('running', 'completing'):
+        logger.info(f"Stock take completion job skipped: stock take {stock_take_id} is not pending")
+        return
+    user = get_user_model().objects.filter(pk=user_id).first() if user_id else None
+    apply_stock_take(stock_take, user=user)
+
+
+def enqueue_stock_take_completion(stock_take, user=None):
+    return enqueue(
+        'inventory.complete_stock_take',
+        {'stock_take_id': stock_take.id, 'user_id': getattr(user, 'id', None)},
+        idempotency_key=f'inventory.stock_take_complete:{stock_take.id}',
+    )
@@ -0,0 +1,300 @@
+"""
+Stock ledger integrity checks
+Compares the four stock representations for every product at an outlet:
+the StockMovement ledger (with compacted opening balances), Batch quantities,
+LocationStock.quantity and Product.stock, plus the StockLedgerSnapshot
+running totals. Each outlet is aggregated by one SQL statement whose rows are
+streamed through a server-side cursor, so memory stays flat on large ledgers.
+"""
+import logging
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.inventory.models import NEGATIVE_MOVEMENT_TYPES, StockLedgerSnapshot, StockMovement
+from apps.inventory.stock_helpers import rebuild_stock_state_many
+from apps.inventory.stock_locks import lock_products
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip from the server-side cursor
+FETCH_SIZE = 2000
+
+OUTLET_INTEGRITY_SQL = """
+    WITH opening AS (
+        SELECT DISTINCT ON (product_id) product_id, period_start, quantity, acquired_quantity, movement_count
+        FROM inventory_stockopeningbalance
+        WHERE outlet_id = %(outlet_id)s
+          AND (%(product_ids)s::bigint[] IS NULL OR product_id = ANY(%(product_ids)s::bigint[]))
+        ORDER BY product_id, period_start DESC
+    ),
+    movements AS (
+        SELECT m.product_id,
+               SUM(d.delta) AS quantity,
+               SUM(GREATEST(d.delta, 0)) AS acquired_quantity,
+               COUNT(*) AS movement_count
+        FROM inventory_stockmovement m
+        LEFT JOIN opening o ON o.product_id = m.product_id
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(
+                m.quantity_delta,
+                CASE WHEN m.movement_type = ANY(%(negative_types)s) THEN -m.quantity ELSE m.quantity END
+            ) AS delta
+        ) d
+        WHERE m.outlet_id = %(outlet_id)s
+          AND m.product_id IS NOT NULL
+          AND (%(product_ids)s::bigint[] IS NULL OR m.product_id = ANY(%(product_ids)s::bigint[]))
+          AND (o.period_start IS NULL OR m.created_at >= (o.period_start::timestamp AT TIME ZONE %(tz)s))
+        GROUP BY m.product_id
+    ),
+    batches AS (
+        SELECT product_id,
+               SUM(quantity) AS total,
+               COALESCE(SUM(quantity) FILTER (WHERE expiry_date > %(today)s AND quantity > 0), 0) AS sellable,
+               COUNT(*) AS batch_count
+        FROM inventory_batch
+        WHERE outlet_id = %(outlet_id)s AND product_id IS NOT NULL
+          AND (%(product_ids)s::bigint[] IS NULL OR product_id = ANY(%(product_ids)s::bigint[]))
+        GROUP BY product_id
+    ),
+    product_keys AS (
+        SELECT product_id FROM movements
+        UNION SELECT product_id FROM opening
+        UNION SELECT product_id FROM batches
+        UNION SELECT product_id FROM inventory_locationstock
+              WHERE outlet_id = %(outlet_id)s AND product_id IS NOT NULL
+                AND (%(product_ids)s::bigint[] IS NULL OR product_id = ANY(%(product_ids)s::bigint[]))
+        UNION SELECT product_id FROM inventory_stockledgersnapshot
+              WHERE outlet_id = %(outlet_id)s
+                AND (%(product_ids)s::bigint[] IS NULL OR product_id = ANY(%(product_ids)s::bigint[]))
+    )
+    SELECT k.product_id,
+           p.tenant_id,
+           p.outlet_id = %(outlet_id)s AS home_outlet,
+           p.stock,
+           COALESCE(o.quantity, 0) + COALESCE(mv.quantity, 0) AS ledger_quantity,
+           COALESCE(o.acquired_quantity, 0) + COALESCE(mv.acquired_quantity, 0) AS ledger_acquired_quantity,
+           COALESCE(o.movement_count, 0) + COALESCE(mv.movement_count, 0) AS ledger_movements,
+           s.quantity AS snapshot_quantity,
+           s.acquired_quantity AS snapshot_acquired_quantity,
+           s.movement_count AS snapshot_movements,
+           COALESCE(b.total, 0) AS batch_total,
+           COALESCE(b.sellable, 0) AS batch_sellable,
+           COALESCE(b.batch_count, 0) AS batch_count,
+           ls.quantity AS location_quantity
+    FROM product_keys k
+    JOIN products_product p ON p.id = k.product_id
+    LEFT JOIN opening o ON o.product_id = k.product_id
+    LEFT JOIN movements mv ON mv.product_id = k.product_id
+    LEFT JOIN batches b ON b.product_id = k.product_id
+    LEFT JOIN inventory_stockledgersnapshot s ON s.product_id = k.product_id AND s.outlet_id = %(outlet_id)s
+    LEFT JOIN inventory_locationstock ls ON ls.product_id = k.product_id AND ls.outlet_id = %(outlet_id)s
+    ORDER BY k.product_id
+"""
+
+OUTLET_INTEGRITY_COLUMNS = (
+    'product_id', 'tenant_id', 'home_outlet', 'product_stock', 'ledger_quantity', 'ledger_acquired_quantity',
+    'ledger_movements', 'snapshot_quantity', 'snapshot_acquired_quantity', 'snapshot_movements',
+    'batch_total', 'batch_sellable', 'batch_count', 'location_quantity',
+)
+
+
+def expected_quantity(row):
+    """Outlet quantity the projections should hold, mirroring rebuild_stock_state_many."""
+    if row['ledger_acquired_quantity'] > 0:
+        return max(0, row['ledger_quantity'])
+    return row['batch_sellable']
+
+
+def drift_kinds(row):
+    """Which outlet-level representations disagree with the ledger for one product/outlet row."""
+    kinds = []
+    if row['snapshot_quantity'] is not None and (
+        row['snapshot_quantity'], row['snapshot_acquired_quantity'], row['snapshot_movements']
+    ) != (row['ledger_quantity'], row['ledger_acquired_quantity'], row['ledger_movements']):
+        kinds.append('snapshot')
+    # Every batch quantity change is booked as a movement, so batch totals
+    # (expired-but-unzeroed batches included) equal the signed ledger.
+    if row['batch_count'] and row['batch_total'] != row['ledger_quantity']:
+        kinds.append('batches')
+    if (row['location_quantity'] or 0) != expected_quantity(row):
+        kinds.append('location_stock')
+    return kinds
+
+
+def iter_outlet_rows(outlet_id, product_ids=None, today=None, fetch_size=FETCH_SIZE):
+    """Yield one dict per product stocked at an outlet (or just product_ids), aggregated in SQL and streamed."""
+    params = {
+        'outlet_id': outlet_id,
+        'product_ids': sorted(product_ids) if product_ids is not None else None,
+        'today': today or timezone.now().date(),
+        'tz': timezone.get_current_timezone_name(),
+        'negative_types': sorted(NEGATIVE_MOVEMENT_TYPES),
+    }
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(OUTLET_INTEGRITY_SQL, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for values in rows:
+                yield dict(zip(OUTLET_INTEGRITY_COLUMNS, values))
+
+
+def check_outlet(outlet_id, product_ids=None, today=None):
+    """
+    Check every product at one outlet
+
+    Product.stock is a legacy mirror of whichever outlet was rebuilt last, so
+    it cannot be judged from one outlet; the result carries what is needed to
+    judge it across outlets with product_stock_drift.
+
+    Args:
+        outlet_id: int
+        product_ids: optional set of product ids to restrict the check to
+        today: date used for batch sellability (default: today)
+
+    Returns:
+        dict with products_checked, drift (JSON-ready dicts), stock_matched
+        (product ids whose Product.stock equals this outlet's quantity) and
+        stock_mismatched ({product_id: [tenant_id, home_outlet, expected_quantity, product_stock]})
+    """
+    result = {
+        'outlet_id': outlet_id,
+        'products_checked': 0,
+        'drift': [],
+        'stock_matched': [],
+        'stock_mismatched': {},
+    }
+    for row in iter_outlet_rows(outlet_id, product_ids=product_ids, today=today):
+        result['products_checked'] += 1
+        expected = expected_quantity(row)
+        if row['product_stock'] == expected:
+            result['stock_matched'].append(row['product_id'])
+        else:
+            result['stock_mismatched'][row['product_id']] = [
+                row['tenant_id'], row['home_outlet'], expected, row['product_stock']
+            ]
+        kinds = drift_kinds(row)
+        if not kinds:
+            continue
+        result['drift'].append({
+            'tenant_id': row['tenant_id'],
+            'outlet_id': outlet_id,
+            'product_id': row['product_id'],
+            'drift': kinds,
+            'ledger_quantity': row['ledger_quantity'],
+            'snapshot_quantity': row['snapshot_quantity'],
+            'batch_total': row['batch_total'] if row['batch_count'] else None,
+            'batch_sellable': row['batch_sellable'],
+            'location_quantity': row['location_quantity'],
+            'product_stock': row['product_stock'],
+            'expected_quantity': expected,
+        })
+    return result
+
+
+def product_stock_drift(results):
+    """
+    Products whose Product.stock matches no outlet's quantity
+
+    Args:
+        results: check_outlet results covering every outlet of the products' tenants
+
+    Returns:
+        list of JSON-ready dicts; expected_quantity is the home outlet's
+        quantity when the product is stocked there, else the first outlet's
+    """
+    matched = {product_id for result in results for product_id in result['stock_matched']}
+    drifted = {}
+    for result in results:
+        for product_id, (tenant_id, home, expected, stock) in result['stock_mismatched'].items():
+            product_id = int(product_id)
+            if product_id in matched:
+                continue
+            entry = drifted.setdefault(product_id, {
+                'tenant_id': tenant_id,
+                'outlet_id': None,
+                'product_id': product_id,
+                'drift': ['product_stock'],
+                'product_stock': stock,
+                'expected_quantity': expected,
+                'outlet_quantities': {},
+            })
+            entry['outlet_quantities'][str(result['outlet_id'])] = expected
+            if home:
+                entry['outlet_id'] = result['outlet_id']
+                entry['expected_quantity'] = expected
+    return [drifted[product_id] for product_id in sorted(drifted)]
+
+
+def repair_outlet(outlet_id, drift, user=None, reference_id=''):
+    """
+    Repair drifted products at one outlet
+    Under product locks the outlet is re-checked for just those products, then:
+    drifted snapshots are rebuilt from the ledger; where batches disagree with
+    the ledger a compensating 'adjustment' movement books the difference so
+    the ledger matches the batches; finally LocationStock is rebuilt from the
+    corrected ledger.
+
+    Returns:
+        list of created compensating StockMovements
+    """
+    from apps.outlets.models import Outlet
+
+    product_ids = {entry['product_id'] for entry in drift if entry['outlet_id'] == outlet_id}
+    if not product_ids:
+        return []
+
+    outlet = Outlet.objects.get(pk=outlet_id)
+    with transaction.atomic():
+        products = lock_products(product_ids)
+        current = check_outlet(outlet_id, product_ids=product_ids)['drift']
+
+        for entry in current:
+            if 'snapshot' in entry['drift']:
+                StockLedgerSnapshot.objects.rebuild(products[entry['product_id']], outlet)
+
+        compensating = []
+        for entry in current:
+            if 'batches' not in entry['drift']:
+                continue
+            product = products[entry['product_id']]
+            difference = entry['batch_total'] - entry['ledger_quantity']
+            compensating.append(StockMovement(
+                tenant_id=product.tenant_id,
+                product=product,
+                outlet=outlet,
+                user=user,
+                movement_type='adjustment',
+                quantity=abs(difference),
+                quantity_delta=difference,
+                unit_cost=product.cost,
+                reference_id=reference_id,
+                reason=f"Ledger integrity repair: batches {entry['batch_total']}, ledger {entry['ledger_quantity']}",
+            ))
+        StockMovement.objects.bulk_create(compensating, batch_size=500)
+
+        # Also mirrors this outlet into Product.stock, which is a valid state
+        rebuild_stock_state_many([products[entry['product_id']] for entry in current], outlet)
+
+    logger.info(
+        f"Repaired {len(current)} drifted products at outlet {outlet_id} "
+        f"with {len(compensating)} compensating movements"
+    )
+    return compensating
+
+
+def repair_product_stock(drift):
+    """Point Product.stock back at the home (or first) outlet's quantity for product_stock drift."""
+    from apps.products.models import Product
+
+    targets = {entry['product_id']: entry['expected_quantity'] for entry in drift if 'product_stock' in entry['drift']}
+    if not targets:
+        return 0
+    with transaction.atomic():
+        products = list(lock_products(targets).values())
+        for product in products:
+            product.stock = targets[product.id]
+        Product.objects.bulk_update(products, ['stock'], batch_size=500)
+    return len(products)
@@ -0,0 +1,161 @@
+"""
+Monthly partition maintenance for the StockMovement ledger
+inventory_stockmovement is range-partitioned on created_at (PostgreSQL only).
+Rows outside every monthly partition land in the default partition.
+"""
+import logging
+from datetime import date, datetime, time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LEDGER_TABLE = 'inventory_stockmovement'
+DEFAULT_PARTITION = f'{LEDGER_TABLE}_default'
+
+
+def month_start(value):
+    """First day of the month containing value (date or datetime)."""
+    if isinstance(value, datetime):
+        value = timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value.replace(day=1)
+
+
+def add_months(value, months):
+    """Shift a month-start date by a number of months."""
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def boundary(value):
+    """Aware datetime at local midnight starting the given date; partition and compaction bounds use it."""
+    return timezone.make_aware(datetime.combine(value, time.min))
+
+
+def partition_name(month):
+    return f'{LEDGER_TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned(using=None):
+    """True when the ledger table is a partitioned table on this connection."""
+    conn = connection if using is None else using
+    if conn.vendor != 'postgresql':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [LEDGER_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Return [(month_start, table_name)] for attached monthly partitions, oldest first."""
+    if not is_partitioned():
+        return []
+    prefix = f'{LEDGER_TABLE}_p'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+            """,
+            [LEDGER_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            partitions.append((date(int(suffix[:4]), int(suffix[4:]), 1), name))
+    return sorted(partitions)
+
+
+@transaction.atomic
+def create_month_partition(month):
+    """Create and attach the partition for one month; rows already in the default partition move into it.
+
+    Returns True if a partition was created.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if any(existing == month for existing, _ in list_partitions()):
+        return False
+
+    lower, upper = boundary(month), boundary(add_months(month, 1))
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {LEDGER_TABLE} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS ('
+            f'  DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s RETURNING *'
+            f') INSERT INTO {name} SELECT * FROM moved',
+            [lower, upper],
+        )
+        cursor.execute(
+            f'ALTER TABLE {LEDGER_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+            [lower, upper],
+        )
+    logger.info(f"Created stock ledger partition {name}")
+    return True
+
+
+def ensure_month_partitions(months_ahead=3, today=None):
+    """Make sure partitions exist from the current month through months_ahead months from now.
+
+    Returns the list of partition names created.
+    """
+    if not is_partitioned():
+        return []
+    current = month_start(today or timezone.now())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_month_partition(month):
+            created.append(partition_name(month))
+    return created
+
+
+def detach_month_partition(month):
+    """Detach one monthly partition so it can be archived (e.g. pg_dump -t) and dropped.
+
+    Refuses unless every product/outlet with movements in the partition has an
+    opening balance at or after the partition's end, so ledger totals and
+    report openings never need the detached rows.
+    """
+    from apps.inventory.models import StockOpeningBalance
+
+    month = month_start(month)
+    name = partition_name(month)
+    if not any(existing == month for existing, _ in list_partitions()):
+        raise ValueError(f"Partition {name} is not attached")
+
+    period_end = add_months(month, 1)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT movement.product_id, movement.outlet_id
+            FROM {name} AS movement
+            WHERE movement.product_id IS NOT NULL
+              AND NOT EXISTS (
+                SELECT 1 FROM {StockOpeningBalance._meta.db_table} AS balance
+                WHERE balance.product_id = movement.product_id
+                  AND balance.outlet_id = movement.outlet_id
+                  AND balance.period_start >= %s
+              )
+            LIMIT 1
+            """,
+            [period_end],
+        )
+        uncovered = cursor.fetchone()
+        if uncovered:
+            raise ValueError(
+                f"Partition {name} has movements for product {uncovered[0]} at outlet {uncovered[1]} "
+                f"with no opening balance on or after {period_end}; run compact_stock_ledger first"
+            )
+        cursor.execute(f'ALTER TABLE {LEDGER_TABLE} DETACH PARTITION {name}')
+    logger.warning(f"Detached stock ledger partition {name}")
+    return name
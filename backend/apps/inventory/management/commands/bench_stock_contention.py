@@ -0,0 +1,188 @@
+"""
+Management command to benchmark checkout contention on stock locks
+Runs several worker processes selling overlapping baskets from a small set of
+hot products against the configured PostgreSQL database, and reports
+checkout latency percentiles plus deadlock / lock-timeout counts.
+
+    python manage.py bench_stock_contention --workers 8 --checkouts 200
+    python manage.py bench_stock_contention --lock-order basket   # pre-lock-layer behaviour
+
+Benchmark rows live under a throwaway tenant that is deleted afterwards.
+"""
+import json
+import multiprocessing
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _checkout(outlet_id, basket, lock_order, lock_timeout_ms):
+    """One checkout: lock the basket, then deduct it in one pass."""
+    from django.db import transaction
+    from apps.inventory.stock_helpers import deduct_stock_for_lines
+    from apps.inventory.stock_locks import lock_products, set_lock_timeout
+    from apps.outlets.models import Outlet
+    from apps.products.models import Product
+
+    with transaction.atomic():
+        if lock_order == 'basket':
+            # What SaleViewSet.create used to do: lock rows one by one in basket order
+            set_lock_timeout(lock_timeout_ms)
+            products = {pid: Product.objects.select_for_update().get(pk=pid) for pid in basket}
+        else:
+            products = lock_products(basket, timeout_ms=lock_timeout_ms)
+        outlet = Outlet.objects.get(pk=outlet_id)
+        deduct_stock_for_lines(
+            [(products[pid], 1) for pid in basket],
+            outlet,
+            reference_id='bench',
+            reason='Contention benchmark',
+        )
+
+
+def _worker(worker_index, options, product_ids, outlet_id, results):
+    import django
+    django.setup()
+    from django.db import connections
+    from apps.inventory.stock_locks import StockLockContention, contention_reason, retry_on_stock_contention
+    from django.db import OperationalError
+
+    connections.close_all()
+    rng = random.Random(options['seed'] + worker_index)
+    run_once = retry_on_stock_contention(attempts=1)(_checkout)
+    stats = {'latencies': [], 'deadlock': 0, 'lock_timeout': 0, 'retries': 0, 'failed': 0}
+
+    for _ in range(options['checkouts']):
+        basket = rng.sample(product_ids, options['basket_size'])
+        started = time.perf_counter()
+        for attempt in range(1, options['retries'] + 2):
+            try:
+                run_once(outlet_id, basket, options['lock_order'], options['lock_timeout'])
+                stats['latencies'].append((time.perf_counter() - started) * 1000.0)
+                break
+            except (StockLockContention, OperationalError) as exc:
+                reason = contention_reason(exc)
+                if reason is None:
+                    raise
+                stats[reason] += 1
+                if attempt > options['retries']:
+                    stats['failed'] += 1
+                    break
+                stats['retries'] += 1
+                time.sleep(0.005 * attempt * (1 + rng.random()))
+
+    connections.close_all()
+    results.put(stats)
+
+
+class Command(BaseCommand):
+    help = "Benchmark checkout latency and deadlocks under concurrent overlapping baskets (PostgreSQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent worker processes (default: 8)')
+        parser.add_argument('--checkouts', type=int, default=100, help='Checkouts per worker (default: 100)')
+        parser.add_argument('--products', type=int, default=10, help='Hot products shared by all baskets (default: 10)')
+        parser.add_argument('--basket-size', type=int, default=4, help='Distinct products per basket (default: 4)')
+        parser.add_argument(
+            '--lock-order',
+            choices=['sorted', 'basket'],
+            default='sorted',
+            help="'sorted' uses lock_products; 'basket' locks rows in basket order like the old checkout",
+        )
+        parser.add_argument('--lock-timeout', type=int, default=3000, help='lock_timeout in ms (default: 3000)')
+        parser.add_argument('--retries', type=int, default=3, help='Retries per checkout on contention (default: 3)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for reproducible baskets (default: 1)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark tenant and its rows')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The contention benchmark needs PostgreSQL row locks.')
+        if options['basket_size'] > options['products']:
+            raise CommandError('--basket-size cannot exceed --products.')
+
+        tenant, outlet, product_ids = self._seed(options)
+        connection.close()
+
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=_worker, args=(index, options, product_ids, outlet.id, results))
+            for index in range(options['workers'])
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = [sample for stats in collected for sample in stats['latencies']]
+        report = {
+            'lock_order': options['lock_order'],
+            'workers': options['workers'],
+            'checkouts': len(latencies),
+            'failed': sum(stats['failed'] for stats in collected),
+            'deadlocks': sum(stats['deadlock'] for stats in collected),
+            'lock_timeouts': sum(stats['lock_timeout'] for stats in collected),
+            'retries': sum(stats['retries'] for stats in collected),
+            'p50_ms': round(_percentile(latencies, 50), 2),
+            'p99_ms': round(_percentile(latencies, 99), 2),
+            'max_ms': round(max(latencies), 2) if latencies else 0.0,
+            'checkouts_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        }
+
+        if not options['keep']:
+            tenant.delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+
+        self.stdout.write(self.style.WARNING('\n=== Stock Contention Benchmark ===\n'))
+        for key, value in report.items():
+            self.stdout.write(f'{key}: {value}')
+        style = self.style.SUCCESS if not report['deadlocks'] and not report['failed'] else self.style.ERROR
+        self.stdout.write(style(f"\n{report['deadlocks']} deadlocks, {report['failed']} failed checkouts\n"))
+
+    def _seed(self, options):
+        from django.utils import timezone
+        from apps.inventory.models import Batch
+        from apps.inventory.stock_helpers import rebuild_stock_state_many
+        from apps.outlets.models import Outlet
+        from apps.products.models import Product
+        from apps.tenants.models import Tenant
+
+        stock_needed = options['workers'] * options['checkouts'] * (options['retries'] + 1)
+        tenant = Tenant.objects.create(name=f"Stock contention benchmark {int(time.time())}")
+        outlet = Outlet.objects.create(tenant=tenant, name="Benchmark Outlet")
+        products = [
+            Product.objects.create(
+                tenant=tenant, outlet=outlet, name=f"Hot product {index}",
+                retail_price=Decimal('10.00'), cost=Decimal('5.00'),
+            )
+            for index in range(options['products'])
+        ]
+        expiry_date = timezone.now().date() + timedelta(days=365)
+        Batch.objects.bulk_create([
+            Batch(
+                tenant=tenant, product=product, outlet=outlet, batch_number=f"BENCH-{product.id}-{lot}",
+                expiry_date=expiry_date + timedelta(days=lot), quantity=stock_needed, cost_price=Decimal('5.00'),
+            )
+            for product in products
+            for lot in range(2)
+        ])
+        rebuild_stock_state_many(products, outlet)
+        return tenant, outlet, [product.id for product in products]
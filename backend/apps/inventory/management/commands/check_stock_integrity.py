@@ -0,0 +1,181 @@
+"""
+Management command to check stock ledger integrity across outlets
+For every product at every outlet, compares the StockMovement ledger against
+Batch quantities, LocationStock, Product.stock and the ledger snapshots, and
+writes a machine-readable drift report. Outlets are spread across worker
+processes; each outlet is one streamed SQL aggregate.
+
+    python manage.py check_stock_integrity --workers 8 --output drift.json
+    python manage.py check_stock_integrity --tenant 3 --repair
+
+With --repair, drifted snapshots are rebuilt, batch/ledger differences are
+booked as compensating 'adjustment' movements (batches are the physical
+count), LocationStock is rebuilt from the ledger and a Product.stock matching no
+outlet is pointed back at its home outlet.
+"""
+import json
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+
+def _check_outlet(outlet_id, repair, reference_id):
+    """Check (and optionally repair) one outlet; runs inline or in a pool worker."""
+    from apps.inventory.ledger_integrity import check_outlet, repair_outlet
+    from apps.inventory.stock_locks import retry_on_stock_contention
+
+    started = time.perf_counter()
+    result = check_outlet(outlet_id)
+    result['compensating_movements'] = 0
+    if repair and result['drift']:
+        result['compensating_movements'] = len(
+            retry_on_stock_contention(repair_outlet)(outlet_id, result['drift'], reference_id=reference_id)
+        )
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _worker_init():
+    import django
+    django.setup()
+    from django.db import connections
+
+    connections.close_all()
+
+
+def _worker(args):
+    from django.db import connections
+
+    try:
+        return _check_outlet(*args)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Check Product.stock, LocationStock, batches and snapshots against the stock movement ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            type=int,
+            help='Check only outlets of a specific tenant ID',
+        )
+        parser.add_argument(
+            '--outlet',
+            type=int,
+            help='Check only a specific outlet ID',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=min(8, multiprocessing.cpu_count()),
+            help='Worker processes, one outlet at a time each (default: CPU count, max 8)',
+        )
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Write compensating movements and rebuild drifted projections',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the JSON drift report to this file',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the JSON drift report instead of a summary',
+        )
+
+    def handle(self, *args, **options):
+        from apps.inventory.ledger_integrity import product_stock_drift, repair_product_stock
+        from apps.inventory.stock_locks import retry_on_stock_contention
+        from apps.outlets.models import Outlet
+
+        if connection.vendor != 'postgresql':
+            raise CommandError('The integrity check streams PostgreSQL aggregates; use a PostgreSQL database.')
+
+        outlets = Outlet.objects.all()
+        if options.get('tenant'):
+            outlets = outlets.filter(tenant_id=options['tenant'])
+        if options.get('outlet'):
+            outlets = outlets.filter(pk=options['outlet'])
+        outlet_ids = list(outlets.order_by('id').values_list('id', flat=True))
+
+        generated_at = timezone.now()
+        reference_id = f"INTEGRITY-{generated_at:%Y%m%d%H%M%S}"
+        tasks = [(outlet_id, options['repair'], reference_id) for outlet_id in outlet_ids]
+        workers = max(1, min(options['workers'], len(tasks)))
+
+        started = time.perf_counter()
+        if workers == 1:
+            results = [_check_outlet(*task) for task in tasks]
+        else:
+            # Children must not share the parent's socket
+            connection.close()
+            with multiprocessing.Pool(workers, initializer=_worker_init) as pool:
+                results = pool.map(_worker, tasks, chunksize=1)
+        elapsed = time.perf_counter() - started
+
+        drift = [entry for result in results for entry in result['drift']]
+        # Product.stock may mirror any outlet, so it is only judged when every
+        # outlet of the tenant was checked.
+        stock_drift = [] if options.get('outlet') else product_stock_drift(results)
+        if options['repair']:
+            retry_on_stock_contention(repair_product_stock)(stock_drift)
+        drift += stock_drift
+        by_kind = {}
+        for entry in drift:
+            for kind in entry['drift']:
+                by_kind[kind] = by_kind.get(kind, 0) + 1
+        report = {
+            'generated_at': generated_at.isoformat(),
+            'tenant': options.get('tenant'),
+            'repair': options['repair'],
+            'reference_id': reference_id if options['repair'] else None,
+            'workers': workers,
+            'seconds': round(elapsed, 3),
+            'outlets_checked': len(results),
+            'products_checked': sum(result['products_checked'] for result in results),
+            'drift_count': len(drift),
+            'by_kind': by_kind,
+            'compensating_movements': sum(result['compensating_movements'] for result in results),
+            'outlets': [
+                {
+                    key: result[key]
+                    for key in ('outlet_id', 'products_checked', 'compensating_movements', 'seconds')
+                }
+                for result in results
+            ],
+            'drift': drift,
+        }
+
+        if options.get('output'):
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+
+        self.stdout.write(self.style.WARNING('\n=== Stock Ledger Integrity Check ===\n'))
+        for entry in drift[:50]:
+            self.stdout.write(self.style.WARNING(
+                f"[DRIFT] product={entry['product_id']} outlet={entry['outlet_id']} {','.join(entry['drift'])}: "
+                f"ledger={entry.get('ledger_quantity')} batches={entry.get('batch_total')} "
+                f"location={entry.get('location_quantity')} stock={entry['product_stock']} "
+                f"expected={entry['expected_quantity']}"
+            ))
+        if len(drift) > 50:
+            self.stdout.write(f'... {len(drift) - 50} more (see --output)')
+        self.stdout.write(self.style.SUCCESS(
+            f"\n=== Check Complete ===\n"
+            f"Outlets checked: {report['outlets_checked']} ({workers} workers, {report['seconds']}s)\n"
+            f"Product/outlet pairs checked: {report['products_checked']}\n"
+            f"Pairs with drift: {report['drift_count']} {by_kind}\n"
+            f"Compensating movements written: {report['compensating_movements']}\n"
+        ))
+        if drift and not options['repair']:
+            self.stdout.write(self.style.WARNING('Run with --repair to correct the drift'))
@@ -0,0 +1,117 @@
+"""
+Management command to compact the StockMovement ledger into monthly opening balances
+Also keeps future monthly partitions in place and can detach old ones for archiving
+Runs on the 1st of each month (primepos-compact-stock-ledger in render.yaml); re-running a month is safe
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from apps.inventory.ledger_partitions import (
+    add_months,
+    detach_month_partition,
+    ensure_month_partitions,
+    list_partitions,
+    month_start,
+)
+from apps.inventory.models import StockMovement, StockOpeningBalance
+
+
+def _parse_month(value):
+    try:
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        raise CommandError(f'Invalid month "{value}". Use YYYY-MM')
+
+
+class Command(BaseCommand):
+    help = 'Write per-product opening balances at month boundaries and maintain ledger partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show which boundaries and partitions would be processed without making changes',
+        )
+        parser.add_argument(
+            '--tenant',
+            type=int,
+            help='Compact only for specific tenant ID',
+        )
+        parser.add_argument(
+            '--through',
+            help='Last boundary to compact as YYYY-MM (default: current month)',
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help='Monthly partitions to keep created ahead of the current month (default: 3)',
+        )
+        parser.add_argument(
+            '--detach-before',
+            help='Detach monthly partitions older than this YYYY-MM once opening balances cover them',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        tenant_id = options.get('tenant')
+        through = _parse_month(options['through']) if options.get('through') else month_start(timezone.now())
+
+        self.stdout.write(self.style.WARNING('\n=== Stock Ledger Compaction ===\n'))
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made\n'))
+
+        if not dry_run:
+            for name in ensure_month_partitions(months_ahead=max(0, options['months_ahead'])):
+                self.stdout.write(f'Created partition {name}')
+
+        movements = StockMovement.objects.filter(product__isnull=False)
+        if tenant_id:
+            movements = movements.filter(tenant_id=tenant_id)
+        first_movements = movements.values('tenant_id').annotate(first=Min('created_at')).order_by('tenant_id')
+
+        balances_written = 0
+        for row in first_movements:
+            current_tenant = row['tenant_id']
+            latest = StockOpeningBalance.objects.filter(
+                tenant_id=current_tenant
+            ).aggregate(period_start=Max('period_start'))['period_start']
+            boundary = add_months(latest, 1) if latest else add_months(month_start(row['first']), 1)
+
+            while boundary <= through:
+                if dry_run:
+                    self.stdout.write(f'Tenant {current_tenant}: would compact boundary {boundary}')
+                else:
+                    with transaction.atomic():
+                        written = StockOpeningBalance.objects.compact(current_tenant, boundary)
+                    balances_written += written
+                    self.stdout.write(f'Tenant {current_tenant}: {written} opening balances at {boundary}')
+                boundary = add_months(boundary, 1)
+
+        detached = []
+        if options.get('detach_before'):
+            detach_before = _parse_month(options['detach_before'])
+            for month, name in list_partitions():
+                if month >= detach_before:
+                    break
+                if dry_run:
+                    self.stdout.write(f'Would detach {name}')
+                    continue
+                try:
+                    detached.append(detach_month_partition(month))
+                except ValueError as exc:
+                    self.stdout.write(self.style.ERROR(str(exc)))
+                    break
+                self.stdout.write(self.style.WARNING(
+                    f'Detached {name}; archive it (e.g. pg_dump -t {name}) before dropping'
+                ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n=== Compaction Complete ===\n'
+            f'Opening balances written: {balances_written}\n'
+            f'Partitions detached: {len(detached)}\n'
+        ))
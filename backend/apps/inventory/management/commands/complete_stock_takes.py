@@ -0,0 +1,70 @@
+"""
+Management command to finish stock takes whose completion was started but not finished
+Schedule frequently (e.g. cron every few minutes); each run resumes where the last stopped
+"""
+from django.core.management.base import BaseCommand
+from apps.inventory.models import StockTake
+from apps.inventory.stock_helpers import complete_stock_take
+
+
+class Command(BaseCommand):
+    help = "Resume 'completing' stock takes, applying their remaining counts in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List stock takes that would be resumed without making changes',
+        )
+        parser.add_argument(
+            '--tenant',
+            type=int,
+            help='Resume only for specific tenant ID',
+        )
+        parser.add_argument(
+            '--stock-take',
+            type=int,
+            help='Complete only this stock take ID (also starts a running one)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Maximum items applied per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        chunk_size = max(1, options['chunk_size'])
+
+        self.stdout.write(self.style.WARNING('\n=== Stock Take Completion ===\n'))
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made\n'))
+
+        stock_takes = StockTake.objects.select_related('outlet', 'user').order_by('id')
+        if options.get('stock_take'):
+            stock_takes = stock_takes.filter(id=options['stock_take'], status__in=['running', 'completing'])
+        else:
+            stock_takes = stock_takes.filter(status='completing')
+        if options.get('tenant'):
+            stock_takes = stock_takes.filter(tenant_id=options['tenant'])
+
+        completed = 0
+        for stock_take in stock_takes:
+            if dry_run:
+                self.stdout.write(
+                    f'Stock take {stock_take.id} ({stock_take.status}): '
+                    f'{stock_take.completion_processed}/{stock_take.completion_total} items applied'
+                )
+                continue
+
+            def report(processed, total, stock_take_id=stock_take.id):
+                self.stdout.write(f'Stock take {stock_take_id}: {processed}/{total} items applied')
+
+            complete_stock_take(stock_take, chunk_size=chunk_size, progress=report)
+            completed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n=== Completion Done ===\n'
+            f'Stock takes completed: {completed}\n'
+        ))
@@ -0,0 +1,71 @@
+"""
+Management command to sweep expired batches into expiry movements
+Runs nightly as the primepos-expire-batches cron job in render.yaml, after roll_forward_stock_expiry
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+from apps.inventory.models import Batch
+from apps.inventory.stock_helpers import mark_expired_batches
+
+
+class Command(BaseCommand):
+    help = 'Zero out expired batches and record expiry stock movements, tenant by tenant in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report expired batches without making changes',
+        )
+        parser.add_argument(
+            '--tenant',
+            type=int,
+            help='Sweep only for specific tenant ID',
+        )
+        parser.add_argument(
+            '--outlet',
+            type=int,
+            help='Sweep only for specific outlet ID',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Maximum batches expired per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        tenant_id = options.get('tenant')
+        outlet_id = options.get('outlet')
+        chunk_size = max(1, options['chunk_size'])
+
+        self.stdout.write(self.style.WARNING('\n=== Expired Batch Sweep ===\n'))
+
+        expired = Batch.objects.filter(expiry_date__lte=timezone.now().date(), quantity__gt=0)
+        if tenant_id:
+            expired = expired.filter(tenant_id=tenant_id)
+        if outlet_id:
+            expired = expired.filter(outlet_id=outlet_id)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made\n'))
+            for row in expired.values('tenant_id').annotate(batches=Count('id')).order_by('tenant_id'):
+                self.stdout.write(f"Tenant {row['tenant_id']}: {row['batches']} expired batches")
+            return
+
+        def report(current_tenant_id, done, total):
+            self.stdout.write(f'Tenant {current_tenant_id}: {done}/{total} batches expired')
+
+        expired_count = mark_expired_batches(
+            tenant=tenant_id,
+            outlet=outlet_id,
+            chunk_size=chunk_size,
+            progress=report,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n=== Sweep Complete ===\n'
+            f'Batches expired: {expired_count}\n'
+        ))
@@ -0,0 +1,85 @@
+"""
+Management command to re-derive StockLedgerSnapshot rows from the StockMovement ledger
+Use for audits or after repairing ledger rows; normal stock writes keep snapshots current
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.inventory.models import StockMovement, StockLedgerSnapshot
+from apps.inventory.stock_helpers import rebuild_stock_state
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-product stock ledger snapshots from the full movement history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report snapshot drift without making changes',
+        )
+        parser.add_argument(
+            '--tenant',
+            type=int,
+            help='Rebuild only for specific tenant ID',
+        )
+        parser.add_argument(
+            '--outlet',
+            type=int,
+            help='Rebuild only for specific outlet ID',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        tenant_id = options.get('tenant')
+        outlet_id = options.get('outlet')
+
+        self.stdout.write(self.style.WARNING('\n=== Stock Ledger Snapshot Rebuild ===\n'))
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made\n'))
+
+        pairs = StockMovement.objects.filter(product__isnull=False)
+        if tenant_id:
+            pairs = pairs.filter(tenant_id=tenant_id)
+        if outlet_id:
+            pairs = pairs.filter(outlet_id=outlet_id)
+        pairs = list(pairs.values_list('product_id', 'outlet_id').distinct().order_by('product_id', 'outlet_id'))
+
+        snapshots = {
+            (snapshot.product_id, snapshot.outlet_id): snapshot
+            for snapshot in StockLedgerSnapshot.objects.filter(
+                product_id__in={product_id for product_id, _ in pairs}
+            )
+        }
+
+        drift_count = 0
+        for product_id, outlet_id in pairs:
+            totals = StockLedgerSnapshot.objects.ledger_totals(product_id, outlet_id)
+            snapshot = snapshots.get((product_id, outlet_id))
+            current = {
+                key: getattr(snapshot, key) for key in totals
+            } if snapshot else None
+            if current == totals:
+                continue
+
+            drift_count += 1
+            self.stdout.write(self.style.WARNING(
+                f'[DRIFT] product={product_id} outlet={outlet_id}: snapshot={current}, ledger={totals}'
+            ))
+            if dry_run:
+                continue
+
+            with transaction.atomic():
+                product = Product.objects.select_for_update().get(pk=product_id)
+                outlet = Outlet.objects.get(pk=outlet_id)
+                StockLedgerSnapshot.objects.rebuild(product, outlet)
+                rebuild_stock_state(product, outlet, reason='Ledger snapshot rebuild')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n=== Rebuild Complete ===\n'
+            f'Product/outlet pairs checked: {len(pairs)}\n'
+            f'Snapshots with drift: {drift_count}\n'
+        ))
+        if dry_run and drift_count:
+            self.stdout.write(self.style.WARNING('Run without --dry-run to rebuild drifted snapshots'))
@@ -0,0 +1,57 @@
+"""
+Management command to roll LocationStock batch columns forward past batch expiry dates
+Runs daily shortly after midnight (primepos-roll-forward-stock-expiry in render.yaml); stock writes keep the columns current in between
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.inventory.models import LocationStock
+
+
+class Command(BaseCommand):
+    help = 'Refresh sellable/expired quantities on LocationStock rows whose next batch has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report stale rows without making changes',
+        )
+        parser.add_argument(
+            '--tenant',
+            type=int,
+            help='Roll forward only for specific tenant ID',
+        )
+        parser.add_argument(
+            '--outlet',
+            type=int,
+            help='Roll forward only for specific outlet ID',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        tenant_id = options.get('tenant')
+        outlet_id = options.get('outlet')
+        today = timezone.now().date()
+
+        self.stdout.write(self.style.WARNING('\n=== Stock Expiry Roll-Forward ===\n'))
+
+        if dry_run:
+            stale = LocationStock.objects.filter(batch_tracked=True, next_expiry_date__lte=today)
+            if tenant_id:
+                stale = stale.filter(tenant_id=tenant_id)
+            if outlet_id:
+                stale = stale.filter(outlet_id=outlet_id)
+            self.stdout.write(self.style.WARNING(
+                f'DRY RUN MODE - {stale.count()} location stock rows are past their next expiry date'
+            ))
+            return
+
+        refreshed = LocationStock.objects.roll_forward_expiry(
+            today=today,
+            tenant_id=tenant_id,
+            outlet_id=outlet_id,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'\n=== Roll-Forward Complete ===\n'
+            f'Location stock rows refreshed: {refreshed}\n'
+        ))
@@ -0,0 +1,85 @@
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Max, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def backfill_ledger_snapshots(apps, schema_editor):
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    StockLedgerSnapshot = apps.get_model('inventory', 'StockLedgerSnapshot')
+    negative_types = ['sale', 'transfer_out', 'damage', 'expiry']
+    money = DecimalField(max_digits=18, decimal_places=2)
+
+    signed_delta = Coalesce(
+        'quantity_delta',
+        Case(When(movement_type__in=negative_types, then=-F('quantity')), default=F('quantity')),
+        output_field=IntegerField(),
+    )
+    unit_cost = Coalesce('unit_cost', 'batch__cost_price', 'product__cost', Value(Decimal('0.00')), output_field=money)
+    rows = (
+        StockMovement.objects.filter(product__isnull=False)
+        .annotate(signed_delta=signed_delta)
+        .values('product_id', 'outlet_id')
+        .annotate(
+            tenant_id=Max('tenant_id'),
+            total_quantity=Sum('signed_delta'),
+            total_acquired_quantity=Sum(Case(When(signed_delta__gt=0, then='signed_delta'), default=Value(0))),
+            total_acquired_cost=Sum(Case(
+                When(signed_delta__gt=0, then=ExpressionWrapper(F('signed_delta') * unit_cost, output_field=money)),
+                default=Value(Decimal('0.00')),
+                output_field=money,
+            )),
+            total_movements=Count('id'),
+        )
+        .order_by()
+    )
+
+    snapshots = [
+        StockLedgerSnapshot(
+            tenant_id=row['tenant_id'],
+            product_id=row['product_id'],
+            outlet_id=row['outlet_id'],
+            quantity=row['total_quantity'] or 0,
+            acquired_quantity=row['total_acquired_quantity'] or 0,
+            acquired_cost=row['total_acquired_cost'] or Decimal('0.00'),
+            movement_count=row['total_movements'],
+        )
+        for row in rows.iterator()
+    ]
+    StockLedgerSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_product_archive_fields'),
+        ('outlets', '0012_remove_outlet_distribution_active'),
+        ('tenants', '0014_backfill_tenant_subdomain_domain'),
+        ('inventory', '0011_stocktakeitem_count_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockLedgerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=0, help_text='Sum of signed movement deltas (may be negative for legacy data)')),
+                ('acquired_quantity', models.IntegerField(default=0, help_text='Sum of positive movement deltas')),
+                ('acquired_cost', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Sum of positive deltas times their unit cost', max_digits=18)),
+                ('movement_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('outlet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_ledger_snapshots', to='outlets.outlet')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_ledger_snapshots', to='products.product')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_ledger_snapshots', to='tenants.tenant')),
+            ],
+            options={
+                'verbose_name': 'Stock Ledger Snapshot',
+                'verbose_name_plural': 'Stock Ledger Snapshots',
+                'db_table': 'inventory_stockledgersnapshot',
+                'indexes': [models.Index(fields=['tenant'], name='inventory_s_tenant__55b303_idx'), models.Index(fields=['outlet'], name='inventory_s_outlet__35acaa_idx')],
+                'unique_together': {('product', 'outlet')},
+            },
+        ),
+        migrations.RunPython(backfill_ledger_snapshots, migrations.RunPython.noop),
+    ]
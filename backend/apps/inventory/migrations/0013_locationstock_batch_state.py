@@ -0,0 +1,90 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:10
+
+from django.db import migrations, models
+from django.db.models import Max, Min, Q, Sum
+from django.utils import timezone
+
+
+def backfill_location_stock_batch_state(apps, schema_editor):
+    Batch = apps.get_model('inventory', 'Batch')
+    LocationStock = apps.get_model('inventory', 'LocationStock')
+    today = timezone.now().date()
+    sellable = Q(expiry_date__gt=today, quantity__gt=0)
+
+    state = {
+        (row['product_id'], row['outlet_id']): row
+        for row in (
+            Batch.objects.filter(product__isnull=False)
+            .values('product_id', 'outlet_id')
+            .annotate(
+                tenant_id=Max('tenant_id'),
+                sellable=Sum('quantity', filter=sellable),
+                expired=Sum('quantity', filter=Q(expiry_date__lte=today, quantity__gt=0)),
+                next_expiry=Min('expiry_date', filter=sellable),
+            )
+            .order_by()
+            .iterator()
+        )
+    }
+    if not state:
+        return
+
+    LocationStock.objects.bulk_create(
+        [
+            LocationStock(tenant_id=row['tenant_id'], product_id=product_id, outlet_id=outlet_id, quantity=0)
+            for (product_id, outlet_id), row in state.items()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+    to_update = []
+    for location_stock in LocationStock.objects.filter(product_id__in={key[0] for key in state}).iterator():
+        row = state.get((location_stock.product_id, location_stock.outlet_id))
+        if row is None:
+            continue
+        location_stock.sellable_quantity = row['sellable'] or 0
+        location_stock.expired_quantity = row['expired'] or 0
+        location_stock.next_expiry_date = row['next_expiry']
+        location_stock.batch_tracked = True
+        to_update.append(location_stock)
+    LocationStock.objects.bulk_update(
+        to_update,
+        ['sellable_quantity', 'expired_quantity', 'next_expiry_date', 'batch_tracked'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_stockledgersnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locationstock',
+            name='batch_tracked',
+            field=models.BooleanField(default=False, help_text='Product has batch rows at this outlet'),
+        ),
+        migrations.AddField(
+            model_name='locationstock',
+            name='expired_quantity',
+            field=models.IntegerField(default=0, help_text='Quantity left in expired batches'),
+        ),
+        migrations.AddField(
+            model_name='locationstock',
+            name='next_expiry_date',
+            field=models.DateField(blank=True, help_text='Earliest expiry among sellable batches; the row is stale once this date is reached', null=True),
+        ),
+        migrations.AddField(
+            model_name='locationstock',
+            name='sellable_quantity',
+            field=models.IntegerField(default=0, help_text='Quantity in non-expired batches'),
+        ),
+        migrations.AddIndex(
+            model_name='locationstock',
+            index=models.Index(fields=['next_expiry_date'], name='inventory_l_next_ex_90b9f6_idx'),
+        ),
+        migrations.RunPython(backfill_location_stock_batch_state, migrations.RunPython.noop),
+    ]
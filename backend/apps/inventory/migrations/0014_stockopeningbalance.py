@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:23
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0012_remove_outlet_distribution_active'),
+        ('tenants', '0014_backfill_tenant_subdomain_domain'),
+        ('products', '0021_product_archive_fields'),
+        ('inventory', '0013_locationstock_batch_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockOpeningBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(help_text='Month boundary; totals cover movements created before this date')),
+                ('quantity', models.IntegerField(default=0)),
+                ('acquired_quantity', models.IntegerField(default=0)),
+                ('acquired_cost', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('movement_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('outlet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_opening_balances', to='outlets.outlet')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_opening_balances', to='products.product')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_opening_balances', to='tenants.tenant')),
+            ],
+            options={
+                'verbose_name': 'Stock Opening Balance',
+                'verbose_name_plural': 'Stock Opening Balances',
+                'db_table': 'inventory_stockopeningbalance',
+                'indexes': [models.Index(fields=['tenant', 'period_start'], name='inventory_s_tenant__8ca085_idx'), models.Index(fields=['outlet', 'period_start'], name='inventory_s_outlet__bd01e0_idx')],
+                'unique_together': {('product', 'outlet', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,135 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:23
+
+from datetime import date, datetime, time
+
+from django.db import migrations
+from django.utils import timezone
+
+TABLE = 'inventory_stockmovement'
+MONTHS_AHEAD = 3
+
+
+def _month_bounds(month):
+    next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return (
+        timezone.make_aware(datetime.combine(month, time.min)),
+        timezone.make_aware(datetime.combine(next_month, time.min)),
+        next_month,
+    )
+
+
+def _table_definition(cursor, table):
+    """Non-primary-key index DDL and foreign key constraints currently on the table."""
+    cursor.execute(
+        """
+        SELECT indexdef FROM pg_indexes
+        WHERE tablename = %s AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'
+        )
+        """,
+        [table, table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _detach_names(cursor, table):
+    """Drop the primary key and indexes on a table about to be replaced, freeing their names."""
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'",
+        [table],
+    )
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+    cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s', [table])
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'DROP INDEX {name}')
+
+
+def _is_partitioned(cursor):
+    cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE])
+    return cursor.fetchone() is not None
+
+
+def partition_stock_movements(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if _is_partitioned(cursor):
+            return
+
+        indexes, foreign_keys = _table_definition(cursor, TABLE)
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_unpartitioned')
+        _detach_names(cursor, f'{TABLE}_unpartitioned')
+
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {TABLE}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, created_at)')
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+        cursor.execute(f'SELECT MIN(created_at) FROM {TABLE}_unpartitioned')
+        earliest = cursor.fetchone()[0]
+        today = timezone.localdate()
+        month = (timezone.localtime(earliest).date() if earliest else today).replace(day=1)
+        last = date(today.year + (today.month - 1 + MONTHS_AHEAD) // 12, (today.month - 1 + MONTHS_AHEAD) % 12 + 1, 1)
+        while month <= last:
+            lower, upper, next_month = _month_bounds(month)
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                [lower, upper],
+            )
+            month = next_month
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_unpartitioned')
+        cursor.execute(f'DROP TABLE {TABLE}_unpartitioned')
+
+        cursor.execute(f'CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id')
+        cursor.execute(f"SELECT setval('{TABLE}_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+
+
+def unpartition_stock_movements(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not _is_partitioned(cursor):
+            return
+
+        indexes, foreign_keys = _table_definition(cursor, TABLE)
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_partitioned')
+        _detach_names(cursor, f'{TABLE}_partitioned')
+
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {TABLE}_partitioned INCLUDING DEFAULTS)')
+        cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_partitioned')
+        cursor.execute(f'DROP TABLE {TABLE}_partitioned CASCADE')
+
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+        cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_stockopeningbalance'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_stock_movements, unpartition_stock_movements),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_partition_stockmovement_by_month'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stocktake',
+            name='completion_processed',
+            field=models.IntegerField(default=0, help_text='Items applied so far by the completion job'),
+        ),
+        migrations.AddField(
+            model_name='stocktake',
+            name='completion_total',
+            field=models.IntegerField(default=0, help_text='Items to apply when completion started'),
+        ),
+        migrations.AddField(
+            model_name='stocktakeitem',
+            name='applied_at',
+            field=models.DateTimeField(blank=True, help_text='When the count was applied to stock on completion', null=True),
+        ),
+        migrations.AlterField(
+            model_name='stocktake',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('completing', 'Completing'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='running', max_length=20),
+        ),
+    ]
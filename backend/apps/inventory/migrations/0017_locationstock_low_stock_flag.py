@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:20
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def backfill_low_stock_flags(apps, schema_editor):
+    """Set the flag for rows already at or below their threshold; no notifications."""
+    LocationStock = apps.get_model('inventory', 'LocationStock')
+    thresholded = LocationStock.objects.filter(product__low_stock_threshold__gt=0)
+    thresholded.filter(
+        Q(batch_tracked=True, sellable_quantity__lte=F('product__low_stock_threshold'))
+        | Q(batch_tracked=False, quantity__lte=F('product__low_stock_threshold'))
+    ).update(is_low_stock=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_stocktake_completion_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locationstock',
+            name='is_low_stock',
+            field=models.BooleanField(default=False, help_text="Sellable stock is at or below the product's low stock threshold"),
+        ),
+        migrations.AddField(
+            model_name='locationstock',
+            name='low_stock_changed_at',
+            field=models.DateTimeField(blank=True, help_text='When is_low_stock last flipped', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='locationstock',
+            index=models.Index(condition=models.Q(('is_low_stock', True)), fields=['outlet', 'product'], name='inventory_ls_low_stock_idx'),
+        ),
+        migrations.RunPython(backfill_low_stock_flags, migrations.RunPython.noop),
+    ]
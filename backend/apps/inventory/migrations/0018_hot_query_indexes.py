@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_locationstock_low_stock_flag'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='batch',
+            name='inventory_b_tenant__9caa42_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='batch',
+            name='inventory_b_expiry__96c551_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='batch',
+            name='inventory_b_outlet__90c2c6_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='batch',
+            name='inventory_b_product_a73c09_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stockmovement',
+            name='inventory_s_tenant__df4fe5_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stockmovement',
+            name='inventory_s_product_cbdc37_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stockmovement',
+            name='inventory_s_outlet__7754ba_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stockmovement',
+            name='inventory_s_movemen_018f99_idx',
+        ),
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['product', 'outlet', 'expiry_date'], include=('quantity', 'cost_price'), name='inventory_batch_fifo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['expiry_date'], name='inventory_batch_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['tenant', 'outlet', '-created_at', '-id'], name='inventory_sm_outlet_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'outlet', 'created_at'], include=('movement_type', 'quantity', 'quantity_delta', 'unit_cost'), name='inventory_sm_product_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['tenant', 'movement_type', 'created_at'], name='inventory_sm_type_time_idx'),
+        ),
+    ]
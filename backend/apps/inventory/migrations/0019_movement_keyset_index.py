@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0014_backfill_tenant_subdomain_domain'),
+        ('inventory', '0018_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='tenants.tenant'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['tenant', '-created_at', '-id'], name='inventory_sm_tenant_time_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0014_backfill_tenant_subdomain_domain'),
+        ('inventory', '0019_movement_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockTransferProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='processing', max_length=20)),
+                ('processed_lines', models.IntegerField(default=0)),
+                ('total_lines', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_transfer_progress', to='tenants.tenant')),
+            ],
+            options={
+                'verbose_name': 'Stock Transfer Progress',
+                'verbose_name_plural': 'Stock Transfer Progress',
+                'db_table': 'inventory_stocktransferprogress',
+                'unique_together': {('tenant', 'reference')},
+            },
+        ),
+    ]
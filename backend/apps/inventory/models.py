@@ -1,7 +1,8 @@
-from django.db import models  # pyright: ignore[reportMissingImports]
+from django.db import models, transaction, IntegrityError  # pyright: ignore[reportMissingImports]
 from django.core.validators import MinValueValidator  # pyright: ignore[reportMissingImports]  # pyright: ignore[reportMissingImports]  # pyright: ignore[reportMissingImports]
 from django.utils import timezone
-from django.db.models import Sum, Q
+from django.db.models import Sum, Min, Q, F, Case, When, Value, Count, ExpressionWrapper
+from django.db.models.functions import Coalesce
 from decimal import Decimal
 from apps.tenants.models import Tenant
 from apps.outlets.models import Outlet
@@ -32,11 +33,22 @@ class Batch(models.Model):
         verbose_name = 'Batch'
         verbose_name_plural = 'Batches'
         unique_together = [['product', 'outlet', 'batch_number']]
+        # tenant/outlet/product lookups use the FK indexes and the unique
+        # (product, outlet, batch_number) index. The partial indexes cover only
+        # batches that still hold stock: FIFO picking and sellable stock read
+        # (product, outlet) in expiry order, expiry jobs scan by expiry date.
         indexes = [
-            models.Index(fields=['tenant']),
-            models.Index(fields=['outlet']),
-            models.Index(fields=['expiry_date']),
-            models.Index(fields=['product', 'outlet']),
+            models.Index(
+                fields=['product', 'outlet', 'expiry_date'],
+                include=['quantity', 'cost_price'],
+                condition=Q(quantity__gt=0),
+                name='inventory_batch_fifo_idx',
+            ),
+            models.Index(
+                fields=['expiry_date'],
+                condition=Q(quantity__gt=0),
+                name='inventory_batch_expiry_idx',
+            ),
         ]
         ordering = ['expiry_date', 'created_at']
 
@@ -58,6 +70,18 @@ class Batch(models.Model):
         return delta.days
 
 
+NEGATIVE_MOVEMENT_TYPES = frozenset({'sale', 'transfer_out', 'damage', 'expiry'})
+
+
+class StockMovementQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """Insert ledger rows and roll them into the per-product snapshots in the same transaction."""
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            StockLedgerSnapshot.objects.apply_movements(created)
+        return created
+
+
 class StockMovement(models.Model):
     """Stock movement tracking model - immutable ledger"""
     MOVEMENT_TYPES = [
@@ -71,7 +95,8 @@ class StockMovement(models.Model):
         ('expiry', 'Expiry'),
     ]
 
-    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='stock_movements')
+    # Indexed by inventory_sm_tenant_time_idx, which leads with tenant
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='stock_movements', db_index=False)
     batch = models.ForeignKey(Batch, on_delete=models.SET_NULL, null=True, blank=True, related_name='movements', help_text="Batch this movement belongs to")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements', null=True, blank=True, help_text="Product affected by this movement")
     outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, related_name='stock_movements')
@@ -96,17 +121,37 @@ class StockMovement(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = StockMovementQuerySet.as_manager()
+
     class Meta:
         db_table = 'inventory_stockmovement'
         verbose_name = 'Stock Movement'
         verbose_name_plural = 'Stock Movements'
         ordering = ['-created_at']
+        # Ledger queries filter on (tenant, outlet) or (product, outlet) plus a
+        # created_at window, and history pages walk (created_at, id) keysets;
+        # single-column product/outlet lookups use the FK indexes. The product
+        # index covers the columns the ledger aggregates read, so snapshot
+        # rebuilds and valuation avoid the heap.
         indexes = [
-            models.Index(fields=['tenant']),
-            models.Index(fields=['product']),
-            models.Index(fields=['outlet']),
-            models.Index(fields=['movement_type']),
             models.Index(fields=['created_at']),
+            models.Index(
+                fields=['tenant', '-created_at', '-id'],
+                name='inventory_sm_tenant_time_idx',
+            ),
+            models.Index(
+                fields=['tenant', 'outlet', '-created_at', '-id'],
+                name='inventory_sm_outlet_time_idx',
+            ),
+            models.Index(
+                fields=['product', 'outlet', 'created_at'],
+                include=['movement_type', 'quantity', 'quantity_delta', 'unit_cost'],
+                name='inventory_sm_product_time_idx',
+            ),
+            models.Index(
+                fields=['tenant', 'movement_type', 'created_at'],
+                name='inventory_sm_type_time_idx',
+            ),
         ]
 
     def __str__(self):
@@ -130,7 +175,7 @@ class StockMovement(models.Model):
             raise ValidationError("Stock movements are immutable and cannot be changed.")
 
         if self.quantity_delta is None:
-            direction = -1 if self.movement_type in {'sale', 'transfer_out', 'damage', 'expiry'} else 1
+            direction = -1 if self.movement_type in NEGATIVE_MOVEMENT_TYPES else 1
             self.quantity_delta = direction * self.quantity
 
         if self.unit_cost is None:
@@ -140,15 +185,218 @@ class StockMovement(models.Model):
                 else self.product.cost if self.product_id and self.product.cost is not None else Decimal('0.00')
             )
         self.clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            StockLedgerSnapshot.objects.apply_movements([self])
 
     def delete(self, *args, **kwargs):
         from django.core.exceptions import ValidationError
         raise ValidationError("Stock movements are immutable and cannot be deleted.")
+
+    @property
+    def signed_quantity(self):
+        """Signed inventory effect, falling back to the movement type for very old rows."""
+        if self.quantity_delta is not None:
+            return int(self.quantity_delta)
+        quantity = int(self.quantity or 0)
+        return -quantity if self.movement_type in NEGATIVE_MOVEMENT_TYPES else quantity
+
+
+def _ledger_aggregates():
+    """Aggregate expressions shared by ledger snapshots and opening balances.
+
+    Returns (annotations, aggregates); apply the annotations to a StockMovement
+    queryset before aggregating.
+    """
+    signed_delta = Coalesce(
+        'quantity_delta',
+        Case(
+            When(movement_type__in=NEGATIVE_MOVEMENT_TYPES, then=-F('quantity')),
+            default=F('quantity'),
+        ),
+    )
+    unit_cost = Coalesce(
+        'unit_cost', 'batch__cost_price', 'product__cost',
+        Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+    aggregates = {
+        'quantity': Sum('signed_delta'),
+        'acquired_quantity': Sum(Case(When(signed_delta__gt=0, then='signed_delta'), default=Value(0))),
+        'acquired_cost': Sum(
+            Case(
+                When(signed_delta__gt=0, then=ExpressionWrapper(
+                    F('signed_delta') * unit_cost,
+                    output_field=models.DecimalField(max_digits=18, decimal_places=2),
+                )),
+                default=Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=18, decimal_places=2),
+            )
+        ),
+        'movement_count': Count('id'),
+    }
+    return {'signed_delta': signed_delta}, aggregates
+
+
+def _ledger_row(totals, opening=None):
+    """Normalize aggregate output, adding an opening balance when one applies."""
+    row = {
+        'quantity': int(totals.get('quantity') or 0),
+        'acquired_quantity': int(totals.get('acquired_quantity') or 0),
+        'acquired_cost': (totals.get('acquired_cost') or Decimal('0.00')).quantize(Decimal('0.01')),
+        'movement_count': int(totals.get('movement_count') or 0),
+    }
+    if opening is not None:
+        for field in row:
+            row[field] += getattr(opening, field) if not isinstance(opening, dict) else opening[field]
+    return row
+
+
+class StockLedgerSnapshotManager(models.Manager):
+    def ledger_totals(self, product_id, outlet_id):
+        """Aggregate the movement ledger for one product/outlet in the database.
+
+        Starts from the latest compacted opening balance, so only movements in
+        attached (recent) partitions are scanned.
+        """
+        from apps.inventory.ledger_partitions import boundary
+
+        opening = StockOpeningBalance.objects.latest_for(product_id, outlet_id)
+        movements = StockMovement.objects.filter(product_id=product_id, outlet_id=outlet_id)
+        if opening is not None:
+            movements = movements.filter(created_at__gte=boundary(opening.period_start))
+        annotations, aggregates = _ledger_aggregates()
+        return _ledger_row(movements.annotate(**annotations).aggregate(**aggregates), opening)
+
+    def rebuild(self, product, outlet):
+        """Re-derive a snapshot from the ledger (audits, backfills and first use)."""
+        totals = self.ledger_totals(product.id, outlet.id)
+        snapshot, _ = self.update_or_create(
+            product=product,
+            outlet=outlet,
+            defaults={'tenant_id': product.tenant_id, **totals},
+        )
+        return snapshot
+
+    def for_stock(self, product, outlet):
+        """Return the snapshot for a product/outlet, seeding it from the ledger if missing."""
+        snapshot = self.filter(product=product, outlet=outlet).first()
+        if snapshot is None:
+            snapshot = self.rebuild(product, outlet)
+        return snapshot
+
+    def apply_movements(self, movements):
+        """Fold newly inserted movements into their snapshots with O(1) increments."""
+        pending = {}
+        for movement in movements:
+            if not movement.product_id:
+                continue
+            key = (movement.product_id, movement.outlet_id)
+            entry = pending.setdefault(key, {
+                'tenant_id': movement.tenant_id,
+                'quantity': 0,
+                'acquired_quantity': 0,
+                'acquired_cost': Decimal('0.00'),
+                'movement_count': 0,
+            })
+            delta = movement.signed_quantity
+            entry['quantity'] += delta
+            entry['movement_count'] += 1
+            if delta > 0:
+                unit_cost = movement.unit_cost
+                if unit_cost is None:
+                    unit_cost = (
+                        movement.batch.cost_price if movement.batch_id and movement.batch.cost_price is not None
+                        else movement.product.cost
+                    )
+                entry['acquired_quantity'] += delta
+                entry['acquired_cost'] += Decimal(str(unit_cost or 0)) * Decimal(delta)
+
+        if not pending:
+            return
+
+        # Existing snapshots are locked in one ordered query and written back in
+        # one bulk update, so a whole cart costs two statements however many
+        # products it touches. The ordering keeps lock acquisition stable
+        # across concurrent writers.
+        now = timezone.now()
+        snapshot_filter = Q()
+        for product_id, outlet_id in pending:
+            snapshot_filter |= Q(product_id=product_id, outlet_id=outlet_id)
+        existing = list(self.select_for_update().filter(snapshot_filter).order_by('product_id', 'outlet_id', 'id'))
+        for snapshot in existing:
+            entry = pending[(snapshot.product_id, snapshot.outlet_id)]
+            snapshot.quantity += entry['quantity']
+            snapshot.acquired_quantity += entry['acquired_quantity']
+            snapshot.acquired_cost += entry['acquired_cost']
+            snapshot.movement_count += entry['movement_count']
+            snapshot.updated_at = now
+        self.bulk_update(
+            existing, ['quantity', 'acquired_quantity', 'acquired_cost', 'movement_count', 'updated_at'], batch_size=500
+        )
+
+        seen = {(snapshot.product_id, snapshot.outlet_id) for snapshot in existing}
+        for (product_id, outlet_id), entry in sorted(pending.items()):
+            if (product_id, outlet_id) in seen:
+                continue
+            increments = {
+                'quantity': F('quantity') + entry['quantity'],
+                'acquired_quantity': F('acquired_quantity') + entry['acquired_quantity'],
+                'acquired_cost': F('acquired_cost') + entry['acquired_cost'],
+                'movement_count': F('movement_count') + entry['movement_count'],
+                'updated_at': now,
+            }
+            # First write for this product/outlet: the ledger already contains
+            # these movements, so seed the snapshot from it instead of adding.
+            try:
+                with transaction.atomic():
+                    self.create(
+                        tenant_id=entry['tenant_id'],
+                        product_id=product_id,
+                        outlet_id=outlet_id,
+                        **self.ledger_totals(product_id, outlet_id),
+                    )
+            except IntegrityError:
+                # A concurrent writer seeded it first without seeing our rows.
+                self.filter(product_id=product_id, outlet_id=outlet_id).update(**increments)
+
+
+class StockLedgerSnapshot(models.Model):
+    """
+    Running totals of the StockMovement ledger per product/outlet.
+    Maintained in the same transaction as every movement insert so stock
+    writes never have to rescan the ledger.
+    """
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='stock_ledger_snapshots')
+    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, related_name='stock_ledger_snapshots')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_ledger_snapshots')
+    quantity = models.IntegerField(default=0, help_text="Sum of signed movement deltas (may be negative for legacy data)")
+    acquired_quantity = models.IntegerField(default=0, help_text="Sum of positive movement deltas")
+    acquired_cost = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), help_text="Sum of positive deltas times their unit cost")
+    movement_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StockLedgerSnapshotManager()
+
+    class Meta:
+        db_table = 'inventory_stockledgersnapshot'
+        verbose_name = 'Stock Ledger Snapshot'
+        verbose_name_plural = 'Stock Ledger Snapshots'
+        unique_together = [['product', 'outlet']]
+        indexes = [
+            models.Index(fields=['tenant']),
+            models.Index(fields=['outlet']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.outlet_id}: {self.quantity}"
+
+
 class StockTake(models.Model):
     """Stock taking/audit session model"""
     STATUS_CHOICES = [
         ('running', 'Running'),
+        ('completing', 'Completing'),
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     ]
@@ -163,6 +411,8 @@ class StockTake(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    completion_total = models.IntegerField(default=0, help_text="Items to apply when completion started")
+    completion_processed = models.IntegerField(default=0, help_text="Items applied so far by the completion job")
 
     class Meta:
         db_table = 'inventory_stocktake'
@@ -179,15 +429,332 @@ class StockTake(models.Model):
         return f"{self.outlet.name} - {self.operating_date}"
 
 
+class StockTransferProgressManager(models.Manager):
+    RECORD_SQL = (
+        "INSERT INTO inventory_stocktransferprogress "
+        "(tenant_id, reference, status, processed_lines, total_lines, updated_at) "
+        "VALUES (%s, %s, %s, %s, %s, %s) "
+        "ON CONFLICT (tenant_id, reference) DO UPDATE SET status = EXCLUDED.status, "
+        "processed_lines = EXCLUDED.processed_lines, total_lines = EXCLUDED.total_lines, "
+        "updated_at = EXCLUDED.updated_at"
+    )
+
+    def record(self, tenant_id, reference, status, processed_lines, total_lines):
+        """Upsert a transfer's progress so it is readable while the transfer's transaction is still open."""
+        from primepos.db import autocommit_connection
+
+        with autocommit_connection().cursor() as cursor:
+            cursor.execute(self.RECORD_SQL, [
+                tenant_id, reference, status, processed_lines, total_lines, timezone.now(),
+            ])
+
+
+class StockTransferProgress(models.Model):
+    """
+    Progress of a transfer document, polled while its lines are moved
+    Written on the autocommit side connection, so every process sees it
+    before the transfer commits; a document reusing a reference starts over.
+    """
+    STATUS_CHOICES = [
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='stock_transfer_progress')
+    reference = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    processed_lines = models.IntegerField(default=0)
+    total_lines = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    objects = StockTransferProgressManager()
+
+    class Meta:
+        db_table = 'inventory_stocktransferprogress'
+        verbose_name = 'Stock Transfer Progress'
+        verbose_name_plural = 'Stock Transfer Progress'
+        unique_together = [['tenant', 'reference']]
+
+    def __str__(self):
+        return f"{self.reference}: {self.processed_lines}/{self.total_lines} ({self.status})"
+
+
+class StockOpeningBalanceManager(models.Manager):
+    def latest_for(self, product_id, outlet_id, on_or_before=None):
+        """Latest opening balance for a product/outlet, optionally no later than a date."""
+        balances = self.filter(product_id=product_id, outlet_id=outlet_id)
+        if on_or_before is not None:
+            balances = balances.filter(period_start__lte=on_or_before)
+        return balances.order_by('-period_start').first()
+
+    def nearest_boundary(self, tenant_id, outlet_id, on_or_before):
+        """Latest compacted period_start for an outlet that is no later than on_or_before."""
+        return self.filter(
+            tenant_id=tenant_id, outlet_id=outlet_id, period_start__lte=on_or_before
+        ).aggregate(period_start=models.Max('period_start'))['period_start']
+
+    def balances_at(self, tenant_id, outlet_id, period_start):
+        """{product_id: balance} for an outlet at one compacted boundary."""
+        if period_start is None:
+            return {}
+        return {
+            balance.product_id: balance
+            for balance in self.filter(tenant_id=tenant_id, outlet_id=outlet_id, period_start=period_start)
+        }
+
+    def compact(self, tenant_id, period_start):
+        """Write opening balances for every product/outlet of a tenant at a month boundary.
+
+        Each balance is the previous boundary's balance plus the movements since
+        it, so compaction only reads one month of ledger once the first
+        boundary exists. Re-running a boundary overwrites it.
+
+        Returns the number of balances written.
+        """
+        from apps.inventory.ledger_partitions import boundary
+
+        previous_start = self.filter(
+            tenant_id=tenant_id, period_start__lt=period_start
+        ).aggregate(period_start=models.Max('period_start'))['period_start']
+
+        rows = {}
+        if previous_start is not None:
+            for balance in self.filter(tenant_id=tenant_id, period_start=previous_start):
+                rows[(balance.product_id, balance.outlet_id)] = _ledger_row({}, balance)
+
+        movements = StockMovement.objects.filter(
+            tenant_id=tenant_id,
+            product__isnull=False,
+            created_at__lt=boundary(period_start),
+        )
+        if previous_start is not None:
+            movements = movements.filter(created_at__gte=boundary(previous_start))
+        annotations, aggregates = _ledger_aggregates()
+        for totals in (
+            movements.annotate(**annotations)
+            .values('product_id', 'outlet_id')
+            .annotate(**aggregates)
+            .order_by()
+        ):
+            key = (totals['product_id'], totals['outlet_id'])
+            rows[key] = _ledger_row(totals, rows.get(key))
+
+        self.bulk_create(
+            [
+                self.model(tenant_id=tenant_id, product_id=product_id, outlet_id=outlet_id,
+                           period_start=period_start, **values)
+                for (product_id, outlet_id), values in sorted(rows.items())
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['product', 'outlet', 'period_start'],
+            update_fields=['quantity', 'acquired_quantity', 'acquired_cost', 'movement_count'],
+        )
+        return len(rows)
+
+
+class StockOpeningBalance(models.Model):
+    """
+    Cumulative StockMovement totals per product/outlet before a month boundary.
+    Written by compact_stock_ledger so readers start from the nearest boundary
+    instead of row zero, and so ledger partitions before it can be detached.
+    """
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='stock_opening_balances')
+    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, related_name='stock_opening_balances')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_opening_balances')
+    period_start = models.DateField(help_text="Month boundary; totals cover movements created before this date")
+    quantity = models.IntegerField(default=0)
+    acquired_quantity = models.IntegerField(default=0)
+    acquired_cost = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    movement_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StockOpeningBalanceManager()
+
+    class Meta:
+        db_table = 'inventory_stockopeningbalance'
+        verbose_name = 'Stock Opening Balance'
+        verbose_name_plural = 'Stock Opening Balances'
+        unique_together = [['product', 'outlet', 'period_start']]
+        indexes = [
+            models.Index(fields=['tenant', 'period_start']),
+            models.Index(fields=['outlet', 'period_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.outlet_id} opening {self.period_start}: {self.quantity}"
+
+
+class LocationStockManager(models.Manager):
+    BATCH_STATE_FIELDS = ('sellable_quantity', 'expired_quantity', 'next_expiry_date', 'batch_tracked')
+
+    def batch_state(self, product_ids, outlet_id, today=None):
+        """Aggregate batch columns for products at one outlet: {product_id: {field: value}}."""
+        today = today or timezone.now().date()
+        sellable = Q(expiry_date__gt=today, quantity__gt=0)
+        state = {
+            product_id: {
+                'sellable_quantity': 0,
+                'expired_quantity': 0,
+                'next_expiry_date': None,
+                'batch_tracked': False,
+            }
+            for product_id in product_ids
+        }
+        for row in (
+            Batch.objects.filter(product_id__in=state, outlet_id=outlet_id)
+            .values('product_id')
+            .annotate(
+                sellable=Sum('quantity', filter=sellable),
+                expired=Sum('quantity', filter=Q(expiry_date__lte=today, quantity__gt=0)),
+                next_expiry=Min('expiry_date', filter=sellable),
+            )
+            .order_by()
+        ):
+            state[row['product_id']] = {
+                'sellable_quantity': int(row['sellable'] or 0),
+                'expired_quantity': int(row['expired'] or 0),
+                'next_expiry_date': row['next_expiry'],
+                'batch_tracked': True,
+            }
+        return state
+
+    def refresh_batch_state(self, product_ids, outlet_id, today=None):
+        """Recompute the batch columns for products at one outlet.
+
+        Creates the LocationStock row for batch-tracked products that do not
+        have one yet, so every product with batches has a row to read.
+        """
+        product_ids = {product_id for product_id in product_ids if product_id is not None}
+        if not product_ids:
+            return 0
+        state = self.batch_state(product_ids, outlet_id, today=today)
+
+        rows = {row.product_id: row for row in self.filter(product_id__in=product_ids, outlet_id=outlet_id)}
+        missing = [product_id for product_id, values in state.items() if values['batch_tracked'] and product_id not in rows]
+        if missing:
+            tenants = dict(Product.objects.filter(id__in=missing).values_list('id', 'tenant_id'))
+            self.bulk_create(
+                [
+                    self.model(tenant_id=tenants[product_id], product_id=product_id, outlet_id=outlet_id, quantity=0)
+                    for product_id in missing
+                ],
+                ignore_conflicts=True,
+            )
+            rows.update({
+                row.product_id: row for row in self.filter(product_id__in=missing, outlet_id=outlet_id)
+            })
+
+        for product_id, row in rows.items():
+            for field, value in state[product_id].items():
+                setattr(row, field, value)
+        self.bulk_update(list(rows.values()), self.BATCH_STATE_FIELDS, batch_size=500)
+        self.sync_low_stock(rows, outlet_id)
+        return len(rows)
+
+    def sync_low_stock(self, product_ids, outlet_id=None, notify=True):
+        """Flip is_low_stock on rows whose sellable stock crossed the product threshold.
+
+        Edge-triggered: only rows whose flag changes are written, and a
+        notification is queued (on commit) only when a row becomes low, so
+        repeated sales below the threshold do not re-alert.
+
+        Args:
+            product_ids: iterable of product ids
+            outlet_id: restrict to one outlet (default: every outlet of the products)
+            notify: queue low-stock notifications for rows that became low
+
+        Returns:
+            list of (product_id, outlet_id, is_low_stock, sellable_stock) transitions
+        """
+        product_ids = {product_id for product_id in product_ids if product_id is not None}
+        if not product_ids:
+            return []
+        rows = self.filter(product_id__in=product_ids)
+        if outlet_id is not None:
+            rows = rows.filter(outlet_id=outlet_id)
+
+        rows = rows.values_list(
+            'id', 'product_id', 'outlet_id', 'quantity', 'sellable_quantity', 'batch_tracked', 'is_low_stock',
+            'product__low_stock_threshold',
+        )
+        raised, cleared, transitions = [], [], []
+        for row_id, product_id, row_outlet_id, quantity, sellable, batch_tracked, is_low, threshold in rows:
+            # Same precedence as get_sellable_stock_many
+            stock = sellable if batch_tracked else quantity
+            low = threshold > 0 and stock <= threshold
+            if low == is_low:
+                continue
+            (raised if low else cleared).append(row_id)
+            transitions.append((product_id, row_outlet_id, low, stock))
+
+        now = timezone.now()
+        if raised:
+            self.filter(id__in=raised).update(is_low_stock=True, low_stock_changed_at=now)
+        if cleared:
+            self.filter(id__in=cleared).update(is_low_stock=False, low_stock_changed_at=now)
+
+        alerts = [(product_id, alert_outlet_id, stock) for product_id, alert_outlet_id, low, stock in transitions if low]
+        if notify and alerts:
+            transaction.on_commit(lambda: _notify_low_stock(alerts))
+        return transitions
+
+    def roll_forward_expiry(self, today=None, tenant_id=None, outlet_id=None, chunk_size=500):
+        """Refresh rows whose next sellable batch has expired since they were last computed.
+
+        Returns the number of rows refreshed.
+        """
+        today = today or timezone.now().date()
+        stale = self.filter(batch_tracked=True, next_expiry_date__lte=today)
+        if tenant_id:
+            stale = stale.filter(tenant_id=tenant_id)
+        if outlet_id:
+            stale = stale.filter(outlet_id=outlet_id)
+
+        by_outlet = {}
+        for stale_outlet_id, product_id in stale.values_list('outlet_id', 'product_id').order_by('outlet_id', 'product_id'):
+            by_outlet.setdefault(stale_outlet_id, []).append(product_id)
+
+        refreshed = 0
+        for stale_outlet_id, product_ids in by_outlet.items():
+            for start in range(0, len(product_ids), chunk_size):
+                with transaction.atomic():
+                    refreshed += self.refresh_batch_state(
+                        product_ids[start:start + chunk_size], stale_outlet_id, today=today
+                    )
+        return refreshed
+
+
+def _notify_low_stock(alerts):
+    """Create one low-stock notification per (product, outlet) that became low."""
+    from apps.notifications.services import NotificationService
+
+    products = Product.objects.select_related('tenant').in_bulk({product_id for product_id, _, _ in alerts})
+    outlets = Outlet.objects.in_bulk({outlet_id for _, outlet_id, _ in alerts})
+    for product_id, outlet_id, stock in alerts:
+        NotificationService.notify_low_stock(products[product_id], outlets[outlet_id], current_stock=stock)
+
+
 class LocationStock(models.Model):
     """
     Stock level per location - tracks current inventory quantity
+    Batch-derived columns (sellable/expired/next expiry) are kept current by the
+    stock helpers, Batch save/delete signals and the daily expiry roll-forward
     """
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='location_stocks')
     outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, related_name='location_stocks')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='location_stocks', null=True, blank=True)
     quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)], help_text="Current stock quantity at this location (legacy - prefer using get_available_quantity())")
+    sellable_quantity = models.IntegerField(default=0, help_text="Quantity in non-expired batches")
+    expired_quantity = models.IntegerField(default=0, help_text="Quantity left in expired batches")
+    next_expiry_date = models.DateField(null=True, blank=True, help_text="Earliest expiry among sellable batches; the row is stale once this date is reached")
+    batch_tracked = models.BooleanField(default=False, help_text="Product has batch rows at this outlet")
+    is_low_stock = models.BooleanField(default=False, help_text="Sellable stock is at or below the product's low stock threshold")
+    low_stock_changed_at = models.DateTimeField(null=True, blank=True, help_text="When is_low_stock last flipped")
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = LocationStockManager()
     
     class Meta:
         db_table = 'inventory_locationstock'
@@ -199,6 +766,12 @@ class LocationStock(models.Model):
             models.Index(fields=['outlet']),
             models.Index(fields=['product']),
             models.Index(fields=['tenant']),
+            models.Index(fields=['next_expiry_date']),
+            models.Index(
+                fields=['outlet', 'product'],
+                condition=Q(is_low_stock=True),
+                name='inventory_ls_low_stock_idx',
+            ),
         ]
 
     def __str__(self):
@@ -206,31 +779,32 @@ class LocationStock(models.Model):
     
     def get_available_quantity(self):
         """
-        Get available quantity from non-expired batches
+        Get available quantity from non-expired batches of this product
         This is the AUTHORITATIVE quantity for inventory checks
         """
         today = timezone.now().date()
-        batches = Batch.objects.filter(
-            outlet=self.outlet,
+        return Batch.objects.filter(
+            product_id=self.product_id,
+            outlet_id=self.outlet_id,
             expiry_date__gt=today,
             quantity__gt=0
-        )
-        return sum(batch.quantity for batch in batches)
+        ).aggregate(total=Sum('quantity'))['total'] or 0
     
     def get_total_quantity_including_expired(self):
-        """Get total quantity including expired batches"""
-        batches = Batch.objects.filter(
-            outlet=self.outlet,
+        """Get total quantity of this product including expired batches"""
+        return Batch.objects.filter(
+            product_id=self.product_id,
+            outlet_id=self.outlet_id,
             quantity__gt=0
-        )
-        return sum(batch.quantity for batch in batches)
+        ).aggregate(total=Sum('quantity'))['total'] or 0
     
     def get_expiring_soon(self, days=30):
-        """Get batches expiring within specified days"""
+        """Get batches of this product expiring within specified days"""
         from datetime import timedelta
         today = timezone.now().date()
         threshold = today + timedelta(days=days)
         return Batch.objects.filter(
+            product_id=self.product_id,
             outlet=self.outlet,
             expiry_date__gt=today,
             expiry_date__lte=threshold,
@@ -257,6 +831,7 @@ class StockTakeItem(models.Model):
     counted_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='counted_stock_take_items')
     difference = models.IntegerField(default=0)
     notes = models.TextField(blank=True)
+    applied_at = models.DateTimeField(null=True, blank=True, help_text="When the count was applied to stock on completion")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
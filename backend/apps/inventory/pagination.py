@@ -0,0 +1,158 @@
+"""
+Keyset pagination for ledger-style listings
+Pages are addressed by the last row seen instead of an OFFSET, so page N
+costs the same as page 1 and no COUNT(*) runs over the ledger. Each view
+declares a fixed two-column keyset ordering, e.g. ('-created_at', '-id');
+the second column must be unique so ties on the first are broken. Keyset
+columns must not change after insert, or rows move across the cursor
+between pages and are skipped or repeated.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a (column, id) keyset
+
+    Views set ``keyset_ordering`` (default ('-created_at', '-id')), may list
+    ``ordering_fields`` a client can pick with ``?ordering=`` (the id
+    tiebreak follows its direction), and may define
+    ``get_keyset_total(queryset, request)`` returning a total from maintained
+    snapshot tables; it is only called for ``?include_total=true``.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 500
+    invalid_cursor_message = 'Invalid cursor'
+    default_ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        self.model = queryset.model
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering if not reverse else tuple(self._flip(field) for field in self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = self._after(queryset, ordering, position)
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = (position is not None) if not reverse else has_more
+        self.first_row = rows[0] if rows else None
+        self.last_row = rows[-1] if rows else None
+
+        self.total = None
+        if str(request.query_params.get('include_total', '')).lower() in ('1', 'true', 'yes'):
+            get_total = getattr(view, 'get_keyset_total', None)
+            self.total = get_total(queryset, request) if get_total else None
+        return rows
+
+    def get_paginated_response(self, data):
+        body = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.total is not None:
+            body['count'] = self.total
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, request, view):
+        requested = request.query_params.get('ordering', '').strip()
+        if requested and requested.lstrip('-') in getattr(view, 'ordering_fields', ()):
+            return (requested, '-id' if requested.startswith('-') else 'id')
+        return tuple(getattr(view, 'keyset_ordering', self.default_ordering))
+
+    def get_page_size(self, request):
+        page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 50
+        try:
+            requested = int(request.query_params.get(self.page_size_query_param, page_size))
+        except (TypeError, ValueError):
+            requested = page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or self.last_row is None:
+            return None
+        return self._link(self.last_row, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_row is None:
+            return None
+        return self._link(self.first_row, reverse=True)
+
+    def decode_cursor(self, request):
+        """Return (position values or None, reverse) from the cursor query param."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError(values)
+            position = tuple(
+                self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            )
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        values = []
+        for field in self.ordering:
+            value = getattr(row, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = {'p': values}
+        if reverse:
+            payload['r'] = 1
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+    def _link(self, row, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(queryset, ordering, position):
+        """Rows strictly after position in the given ordering, as one index range."""
+        (first, tiebreak), (first_value, tiebreak_value) = ordering, position
+        first_name, tiebreak_name = first.lstrip('-'), tiebreak.lstrip('-')
+        if first.startswith('-'):
+            queryset = queryset.filter(**{f'{first_name}__lte': first_value})
+        else:
+            queryset = queryset.filter(**{f'{first_name}__gte': first_value})
+        tie_lookup = 'gte' if tiebreak.startswith('-') else 'lte'
+        return queryset.exclude(**{first_name: first_value, f'{tiebreak_name}__{tie_lookup}': tiebreak_value})
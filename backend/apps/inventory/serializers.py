@@ -137,8 +137,9 @@ class StockTakeItemSerializer(serializers.ModelSerializer):
         model = StockTakeItem
         fields = ('id', 'stock_take', 'product', 'product_id', 'product_name', 
                   'expected_quantity', 'counted_quantity', 'is_counted', 'counted_at', 'counted_by',
-                  'difference', 'notes', 'created_at', 'updated_at')
-        read_only_fields = ('id', 'stock_take', 'difference', 'product_name', 'counted_at', 'counted_by', 'created_at', 'updated_at')
+                  'difference', 'notes', 'applied_at', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'stock_take', 'difference', 'product_name', 'counted_at', 'counted_by',
+                            'applied_at', 'created_at', 'updated_at')
 
 
 class LocationStockSerializer(serializers.ModelSerializer):
@@ -150,8 +151,11 @@ class LocationStockSerializer(serializers.ModelSerializer):
     class Meta:
         model = LocationStock
         fields = ('id', 'tenant', 'product', 'product_id', 'outlet', 'outlet_name', 
-                  'quantity', 'product_name', 'updated_at')
-        read_only_fields = ('id', 'tenant', 'updated_at', 'product_name', 'outlet_name')
+                  'quantity', 'sellable_quantity', 'expired_quantity', 'next_expiry_date',
+                  'batch_tracked', 'is_low_stock', 'low_stock_changed_at', 'product_name', 'updated_at')
+        read_only_fields = ('id', 'tenant', 'updated_at', 'product_name', 'outlet_name',
+                            'sellable_quantity', 'expired_quantity', 'next_expiry_date', 'batch_tracked',
+                            'is_low_stock', 'low_stock_changed_at')
 
 
 class StockTakeSerializer(serializers.ModelSerializer):
@@ -173,8 +177,9 @@ class StockTakeSerializer(serializers.ModelSerializer):
     class Meta:
         model = StockTake
         fields = ('id', 'tenant', 'outlet', 'outlet_name', 'user', 'user_name', 'operating_date', 'status',
-              'description', 'items', 'created_at', 'completed_at')
-        read_only_fields = ('id', 'tenant', 'user', 'status', 'created_at', 'completed_at')
+              'description', 'items', 'created_at', 'completed_at', 'completion_total', 'completion_processed')
+        read_only_fields = ('id', 'tenant', 'user', 'status', 'created_at', 'completed_at',
+                            'completion_total', 'completion_processed')
     
     def validate_outlet(self, value):
         """Validate that outlet belongs to the tenant"""
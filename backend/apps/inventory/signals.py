@@ -3,5 +3,49 @@ Django signals for inventory management
 """
 import logging
 
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.inventory.models import Batch, LocationStock
+from apps.products.models import Product
+
 logger = logging.getLogger(__name__)
 
+BATCH_STATE_SOURCE_FIELDS = frozenset({'quantity', 'expiry_date', 'product', 'outlet'})
+
+
+@receiver(post_save, sender=Batch)
+def refresh_location_stock_on_batch_save(sender, instance, update_fields=None, **kwargs):
+    """Keep LocationStock batch columns current when a batch quantity or expiry changes."""
+    if update_fields is not None and not BATCH_STATE_SOURCE_FIELDS.intersection(update_fields):
+        return
+    if instance.product_id is None:
+        return
+    LocationStock.objects.refresh_batch_state([instance.product_id], instance.outlet_id)
+
+
+@receiver(post_delete, sender=Batch)
+def refresh_location_stock_on_batch_delete(sender, instance, origin=None, **kwargs):
+    """Refresh after a batch is deleted directly; cascades from product/outlet/tenant deletes are skipped."""
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin is not None and origin_model is not Batch:
+        return
+    if instance.product_id is None:
+        return
+    LocationStock.objects.refresh_batch_state([instance.product_id], instance.outlet_id)
+
+
+@receiver(post_save, sender=LocationStock)
+def sync_low_stock_on_location_stock_save(sender, instance, **kwargs):
+    """Re-evaluate the low-stock flag when a location stock row is saved directly."""
+    if instance.product_id is None:
+        return
+    LocationStock.objects.sync_low_stock([instance.product_id], instance.outlet_id)
+
+
+@receiver(post_save, sender=Product)
+def sync_low_stock_on_threshold_change(sender, instance, created=False, update_fields=None, **kwargs):
+    """A threshold edit can move every outlet of the product across the line."""
+    if created or (update_fields is not None and 'low_stock_threshold' not in update_fields):
+        return
+    LocationStock.objects.sync_low_stock([instance.id])
@@ -3,11 +3,13 @@ Stock management helper functions
 Handles batch-aware stock operations with expiry tracking
 """
 import logging
+from collections import defaultdict
 from django.db import transaction
 from django.utils import timezone
 from decimal import Decimal
 from datetime import timedelta
-from apps.inventory.models import Batch, LocationStock, StockMovement
+from apps.inventory.models import Batch, LocationStock, StockMovement, StockLedgerSnapshot, StockTake, StockTakeItem
+from apps.inventory.stock_locks import lock_products
 
 logger = logging.getLogger(__name__)
 
@@ -44,39 +46,24 @@ def _resolve_product(product=None, variation=None):
 
 
 def _get_ledger_quantity_and_cost(product, outlet):
-    """Return current stock quantity and positive-flow acquisition basis from immutable movement deltas."""
-    movements = StockMovement.objects.filter(
-        product=product,
-        outlet=outlet,
-    ).order_by('created_at')
-
-    total_quantity_delta = 0
-    total_acquired_qty = 0
-    total_acquired_cost = Decimal('0.00')
-    negative_types = {'sale', 'transfer_out', 'damage', 'expiry'}
-
-    for movement in movements:
-        quantity = int(movement.quantity or 0)
-        quantity_delta = movement.quantity_delta
-        if quantity_delta is None:
-            # Backward-compatible fallback for very old rows.
-            quantity_delta = -quantity if movement.movement_type in negative_types else quantity
-
-        quantity_delta = int(quantity_delta)
-        total_quantity_delta += quantity_delta
-
-        if quantity_delta > 0:
-            unit_cost = _coerce_decimal(
-                movement.unit_cost
-                if movement.unit_cost is not None
-                else movement.batch.cost_price if movement.batch_id and movement.batch and movement.batch.cost_price is not None
-                else product.cost
-            )
-            total_acquired_qty += quantity_delta
-            total_acquired_cost += unit_cost * Decimal(quantity_delta)
+    """Return current stock quantity and positive-flow acquisition basis from the ledger snapshot.
+
+    The snapshot is kept in step with every StockMovement insert, so this is a
+    single-row read regardless of how long the ledger is.
+    """
+    snapshot = StockLedgerSnapshot.objects.for_stock(product, outlet)
+    current_qty = max(0, int(snapshot.quantity))
+    return current_qty, _coerce_decimal(snapshot.acquired_cost), int(snapshot.acquired_quantity)
+
 
-    current_qty = max(0, total_quantity_delta)
-    return current_qty, total_acquired_cost, total_acquired_qty
+def rebuild_ledger_snapshot(product, outlet):
+    """Re-derive the ledger snapshot for a product/outlet from every StockMovement row.
+
+    Use for audits or after repairing ledger rows; normal stock writes keep the
+    snapshot current incrementally.
+    """
+    product = _resolve_product(product=product)
+    return StockLedgerSnapshot.objects.rebuild(product, outlet)
 
 
 def get_stock_valuation(product, outlet):
@@ -129,7 +116,10 @@ def rebuild_stock_state(product, outlet, user=None, reason='Stock state rebuild'
         defaults={'quantity': 0},
     )
     location_stock.quantity = valuation['quantity']
-    location_stock.save(update_fields=['quantity', 'updated_at'])
+    batch_state = LocationStock.objects.batch_state([product.id], outlet.id)[product.id]
+    for field, value in batch_state.items():
+        setattr(location_stock, field, value)
+    location_stock.save(update_fields=['quantity', *batch_state, 'updated_at'])
 
     from apps.products.models import Product as _Product
     _Product.objects.filter(id=product.id).update(stock=valuation['quantity'])
@@ -137,6 +127,64 @@ def rebuild_stock_state(product, outlet, user=None, reason='Stock state rebuild'
     return valuation
 
 
+def rebuild_stock_state_many(products, outlet):
+    """Set-based rebuild_stock_state for many products at one outlet.
+
+    Reads the ledger snapshots and batch state in one query each, then writes
+    LocationStock and Product.stock with one bulk update each.
+
+    Returns:
+        dict mapping product id to its rebuilt quantity
+    """
+    from apps.products.models import Product as _Product
+
+    products = {product.id: product for product in (_resolve_product(product=item) for item in products)}
+    if not products:
+        return {}
+
+    snapshots = {
+        snapshot.product_id: snapshot
+        for snapshot in StockLedgerSnapshot.objects.filter(product_id__in=products, outlet=outlet)
+    }
+    for product_id in products.keys() - snapshots.keys():
+        snapshots[product_id] = StockLedgerSnapshot.objects.for_stock(products[product_id], outlet)
+    batch_state = LocationStock.objects.batch_state(list(products), outlet.id)
+
+    quantities = {}
+    for product_id, snapshot in snapshots.items():
+        if int(snapshot.acquired_quantity) > 0:
+            quantities[product_id] = max(0, int(snapshot.quantity))
+        else:
+            quantities[product_id] = batch_state[product_id]['sellable_quantity']
+
+    LocationStock.objects.bulk_create(
+        [
+            LocationStock(product_id=product_id, outlet=outlet, tenant_id=products[product_id].tenant_id, quantity=0)
+            for product_id in sorted(products)
+        ],
+        ignore_conflicts=True,
+    )
+    now = timezone.now()
+    location_stocks = list(
+        LocationStock.objects.filter(product_id__in=products, outlet=outlet).order_by('product_id')
+    )
+    for location_stock in location_stocks:
+        location_stock.quantity = quantities[location_stock.product_id]
+        for field, value in batch_state[location_stock.product_id].items():
+            setattr(location_stock, field, value)
+        location_stock.updated_at = now
+    LocationStock.objects.bulk_update(
+        location_stocks, ['quantity', *LocationStock.objects.BATCH_STATE_FIELDS, 'updated_at'], batch_size=500
+    )
+
+    LocationStock.objects.sync_low_stock(products, outlet.id)
+
+    for product_id, product in products.items():
+        product.stock = quantities[product_id]
+    _Product.objects.bulk_update(list(products.values()), ['stock'], batch_size=500)
+    return quantities
+
+
 def get_sellable_stock(product, outlet):
     """Return sellable stock for a product at an outlet.
 
@@ -144,27 +192,87 @@ def get_sellable_stock(product, outlet):
     no valid batches, use outlet-level location stock. Do not fall back to
     product-level legacy stock.
     """
+    product = _resolve_product(product=product)
+    return get_sellable_stock_many([product], outlet).get(product.id, 0)
+
+
+def get_sellable_stock_many(products, outlet):
+    """Return {product_id: sellable_qty} for many products at one outlet.
+
+    Applies the same precedence as get_sellable_stock. Reads the maintained
+    LocationStock columns in one query; only rows whose next sellable batch
+    has expired since they were computed are re-derived from batches.
+
+    Args:
+        products: iterable of Product instances or product ids
+        outlet: Outlet instance or outlet id
+
+    Returns:
+        dict mapping every requested product id to its sellable quantity
+    """
+    product_ids = {
+        item if isinstance(item, int) else _resolve_product(product=item).id
+        for item in products
+    }
+    if not product_ids:
+        return {}
+
+    outlet_id = outlet if isinstance(outlet, int) else outlet.id
     today = timezone.now().date()
-    batches = Batch.objects.filter(
-        product=product,
-        outlet=outlet,
-        expiry_date__gt=today,
-        quantity__gt=0
-    )
-    batch_total = sum(batch.quantity for batch in batches)
 
-    if batch_total > 0:
-        return batch_total
+    stock = dict.fromkeys(product_ids, 0)
+    stale_ids = []
+    for product_id, quantity, sellable_quantity, batch_tracked, next_expiry_date in (
+        LocationStock.objects.filter(product_id__in=product_ids, outlet_id=outlet_id)
+        .values_list('product_id', 'quantity', 'sellable_quantity', 'batch_tracked', 'next_expiry_date')
+    ):
+        if not batch_tracked:
+            stock[product_id] = quantity
+        elif next_expiry_date is not None and next_expiry_date <= today:
+            stale_ids.append(product_id)
+        else:
+            stock[product_id] = sellable_quantity
 
-    has_any_batches = Batch.objects.filter(product=product, outlet=outlet).exists()
-    if has_any_batches:
-        return 0
+    if stale_ids:
+        # The daily roll-forward has not reached these rows yet
+        for product_id, state in LocationStock.objects.batch_state(stale_ids, outlet_id, today=today).items():
+            stock[product_id] = state['sellable_quantity']
 
-    location_stock = LocationStock.objects.filter(product=product, outlet=outlet).values_list('quantity', flat=True).first()
-    if location_stock is not None:
-        return location_stock
+    return stock
 
-    return 0
+
+def get_sellable_stock_totals(products):
+    """Return {product_id: sellable_qty summed over every outlet} for many products.
+
+    Same precedence as get_sellable_stock_many, read from LocationStock in one
+    query instead of one query per outlet.
+    """
+    product_ids = {
+        item if isinstance(item, int) else _resolve_product(product=item).id
+        for item in products
+    }
+    if not product_ids:
+        return {}
+
+    today = timezone.now().date()
+    totals = dict.fromkeys(product_ids, 0)
+    stale = {}
+    for product_id, outlet_id, quantity, sellable_quantity, batch_tracked, next_expiry_date in (
+        LocationStock.objects.filter(product_id__in=product_ids)
+        .values_list('product_id', 'outlet_id', 'quantity', 'sellable_quantity', 'batch_tracked', 'next_expiry_date')
+    ):
+        if not batch_tracked:
+            totals[product_id] += quantity
+        elif next_expiry_date is not None and next_expiry_date <= today:
+            stale.setdefault(outlet_id, []).append(product_id)
+        else:
+            totals[product_id] += sellable_quantity
+
+    for outlet_id, stale_ids in stale.items():
+        for product_id, state in LocationStock.objects.batch_state(stale_ids, outlet_id, today=today).items():
+            totals[product_id] += state['sellable_quantity']
+
+    return totals
 
 
 def get_available_stock(unit, outlet):
@@ -224,11 +332,11 @@ def get_batch_for_sale(product, outlet, required_quantity):
 
 
 @transaction.atomic
-def deduct_stock(product=None, outlet=None, quantity=None, user=None, reference_id='', reason='', movement_type='sale', variation=None):
+def deduct_stock(product=None, outlet=None, quantity=None, user=None, reference_id='', reason='', movement_type='sale', variation=None, with_cost=False):
     """
     Deduct stock from batches using FIFO expiry logic
     UNITS ONLY ARCHITECTURE: Changed from variation-based to product-based
-    Optimized to reduce database queries (batch updates + movements collected then bulk-created)
+    Single-line wrapper around deduct_stock_for_lines
     
     Args:
         product: Product instance
@@ -237,9 +345,11 @@ def deduct_stock(product=None, outlet=None, quantity=None, user=None, reference_
         user: User instance
         reference_id: str - reference to sale/order
         reason: str - reason for deduction
+        with_cost: bool - also return the cost of the stock consumed
     
     Returns:
-        list of (Batch, quantity_deducted) tuples
+        list of (Batch, quantity_deducted) tuples, or
+        (deductions, Decimal cost consumed) when with_cost is set
     
     Raises:
         ValueError: If insufficient stock
@@ -249,114 +359,242 @@ def deduct_stock(product=None, outlet=None, quantity=None, user=None, reference_
     if quantity is None:
         raise TypeError('quantity is required')
 
-    today = timezone.now().date()
-    remaining = quantity
-    deductions = []
-    batches_to_update = []
-    movements_to_create = []
-    
-    # Get batches ordered by expiry (FIFO)
-    batches = Batch.objects.select_for_update().filter(
-        product=product,
-        outlet=outlet,
-        expiry_date__gt=today,
-        quantity__gt=0
-    ).order_by('expiry_date', 'created_at')
+    deductions = deduct_stock_for_lines(
+        [(product, quantity)],
+        outlet,
+        user=user,
+        reference_id=reference_id,
+        reason=reason,
+        movement_type=movement_type,
+    )[0]
+    if with_cost:
+        return deductions, deduction_cost(deductions, product)
+    return deductions
 
-    # Check total available. If a legacy/non-expiry product has no batches,
-    # fall back to outlet projections so checkout matches the stock value shown in POS.
-    batch_total_available = sum(b.quantity for b in batches)
-    if batch_total_available < quantity and not batches.exists():
-        total_available = get_sellable_stock(product, outlet)
-        if total_available < quantity:
-            raise ValueError(
-                f"Insufficient stock for product. "
-                f"Available: {total_available}, Requested: {quantity}"
-            )
 
-        location_stock, _ = LocationStock.objects.get_or_create(
-            product=product,
-            outlet=outlet,
-            tenant=product.tenant,
-            defaults={'quantity': 0}
+def deduction_cost(line_deductions, product):
+    """
+    Cost of the stock consumed by one deduct_stock_for_lines line
+    Each batch slice is priced exactly as its StockMovement's unit_cost:
+    the batch cost price, falling back to product cost for batches without
+    one and for projection-only stock.
+    
+    Args:
+        line_deductions: list of (Batch or None, quantity_deducted) tuples
+        product: Product instance the line was deducted for
+    
+    Returns:
+        Decimal total cost, unrounded
+    """
+    total = Decimal('0')
+    for batch, quantity in line_deductions:
+        cost_price = batch.cost_price if batch is not None and batch.cost_price is not None else product.cost
+        total += _coerce_decimal(cost_price) * Decimal(int(quantity))
+    return total
+
+
+class InsufficientStockError(ValueError):
+    """Raised by deduct_stock_for_lines before any write when a line cannot be filled."""
+
+    def __init__(self, product, available, requested, line_index=0):
+        self.product = product
+        self.available = available
+        self.requested = requested
+        self.line_index = line_index
+        super().__init__(
+            f"Insufficient stock for {product.name}. "
+            f"Available: {available}, Requested: {requested}"
         )
-        next_quantity = max(0, int(location_stock.quantity or 0) - quantity)
-        LocationStock.objects.filter(id=location_stock.id).update(quantity=next_quantity)
-        location_stock.quantity = next_quantity
 
-        from apps.products.models import Product as _Product
-        next_product_stock = max(0, int(getattr(product, 'stock', 0) or 0) - quantity)
-        _Product.objects.filter(id=product.id).update(stock=next_product_stock)
-        product.stock = next_product_stock
 
-        StockMovement.objects.create(
-            tenant=product.tenant,
-            batch=None,
-            product=product,
-            outlet=outlet,
-            user=user,
-            movement_type=movement_type,
-            quantity=quantity,
-            reference_id=reference_id,
-            reason=reason or f"{movement_type.title()} {reference_id}"
-        )
+@transaction.atomic
+def deduct_stock_for_lines(lines, outlet, user=None, reference_id='', reason='', movement_type='sale'):
+    """
+    Deduct stock for a whole cart in one pass using FIFO expiry logic
+    
+    The cart's products are locked first through lock_products, then all
+    sellable batches in a single query ordered by product id, so concurrent
+    checkouts take row locks in the same order.
+    Allocation happens in memory across every line (a product may repeat),
+    then batches are written with one bulk_update, movements with one
+    bulk_create, and each batch-backed product's projections are refreshed
+    once. Products with no sellable batches use the outlet stock projection,
+    as deduct_stock always has.
+    
+    Args:
+        lines: iterable of (product, quantity) tuples or {'product', 'quantity'} dicts;
+            dicts may also carry per-line 'reference_id' and 'reason'
+        outlet: Outlet instance
+        user: User instance
+        reference_id: str - reference to sale/order
+        reason: str - reason for deduction
+        movement_type: str - StockMovement type for every line
+    
+    Returns:
+        list with one entry per input line, each a list of (Batch, quantity_deducted)
+        tuples ((None, quantity) for projection-only stock)
+    
+    Raises:
+        InsufficientStockError: If any line cannot be filled; nothing is written
+        StockLockContention: If the products could not be locked in time
+    """
+    from apps.products.models import Product as _Product
 
-        logger.info(
-            f"Deducted {quantity} from legacy stock projection for {product.name} at {outlet.name}"
-        )
-        return [(None, quantity)]
+    normalized = []
+    for line in lines:
+        line_reference, line_reason = reference_id, reason
+        if isinstance(line, dict):
+            product, quantity = line.get('product'), line.get('quantity')
+            line_reference = line.get('reference_id', reference_id)
+            line_reason = line.get('reason', reason)
+        else:
+            product, quantity = line
+        if quantity is None:
+            raise TypeError('quantity is required')
+        normalized.append((
+            _resolve_product(product=product),
+            int(quantity),
+            line_reference,
+            line_reason or f"{movement_type.title()} {line_reference}",
+        ))
+
+    products = {product.id: product for product, quantity, _, _ in normalized if quantity > 0}
+    if not products:
+        return [[] for _ in normalized]
+
+    lock_products(products)
+    today = timezone.now().date()
 
-    total_available = batch_total_available
-    if total_available < quantity:
-        raise ValueError(
-            f"Insufficient stock for product. "
-            f"Available: {total_available}, Requested: {quantity}"
-        )
-    
-    # Collect batch updates and movements (don't save individually)
-    for batch in batches:
-        if remaining <= 0:
-            break
-        
-        # Calculate deduction for this batch
-        deduct_qty = min(batch.quantity, remaining)
-        batch.quantity -= deduct_qty
-        
-        # Track for bulk update
-        batches_to_update.append(batch)
-        deductions.append((batch, deduct_qty))
-        remaining -= deduct_qty
-        
-        # Prepare stock movement (will be bulk created)
-        # Prepare stock movement (will be bulk created)
-        movements_to_create.append(
-            StockMovement(
-                tenant=product.tenant,
-                batch=batch,
-                product=product,
+    batches_by_product = defaultdict(list)
+    for batch in Batch.objects.select_for_update().filter(
+        product_id__in=products,
+        outlet=outlet,
+        expiry_date__gt=today,
+        quantity__gt=0
+    ).order_by('product_id', 'expiry_date', 'created_at', 'id'):
+        batches_by_product[batch.product_id].append(batch)
+
+    # Legacy/non-expiry products without sellable batches fall back to outlet
+    # projections so checkout matches the stock value shown in POS.
+    projection_ids = sorted(set(products) - set(batches_by_product))
+    projection_available = {}
+    location_stocks = {}
+    if projection_ids:
+        location_stocks = {
+            location_stock.product_id: location_stock
+            for location_stock in LocationStock.objects.select_for_update().filter(
+                product_id__in=projection_ids,
                 outlet=outlet,
-                user=user,
-                movement_type=movement_type,
-                quantity=deduct_qty,
-                quantity_delta=-deduct_qty,
-                unit_cost=_coerce_decimal(batch.cost_price if batch.cost_price is not None else product.cost),
-                reference_id=reference_id,
-                reason=reason or f"{movement_type.title()} {reference_id}"
+            ).order_by('product_id')
+        }
+        projection_available = get_sellable_stock_many(projection_ids, outlet)
+
+    deductions = []
+    batches_to_update = {}
+    movements_to_create = []
+    projection_consumed = defaultdict(int)
+
+    for line_index, (product, quantity, line_reference, movement_reason) in enumerate(normalized):
+        if quantity <= 0:
+            deductions.append([])
+            continue
+
+        batches = batches_by_product.get(product.id)
+        if batches is None:
+            available = projection_available.get(product.id, 0) - projection_consumed[product.id]
+            if available < quantity:
+                raise InsufficientStockError(product, available, quantity, line_index)
+            projection_consumed[product.id] += quantity
+            movements_to_create.append(
+                StockMovement(
+                    tenant_id=product.tenant_id,
+                    batch=None,
+                    product=product,
+                    outlet=outlet,
+                    user=user,
+                    movement_type=movement_type,
+                    quantity=quantity,
+                    quantity_delta=-quantity,
+                    unit_cost=_coerce_decimal(product.cost),
+                    reference_id=line_reference,
+                    reason=movement_reason
+                )
             )
-        )
-        
+            deductions.append([(None, quantity)])
+            continue
+
+        available = sum(batch.quantity for batch in batches)
+        if available < quantity:
+            raise InsufficientStockError(product, available, quantity, line_index)
+
+        remaining = quantity
+        line_deductions = []
+        for batch in batches:
+            if remaining <= 0:
+                break
+            if batch.quantity <= 0:
+                continue
+
+            deduct_qty = min(batch.quantity, remaining)
+            batch.quantity -= deduct_qty
+            batches_to_update[batch.id] = batch
+            line_deductions.append((batch, deduct_qty))
+            remaining -= deduct_qty
+
+            movements_to_create.append(
+                StockMovement(
+                    tenant_id=product.tenant_id,
+                    batch=batch,
+                    product=product,
+                    outlet=outlet,
+                    user=user,
+                    movement_type=movement_type,
+                    quantity=deduct_qty,
+                    quantity_delta=-deduct_qty,
+                    unit_cost=_coerce_decimal(batch.cost_price if batch.cost_price is not None else product.cost),
+                    reference_id=line_reference,
+                    reason=movement_reason
+                )
+            )
+
+            logger.info(
+                f"Deducting {deduct_qty} from batch {batch.batch_number} "
+                f"({product.name}) at {outlet.name}"
+            )
+        deductions.append(line_deductions)
+
+    # Every line is satisfiable; write the whole cart in bulk
+    if batches_to_update:
+        now = timezone.now()
+        for batch in batches_to_update.values():
+            batch.updated_at = now
+        Batch.objects.bulk_update(list(batches_to_update.values()), ['quantity', 'updated_at'], batch_size=100)
+
+    projection_stocks = []
+    projection_products = []
+    for product_id in projection_ids:
+        consumed = projection_consumed.get(product_id)
+        if not consumed:
+            continue
+        product = products[product_id]
+        location_stock = location_stocks[product_id]
+        location_stock.quantity = max(0, int(location_stock.quantity or 0) - consumed)
+        projection_stocks.append(location_stock)
+
+        product.stock = max(0, int(getattr(product, 'stock', 0) or 0) - consumed)
+        projection_products.append(product)
+
         logger.info(
-            f"Deducting {deduct_qty} from batch {batch.batch_number} "
-            f"({product.name}) at {outlet.name}"
+            f"Deducted {consumed} from legacy stock projection for {product.name} at {outlet.name}"
         )
-    
-    # Bulk update all batches (1 query instead of N queries)
-    Batch.objects.bulk_update(batches_to_update, ['quantity', 'updated_at'], batch_size=100)
+    if projection_stocks:
+        LocationStock.objects.bulk_update(projection_stocks, ['quantity'], batch_size=100)
+        _Product.objects.bulk_update(projection_products, ['stock'], batch_size=100)
+        LocationStock.objects.sync_low_stock([product.id for product in projection_products], outlet.id)
 
-    # Bulk create all stock movements (1 query instead of N queries)
     StockMovement.objects.bulk_create(movements_to_create, batch_size=100)
 
-    rebuild_stock_state(product, outlet, user=user, reason=reason or f"{movement_type.title()} stock deduction")
+    rebuild_stock_state_many([products[product_id] for product_id in batches_by_product], outlet)
 
     return deductions
 
@@ -386,6 +624,7 @@ def add_stock(product=None, outlet=None, quantity=None, batch_number=None, expir
         raise TypeError('quantity is required')
     if batch_number is None or expiry_date is None:
         raise TypeError('batch_number and expiry_date are required')
+    lock_products([product])
 
     # Get or create batch
     batch, created = Batch.objects.get_or_create(
@@ -434,6 +673,207 @@ def add_stock(product=None, outlet=None, quantity=None, batch_number=None, expir
     return batch
 
 
+UPSERT_BATCHES_SQL = """
+    INSERT INTO inventory_batch
+        (tenant_id, outlet_id, product_id, batch_number, expiry_date, quantity, cost_price, created_at, updated_at)
+    SELECT incoming.tenant_id, %s, incoming.product_id, incoming.batch_number, incoming.expiry_date,
+           incoming.quantity, incoming.cost_price, %s, %s
+    FROM unnest(%s::bigint[], %s::bigint[], %s::varchar[], %s::date[], %s::integer[], %s::numeric[])
+        AS incoming(tenant_id, product_id, batch_number, expiry_date, quantity, cost_price)
+    ORDER BY incoming.product_id, incoming.batch_number
+    ON CONFLICT (product_id, outlet_id, batch_number) DO UPDATE
+    SET quantity = inventory_batch.quantity + EXCLUDED.quantity,
+        cost_price = COALESCE(EXCLUDED.cost_price, inventory_batch.cost_price),
+        updated_at = EXCLUDED.updated_at
+    RETURNING id, product_id, batch_number, cost_price
+"""
+
+
+def upsert_batches(rows, outlet):
+    """Add quantities into batches at one outlet with a single INSERT ... ON CONFLICT.
+
+    Rows for the same product and batch number are merged first. Existing
+    batches gain the quantity and take the new cost price when one is given;
+    their expiry date is left unchanged, as in add_stock.
+
+    Args:
+        rows: iterable of dicts with product, batch_number, expiry_date, quantity, cost_price
+        outlet: Outlet instance
+
+    Returns:
+        dict mapping (product_id, batch_number) to (batch_id, cost_price)
+    """
+    from django.db import connection
+
+    merged = {}
+    for row in rows:
+        product = row['product']
+        key = (product.id, row['batch_number'])
+        entry = merged.setdefault(key, {
+            'tenant_id': product.tenant_id,
+            'expiry_date': row['expiry_date'],
+            'quantity': 0,
+            'cost_price': None,
+        })
+        entry['quantity'] += int(row['quantity'])
+        if row.get('cost_price') is not None:
+            entry['cost_price'] = _coerce_decimal(row['cost_price'])
+    if not merged:
+        return {}
+
+    keys = sorted(merged)
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_BATCHES_SQL, [
+            outlet.id, now, now,
+            [merged[key]['tenant_id'] for key in keys],
+            [key[0] for key in keys],
+            [key[1] for key in keys],
+            [merged[key]['expiry_date'] for key in keys],
+            [merged[key]['quantity'] for key in keys],
+            [merged[key]['cost_price'] for key in keys],
+        ])
+        return {
+            (product_id, batch_number): (batch_id, cost_price)
+            for batch_id, product_id, batch_number, cost_price in cursor.fetchall()
+        }
+
+
+@transaction.atomic
+def add_stock_for_lines(lines, outlet, user=None, reference_id='', reason='', movement_type='purchase'):
+    """
+    Add stock for many lines at one outlet in one pass
+    Set-based add_stock: batches are upserted in one statement, movements are
+    written with one bulk insert and each product is refreshed once.
+    
+    Args:
+        lines: iterable of dicts with product, quantity, batch_number, expiry_date
+            and optional cost_price, reference_id and reason
+        outlet: Outlet instance
+        user: User instance
+        reference_id: str - default reference for every line
+        reason: str - default reason for every line
+        movement_type: str - StockMovement type for every line
+    
+    Returns:
+        list of created StockMovement instances, one per line
+    """
+    lines = [dict(line, product=_resolve_product(product=line.get('product'))) for line in lines]
+    for line in lines:
+        if line.get('quantity') is None:
+            raise TypeError('quantity is required')
+        if line.get('batch_number') is None or line.get('expiry_date') is None:
+            raise TypeError('batch_number and expiry_date are required')
+
+    lock_products(line['product'] for line in lines)
+    batches = upsert_batches(lines, outlet)
+
+    movements = []
+    for line in lines:
+        product = line['product']
+        batch_id, batch_cost = batches[(product.id, line['batch_number'])]
+        quantity = int(line['quantity'])
+        unit_cost = line.get('cost_price')
+        if unit_cost is None:
+            unit_cost = batch_cost if batch_cost is not None else product.cost
+        line_reason = line.get('reason') or reason or f"{movement_type.title()} - Batch {line['batch_number']}"
+        movements.append(
+            StockMovement(
+                tenant_id=product.tenant_id,
+                batch_id=batch_id,
+                product=product,
+                outlet=outlet,
+                user=user,
+                movement_type=movement_type,
+                quantity=quantity,
+                quantity_delta=quantity,
+                unit_cost=_coerce_decimal(unit_cost),
+                reference_id=line.get('reference_id', reference_id),
+                reason=line_reason,
+            )
+        )
+    StockMovement.objects.bulk_create(movements, batch_size=500)
+
+    rebuild_stock_state_many([line['product'] for line in lines], outlet)
+
+    logger.info(f"Added {len(lines)} stock lines into {len(batches)} batches at {outlet.name}")
+    return movements
+
+
+def transfer_stock_lines(lines, source_outlet, destination_outlet, user=None, reference_id='', reason='Outlet transfer', chunk_size=200, progress=None):
+    """
+    Move many products between outlets in one transaction
+    Each chunk of lines is deducted FEFO at the source with
+    deduct_stock_for_lines and lands at the destination through
+    add_stock_for_lines, so batch numbers, expiry dates and cost prices
+    travel with the stock.
+    
+    Args:
+        lines: iterable of (product, quantity) tuples or {'product', 'quantity'} dicts
+        source_outlet: Outlet instance
+        destination_outlet: Outlet instance
+        user: User instance
+        reference_id: str - transfer document reference
+        reason: str - reason recorded on both sides
+        chunk_size: int - lines per deduct/add round
+        progress: callable(processed_lines, total_lines) called after each chunk (optional)
+    
+    Returns:
+        list of [(Batch|None, quantity)] deductions, one per line
+    
+    Raises:
+        InsufficientStockError: If any line cannot be filled; nothing is written
+    """
+    lines = list(lines)
+    today = timezone.now().date()
+    deductions = []
+    with transaction.atomic():
+        for start in range(0, len(lines), chunk_size):
+            chunk = lines[start:start + chunk_size]
+            try:
+                chunk_deductions = deduct_stock_for_lines(
+                    chunk,
+                    source_outlet,
+                    user=user,
+                    reference_id=reference_id,
+                    reason=reason,
+                    movement_type='transfer_out',
+                )
+            except InsufficientStockError as e:
+                e.line_index += start
+                raise
+
+            incoming = []
+            for line, line_deductions in zip(chunk, chunk_deductions):
+                product = _resolve_product(product=line.get('product') if isinstance(line, dict) else line[0])
+                for batch, moved_quantity in line_deductions:
+                    incoming.append({
+                        'product': product,
+                        'quantity': moved_quantity,
+                        'batch_number': batch.batch_number if batch else f"{reference_id}-{product.id}",
+                        'expiry_date': batch.expiry_date if batch else today + timedelta(days=365),
+                        'cost_price': batch.cost_price if batch else product.cost,
+                    })
+            if incoming:
+                add_stock_for_lines(
+                    incoming,
+                    destination_outlet,
+                    user=user,
+                    reference_id=reference_id,
+                    reason=reason,
+                    movement_type='transfer_in',
+                )
+
+            deductions.extend(chunk_deductions)
+            if progress:
+                progress(start + len(chunk), len(lines))
+
+    logger.info(
+        f"Transferred {len(lines)} lines from {source_outlet.name} to {destination_outlet.name} ({reference_id})"
+    )
+    return deductions
+
+
 @transaction.atomic
 def adjust_stock(product=None, outlet=None, new_quantity=None, user=None, reason='Stock adjustment', variation=None):
     """
@@ -455,6 +895,7 @@ def adjust_stock(product=None, outlet=None, new_quantity=None, user=None, reason
     if new_quantity is None:
         raise TypeError('new_quantity is required')
 
+    lock_products([product])
     current_quantity = get_available_stock(product, outlet)
     difference = new_quantity - current_quantity
     
@@ -495,20 +936,321 @@ def adjust_stock(product=None, outlet=None, new_quantity=None, user=None, reason
 
 
 @transaction.atomic
-def mark_expired_batches(product=None, outlet=None, variation=None):
+def adjust_stock_many(lines, outlet, user=None, reference_id=''):
+    """
+    Adjust many products at one outlet to target quantities in one pass
+    Set-based adjust_stock: current stock is read once for every line,
+    increases go to the day's ADJ- batches with one bulk write, and decreases
+    are deducted FEFO through deduct_stock_for_lines.
+    
+    Args:
+        lines: iterable of (product, new_quantity[, reason]) tuples or
+            {'product', 'new_quantity', 'reason'} dicts
+        outlet: Outlet instance
+        user: User instance
+        reference_id: str - reference recorded on increase movements
+    
+    Returns:
+        dict mapping product id to the signed quantity applied
+    """
+    targets = {}
+    for line in lines:
+        if isinstance(line, dict):
+            product, new_quantity, line_reason = line.get('product'), line.get('new_quantity'), line.get('reason')
+        else:
+            product, new_quantity, line_reason = (tuple(line) + (None,))[:3]
+        if new_quantity is None:
+            raise TypeError('new_quantity is required')
+        product = _resolve_product(product=product)
+        targets[product.id] = (product, int(new_quantity), line_reason or 'Stock adjustment')
+
+    if not targets:
+        return {}
+
+    lock_products(targets)
+    current = get_sellable_stock_many([product for product, _, _ in targets.values()], outlet)
+    differences = {
+        product_id: new_quantity - current.get(product_id, 0)
+        for product_id, (_, new_quantity, _) in targets.items()
+    }
+
+    today = timezone.now().date()
+    batch_prefix = f"ADJ-{today.strftime('%Y%m%d')}"
+    increases = sorted(product_id for product_id, difference in differences.items() if difference > 0)
+    decreases = sorted(product_id for product_id, difference in differences.items() if difference < 0)
+
+    if increases:
+        batches = {
+            batch.product_id: batch
+            for batch in Batch.objects.select_for_update().filter(
+                product_id__in=increases,
+                outlet=outlet,
+                batch_number__in=[f"{batch_prefix}-{product_id}" for product_id in increases],
+            ).order_by('product_id')
+        }
+        now = timezone.now()
+        new_batches = []
+        for product_id in increases:
+            batch = batches.get(product_id)
+            if batch is None:
+                batch = Batch(
+                    tenant_id=targets[product_id][0].tenant_id,
+                    product_id=product_id,
+                    outlet=outlet,
+                    batch_number=f"{batch_prefix}-{product_id}",
+                    expiry_date=today + timedelta(days=365),  # 1 year default for adjustments
+                    quantity=differences[product_id],
+                )
+                new_batches.append(batch)
+                batches[product_id] = batch
+            else:
+                batch.quantity += differences[product_id]
+                batch.updated_at = now
+        Batch.objects.bulk_update(
+            [batch for batch in batches.values() if batch.pk], ['quantity', 'updated_at'], batch_size=500
+        )
+        Batch.objects.bulk_create(new_batches, batch_size=500)
+
+        movements = []
+        for product_id in increases:
+            product, _, line_reason = targets[product_id]
+            batch = batches[product_id]
+            movements.append(
+                StockMovement(
+                    tenant_id=product.tenant_id,
+                    batch=batch,
+                    product=product,
+                    outlet=outlet,
+                    user=user,
+                    movement_type='adjustment',
+                    quantity=differences[product_id],
+                    quantity_delta=differences[product_id],
+                    unit_cost=_coerce_decimal(batch.cost_price if batch.cost_price is not None else product.cost),
+                    reference_id=reference_id,
+                    reason=line_reason,
+                )
+            )
+        StockMovement.objects.bulk_create(movements, batch_size=500)
+        rebuild_stock_state_many([targets[product_id][0] for product_id in increases], outlet)
+
+    if decreases:
+        deduct_stock_for_lines(
+            [
+                {
+                    'product': targets[product_id][0],
+                    'quantity': -differences[product_id],
+                    'reference_id': f"{batch_prefix}-{product_id}",
+                    'reason': targets[product_id][2],
+                }
+                for product_id in decreases
+            ],
+            outlet,
+            user=user,
+            movement_type='adjustment',
+        )
+
+    logger.info(
+        f"Adjusted {len(increases) + len(decreases)} of {len(targets)} products at {outlet.name}"
+    )
+    return {product_id: difference for product_id, difference in differences.items() if difference}
+
+
+def begin_stock_take_completion(stock_take):
+    """Move a running stock take into 'completing' and record how many items it has to apply.
+
+    Safe to call again on a stock take that is already completing.
+    """
+    with transaction.atomic():
+        stock_take = StockTake.objects.select_for_update().get(pk=stock_take.pk)
+        if stock_take.status == 'completing':
+            return stock_take
+        if stock_take.status != 'running':
+            raise ValueError("Stock take is not running")
+
+        items = StockTakeItem.objects.filter(stock_take=stock_take)
+        stock_take.status = 'completing'
+        stock_take.completion_total = items.count()
+        stock_take.completion_processed = items.filter(applied_at__isnull=False).count()
+        stock_take.save(update_fields=['status', 'completion_total', 'completion_processed'])
+    return stock_take
+
+
+def complete_stock_take(stock_take, user=None, chunk_size=500, progress=None):
+    """
+    Apply a stock take's counts to stock and mark it completed
+    
+    Items are applied in chunks of at most chunk_size, each in its own
+    transaction: variances are computed in memory, stock is set with one
+    adjust_stock_many call, and the items are stamped applied_at in bulk.
+    An interrupted run leaves the stock take 'completing'; calling this
+    again resumes with the items not yet applied.
+    
+    Args:
+        stock_take: StockTake instance ('running' or 'completing')
+        user: User recorded on adjustment movements (defaults to the stock take's user)
+        chunk_size: int - maximum items per transaction
+        progress: callable(processed, total) called after each chunk (optional)
+    
+    Returns:
+        StockTake instance
+    
+    Raises:
+        ValueError: If the stock take is neither running nor completing
+    """
+    from django.db.models import F
+
+    stock_take = begin_stock_take_completion(stock_take)
+    user = user or stock_take.user
+    outlet = stock_take.outlet
+
+    pending_ids = list(
+        StockTakeItem.objects.filter(stock_take=stock_take, applied_at__isnull=True)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+    for start in range(0, len(pending_ids), chunk_size):
+        with transaction.atomic():
+            # Re-check under lock so a concurrent resume never applies an item twice
+            items = list(
+                StockTakeItem.objects.select_for_update(of=('self',))
+                .select_related('product')
+                .filter(id__in=pending_ids[start:start + chunk_size], applied_at__isnull=True)
+                .order_by('id')
+            )
+            now = timezone.now()
+            lines = []
+            for item in items:
+                item.difference = item.counted_quantity - item.expected_quantity
+                item.applied_at = now
+                if item.difference == 0:
+                    continue
+
+                product = item.product
+                if not product:
+                    logger.error(f"StockTakeItem {item.id} has no product. Skipping.")
+                    continue
+                # Tenant safety
+                if product.tenant_id != stock_take.tenant_id:
+                    logger.warning(f"Tenant mismatch for StockTakeItem {item.id} in stock_take {stock_take.id}")
+                    continue
+
+                lines.append((
+                    product,
+                    item.counted_quantity,
+                    f"Stock take {stock_take.id}: Expected {item.expected_quantity}, Counted {item.counted_quantity}",
+                ))
+
+            adjust_stock_many(lines, outlet, user=user, reference_id=f"STOCKTAKE-{stock_take.id}")
+            StockTakeItem.objects.bulk_update(items, ['difference', 'applied_at'], batch_size=500)
+            StockTake.objects.filter(pk=stock_take.pk).update(
+                completion_processed=F('completion_processed') + len(items)
+            )
+
+        if progress:
+            stock_take.refresh_from_db(fields=['completion_processed', 'completion_total'])
+            progress(stock_take.completion_processed, stock_take.completion_total)
+
+    with transaction.atomic():
+        stock_take = StockTake.objects.select_for_update().get(pk=stock_take.pk)
+        if stock_take.status == 'completing':
+            stock_take.status = 'completed'
+            stock_take.completed_at = timezone.now()
+            stock_take.save(update_fields=['status', 'completed_at'])
+
+    logger.info(
+        f"Stock take {stock_take.id} completed: {stock_take.completion_processed} items applied"
+    )
+    return stock_take
+
+
+EXPIRE_BATCHES_SQL = """
+    UPDATE inventory_batch AS batch
+    SET quantity = 0, updated_at = %s
+    FROM (
+        SELECT id, quantity
+        FROM inventory_batch
+        WHERE id = ANY(%s) AND expiry_date <= %s AND quantity > 0
+        FOR UPDATE
+    ) AS expired
+    WHERE batch.id = expired.id
+    RETURNING batch.id, batch.tenant_id, batch.product_id, batch.outlet_id,
+              batch.expiry_date, batch.cost_price, expired.quantity
+"""
+
+
+def _expire_batch_chunk(batch_ids, today):
+    """Zero a chunk of expired batches in one statement and record their expiry movements.
+
+    Returns the number of batches expired.
+    """
+    from django.db import connection
+    from apps.outlets.models import Outlet
+    from apps.products.models import Product
+
+    # Products before batches, like every other stock mutation
+    lock_products(
+        Product.objects.filter(id__in=Batch.objects.filter(id__in=batch_ids).values('product_id'))
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(EXPIRE_BATCHES_SQL, [timezone.now(), list(batch_ids), today])
+        expired = cursor.fetchall()
+    if not expired:
+        return 0
+
+    products = Product.objects.in_bulk({row[2] for row in expired if row[2] is not None})
+    outlets = Outlet.objects.in_bulk({row[3] for row in expired})
+
+    movements = []
+    for batch_id, tenant_id, product_id, outlet_id, expiry_date, cost_price, qty_expired in expired:
+        product = products.get(product_id)
+        movements.append(
+            StockMovement(
+                tenant_id=tenant_id,
+                batch_id=batch_id,
+                product_id=product_id,
+                outlet_id=outlet_id,
+                movement_type='expiry',
+                quantity=qty_expired,
+                quantity_delta=-qty_expired,
+                unit_cost=_coerce_decimal(cost_price if cost_price is not None else getattr(product, 'cost', None)),
+                reason=f"Batch expired on {expiry_date}"
+            )
+        )
+    StockMovement.objects.bulk_create(movements, batch_size=500)
+
+    affected = defaultdict(set)
+    for row in expired:
+        if row[2] is not None:
+            affected[row[3]].add(row[2])
+    for outlet_id in sorted(affected):
+        rebuild_stock_state_many([products[product_id] for product_id in affected[outlet_id]], outlets[outlet_id])
+
+    return len(expired)
+
+
+def mark_expired_batches(product=None, outlet=None, variation=None, tenant=None, chunk_size=500, progress=None):
     """
     Mark expired batches and create expiry movements
     UNITS ONLY ARCHITECTURE: Changed from variation-based to product-based
-    Can be called for specific product/outlet or for all
+    Can be called for specific product/outlet/tenant or for all
+    
+    Works tenant by tenant in chunks of at most chunk_size batches. Each chunk
+    is its own transaction: one UPDATE ... RETURNING zeroes the batches, one
+    bulk insert records the expiry movements, and each affected product/outlet
+    is refreshed once, so row locks are held only for the chunk.
     
     Args:
         product: Product instance (optional)
-        outlet: Outlet instance (optional)
+        outlet: Outlet instance or id (optional)
+        tenant: Tenant instance or id (optional)
+        chunk_size: int - maximum batches per transaction
+        progress: callable(tenant_id, expired_so_far, tenant_total) called after each chunk (optional)
     
     Returns:
         int: Number of batches marked as expired
     """
-    product = _resolve_product(product=product, variation=variation)
+    if product is not None or variation is not None:
+        product = _resolve_product(product=product, variation=variation)
 
     today = timezone.now().date()
     
@@ -522,34 +1264,24 @@ def mark_expired_batches(product=None, outlet=None, variation=None):
         query = query.filter(product=product)
     if outlet:
         query = query.filter(outlet=outlet)
+    if tenant:
+        query = query.filter(tenant=tenant)
     
     expired_count = 0
-    
-    for batch in query.select_for_update():
-        qty_expired = batch.quantity
-        
-        # Create expiry movement
-        StockMovement.objects.create(
-            tenant=batch.tenant,
-            batch=batch,
-            product=batch.product,
-            outlet=batch.outlet,
-            movement_type='expiry',
-            quantity=qty_expired,
-            reason=f"Batch expired on {batch.expiry_date}"
-        )
-        
-        # Zero out the batch
-        batch.quantity = 0
-        batch.save(update_fields=['quantity', 'updated_at'])
-        
-        rebuild_stock_state(batch.product, batch.outlet, user=None, reason=f"Batch expiry cleanup for {batch.batch_number}")
-
-        expired_count += 1
-        logger.warning(
-            f"Marked {qty_expired} units as expired in batch {batch.batch_number} "
-            f"({batch.product.name}) at {batch.outlet.name}"
-        )
+    tenant_ids = query.values_list('tenant_id', flat=True).distinct().order_by('tenant_id')
+
+    for tenant_id in list(tenant_ids):
+        batch_ids = list(query.filter(tenant_id=tenant_id).order_by('id').values_list('id', flat=True))
+        tenant_expired = 0
+        for start in range(0, len(batch_ids), chunk_size):
+            with transaction.atomic():
+                tenant_expired += _expire_batch_chunk(batch_ids[start:start + chunk_size], today)
+            if progress:
+                progress(tenant_id, tenant_expired, len(batch_ids))
+
+        expired_count += tenant_expired
+        if tenant_expired:
+            logger.warning(f"Marked {tenant_expired} expired batches for tenant {tenant_id}")
     
     return expired_count
 
@@ -607,6 +1339,7 @@ def restore_stock_for_refund(product, outlet, quantity, user, reference_id, reas
     """
     from datetime import timedelta
 
+    lock_products([product])
     today = timezone.now().date()
 
     # Try to restore into the youngest non-expired batch for this product/outlet.
@@ -0,0 +1,157 @@
+"""
+Stock locking layer
+Stock mutations serialize on Product rows: every path that changes stock
+locks the products it touches through lock_products before it reads or
+writes batches, location stock or the ledger. Locks are always taken in
+ascending product id order under a bounded lock_timeout, so two tills
+selling overlapping baskets queue behind each other instead of deadlocking.
+Batch and LocationStock rows belong to exactly one product, so once product
+locks are ordered their own lock order cannot form a cycle. The outlet's
+receipt sequence row (gap-free numbering holds it until commit) is always
+the last lock a sale takes: every sale path locks its basket first and only
+then allocates the receipt number.
+"""
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import QuerySet
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL SQLSTATEs that mean "try the whole transaction again"
+CONTENTION_SQLSTATES = {
+    '40P01': 'deadlock',
+    '55P03': 'lock_timeout',
+}
+
+
+class StockLockContention(Exception):
+    """Raised when stock locks could not be taken (lock timeout or deadlock) after retrying."""
+
+    def __init__(self, reason, attempts=1):
+        self.reason = reason
+        self.attempts = attempts
+        super().__init__(
+            f"Stock is locked by another transaction ({reason}) after {attempts} attempt(s)"
+        )
+
+
+def contention_reason(exc):
+    """'deadlock' or 'lock_timeout' when a database error is lock contention, else None."""
+    if isinstance(exc, StockLockContention):
+        return exc.reason
+    return CONTENTION_SQLSTATES.get(getattr(getattr(exc, '__cause__', None), 'pgcode', None))
+
+
+def set_lock_timeout(timeout_ms=None):
+    """Bound how long the current transaction waits for any row lock (PostgreSQL only)."""
+    if connection.vendor != 'postgresql':
+        return
+    if timeout_ms is None:
+        timeout_ms = settings.STOCK_LOCK_TIMEOUT_MS
+    with connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = {int(timeout_ms)}")
+
+
+def lock_products(products, timeout_ms=None):
+    """
+    Lock Product rows for a stock mutation in ascending id order
+    Must run inside a transaction. Locking rows the transaction already holds
+    is a no-op, so helpers can lock defensively after a view has locked a
+    whole basket.
+
+    Args:
+        products: Product queryset (filtered by tenant/outlet as needed), or an
+            iterable of Product instances or ids
+        timeout_ms: int - lock_timeout for the transaction (default: STOCK_LOCK_TIMEOUT_MS)
+
+    Returns:
+        dict {product_id: Product} of the locked rows
+
+    Raises:
+        StockLockContention: If the locks could not be taken in time
+    """
+    from apps.products.models import Product
+
+    if not isinstance(products, QuerySet):
+        product_ids = {getattr(product, 'id', product) for product in products}
+        if not product_ids:
+            return {}
+        products = Product.objects.filter(id__in=product_ids)
+
+    set_lock_timeout(timeout_ms)
+    try:
+        return {
+            product.id: product
+            for product in products.select_for_update().order_by('id')
+        }
+    except OperationalError as exc:
+        reason = contention_reason(exc)
+        if reason is None:
+            raise
+        raise StockLockContention(reason) from exc
+
+
+def retry_on_stock_contention(func=None, *, attempts=None, backoff_ms=None):
+    """
+    Run func in its own transaction, retrying it on lock timeouts and deadlocks
+    Each attempt is a fresh atomic block (a savepoint when nested), so a
+    deadlock victim rolls back and starts over with jittered exponential
+    backoff. Use in place of @transaction.atomic on stock-mutating entry points.
+
+    Raises:
+        StockLockContention: When every attempt hit contention
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            max_attempts = max(1, attempts or settings.STOCK_LOCK_RETRIES)
+            base_delay = (backoff_ms if backoff_ms is not None else settings.STOCK_LOCK_BACKOFF_MS) / 1000.0
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    with transaction.atomic():
+                        return func(*args, **kwargs)
+                except (StockLockContention, OperationalError) as exc:
+                    reason = contention_reason(exc)
+                    if reason is None:
+                        raise
+                    if attempt == max_attempts:
+                        raise StockLockContention(reason, attempt) from exc
+                    logger.warning(
+                        f"Stock lock {reason} in {func.__qualname__}, retrying "
+                        f"(attempt {attempt + 1}/{max_attempts})"
+                    )
+                    time.sleep(base_delay * (2 ** (attempt - 1)) * (1 + random.random()))
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def exception_handler(exc, context):
+    """
+    DRF exception handler: stock still locked after retrying becomes a 409
+    Tills, storefronts and back-office screens get "busy, resend" with a
+    Retry-After instead of a 500. Everything else is handled by DRF.
+    """
+    from rest_framework import status
+    from rest_framework.response import Response
+    from rest_framework.views import exception_handler as drf_exception_handler, set_rollback
+
+    reason = contention_reason(exc) if isinstance(exc, (StockLockContention, OperationalError)) else None
+    if reason is None:
+        return drf_exception_handler(exc, context)
+
+    view = context.get('view')
+    logger.warning(f"{type(view).__name__ if view else 'Request'} gave up on stock locks: {exc}")
+    set_rollback()
+    return Response(
+        {"detail": "Stock is busy with another transaction. Please retry.", "code": "stock_busy"},
+        status=status.HTTP_409_CONFLICT,
+        headers={'Retry-After': '1'},
+    )
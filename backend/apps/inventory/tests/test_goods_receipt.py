@@ -0,0 +1,164 @@
+"""
+Tests for the bulk goods receipt pipeline
+"""
+
+import unittest
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.goods_receipt import parse_delivery_note, receive_goods
+from apps.inventory.models import Batch, StockLedgerSnapshot, StockMovement
+from apps.inventory.stock_helpers import get_sellable_stock_many
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+from apps.suppliers.models import PurchaseOrder, Supplier
+from apps.suppliers.views import PurchaseOrderViewSet
+from apps.tenants.models import Tenant
+
+
+class GoodsReceiptTestCase(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Receiving Tenant")
+        self.user = User.objects.create_user(
+            username="receiver", email="receiver@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Receiving Store")
+        self.products = [
+            Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=f"Delivered {index}",
+                sku=f"SKU-{index}", barcode=f"BC{index:05d}", retail_price=Decimal("9.00"), cost=Decimal("1.00")
+            )
+            for index in range(40)
+        ]
+
+    def test_csv_delivery_note_is_parsed(self):
+        note = SimpleUploadedFile(
+            "note.csv",
+            b"SKU,Quantity,Cost,Batch_Number,Expiry_Date,Colour\nSKU-1,5,2.50,LOT-9,2027-01-31,red\nSKU-2,,,,,\n",
+        )
+
+        self.assertEqual(parse_delivery_note({}, {'delivery_note': note}), [
+            {'sku': 'SKU-1', 'quantity': '5', 'cost': '2.50', 'batch_number': 'LOT-9', 'expiry_date': '2027-01-31'},
+            {'sku': 'SKU-2'},
+        ])
+        with self.assertRaises(ValueError):
+            parse_delivery_note({'delivery_note': "sku,cost\nSKU-1,1\n"})
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Batch upserts need PostgreSQL')
+    def test_receipt_books_every_line_in_bulk(self):
+        items = [{'product_id': product.id, 'quantity': 10, 'cost': '2.00'} for product in self.products[:20]]
+        items += [{'sku': product.sku, 'quantity': 4, 'batch_number': 'LOT-1', 'expiry_date': '2027-06-30'}
+                  for product in self.products[20:30]]
+        items += [{'barcode': product.barcode.lower(), 'quantity': 3, 'cost': '1.50'} for product in self.products[30:]]
+        items += [{'sku': 'NOPE', 'quantity': 1}, {'product_id': self.products[0].id, 'quantity': 0}]
+
+        with CaptureQueriesContext(connection) as ctx:
+            movements, errors = receive_goods(self.tenant, self.outlet, items, user=self.user, reference_id="DN-1")
+
+        self.assertEqual(len(movements), 40)
+        self.assertEqual([error['line'] for error in errors], [40, 41])
+        movement_inserts = [
+            query for query in ctx.captured_queries
+            if query['sql'].startswith('INSERT INTO "inventory_stockmovement"')
+        ]
+        batch_upserts = [query for query in ctx.captured_queries if 'INSERT INTO inventory_batch' in query['sql']]
+        self.assertEqual((len(movement_inserts), len(batch_upserts)), (1, 1))
+
+        stock = get_sellable_stock_many(self.products, self.outlet)
+        self.assertEqual(stock[self.products[0].id], 10)
+        self.assertEqual(stock[self.products[25].id], 4)
+        self.assertEqual(stock[self.products[35].id], 3)
+        lot = Batch.objects.get(product=self.products[25], batch_number='LOT-1')
+        self.assertEqual(lot.expiry_date, date(2027, 6, 30))
+        self.assertEqual(
+            StockLedgerSnapshot.objects.get(product=self.products[35], outlet=self.outlet).acquired_cost,
+            Decimal("4.50")
+        )
+        self.assertEqual(
+            StockMovement.objects.get(product=self.products[25], reference_id="DN-1").unit_cost, Decimal("1.00")
+        )
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Batch upserts need PostgreSQL')
+    def test_products_of_every_identifier_kind_are_locked_in_one_pass(self):
+        from apps.inventory import goods_receipt
+
+        items = [
+            {'product_id': self.products[30].id, 'quantity': 1},
+            {'sku': self.products[10].sku, 'quantity': 1},
+            {'barcode': self.products[2].barcode, 'quantity': 1},
+        ]
+        with mock.patch.object(goods_receipt, 'lock_products', wraps=goods_receipt.lock_products) as locker:
+            movements, errors = receive_goods(self.tenant, self.outlet, items, user=self.user)
+
+        self.assertEqual((len(movements), errors), (3, []))
+        locker.assert_called_once()
+        self.assertEqual(
+            {product.id for product in locker.call_args.args[0]},
+            {self.products[2].id, self.products[10].id, self.products[30].id},
+        )
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Batch upserts need PostgreSQL')
+class PurchaseOrderReceiveTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.tenant = Tenant.objects.create(name="PO Tenant")
+        self.user = User.objects.create_user(
+            username="buyer", email="buyer@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.client.force_authenticate(user=self.user)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="PO Store")
+        self.client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+        self.supplier = Supplier.objects.create(tenant=self.tenant, name="Acme Wholesale")
+        self.product = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Flour", sku="FLOUR",
+            retail_price=Decimal("5.00"), cost=Decimal("2.00")
+        )
+        self.po = PurchaseOrder.objects.create(
+            tenant=self.tenant, supplier=self.supplier, outlet=self.outlet, created_by=self.user,
+            po_number="PO-TEST-0001", order_date=timezone.now().date(), status='ordered'
+        )
+        self.url = f"/api/v1/purchase-orders/{self.po.id}/receive/"
+
+    def test_partial_then_final_receipt(self):
+        response = self.client.post(
+            self.url, {'partial': True, 'items': [{'product_id': self.product.id, 'quantity': 6, 'cost': '2.20'}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['status'], 'partial')
+        self.assertEqual(response.json()['receipt']['quantity_received'], 6)
+
+        response = self.client.post(
+            self.url, {'delivery_note': "sku,quantity,cost\nFLOUR,4,2.20\n"}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.po.refresh_from_db()
+        self.assertEqual(self.po.status, 'received')
+        self.assertIsNotNone(self.po.received_at)
+
+        movements = StockMovement.objects.filter(reference_id="PO-TEST-0001", movement_type='purchase')
+        self.assertEqual(sorted(movement.quantity for movement in movements), [4, 6])
+        self.assertEqual(get_sellable_stock_many([self.product], self.outlet), {self.product.id: 10})
+
+    def test_status_is_checked_on_the_locked_row(self):
+        # The request loaded the PO just before a concurrent receipt completed it
+        stale = PurchaseOrder.objects.get(pk=self.po.pk)
+        PurchaseOrder.objects.filter(pk=self.po.pk).update(status='received', received_at=timezone.now())
+
+        with mock.patch.object(PurchaseOrderViewSet, 'get_object', return_value=stale):
+            response = self.client.post(
+                self.url, {'items': [{'product_id': self.product.id, 'quantity': 6}]}, format='json'
+            )
+
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertFalse(StockMovement.objects.filter(reference_id="PO-TEST-0001").exists())
@@ -0,0 +1,113 @@
+"""
+Tests for keyset pagination on the stock movement and batch listings
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.models import Batch, StockMovement
+from apps.inventory.stock_helpers import add_stock
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+from apps.tenants.models import Tenant
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Cursor Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Cursor Store")
+        self.user = User.objects.create_user(
+            username="cursor", email="cursor@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.products = [
+            Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=f"Cursor Product {index}",
+                retail_price=Decimal("5.00"), cost=Decimal("2.00")
+            )
+            for index in range(3)
+        ]
+        today = timezone.now().date()
+        for index in range(12):
+            add_stock(
+                self.products[index % 3], self.outlet, 2, batch_number=f"C-{index}",
+                expiry_date=today + timedelta(days=30 + index % 4)
+            )
+        # Several movements share a timestamp so the id tiebreak is exercised
+        stamp = timezone.now() - timedelta(hours=1)
+        movements = StockMovement.objects.filter(tenant=self.tenant)
+        StockMovement.objects.filter(id__in=list(movements.values_list('id', flat=True)[:5])).update(created_at=stamp)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+
+    def _walk(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        pages = [response.json()]
+        while pages[-1]['next']:
+            response = self.client.get(pages[-1]['next'])
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append(response.json())
+        return pages
+
+    def test_movement_pages_cover_the_ledger_once_in_order(self):
+        pages = self._walk('/api/v1/inventory/movements/', {'limit': 5})
+
+        seen = [row['id'] for page in pages for row in page['results']]
+        expected = list(
+            StockMovement.objects.filter(tenant=self.tenant).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]['previous'])
+        self.assertNotIn('count', pages[0])
+
+        back = self.client.get(pages[1]['previous']).json()
+        self.assertEqual([row['id'] for row in back['results']], expected[:5])
+        self.assertIsNone(back['previous'])
+
+    def test_filters_and_snapshot_total(self):
+        product = self.products[0]
+        response = self.client.get(
+            '/api/v1/inventory/movements/', {'product': product.id, 'include_total': 'true', 'limit': 2}
+        )
+
+        body = response.json()
+        self.assertEqual(body['count'], 4)
+        self.assertTrue(all(row['product']['id'] == product.id for row in body['results']))
+
+        typed = self.client.get(
+            '/api/v1/inventory/movements/', {'movement_type': 'sale', 'include_total': 'true'}
+        ).json()
+        self.assertEqual(typed['results'], [])
+        self.assertNotIn('count', typed)
+
+    def test_batch_pages_follow_expiry_order(self):
+        pages = self._walk('/api/v1/inventory/batches/', {'limit': 5})
+
+        seen = [row['id'] for page in pages for row in page['results']]
+        expected = list(
+            Batch.objects.filter(tenant=self.tenant).order_by('expiry_date', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+        newest = self._walk('/api/v1/inventory/batches/', {'limit': 5, 'ordering': '-created_at'})
+        self.assertEqual(
+            [row['id'] for page in newest for row in page['results']],
+            list(Batch.objects.filter(tenant=self.tenant).order_by('-created_at', '-id').values_list('id', flat=True)),
+        )
+
+        # Mutable columns are not offered as keysets; the default order applies
+        by_quantity = self._walk('/api/v1/inventory/batches/', {'limit': 5, 'ordering': '-quantity'})
+        self.assertEqual([row['id'] for page in by_quantity for row in page['results']], expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/v1/inventory/movements/', {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,114 @@
+"""
+Tests for the stock ledger integrity check and its repair mode
+"""
+
+import json
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.inventory.ledger_integrity import check_outlet, product_stock_drift, repair_outlet
+from apps.inventory.models import Batch, LocationStock, StockLedgerSnapshot, StockMovement
+from apps.inventory.stock_helpers import add_stock, deduct_stock
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+from apps.tenants.models import Tenant
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Integrity queries use PostgreSQL DISTINCT ON')
+class LedgerIntegrityTestCase(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Audit Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Audit Store")
+        self.branch = Outlet.objects.create(tenant=self.tenant, name="Audit Branch")
+        expiry = timezone.now().date() + timedelta(days=60)
+        self.products = [
+            Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=f"Audited {index}",
+                retail_price=Decimal("8.00"), cost=Decimal("3.00")
+            )
+            for index in range(3)
+        ]
+        for product in self.products:
+            add_stock(product, self.outlet, 20, batch_number=f"A-{product.id}", expiry_date=expiry)
+            deduct_stock(product, self.outlet, 5)
+        add_stock(self.products[0], self.branch, 7, batch_number="BR-1", expiry_date=expiry)
+
+    def _check(self, outlet):
+        result = check_outlet(outlet.id)
+        return result['products_checked'], result['drift']
+
+    def test_consistent_stock_reports_no_drift(self):
+        self.assertEqual(self._check(self.outlet), (3, []))
+        self.assertEqual(self._check(self.branch), (1, []))
+        # Product.stock mirrors the branch it was last rebuilt at, which is valid
+        results = [check_outlet(self.outlet.id), check_outlet(self.branch.id)]
+        self.assertEqual(product_stock_drift(results), [])
+
+    def test_each_kind_of_drift_is_reported(self):
+        first, second, third = self.products
+        Batch.objects.filter(product=first, outlet=self.outlet).update(quantity=12)
+        LocationStock.objects.filter(product=second, outlet=self.outlet).update(quantity=99)
+        Product.objects.filter(pk=second.pk).update(stock=1)
+        StockLedgerSnapshot.objects.filter(product=third, outlet=self.outlet).update(quantity=4)
+
+        results = [check_outlet(self.outlet.id), check_outlet(self.branch.id)]
+
+        by_product = {entry['product_id']: entry for entry in results[0]['drift']}
+        self.assertEqual(by_product[first.id]['drift'], ['batches'])
+        self.assertEqual((by_product[first.id]['batch_total'], by_product[first.id]['ledger_quantity']), (12, 15))
+        self.assertEqual(by_product[second.id]['drift'], ['location_stock'])
+        self.assertEqual(by_product[third.id]['drift'], ['snapshot'])
+        self.assertEqual(results[1]['drift'], [])
+        stock_drift = product_stock_drift(results)
+        self.assertEqual([(entry['product_id'], entry['expected_quantity']) for entry in stock_drift], [(second.id, 15)])
+
+    def test_check_can_be_restricted_to_some_products(self):
+        first, second, third = self.products
+        LocationStock.objects.filter(product=second, outlet=self.outlet).update(quantity=99)
+        StockLedgerSnapshot.objects.filter(product=third, outlet=self.outlet).update(quantity=4)
+
+        result = check_outlet(self.outlet.id, product_ids={first.id, second.id})
+
+        self.assertEqual(result['products_checked'], 2)
+        self.assertEqual([entry['product_id'] for entry in result['drift']], [second.id])
+        self.assertEqual(check_outlet(self.outlet.id, product_ids=set())['products_checked'], 0)
+
+    def test_repair_books_compensating_movement_and_rebuilds_projections(self):
+        first, second, third = self.products
+        Batch.objects.filter(product=first, outlet=self.outlet).update(quantity=12)
+        LocationStock.objects.filter(product=second, outlet=self.outlet).update(quantity=99)
+        StockLedgerSnapshot.objects.filter(product=third, outlet=self.outlet).update(quantity=4)
+        drift = check_outlet(self.outlet.id)['drift']
+
+        compensating = repair_outlet(self.outlet.id, drift, reference_id='INTEGRITY-TEST')
+
+        self.assertEqual([(movement.product_id, movement.quantity_delta) for movement in compensating], [(first.id, -3)])
+        movement = StockMovement.objects.get(reference_id='INTEGRITY-TEST')
+        self.assertEqual((movement.movement_type, movement.quantity), ('adjustment', 3))
+        self.assertEqual(self._check(self.outlet), (3, []))
+        first.refresh_from_db()
+        self.assertEqual(first.stock, 12)
+        self.assertEqual(LocationStock.objects.get(product=second, outlet=self.outlet).quantity, 15)
+
+    def test_command_writes_json_report_and_repairs(self):
+        Batch.objects.filter(product=self.products[0], outlet=self.branch).update(quantity=9)
+        out = StringIO()
+
+        call_command('check_stock_integrity', tenant=self.tenant.id, workers=1, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual((report['outlets_checked'], report['products_checked']), (2, 4))
+        self.assertEqual(report['by_kind'], {'batches': 1})
+        self.assertEqual(report['drift'][0]['outlet_id'], self.branch.id)
+
+        call_command('check_stock_integrity', tenant=self.tenant.id, workers=1, repair=True, json=True, stdout=StringIO())
+        out = StringIO()
+        call_command('check_stock_integrity', tenant=self.tenant.id, workers=1, json=True, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['drift_count'], 0)
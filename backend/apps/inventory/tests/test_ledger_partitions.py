@@ -0,0 +1,118 @@
+"""
+Tests for the month-partitioned StockMovement ledger and opening-balance compaction
+"""
+
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.inventory.ledger_partitions import (
+    DEFAULT_PARTITION,
+    add_months,
+    boundary,
+    create_month_partition,
+    detach_month_partition,
+    is_partitioned,
+    list_partitions,
+    month_start,
+    partition_name,
+)
+from apps.inventory.models import StockLedgerSnapshot, StockMovement, StockOpeningBalance
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+from apps.tenants.models import Tenant
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Ledger partitions need PostgreSQL')
+class LedgerPartitionTestCase(TestCase):
+    """Opening balances let readers and partition maintenance skip old ledger rows"""
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Ledger Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Ledger Store")
+        self.product = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Ledger Product",
+            retail_price=Decimal("10.00"), cost=Decimal("4.00")
+        )
+        self.this_month = month_start(timezone.now())
+
+    def _movement(self, movement_type, quantity, month_offset, unit_cost=Decimal("5.00")):
+        movement = StockMovement.objects.create(
+            tenant=self.tenant, product=self.product, outlet=self.outlet,
+            movement_type=movement_type, quantity=quantity, unit_cost=unit_cost
+        )
+        created_at = boundary(add_months(self.this_month, month_offset)) + timedelta(days=3)
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=created_at)
+        return movement
+
+    def _compact_through_current_month(self, months_back):
+        for offset in range(-months_back + 1, 1):
+            StockOpeningBalance.objects.compact(self.tenant.id, add_months(self.this_month, offset))
+
+    def _partition_rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE product_id = %s', [self.product.id])
+            return cursor.fetchone()[0]
+
+    def test_ledger_is_partitioned_by_month(self):
+        self.assertTrue(is_partitioned())
+        self.assertIn(self.this_month, [month for month, _ in list_partitions()])
+
+    def test_compacted_totals_match_full_ledger(self):
+        self._movement('purchase', 40, -3, Decimal("5.00"))
+        self._movement('sale', 15, -2)
+        self._movement('purchase', 10, -1, Decimal("8.00"))
+        self._movement('damage', 2, 0)
+        full = StockLedgerSnapshot.objects.ledger_totals(self.product.id, self.outlet.id)
+
+        self._compact_through_current_month(3)
+
+        opening = StockOpeningBalance.objects.latest_for(self.product.id, self.outlet.id)
+        self.assertEqual(opening.period_start, self.this_month)
+        self.assertEqual((opening.quantity, opening.acquired_quantity), (35, 50))
+        self.assertEqual(opening.acquired_cost, Decimal("280.00"))
+        self.assertEqual(StockLedgerSnapshot.objects.ledger_totals(self.product.id, self.outlet.id), full)
+        self.assertEqual(full['quantity'], 33)
+
+    def test_recompacting_a_boundary_overwrites_it(self):
+        self._movement('purchase', 5, -1)
+        self._compact_through_current_month(1)
+        self._compact_through_current_month(1)
+
+        self.assertEqual(StockOpeningBalance.objects.filter(product=self.product).count(), 1)
+        self.assertEqual(StockOpeningBalance.objects.get(product=self.product).quantity, 5)
+
+    def test_creating_partition_moves_rows_out_of_default(self):
+        old_month = add_months(self.this_month, -30)
+        movement = StockMovement.objects.create(
+            tenant=self.tenant, product=self.product, outlet=self.outlet,
+            movement_type='purchase', quantity=3
+        )
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=boundary(old_month) + timedelta(hours=5))
+        self.assertEqual(self._partition_rows(DEFAULT_PARTITION), 1)
+
+        self.assertTrue(create_month_partition(old_month))
+        self.assertFalse(create_month_partition(old_month))
+        self.assertEqual(self._partition_rows(DEFAULT_PARTITION), 0)
+        self.assertEqual(self._partition_rows(partition_name(old_month)), 1)
+        self.assertTrue(StockMovement.objects.filter(pk=movement.pk).exists())
+
+    def test_detach_requires_covering_opening_balances(self):
+        old_month = add_months(self.this_month, -2)
+        create_month_partition(old_month)
+        self._movement('purchase', 12, -2)
+        self._movement('sale', 2, 0)
+
+        with self.assertRaises(ValueError):
+            detach_month_partition(old_month)
+
+        self._compact_through_current_month(2)
+        detach_month_partition(old_month)
+
+        self.assertNotIn(old_month, [month for month, _ in list_partitions()])
+        self.assertEqual(StockMovement.objects.filter(product=self.product).count(), 1)
+        self.assertEqual(StockLedgerSnapshot.objects.ledger_totals(self.product.id, self.outlet.id)['quantity'], 10)
@@ -0,0 +1,119 @@
+"""
+Tests for the edge-triggered per-outlet low-stock flag and its notifications
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.models import LocationStock
+from apps.inventory.stock_helpers import add_stock, deduct_stock
+from apps.notifications.models import Notification
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+from apps.tenants.models import Tenant
+
+
+class LowStockFlagTestCase(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Alert Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Alert Store")
+        self.branch = Outlet.objects.create(tenant=self.tenant, name="Alert Branch")
+        self.expiry = timezone.now().date() + timedelta(days=60)
+        self.product = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Milk", retail_price=Decimal("3.00"),
+            cost=Decimal("1.00"), low_stock_threshold=5
+        )
+        add_stock(self.product, self.outlet, 10, batch_number="M-1", expiry_date=self.expiry)
+        add_stock(self.product, self.branch, 10, batch_number="M-2", expiry_date=self.expiry)
+
+    def _flag(self, outlet):
+        return LocationStock.objects.get(product=self.product, outlet=outlet).is_low_stock
+
+    def _sell(self, quantity, outlet=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            deduct_stock(self.product, outlet or self.outlet, quantity)
+
+    def _alerts(self):
+        return Notification.objects.filter(type=Notification.TYPE_STOCK, resource_id=str(self.product.id))
+
+    def test_notifies_once_per_threshold_crossing(self):
+        self._sell(3)
+        self.assertFalse(self._flag(self.outlet))
+        self.assertEqual(self._alerts().count(), 0)
+
+        self._sell(3)
+        self._sell(1)
+        self.assertTrue(self._flag(self.outlet))
+        self.assertFalse(self._flag(self.branch))
+        self.assertEqual(self._alerts().count(), 1)
+        self.assertEqual(self._alerts().get().metadata['current_stock'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            add_stock(self.product, self.outlet, 20, batch_number="M-3", expiry_date=self.expiry)
+        self.assertFalse(self._flag(self.outlet))
+
+        self._sell(20)
+        self.assertEqual(self._alerts().count(), 2)
+        self.assertTrue(self.product.is_low_stock)
+
+    def test_threshold_change_flips_flags_without_a_stock_write(self):
+        self.product.low_stock_threshold = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+
+        self.assertTrue(self._flag(self.outlet))
+        self.assertTrue(self._flag(self.branch))
+        self.assertEqual(self._alerts().count(), 2)
+
+        self.product.low_stock_threshold = 0
+        self.product.save(update_fields=['low_stock_threshold'])
+        self.assertFalse(self._flag(self.outlet))
+        self.assertFalse(self.product.is_low_stock)
+
+    def test_low_stock_endpoint_reads_the_flag_or_the_tenant_total(self):
+        user = User.objects.create_user(
+            username="stockist", email="stockist@example.com", password="pass1234", tenant=self.tenant
+        )
+        client = APIClient()
+        client.force_authenticate(user=user)
+        client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+
+        def low_stock_ids(outlet=None):
+            response = client.get('/api/v1/products/low_stock/', {'outlet': outlet.id} if outlet else {})
+            self.assertEqual(response.status_code, 200, response.content)
+            rows = response.json()
+            rows = rows.get('results', rows) if isinstance(rows, dict) else rows
+            return [row['id'] for row in rows]
+
+        # The branch is low (2 left) but the tenant still holds 12
+        self._sell(8, outlet=self.branch)
+        self.assertEqual(low_stock_ids(self.outlet), [])
+        self.assertEqual(low_stock_ids(), [])
+
+        self._sell(7)
+        self.assertEqual(low_stock_ids(self.outlet), [self.product.id])
+        self.assertEqual(low_stock_ids(), [self.product.id])
+
+    def test_projection_only_product_crosses_the_threshold(self):
+        legacy = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Loose sugar", retail_price=Decimal("2.00"),
+            cost=Decimal("1.00"), low_stock_threshold=5
+        )
+        # Stock held only on the outlet projection, without batches
+        LocationStock.objects.create(tenant=self.tenant, product=legacy, outlet=self.outlet, quantity=10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deduct_stock(legacy, self.outlet, 7)
+
+        row = LocationStock.objects.get(product=legacy, outlet=self.outlet)
+        self.assertEqual(row.quantity, 3)
+        self.assertTrue(row.is_low_stock)
+        self.assertTrue(Product.objects.get(pk=legacy.pk).is_low_stock)
+        self.assertEqual(
+            Notification.objects.filter(type=Notification.TYPE_STOCK, resource_id=str(legacy.id)).count(), 1
+        )
@@ -0,0 +1,144 @@
+"""
+EXPLAIN checks for the hot inventory queries on a seeded ledger (PostgreSQL)
+Fails when a hot query stops using its index or falls back to a sequential
+scan over the movement ledger or batches.
+"""
+
+import json
+import unittest
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.inventory.models import Batch, StockMovement
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+from apps.tenants.models import Tenant
+
+# Index(es) each hot query is expected to use (None: any index, but no seq scan)
+EXPLAIN_SNAPSHOTS = {
+    'movement_history': 'inventory_sm_outlet_time_idx',
+    'ledger_window': 'inventory_sm_product_time_idx',
+    # On a small seed the tenant keyset index is an equally tight time range
+    'movements_by_type': ('inventory_sm_type_time_idx', 'inventory_sm_tenant_time_idx'),
+    'fifo_batches': None,
+    'expired_batches': 'inventory_batch_expiry_idx',
+}
+
+WATCHED_TABLES = ('inventory_stockmovement', 'inventory_batch')
+
+SEED_MOVEMENTS_SQL = """
+    INSERT INTO inventory_stockmovement
+        (tenant_id, outlet_id, product_id, movement_type, quantity, quantity_delta, unit_cost,
+         reason, reference_id, created_at)
+    SELECT o.tenant_id, o.id, p.id,
+           CASE WHEN g %% 4 = 0 THEN 'purchase' ELSE 'sale' END,
+           1,
+           CASE WHEN g %% 4 = 0 THEN 3 ELSE -1 END,
+           2.00, '', 'seed',
+           %(now)s - (g * interval '11 hours')
+    FROM outlets_outlet o
+    JOIN products_product p ON p.tenant_id = o.tenant_id
+    CROSS JOIN generate_series(1, %(per_pair)s) g
+    WHERE o.tenant_id = ANY(%(tenants)s)
+"""
+
+SEED_BATCHES_SQL = """
+    INSERT INTO inventory_batch
+        (tenant_id, outlet_id, product_id, batch_number, expiry_date, quantity, cost_price, created_at, updated_at)
+    SELECT o.tenant_id, o.id, p.id, 'LOT-' || g, %(today)s + (g * 30 - 150),
+           CASE WHEN g < 6 THEN 0 ELSE 40 END, 2.00, %(now)s, %(now)s
+    FROM outlets_outlet o
+    JOIN products_product p ON p.tenant_id = o.tenant_id
+    CROSS JOIN generate_series(1, 8) g
+    WHERE o.tenant_id = ANY(%(tenants)s)
+"""
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Query plans are checked on PostgreSQL')
+class HotQueryPlanTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tenants = [Tenant.objects.create(name=f"Plan Tenant {index}") for index in range(3)]
+        for tenant in tenants:
+            outlets = [Outlet.objects.create(tenant=tenant, name=f"Plan Outlet {index}") for index in range(3)]
+            Product.objects.bulk_create([
+                Product(tenant=tenant, outlet=outlets[0], name=f"Plan Product {index}", retail_price=5, cost=2)
+                for index in range(60)
+            ])
+        cls.tenant = tenants[0]
+        cls.outlet = Outlet.objects.filter(tenant=cls.tenant).first()
+        cls.product = Product.objects.filter(tenant=cls.tenant).first()
+        now = timezone.now()
+        params = {'tenants': [tenant.id for tenant in tenants], 'now': now, 'today': now.date(), 'per_pair': 60}
+        with connection.cursor() as cursor:
+            # Raw inserts skip snapshot upkeep; these rows only exist to be planned against
+            cursor.execute(SEED_MOVEMENTS_SQL, params)
+            cursor.execute(SEED_BATCHES_SQL, params)
+            cursor.execute('ANALYZE inventory_stockmovement')
+            cursor.execute('ANALYZE inventory_batch')
+
+    def _hot_queries(self):
+        now = timezone.now()
+        today = now.date()
+        return {
+            'movement_history': StockMovement.objects.filter(
+                tenant=self.tenant, outlet=self.outlet
+            ).order_by('-created_at', '-id')[:50],
+            'ledger_window': StockMovement.objects.filter(
+                product=self.product, outlet=self.outlet, created_at__gte=now - timedelta(days=14)
+            ).values('movement_type', 'quantity', 'quantity_delta', 'unit_cost'),
+            'movements_by_type': StockMovement.objects.filter(
+                tenant=self.tenant, movement_type='purchase', created_at__gte=now - timedelta(days=2)
+            ).values('product_id', 'quantity_delta'),
+            'fifo_batches': Batch.objects.filter(
+                product_id__in=[self.product.id, self.product.id + 1], outlet=self.outlet,
+                expiry_date__gt=today, quantity__gt=0,
+            ).order_by('expiry_date', 'created_at'),
+            'expired_batches': Batch.objects.filter(expiry_date__lte=today, quantity__gt=0).values('id'),
+        }
+
+    def _plan_nodes(self, queryset):
+        plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        nodes = []
+        stack = [plan]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node.get('Plans', []))
+        return nodes
+
+    def _parent_relation(self, name):
+        """Map a partition (or partition index) back to the partitioned parent's name."""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_partition_root(%s::regclass)::text', [name])
+            return cursor.fetchone()[0] or name
+
+    def _populated(self, relation):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples > 0 FROM pg_class WHERE relname = %s', [relation])
+            row = cursor.fetchone()
+        return bool(row and row[0])
+
+    def test_hot_queries_match_their_explain_snapshots(self):
+        for name, queryset in self._hot_queries().items():
+            with self.subTest(query=name):
+                nodes = self._plan_nodes(queryset)
+                seq_scans = [
+                    node['Relation Name'] for node in nodes
+                    if node['Node Type'] == 'Seq Scan'
+                    and self._parent_relation(node['Relation Name']) in WATCHED_TABLES
+                    and self._populated(node['Relation Name'])
+                ]
+                self.assertEqual(seq_scans, [], f'{name} regressed to a sequential scan')
+
+                indexes = {self._parent_relation(node['Index Name']) for node in nodes if node.get('Index Name')}
+                expected = EXPLAIN_SNAPSHOTS[name]
+                if isinstance(expected, tuple):
+                    self.assertTrue(indexes.intersection(expected), f'{name} used {indexes}')
+                elif expected:
+                    self.assertIn(expected, indexes)
+                else:
+                    self.assertTrue(indexes, f'{name} uses no index')
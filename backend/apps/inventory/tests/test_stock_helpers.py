@@ -3,19 +3,37 @@ Unit tests for stock_helpers module
 Tests FIFO logic, atomic deduction, and stock management functions
 """
 
-from django.test import TestCase
+import threading
+import unittest
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
-from django.db import transaction
+from django.db import transaction, connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 from datetime import timedelta, date
 from decimal import Decimal
 
-from apps.inventory.models import Batch, LocationStock, StockMovement
+from apps.inventory.models import (
+    Batch, LocationStock, StockMovement, StockLedgerSnapshot, StockTake, StockTakeItem, StockTransferProgress,
+)
 from apps.inventory.stock_helpers import (
     get_available_stock,
+    get_stock_valuation,
+    get_sellable_stock,
+    get_sellable_stock_many,
+    rebuild_ledger_snapshot,
     get_batch_for_sale,
     deduct_stock,
+    deduct_stock_for_lines,
+    InsufficientStockError,
     add_stock,
     adjust_stock,
+    adjust_stock_many,
+    add_stock_for_lines,
+    transfer_stock_lines,
+    complete_stock_take,
     mark_expired_batches,
     get_expiring_soon
 )
@@ -23,6 +41,7 @@ from apps.products.models import Product, Category
 from apps.outlets.models import Outlet
 from apps.tenants.models import Tenant
 from apps.accounts.models import User
+from primepos.db import close_side_connection
 
 
 class StockHelpersTestCase(TestCase):
@@ -362,6 +381,7 @@ class StockHelpersTestCase(TestCase):
         new_available = get_available_stock(self.product, self.outlet)
         self.assertEqual(new_available, target)
     
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Expiry sweep SQL needs PostgreSQL')
     def test_mark_expired_batches(self):
         """Test marking expired batches"""
         initial_count = self.batch3.quantity
@@ -552,3 +572,575 @@ class StockHelpersEdgeCasesTestCase(TestCase):
         # Should not be available (expiry_date > today excludes today)
         available = get_available_stock(self.product, self.outlet)
         self.assertEqual(available, 0)
+
+
+class StockLedgerSnapshotTestCase(TestCase):
+    """Ledger snapshots stay in step with movement inserts"""
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Snapshot Tenant")
+        self.user = User.objects.create_user(username="snapshot", tenant=self.tenant)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Snapshot Store")
+        self.product = Product.objects.create(
+            tenant=self.tenant,
+            outlet=self.outlet,
+            name="Snapshot Product",
+            retail_price=Decimal("10.00"),
+            cost=Decimal("4.00")
+        )
+        self.expiry = timezone.now().date() + timedelta(days=90)
+
+    def _snapshot(self):
+        return StockLedgerSnapshot.objects.get(product=self.product, outlet=self.outlet)
+
+    def test_snapshot_tracks_additions_and_deductions(self):
+        add_stock(product=self.product, outlet=self.outlet, quantity=50, batch_number="S-1",
+                  expiry_date=self.expiry, cost_price=Decimal("6.00"), user=self.user)
+        add_stock(product=self.product, outlet=self.outlet, quantity=30, batch_number="S-2",
+                  expiry_date=self.expiry + timedelta(days=10), cost_price=Decimal("8.00"), user=self.user)
+        deduct_stock(product=self.product, outlet=self.outlet, quantity=60, user=self.user, reference_id="SNAP-SALE")
+
+        snapshot = self._snapshot()
+        self.assertEqual(snapshot.quantity, 20)
+        self.assertEqual(snapshot.acquired_quantity, 80)
+        self.assertEqual(snapshot.acquired_cost, Decimal("540.00"))
+        self.assertEqual(snapshot.movement_count, 4)
+
+        valuation = get_stock_valuation(self.product, self.outlet)
+        self.assertEqual(valuation['quantity'], 20)
+        self.assertEqual(valuation['unit_cost'], Decimal("6.75"))
+
+    def test_rebuild_matches_incremental_snapshot(self):
+        add_stock(product=self.product, outlet=self.outlet, quantity=40, batch_number="S-1",
+                  expiry_date=self.expiry, cost_price=Decimal("5.25"), user=self.user)
+        deduct_stock(product=self.product, outlet=self.outlet, quantity=15, user=self.user, reference_id="SNAP-1")
+        StockMovement.objects.create(
+            tenant=self.tenant, product=self.product, outlet=self.outlet,
+            movement_type='return', quantity=3, reference_id="SNAP-RET"
+        )
+
+        incremental = self._snapshot()
+        rebuilt = rebuild_ledger_snapshot(self.product, self.outlet)
+        for field in ('quantity', 'acquired_quantity', 'acquired_cost', 'movement_count'):
+            self.assertEqual(getattr(rebuilt, field), getattr(incremental, field), field)
+
+    def test_deduction_cost_independent_of_ledger_length(self):
+        add_stock(product=self.product, outlet=self.outlet, quantity=1000, batch_number="S-1",
+                  expiry_date=self.expiry, cost_price=Decimal("5.00"), user=self.user)
+
+        def count_deduct_queries(reference):
+            with CaptureQueriesContext(connection) as ctx:
+                deduct_stock(product=self.product, outlet=self.outlet, quantity=1, user=self.user, reference_id=reference)
+            return len(ctx.captured_queries)
+
+        baseline = count_deduct_queries("SHORT-LEDGER")
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                tenant=self.tenant, product=self.product, outlet=self.outlet,
+                movement_type='adjustment', quantity=1, quantity_delta=1, unit_cost=Decimal("5.00"),
+                reference_id=f"FILL-{i}"
+            )
+            for i in range(300)
+        ])
+        self.assertEqual(self._snapshot().movement_count, 302)
+        self.assertEqual(count_deduct_queries("LONG-LEDGER"), baseline)
+
+
+class SellableStockManyTestCase(TestCase):
+    """Bulk resolver applies the same precedence as get_sellable_stock"""
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Bulk Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Bulk Store")
+        today = timezone.now().date()
+
+        def make_product(name):
+            return Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=name, retail_price=Decimal("10.00")
+            )
+
+        self.with_batches = make_product("With batches")
+        Batch.objects.create(tenant=self.tenant, product=self.with_batches, outlet=self.outlet,
+                             batch_number="B-1", expiry_date=today + timedelta(days=5), quantity=7)
+        Batch.objects.create(tenant=self.tenant, product=self.with_batches, outlet=self.outlet,
+                             batch_number="B-2", expiry_date=today - timedelta(days=1), quantity=9)
+
+        self.expired_only = make_product("Expired only")
+        LocationStock.objects.create(tenant=self.tenant, product=self.expired_only, outlet=self.outlet, quantity=12)
+        Batch.objects.create(tenant=self.tenant, product=self.expired_only, outlet=self.outlet,
+                             batch_number="E-1", expiry_date=today, quantity=4)
+
+        self.location_only = make_product("Location only")
+        LocationStock.objects.create(tenant=self.tenant, product=self.location_only, outlet=self.outlet, quantity=3)
+
+        self.untracked = make_product("Untracked")
+        self.products = [self.with_batches, self.expired_only, self.location_only, self.untracked]
+
+    def test_precedence_matches_single_product_resolver(self):
+        stock = get_sellable_stock_many(self.products, self.outlet)
+
+        self.assertEqual(stock, {
+            self.with_batches.id: 7,
+            self.expired_only.id: 0,
+            self.location_only.id: 3,
+            self.untracked.id: 0,
+        })
+        for product in self.products:
+            self.assertEqual(get_sellable_stock(product, self.outlet), stock[product.id])
+
+    def test_query_count_is_constant(self):
+        with self.assertNumQueries(1):
+            get_sellable_stock_many(self.products, self.outlet)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_sellable_stock_many([], self.outlet), {})
+
+
+class DeductStockForLinesTestCase(TestCase):
+    """Whole-cart deduction allocates FEFO across lines and writes in bulk"""
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Cart Tenant")
+        self.user = User.objects.create_user(username="cart", tenant=self.tenant)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Cart Store")
+        today = timezone.now().date()
+
+        def make_product(name):
+            return Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=name,
+                retail_price=Decimal("10.00"), cost=Decimal("4.00")
+            )
+
+        self.milk = make_product("Milk")
+        self.milk_early = Batch.objects.create(tenant=self.tenant, product=self.milk, outlet=self.outlet,
+                                               batch_number="M-1", expiry_date=today + timedelta(days=3), quantity=5)
+        self.milk_late = Batch.objects.create(tenant=self.tenant, product=self.milk, outlet=self.outlet,
+                                              batch_number="M-2", expiry_date=today + timedelta(days=30), quantity=10)
+
+        self.bread = make_product("Bread")
+        self.bread_batch = Batch.objects.create(tenant=self.tenant, product=self.bread, outlet=self.outlet,
+                                                batch_number="B-1", expiry_date=today + timedelta(days=2), quantity=4)
+
+        self.soap = make_product("Soap")
+        LocationStock.objects.create(tenant=self.tenant, product=self.soap, outlet=self.outlet, quantity=6)
+
+    def test_allocates_fefo_across_repeated_products(self):
+        deductions = deduct_stock_for_lines(
+            [(self.milk, 3), {'product': self.bread, 'quantity': 4}, (self.milk, 4), (self.soap, 2)],
+            self.outlet, user=self.user, reference_id="CART-1"
+        )
+
+        self.assertEqual([[(batch.batch_number if batch else None, qty) for batch, qty in line] for line in deductions], [
+            [("M-1", 3)],
+            [("B-1", 4)],
+            [("M-1", 2), ("M-2", 2)],
+            [(None, 2)],
+        ])
+        self.milk_early.refresh_from_db()
+        self.milk_late.refresh_from_db()
+        self.assertEqual((self.milk_early.quantity, self.milk_late.quantity), (0, 8))
+        self.assertEqual(LocationStock.objects.get(product=self.soap, outlet=self.outlet).quantity, 4)
+        self.assertEqual(StockMovement.objects.filter(reference_id="CART-1").count(), 5)
+
+    def test_shortage_on_any_line_writes_nothing(self):
+        with self.assertRaises(InsufficientStockError) as ctx:
+            deduct_stock_for_lines(
+                [(self.milk, 10), (self.bread, 1), (self.milk, 6)],
+                self.outlet, user=self.user, reference_id="CART-SHORT"
+            )
+
+        self.assertEqual(ctx.exception.line_index, 2)
+        self.assertEqual((ctx.exception.available, ctx.exception.requested), (5, 6))
+        self.assertFalse(StockMovement.objects.filter(reference_id="CART-SHORT").exists())
+        self.milk_early.refresh_from_db()
+        self.bread_batch.refresh_from_db()
+        self.assertEqual((self.milk_early.quantity, self.bread_batch.quantity), (5, 4))
+
+    def test_movements_written_in_one_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            deduct_stock_for_lines(
+                [(self.milk, 7), (self.bread, 2), (self.soap, 1)],
+                self.outlet, user=self.user, reference_id="CART-BULK"
+            )
+
+        movement_inserts = [
+            query for query in ctx.captured_queries
+            if query['sql'].startswith('INSERT INTO "inventory_stockmovement"')
+        ]
+        self.assertEqual(len(movement_inserts), 1)
+        self.assertEqual(StockMovement.objects.filter(reference_id="CART-BULK").count(), 4)
+
+
+class LocationStockBatchStateTestCase(TestCase):
+    """LocationStock carries sellable/expired/next-expiry columns kept in step with batches"""
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="State Tenant")
+        self.user = User.objects.create_user(username="state", tenant=self.tenant)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="State Store")
+        self.today = timezone.now().date()
+
+        def make_product(name):
+            return Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=name,
+                retail_price=Decimal("10.00"), cost=Decimal("4.00")
+            )
+
+        self.product = make_product("Yoghurt")
+        self.neighbour = make_product("Cheese")
+
+    def _row(self, product=None):
+        return LocationStock.objects.get(product=product or self.product, outlet=self.outlet)
+
+    def test_helpers_maintain_columns(self):
+        add_stock(product=self.product, outlet=self.outlet, quantity=10, batch_number="Y-1",
+                  expiry_date=self.today + timedelta(days=2), user=self.user)
+        add_stock(product=self.product, outlet=self.outlet, quantity=5, batch_number="Y-2",
+                  expiry_date=self.today + timedelta(days=9), user=self.user)
+        deduct_stock(product=self.product, outlet=self.outlet, quantity=12, user=self.user, reference_id="STATE-1")
+
+        row = self._row()
+        self.assertTrue(row.batch_tracked)
+        self.assertEqual(row.sellable_quantity, 3)
+        self.assertEqual(row.expired_quantity, 0)
+        self.assertEqual(row.next_expiry_date, self.today + timedelta(days=9))
+
+    def test_roll_forward_moves_expired_batches_out_of_sellable(self):
+        Batch.objects.create(tenant=self.tenant, product=self.product, outlet=self.outlet,
+                             batch_number="Y-1", expiry_date=self.today + timedelta(days=1), quantity=4)
+        Batch.objects.create(tenant=self.tenant, product=self.product, outlet=self.outlet,
+                             batch_number="Y-2", expiry_date=self.today + timedelta(days=5), quantity=6)
+        self.assertEqual(self._row().sellable_quantity, 10)
+
+        tomorrow = self.today + timedelta(days=1)
+        self.assertEqual(LocationStock.objects.roll_forward_expiry(today=tomorrow), 1)
+        row = self._row()
+        self.assertEqual((row.sellable_quantity, row.expired_quantity), (6, 4))
+        self.assertEqual(row.next_expiry_date, self.today + timedelta(days=5))
+        self.assertEqual(LocationStock.objects.roll_forward_expiry(today=tomorrow), 0)
+
+    def test_stale_row_is_rederived_on_read(self):
+        Batch.objects.create(tenant=self.tenant, product=self.product, outlet=self.outlet,
+                             batch_number="Y-1", expiry_date=self.today + timedelta(days=3), quantity=4)
+        LocationStock.objects.filter(product=self.product, outlet=self.outlet).update(
+            next_expiry_date=self.today, sellable_quantity=99
+        )
+
+        self.assertEqual(get_sellable_stock(self.product, self.outlet), 4)
+
+    def test_quantity_methods_are_product_scoped(self):
+        Batch.objects.create(tenant=self.tenant, product=self.product, outlet=self.outlet,
+                             batch_number="Y-1", expiry_date=self.today + timedelta(days=3), quantity=4)
+        Batch.objects.create(tenant=self.tenant, product=self.product, outlet=self.outlet,
+                             batch_number="Y-OLD", expiry_date=self.today - timedelta(days=3), quantity=2)
+        Batch.objects.create(tenant=self.tenant, product=self.neighbour, outlet=self.outlet,
+                             batch_number="C-1", expiry_date=self.today + timedelta(days=3), quantity=50)
+
+        row = self._row()
+        self.assertEqual(row.get_available_quantity(), 4)
+        self.assertEqual(row.get_total_quantity_including_expired(), 6)
+        self.assertEqual((row.sellable_quantity, row.expired_quantity), (4, 2))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Expiry sweep SQL needs PostgreSQL')
+class MarkExpiredBatchesSweepTestCase(TestCase):
+    """Expiry sweep zeroes batches set-wise, chunked per tenant"""
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.tenants = []
+        self.products = []
+        for index in range(2):
+            tenant = Tenant.objects.create(name=f"Sweep Tenant {index}")
+            outlet = Outlet.objects.create(tenant=tenant, name=f"Sweep Store {index}")
+            for product_index in range(2):
+                product = Product.objects.create(
+                    tenant=tenant, outlet=outlet, name=f"Sweep Product {index}-{product_index}",
+                    retail_price=Decimal("10.00"), cost=Decimal("2.00")
+                )
+                for lot in range(3):
+                    Batch.objects.create(
+                        tenant=tenant, product=product, outlet=outlet, batch_number=f"L-{lot}",
+                        expiry_date=self.today - timedelta(days=lot), quantity=lot + 1,
+                        cost_price=Decimal("3.00")
+                    )
+                Batch.objects.create(
+                    tenant=tenant, product=product, outlet=outlet, batch_number="FRESH",
+                    expiry_date=self.today + timedelta(days=30), quantity=7
+                )
+                self.products.append((product, outlet))
+            self.tenants.append(tenant)
+
+    def test_sweep_all_tenants_in_chunks(self):
+        calls = []
+        count = mark_expired_batches(chunk_size=4, progress=lambda *args: calls.append(args))
+
+        self.assertEqual(count, 12)
+        self.assertFalse(Batch.objects.filter(expiry_date__lte=self.today, quantity__gt=0).exists())
+        self.assertEqual(calls, [
+            (self.tenants[0].id, 4, 6), (self.tenants[0].id, 6, 6),
+            (self.tenants[1].id, 4, 6), (self.tenants[1].id, 6, 6),
+        ])
+
+        movements = StockMovement.objects.filter(movement_type='expiry')
+        self.assertEqual(movements.count(), 12)
+        self.assertEqual(sum(movement.quantity_delta for movement in movements), -24)
+        self.assertTrue(all(movement.unit_cost == Decimal("3.00") for movement in movements))
+
+        for product, outlet in self.products:
+            row = LocationStock.objects.get(product=product, outlet=outlet)
+            self.assertEqual((row.sellable_quantity, row.expired_quantity), (7, 0))
+            self.assertEqual(StockLedgerSnapshot.objects.get(product=product, outlet=outlet).quantity, -6)
+
+    def test_sweep_scoped_to_tenant(self):
+        self.assertEqual(mark_expired_batches(tenant=self.tenants[1]), 6)
+        self.assertEqual(
+            Batch.objects.filter(tenant=self.tenants[0], expiry_date__lte=self.today, quantity__gt=0).count(), 6
+        )
+        self.assertEqual(mark_expired_batches(tenant=self.tenants[1]), 0)
+
+
+class StockTakeCompletionTestCase(TestCase):
+    """Stock take completion applies counts in bulk chunks and can resume"""
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Count Tenant")
+        self.user = User.objects.create_user(username="counter", tenant=self.tenant)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Count Store")
+        self.today = timezone.now().date()
+        self.stock_take = StockTake.objects.create(
+            tenant=self.tenant, outlet=self.outlet, user=self.user, operating_date=self.today
+        )
+
+        self.counts = {}
+        for index, (on_hand, counted) in enumerate([(10, 14), (10, 6), (5, 5), (8, 0), (3, 9)]):
+            product = Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=f"Counted {index}",
+                retail_price=Decimal("10.00"), cost=Decimal("2.00")
+            )
+            add_stock(
+                product=product, outlet=self.outlet, quantity=on_hand, batch_number=f"C-{index}",
+                expiry_date=self.today + timedelta(days=20 + index), cost_price=Decimal("2.00"), user=self.user
+            )
+            StockTakeItem.objects.create(
+                stock_take=self.stock_take, product=product,
+                expected_quantity=on_hand, counted_quantity=counted, is_counted=True
+            )
+            self.counts[product.id] = counted
+
+    def test_complete_sets_stock_to_counts(self):
+        calls = []
+        stock_take = complete_stock_take(
+            self.stock_take, user=self.user, chunk_size=2, progress=lambda *args: calls.append(args)
+        )
+
+        self.assertEqual(stock_take.status, 'completed')
+        self.assertIsNotNone(stock_take.completed_at)
+        self.assertEqual(calls, [(2, 5), (4, 5), (5, 5)])
+        self.assertEqual(get_sellable_stock_many(list(self.counts), self.outlet), self.counts)
+        self.assertFalse(StockTakeItem.objects.filter(stock_take=self.stock_take, applied_at__isnull=True).exists())
+        self.assertEqual(
+            sorted(StockTakeItem.objects.filter(stock_take=self.stock_take).values_list('difference', flat=True)),
+            [-8, -4, 0, 4, 6]
+        )
+        adjustments = StockMovement.objects.filter(movement_type='adjustment')
+        self.assertEqual(adjustments.count(), 4)
+        self.assertTrue(all(movement.reason.startswith(f"Stock take {self.stock_take.id}:") for movement in adjustments))
+        for product_id, counted in self.counts.items():
+            self.assertEqual(Product.objects.get(id=product_id).stock, counted)
+
+    def test_interrupted_completion_resumes_without_reapplying(self):
+        def interrupt(processed, total):
+            raise RuntimeError("worker stopped")
+
+        with self.assertRaises(RuntimeError):
+            complete_stock_take(self.stock_take, user=self.user, chunk_size=2, progress=interrupt)
+
+        self.stock_take.refresh_from_db()
+        self.assertEqual(self.stock_take.status, 'completing')
+        self.assertEqual((self.stock_take.completion_processed, self.stock_take.completion_total), (2, 5))
+
+        stock_take = complete_stock_take(self.stock_take, chunk_size=2)
+
+        self.assertEqual(stock_take.status, 'completed')
+        self.assertEqual(stock_take.completion_processed, 5)
+        self.assertEqual(get_sellable_stock_many(list(self.counts), self.outlet), self.counts)
+        self.assertEqual(StockMovement.objects.filter(movement_type='adjustment').count(), 4)
+
+    def test_adjust_many_matches_single_adjustments(self):
+        soap = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Loose Soap", retail_price=Decimal("3.00")
+        )
+        LocationStock.objects.create(tenant=self.tenant, product=soap, outlet=self.outlet, quantity=9)
+        first, second = list(Product.objects.filter(id__in=self.counts).order_by('id'))[:2]
+
+        applied = adjust_stock_many([(first, 15), {'product': second, 'new_quantity': 7}, (soap, 4)], self.outlet)
+
+        self.assertEqual(applied, {first.id: 5, second.id: -3, soap.id: -5})
+        self.assertEqual(get_sellable_stock_many([first, second, soap], self.outlet), {first.id: 15, second.id: 7, soap.id: 4})
+        adjustment_batch = Batch.objects.get(product=first, batch_number__startswith="ADJ-")
+        self.assertEqual(adjustment_batch.quantity, 5)
+        self.assertEqual(StockLedgerSnapshot.objects.get(product=first, outlet=self.outlet).quantity, 15)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Batch upserts need PostgreSQL')
+class TransferStockLinesTestCase(TestCase):
+    """Multi-line transfers carry batches across outlets with bulk writes"""
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Transfer Tenant")
+        self.user = User.objects.create_user(username="mover", tenant=self.tenant)
+        self.warehouse = Outlet.objects.create(tenant=self.tenant, name="Warehouse")
+        self.branch = Outlet.objects.create(tenant=self.tenant, name="Branch")
+        self.today = timezone.now().date()
+
+        self.products = []
+        for index in range(6):
+            product = Product.objects.create(
+                tenant=self.tenant, outlet=self.warehouse, name=f"Moved {index}",
+                retail_price=Decimal("10.00"), cost=Decimal("1.00")
+            )
+            add_stock_for_lines([
+                {'product': product, 'quantity': 4, 'batch_number': f"W{index}-A",
+                 'expiry_date': self.today + timedelta(days=10), 'cost_price': Decimal("2.50")},
+                {'product': product, 'quantity': 6, 'batch_number': f"W{index}-B",
+                 'expiry_date': self.today + timedelta(days=40), 'cost_price': Decimal("3.00")},
+            ], self.warehouse, user=self.user)
+            self.products.append(product)
+
+    def test_add_stock_for_lines_merges_into_existing_batches(self):
+        product = self.products[0]
+        add_stock_for_lines([
+            {'product': product, 'quantity': 5, 'batch_number': "W0-A", 'expiry_date': self.today + timedelta(days=99)},
+            {'product': product, 'quantity': 1, 'batch_number': "W0-A", 'expiry_date': self.today + timedelta(days=99)},
+        ], self.warehouse, reference_id="PO-7")
+
+        batch = Batch.objects.get(product=product, outlet=self.warehouse, batch_number="W0-A")
+        self.assertEqual((batch.quantity, batch.cost_price, batch.expiry_date), (10, Decimal("2.50"), self.today + timedelta(days=10)))
+        movements = StockMovement.objects.filter(reference_id="PO-7")
+        self.assertEqual([movement.unit_cost for movement in movements], [Decimal("2.50"), Decimal("2.50")])
+        self.assertEqual(get_sellable_stock(product, self.warehouse), 16)
+
+    def test_transfer_preserves_batches_and_costs(self):
+        calls = []
+        with CaptureQueriesContext(connection) as ctx:
+            transfer_stock_lines(
+                [(product, 7) for product in self.products],
+                self.warehouse, self.branch, user=self.user, reference_id="TRF-1",
+                chunk_size=4, progress=lambda *args: calls.append(args)
+            )
+
+        self.assertEqual(calls, [(4, 6), (6, 6)])
+        movement_inserts = [
+            query for query in ctx.captured_queries
+            if query['sql'].startswith('INSERT INTO "inventory_stockmovement"')
+        ]
+        self.assertEqual(len(movement_inserts), 4)
+
+        for index, product in enumerate(self.products):
+            arrived = {
+                batch.batch_number: (batch.quantity, batch.expiry_date, batch.cost_price)
+                for batch in Batch.objects.filter(product=product, outlet=self.branch)
+            }
+            self.assertEqual(arrived, {
+                f"W{index}-A": (4, self.today + timedelta(days=10), Decimal("2.50")),
+                f"W{index}-B": (3, self.today + timedelta(days=40), Decimal("3.00")),
+            })
+            self.assertEqual(get_sellable_stock_many([product], self.branch), {product.id: 7})
+            self.assertEqual(get_sellable_stock_many([product], self.warehouse), {product.id: 3})
+
+        incoming = StockMovement.objects.filter(reference_id="TRF-1", movement_type='transfer_in')
+        self.assertEqual(incoming.count(), 12)
+        self.assertEqual(
+            StockLedgerSnapshot.objects.get(product=self.products[0], outlet=self.branch).acquired_cost,
+            Decimal("19.00")
+        )
+
+    def test_shortage_rolls_back_whole_document(self):
+        lines = [(product, 2) for product in self.products[:5]] + [(self.products[5], 11)]
+
+        with self.assertRaises(InsufficientStockError) as ctx:
+            transfer_stock_lines(lines, self.warehouse, self.branch, reference_id="TRF-SHORT", chunk_size=2)
+
+        self.assertEqual(ctx.exception.line_index, 5)
+        self.assertFalse(StockMovement.objects.filter(reference_id="TRF-SHORT").exists())
+        self.assertFalse(Batch.objects.filter(outlet=self.branch).exists())
+        self.assertEqual(get_sellable_stock(self.products[0], self.warehouse), 10)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Batch upserts need PostgreSQL')
+class TransferProgressTestCase(TransactionTestCase):
+    """Transfer progress is a database row other processes can read before the transfer commits"""
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Progress Tenant")
+        self.user = User.objects.create_user(username="progress", tenant=self.tenant)
+        self.warehouse = Outlet.objects.create(tenant=self.tenant, name="Warehouse")
+        self.branch = Outlet.objects.create(tenant=self.tenant, name="Branch")
+        self.products = [
+            Product.objects.create(
+                tenant=self.tenant, outlet=self.warehouse, name=f"Tracked {index}",
+                retail_price=Decimal("10.00"), cost=Decimal("1.00")
+            )
+            for index in range(3)
+        ]
+        add_stock_for_lines([
+            {'product': product, 'quantity': 5, 'batch_number': f"P{product.id}",
+             'expiry_date': timezone.now().date() + timedelta(days=30), 'cost_price': Decimal("2.00")}
+            for product in self.products
+        ], self.warehouse, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.addCleanup(close_side_connection)
+
+    def _read_elsewhere(self, reference):
+        """Progress as another process sees it, through a connection of its own."""
+        result = []
+
+        def read():
+            try:
+                result.append(StockTransferProgress.objects.filter(reference=reference).values_list(
+                    'status', 'processed_lines', 'total_lines'
+                ).first())
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def _transfer(self, quantity, reference):
+        return self.client.post('/api/v1/inventory/transfer/', {
+            'from_outlet_id': self.warehouse.id,
+            'to_outlet_id': self.branch.id,
+            'reference': reference,
+            'lines': [{'product_id': product.id, 'quantity': quantity} for product in self.products],
+        }, format='json')
+
+    def _progress(self, reference):
+        return self.client.get('/api/v1/inventory/transfer/progress/', {'reference': reference})
+
+    def test_progress_is_visible_while_the_transfer_runs(self):
+        seen = []
+
+        def one_line_chunks(*args, progress, **kwargs):
+            def report(processed, total):
+                progress(processed, total)
+                seen.append(self._read_elsewhere("TRF-PROG"))
+            return transfer_stock_lines(*args, progress=report, chunk_size=1, **kwargs)
+
+        with mock.patch('apps.inventory.views.transfer_stock_lines', side_effect=one_line_chunks):
+            response = self._transfer(2, "TRF-PROG")
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(seen, [('processing', 1, 3), ('processing', 2, 3), ('processing', 3, 3)])
+        progress = self._progress("TRF-PROG").json()
+        self.assertEqual(
+            (progress['status'], progress['processed_lines'], progress['total_lines']), ('completed', 3, 3)
+        )
+
+    def test_shortage_is_reported_as_failed(self):
+        self.assertEqual(self._transfer(9, "TRF-SHORT").status_code, 400)
+
+        self.assertEqual(self._progress("TRF-SHORT").json()['status'], 'failed')
+        self.assertEqual(self._progress("TRF-NONE").status_code, 404)
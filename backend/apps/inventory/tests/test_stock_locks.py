@@ -0,0 +1,156 @@
+"""
+Tests for the stock locking layer: ordered product locks, bounded waits and typed retry
+"""
+
+import threading
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.models import Batch
+from apps.inventory.stock_helpers import deduct_stock_for_lines, get_sellable_stock_many
+from apps.inventory.stock_locks import StockLockContention, lock_products, retry_on_stock_contention
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+from apps.tenants.models import Tenant
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Lock timeouts need PostgreSQL row locks')
+class StockLockingTestCase(TransactionTestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Lock Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Lock Store")
+        self.products = [
+            Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=f"Hot {index}",
+                retail_price=Decimal("5.00"), cost=Decimal("2.00")
+            )
+            for index in range(4)
+        ]
+        for product in self.products:
+            Batch.objects.create(
+                tenant=self.tenant, product=product, outlet=self.outlet, batch_number=f"LOT-{product.id}",
+                quantity=100, expiry_date=timezone.now().date() + timedelta(days=30)
+            )
+
+    def _hold_lock(self, product, locked, release):
+        try:
+            with transaction.atomic():
+                lock_products([product])
+                locked.set()
+                release.wait(5)
+        finally:
+            connection.close()
+
+    def test_products_are_locked_in_id_order_with_a_timeout(self):
+        with CaptureQueriesContext(connection) as ctx, transaction.atomic():
+            locked = lock_products(reversed(self.products), timeout_ms=250)
+
+        self.assertEqual(list(locked), sorted(product.id for product in self.products))
+        statements = [query['sql'] for query in ctx.captured_queries if query['sql'] not in ('BEGIN', 'COMMIT')]
+        self.assertEqual(statements[0], 'SET LOCAL lock_timeout = 250')
+        self.assertTrue(statements[1].endswith('ORDER BY "products_product"."id" ASC FOR UPDATE'))
+
+    def test_lock_timeout_surfaces_as_typed_contention(self):
+        locked, release = threading.Event(), threading.Event()
+        holder = threading.Thread(target=self._hold_lock, args=(self.products[0], locked, release))
+        holder.start()
+        locked.wait(5)
+
+        @retry_on_stock_contention(attempts=2, backoff_ms=1)
+        def sell():
+            lock_products([self.products[0]], timeout_ms=50)
+
+        try:
+            with self.assertRaises(StockLockContention) as raised:
+                sell()
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual((raised.exception.reason, raised.exception.attempts), ('lock_timeout', 2))
+
+    @override_settings(STOCK_LOCK_TIMEOUT_MS=100)
+    def test_retry_succeeds_once_the_lock_is_released(self):
+        locked, release = threading.Event(), threading.Event()
+        holder = threading.Thread(target=self._hold_lock, args=(self.products[1], locked, release))
+        holder.start()
+        locked.wait(5)
+        attempts = []
+
+        @retry_on_stock_contention(attempts=5, backoff_ms=20)
+        def sell():
+            attempts.append(1)
+            if len(attempts) == 2:
+                release.set()
+            return deduct_stock_for_lines([(self.products[1], 3)], self.outlet)
+
+        sell()
+        holder.join()
+
+        self.assertGreaterEqual(len(attempts), 2)
+        self.assertEqual(get_sellable_stock_many([self.products[1]], self.outlet), {self.products[1].id: 97})
+
+    def test_overlapping_baskets_in_opposite_order_do_not_deadlock(self):
+        errors = []
+
+        def till(basket):
+            try:
+                for _ in range(10):
+                    retry_on_stock_contention(attempts=1)(deduct_stock_for_lines)(
+                        [(product, 1) for product in basket], self.outlet
+                    )
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        tills = [
+            threading.Thread(target=till, args=(self.products,)),
+            threading.Thread(target=till, args=(list(reversed(self.products)),)),
+        ]
+        for thread in tills:
+            thread.start()
+        for thread in tills:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            set(get_sellable_stock_many(self.products, self.outlet).values()), {80}
+        )
+
+
+class StockContentionResponseTestCase(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Busy Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Busy Store")
+        self.product = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Busy", retail_price=Decimal("5.00"), cost=Decimal("2.00")
+        )
+        user = User.objects.create_user(
+            username="busy", email="busy@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=user)
+
+    @override_settings(STOCK_LOCK_RETRIES=2, STOCK_LOCK_BACKOFF_MS=0)
+    def test_contention_after_retrying_answers_409_with_retry_after(self):
+        with mock.patch(
+            'apps.inventory.views.lock_products', side_effect=StockLockContention('lock_timeout')
+        ) as locked:
+            response = self.client.post('/api/v1/inventory/adjust/', {
+                'product_id': self.product.id, 'outlet_id': self.outlet.id, 'quantity': 5,
+            }, format='json')
+
+        self.assertEqual(locked.call_count, 2)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['code'], 'stock_busy')
+        self.assertEqual(response['Retry-After'], '1')
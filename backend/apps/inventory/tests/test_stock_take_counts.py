@@ -0,0 +1,101 @@
+"""
+API tests for bulk stock take count entry
+"""
+
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.models import LocationStock, StockTake, StockTakeItem
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+from apps.tenants.models import Tenant
+
+
+class StockTakeCountsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.tenant = Tenant.objects.create(name="Scan Tenant")
+        self.user = User.objects.create_user(
+            username="scanner", email="scanner@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.client.force_authenticate(user=self.user)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Scan Store")
+        self.client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+
+        self.stock_take = StockTake.objects.create(
+            tenant=self.tenant, outlet=self.outlet, user=self.user, operating_date=timezone.now().date()
+        )
+        self.products = []
+        for index in range(30):
+            product = Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=f"Scan {index}",
+                barcode=f"60012345{index:04d}AB", retail_price=Decimal("5.00"), cost=Decimal("2.00")
+            )
+            StockTakeItem.objects.create(
+                stock_take=self.stock_take, product=product, expected_quantity=10, counted_quantity=0
+            )
+            self.products.append(product)
+
+        self.url = f"/api/v1/inventory/stock-take/{self.stock_take.id}/counts/"
+
+    def test_bulk_counts_by_id_and_barcode(self):
+        late = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Late Arrival", barcode="LATE-1",
+            retail_price=Decimal("5.00"), cost=Decimal("2.00")
+        )
+        LocationStock.objects.create(tenant=self.tenant, product=late, outlet=self.outlet, quantity=4)
+
+        entries = [{'product_id': product.id, 'counted_quantity': 12} for product in self.products[:20]]
+        entries += [{'barcode': product.barcode.lower(), 'counted_quantity': 8} for product in self.products[20:]]
+        entries += [
+            {'barcode': 'late-1', 'counted_quantity': 3},
+            {'barcode': 'UNKNOWN', 'counted_quantity': 1},
+            {'product_id': self.products[0].id, 'counted_quantity': -1},
+        ]
+
+        response = self.client.post(self.url, {'entries': entries}, format='json')
+
+        self.assertEqual(response.status_code, 200, response.content)
+        payload = response.json()
+        self.assertEqual(payload['applied'], 31)
+        self.assertEqual([error['index'] for error in payload['errors']], [31, 32])
+        self.assertEqual(payload['summary']['counted_items'], 31)
+        self.assertEqual(payload['summary']['expected_total_quantity'], 304)
+        self.assertEqual(payload['summary']['counted_total_quantity'], 323)
+        self.assertEqual(payload['summary']['valuation_difference'], '38.00')
+
+        item = StockTakeItem.objects.get(stock_take=self.stock_take, product=self.products[25])
+        self.assertEqual((item.counted_quantity, item.difference, item.is_counted), (8, -2, True))
+        self.assertEqual(item.counted_by, self.user)
+        late_item = StockTakeItem.objects.get(stock_take=self.stock_take, product=late)
+        self.assertEqual((late_item.expected_quantity, late_item.counted_quantity), (4, 3))
+
+    def test_item_writes_are_one_bulk_update(self):
+        entries = [{'barcode': product.barcode, 'counted_quantity': 9} for product in self.products]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, {'entries': entries}, format='json')
+
+        self.assertEqual(response.status_code, 200, response.content)
+        item_updates = [
+            query for query in ctx.captured_queries
+            if query['sql'].startswith('UPDATE "inventory_stocktakeitem"')
+        ]
+        self.assertEqual(len(item_updates), 1)
+        self.assertEqual(response.json()['summary']['counted_total_quantity'], 270)
+
+    def test_counts_rejected_once_stock_take_is_not_running(self):
+        StockTake.objects.filter(pk=self.stock_take.pk).update(status='completed')
+
+        response = self.client.post(
+            self.url, {'entries': [{'product_id': self.products[0].id, 'counted_quantity': 1}]}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(StockTakeItem.objects.get(product=self.products[0]).counted_quantity, 0)
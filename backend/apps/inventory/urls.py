@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import StockMovementViewSet, StockTakeViewSet, StockTakeItemViewSet, LocationStockViewSet, BatchViewSet, adjust, transfer, receive
+from .views import StockMovementViewSet, StockTakeViewSet, StockTakeItemViewSet, LocationStockViewSet, BatchViewSet, adjust, transfer, transfer_progress, receive
 
 router = DefaultRouter()
 router.register(r'inventory/movements', StockMovementViewSet, basename='stockmovement')
@@ -17,5 +17,6 @@ urlpatterns = [
     path('', include(router.urls)),
     path('inventory/adjust/', adjust, name='stock-adjust'),
     path('inventory/transfer/', transfer, name='stock-transfer'),
+    path('inventory/transfer/progress/', transfer_progress, name='stock-transfer-progress'),
     path('inventory/receive/', receive, name='stock-receive'),
 ]
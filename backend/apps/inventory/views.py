@@ -10,14 +10,27 @@ from django.utils import timezone
 from decimal import Decimal, InvalidOperation
 from datetime import datetime, timedelta
 import logging
-from .models import StockMovement, StockTake, StockTakeItem, LocationStock, Batch
+from .models import StockMovement, StockTake, StockTakeItem, StockTransferProgress, LocationStock, Batch
 from .serializers import StockMovementSerializer, StockTakeSerializer, StockTakeListSerializer, StockTakeItemSerializer, LocationStockSerializer, BatchSerializer
-from .stock_helpers import get_available_stock, deduct_stock, add_stock, adjust_stock, mark_expired_batches, get_expiring_soon
+from .goods_receipt import MAX_RECEIPT_LINES, parse_delivery_note, receive_goods
+from .jobs import enqueue_stock_take_completion
+from .pagination import KeysetPagination
+from .stock_helpers import (
+    get_available_stock, get_sellable_stock_many, deduct_stock, add_stock, adjust_stock, mark_expired_batches,
+    get_expiring_soon, begin_stock_take_completion, complete_stock_take, transfer_stock_lines,
+    InsufficientStockError,
+)
 from apps.products.models import Product
+from .stock_locks import lock_products, retry_on_stock_contention
 from apps.tenants.permissions import TenantFilterMixin, HasTenantModuleAccess
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on entries accepted by one stock take counts request
+MAX_COUNT_ENTRIES = 1000
+# Upper bound on lines in one transfer document
+MAX_TRANSFER_LINES = 2000
+
 
 class StockMovementViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
     """Stock movement ViewSet - tracks inventory movements"""
@@ -25,8 +38,11 @@ class StockMovementViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
     serializer_class = StockMovementSerializer
     permission_classes = [IsAuthenticated, HasTenantModuleAccess]
     required_tenant_permissions = ['allow_inventory']
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # Ordering is part of the keyset, so it is applied by the paginator
+    filter_backends = [DjangoFilterBackend, SearchFilter]
     filterset_fields = ['tenant', 'product', 'outlet', 'movement_type']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
     ordering_fields = ['created_at']
     ordering = ['-created_at']
     
@@ -60,8 +76,7 @@ class StockMovementViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
         if not is_saas_admin:
             if tenant:
                 queryset = queryset.filter(tenant=tenant)
-                count = queryset.count()
-                logger.info(f"Applied tenant filter: {tenant.id} ({tenant.name}) - {count} movements found")
+                logger.info(f"Applied tenant filter: {tenant.id} ({tenant.name})")
             else:
                 logger.error(f"CRITICAL: No tenant found for user {user.email} (ID: {user.id}). User must have a tenant assigned to view inventory.")
                 logger.error(f"User tenant: {user_tenant}, Request tenant: {request_tenant}")
@@ -83,6 +98,24 @@ class StockMovementViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
                 pass
         
         return queryset
+
+    def get_keyset_total(self, queryset, request):
+        """Movement total from the ledger snapshots; None when a filter they cannot answer is set."""
+        from .models import StockLedgerSnapshot
+
+        if request.query_params.get('movement_type'):
+            return None
+        tenant = getattr(request, 'tenant', None) or getattr(request.user, 'tenant', None)
+        snapshots = StockLedgerSnapshot.objects.all()
+        if not getattr(request.user, 'is_saas_admin', False):
+            snapshots = snapshots.filter(tenant=tenant)
+        outlet = self.get_outlet_for_request(request)
+        outlet_id = outlet.id if outlet else request.query_params.get('outlet')
+        if outlet_id:
+            snapshots = snapshots.filter(outlet_id=outlet_id)
+        if request.query_params.get('product'):
+            snapshots = snapshots.filter(product_id=request.query_params.get('product'))
+        return snapshots.aggregate(total=Sum('movement_count'))['total'] or 0
     
     def perform_create(self, serializer):
         """Create stock movement and update batches/LocationStock if product is provided"""
@@ -585,56 +618,55 @@ class StockTakeViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        if stock_take.status != 'running':
+        if stock_take.status not in ('running', 'completing'):
             return Response(
                 {"detail": "Stock take is not running"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        with transaction.atomic():
-            # Apply adjustments
-            for item in stock_take.items.all():
-                difference = item.counted_quantity - item.expected_quantity
-                if item.difference != difference:
-                    StockTakeItem.objects.filter(id=item.id).update(difference=difference)
-                if difference == 0:
-                    continue
+        background = str(
+            request.query_params.get('background', request.data.get('background', ''))
+        ).lower() in ('1', 'true', 'yes')
+        if background or stock_take.status == 'completing':
+            # Applied in chunks by the job worker; complete_stock_takes can also resume it
+            stock_take = begin_stock_take_completion(stock_take)
+            enqueue_stock_take_completion(stock_take, user=request.user)
+            return Response(self._completion_progress(stock_take), status=status.HTTP_202_ACCEPTED)
 
-                product = item.product
-                variation = getattr(item, 'variation', None)
-
-                # If product is missing but variation exists, get product from variation
-                if not product and variation:
-                    product = variation.product
+        try:
+            stock_take = complete_stock_take(stock_take, user=request.user)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-                if not product:
-                    logger.error(f"StockTakeItem {item.id} has no product or variation. Skipping.")
-                    continue
+        serializer = self.get_serializer(stock_take)
+        return Response(serializer.data)
 
-                # Tenant safety
-                if product.tenant != stock_take.tenant:
-                    logger.warning(f"Tenant mismatch for StockTakeItem {item.id} in stock_take {stock_take.id}")
-                    continue
+    def _completion_progress(self, stock_take):
+        total = stock_take.completion_total
+        processed = stock_take.completion_processed
+        return {
+            'stock_take_id': stock_take.id,
+            'status': stock_take.status,
+            'completion_total': total,
+            'completion_processed': processed,
+            'completion_percent': round((processed / total) * 100, 2) if total > 0 else 0.0,
+            'completed_at': stock_take.completed_at,
+        }
 
-                adjust_stock(
-                    product=product,
-                    outlet=stock_take.outlet,
-                    new_quantity=item.counted_quantity,
-                    user=request.user,
-                    reason=f"Stock take {stock_take.id}: Expected {item.expected_quantity}, Counted {item.counted_quantity}",
-                )
-                logger.info(
-                    f"Stock take adjusted for {product.name}: "
-                    f"{item.expected_quantity} -> {item.counted_quantity}"
-                )
+    @action(detail=True, methods=["get"])
+    def progress(self, request, pk=None):
+        """Return how far a stock take completion has got."""
+        stock_take = self.get_object()
+        tenant = getattr(request, 'tenant', None) or request.user.tenant
 
-            # Complete the stock take
-            stock_take.status = 'completed'
-            stock_take.completed_at = timezone.now()
-            stock_take.save(update_fields=['status', 'completed_at'])
+        from apps.tenants.permissions import is_admin_user
+        if not is_admin_user(request.user) and tenant and stock_take.tenant != tenant:
+            return Response(
+                {"detail": "You do not have permission to view this stock take."},
+                status=status.HTTP_403_FORBIDDEN
+            )
 
-        serializer = self.get_serializer(stock_take)
-        return Response(serializer.data)
+        return Response(self._completion_progress(stock_take))
 
     @action(detail=True, methods=["get"])
     def summary(self, request, pk=None):
@@ -649,39 +681,42 @@ class StockTakeViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        items = list(stock_take.items.select_related('product').all())
-        total_items = len(items)
-
-        def is_counted(item):
-            if getattr(item, 'is_counted', False):
-                return True
-            if getattr(item, 'counted_at', None):
-                return True
-            return False
+        return Response(self._summary_figures(stock_take))
+
+    def _summary_figures(self, stock_take):
+        """Stock take KPIs aggregated in the database from the line snapshots."""
+        from django.db.models import DecimalField, ExpressionWrapper, F, Value
+        from django.db.models.functions import Abs, Coalesce
+
+        totals = stock_take.items.annotate(
+            variance=F('counted_quantity') - F('expected_quantity')
+        ).aggregate(
+            total_items=Count('id'),
+            counted_items=Count('id', filter=Q(is_counted=True) | Q(counted_at__isnull=False)),
+            expected_total=Coalesce(Sum('expected_quantity'), 0),
+            counted_total=Coalesce(Sum('counted_quantity'), 0),
+            absolute_variance_total=Coalesce(Sum(Abs('variance')), 0),
+            valuation_difference=Sum(ExpressionWrapper(
+                F('variance') * Coalesce('product__cost', Value(Decimal('0.00'))),
+                output_field=DecimalField(max_digits=18, decimal_places=2),
+            )),
+        )
 
-        counted_items = sum(1 for item in items if is_counted(item))
+        total_items = totals['total_items']
+        counted_items = totals['counted_items']
         completion_percent = round((counted_items / total_items) * 100, 2) if total_items > 0 else 0.0
 
-        expected_total = sum(int(item.expected_quantity or 0) for item in items)
-        counted_total = sum(int(item.counted_quantity or 0) for item in items)
-        variance_total = counted_total - expected_total
-        absolute_variance_total = sum(abs(int(item.counted_quantity or 0) - int(item.expected_quantity or 0)) for item in items)
-
+        expected_total = int(totals['expected_total'])
+        counted_total = int(totals['counted_total'])
+        absolute_variance_total = int(totals['absolute_variance_total'])
         if expected_total > 0:
             accuracy_percent = round(max(0.0, (1 - (absolute_variance_total / expected_total)) * 100), 2)
         else:
             accuracy_percent = 100.0
 
-        valuation_difference = Decimal('0.00')
-        for item in items:
-            product = item.product
-            if not product:
-                continue
-            unit_cost = product.cost if product.cost is not None else Decimal('0.00')
-            difference = Decimal(int(item.counted_quantity or 0) - int(item.expected_quantity or 0))
-            valuation_difference += difference * unit_cost
+        valuation_difference = totals['valuation_difference'] or Decimal('0.00')
 
-        return Response({
+        return {
             'stock_take_id': stock_take.id,
             'status': stock_take.status,
             'total_items': total_items,
@@ -689,16 +724,153 @@ class StockTakeViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             'completion_percent': completion_percent,
             'expected_total_quantity': expected_total,
             'counted_total_quantity': counted_total,
-            'variance_total_quantity': variance_total,
+            'variance_total_quantity': counted_total - expected_total,
             'absolute_variance_total_quantity': absolute_variance_total,
             'accuracy_percent': accuracy_percent,
             'valuation_difference': str(valuation_difference.quantize(Decimal('0.01'))),
-        })
+        }
+
+    @action(detail=True, methods=["post"])
+    def counts(self, request, pk=None):
+        """Record many counts in one request.
+
+        Body: {"entries": [{"product_id" | "barcode", "counted_quantity"}, ...]}.
+        Entries are applied with one bulk update; later entries for the same
+        product win. Unresolvable entries are reported in 'errors' and skipped.
+        Returns the applied count and the refreshed summary figures.
+        """
+        stock_take = self.get_object()
+        tenant = getattr(request, 'tenant', None) or request.user.tenant
+
+        from apps.tenants.permissions import is_admin_user
+        if not is_admin_user(request.user) and tenant and stock_take.tenant != tenant:
+            return Response(
+                {"detail": "You do not have permission to update this stock take."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        entries = request.data.get('entries')
+        if not isinstance(entries, list) or not entries:
+            return Response(
+                {"entries": "A non-empty list of counts is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(entries) > MAX_COUNT_ENTRIES:
+            return Response(
+                {"entries": f"At most {MAX_COUNT_ENTRIES} counts can be sent per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        errors = []
+        parsed = []
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                errors.append({'index': index, 'detail': 'Each entry must be an object'})
+                continue
+            try:
+                counted_quantity = int(entry.get('counted_quantity'))
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'detail': 'counted_quantity must be a whole number'})
+                continue
+            if counted_quantity < 0:
+                errors.append({'index': index, 'detail': 'counted_quantity cannot be negative'})
+                continue
 
+            product_id = entry.get('product_id') or entry.get('product')
+            barcode = str(entry.get('barcode') or '').strip()
+            if product_id not in (None, ''):
+                try:
+                    parsed.append((index, int(product_id), None, counted_quantity))
+                except (TypeError, ValueError):
+                    errors.append({'index': index, 'detail': 'Invalid product_id'})
+            elif barcode:
+                parsed.append((index, None, barcode.upper(), counted_quantity))
+            else:
+                errors.append({'index': index, 'detail': 'product_id or barcode is required'})
+
+        from django.db.models.functions import Upper
+
+        products = Product.objects.filter(tenant=stock_take.tenant, outlet=stock_take.outlet)
+        known_ids = set(
+            products.filter(id__in={product_id for _, product_id, _, _ in parsed if product_id})
+            .values_list('id', flat=True)
+        )
+        barcode_matches = {}
+        for product_id, barcode_key in (
+            products.annotate(barcode_key=Upper('barcode'))
+            .filter(barcode_key__in={key for _, _, key, _ in parsed if key})
+            .values_list('id', 'barcode_key')
+        ):
+            barcode_matches.setdefault(barcode_key, []).append(product_id)
+
+        counts = {}
+        for index, product_id, barcode_key, counted_quantity in parsed:
+            if barcode_key is not None:
+                matches = barcode_matches.get(barcode_key, [])
+                if len(matches) != 1:
+                    detail = 'Barcode not found' if not matches else 'Barcode matches more than one product'
+                    errors.append({'index': index, 'detail': detail})
+                    continue
+                product_id = matches[0]
+            elif product_id not in known_ids:
+                errors.append({'index': index, 'detail': 'Product not found in this stock take outlet'})
+                continue
+            counts[product_id] = counted_quantity
+
+        with transaction.atomic():
+            stock_take = StockTake.objects.select_for_update().get(pk=stock_take.pk)
+            if stock_take.status != 'running':
+                return Response(
+                    {"detail": "Stock take is not running"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            items = {
+                item.product_id: item
+                for item in StockTakeItem.objects.filter(stock_take=stock_take, product_id__in=counts)
+            }
+            missing_ids = sorted(counts.keys() - items.keys())
+            if missing_ids:
+                # Products added to the outlet after the stock take started
+                expected = get_sellable_stock_many(missing_ids, stock_take.outlet)
+                StockTakeItem.objects.bulk_create([
+                    StockTakeItem(
+                        stock_take=stock_take,
+                        product_id=product_id,
+                        expected_quantity=max(0, expected.get(product_id, 0)),
+                        counted_quantity=0,
+                    )
+                    for product_id in missing_ids
+                ], ignore_conflicts=True)
+                items = {
+                    item.product_id: item
+                    for item in StockTakeItem.objects.filter(stock_take=stock_take, product_id__in=counts)
+                }
+
+            now = timezone.now()
+            for product_id, item in items.items():
+                item.counted_quantity = counts[product_id]
+                item.difference = item.counted_quantity - item.expected_quantity
+                item.is_counted = True
+                item.counted_at = item.counted_at or now
+                item.counted_by_id = item.counted_by_id or request.user.id
+                item.updated_at = now
+            StockTakeItem.objects.bulk_update(
+                list(items.values()),
+                ['counted_quantity', 'difference', 'is_counted', 'counted_at', 'counted_by', 'updated_at'],
+                batch_size=500,
+            )
+
+        return Response({
+            'applied': len(items),
+            'errors': sorted(errors, key=lambda error: error['index']),
+            'summary': self._summary_figures(stock_take),
+        })
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@retry_on_stock_contention
 def adjust(request):
     """Manual stock adjustment"""
     logger.info(f"Stock adjustment request: {request.data}")
@@ -723,46 +895,44 @@ def adjust(request):
     
     logger.info(f"Processing adjustment for tenant={tenant.id}, product={product_id}, outlet={outlet_id}, quantity={quantity}")
     
-    with transaction.atomic():
-        try:
-            # select_for_update must be inside the transaction
-            product = Product.objects.select_for_update().get(id=product_id, tenant=tenant)
-            logger.info(f"Found product: {product.name}, current stock: {product.stock}")
-        except Product.DoesNotExist:
-            logger.error(f"Product {product_id} not found for tenant {tenant.id}")
-            return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
-        
-        # Get outlet
-        from apps.outlets.models import Outlet
-        try:
-            outlet = Outlet.objects.get(id=outlet_id, tenant=tenant)
-        except Outlet.DoesNotExist:
-            logger.error(f"Outlet {outlet_id} not found for tenant {tenant.id}")
-            return Response({"detail": "Outlet not found"}, status=status.HTTP_404_NOT_FOUND)
-        
-        # UNITS ONLY ARCHITECTURE: No variations — track per-Product and Batch
-        try:
-            quantity = int(quantity)
-        except (TypeError, ValueError):
-            return Response({"detail": "quantity must be a valid integer"}, status=status.HTTP_400_BAD_REQUEST)
-
-        if movement_type != 'adjustment':
-            return Response({"detail": "Only adjustment movements are allowed here."}, status=status.HTTP_400_BAD_REQUEST)
-
-        current_quantity = get_available_stock(product, outlet)
-        target_quantity = max(0, current_quantity + quantity)
-        adjust_stock(
-            product=product,
-            outlet=outlet,
-            new_quantity=target_quantity,
-            user=request.user,
-            reason=reason or "Manual stock adjustment",
-        )
-        movement = StockMovement.objects.filter(
-            product=product,
-            outlet=outlet,
-            movement_type='adjustment',
-        ).latest('created_at')
+    try:
+        product = lock_products(Product.objects.filter(id=product_id, tenant=tenant))[int(product_id)]
+        logger.info(f"Found product: {product.name}, current stock: {product.stock}")
+    except (KeyError, TypeError, ValueError):
+        logger.error(f"Product {product_id} not found for tenant {tenant.id}")
+        return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+    # Get outlet
+    from apps.outlets.models import Outlet
+    try:
+        outlet = Outlet.objects.get(id=outlet_id, tenant=tenant)
+    except Outlet.DoesNotExist:
+        logger.error(f"Outlet {outlet_id} not found for tenant {tenant.id}")
+        return Response({"detail": "Outlet not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+    # UNITS ONLY ARCHITECTURE: No variations — track per-Product and Batch
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return Response({"detail": "quantity must be a valid integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if movement_type != 'adjustment':
+        return Response({"detail": "Only adjustment movements are allowed here."}, status=status.HTTP_400_BAD_REQUEST)
+
+    current_quantity = get_available_stock(product, outlet)
+    target_quantity = max(0, current_quantity + quantity)
+    adjust_stock(
+        product=product,
+        outlet=outlet,
+        new_quantity=target_quantity,
+        user=request.user,
+        reason=reason or "Manual stock adjustment",
+    )
+    movement = StockMovement.objects.filter(
+        product=product,
+        outlet=outlet,
+        movement_type='adjustment',
+    ).latest('created_at')
     
     serializer = StockMovementSerializer(movement)
     logger.info(f"Returning movement data: {serializer.data}")
@@ -771,86 +941,144 @@ def adjust(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@retry_on_stock_contention
 def transfer(request):
-    """Transfer stock between outlets"""
-    product_id = request.data.get('product_id')
+    """Transfer stock between outlets
+
+    Accepts a transfer document with many lines:
+    {from_outlet_id, to_outlet_id, lines: [{product_id, quantity}, ...], reference?, reason?}
+    The single-product form (product_id + quantity) is still accepted as a one-line document.
+    Progress of large documents can be polled at inventory/transfer/progress/?reference=...
+    """
     from_outlet_id = request.data.get('from_outlet_id')
     to_outlet_id = request.data.get('to_outlet_id')
-    quantity = request.data.get('quantity')
     reason = request.data.get('reason', '')
     is_return_raw = request.data.get('is_return', False)
     is_return = str(is_return_raw).lower() in ['true', '1', 'yes']
     return_number = request.data.get('return_number')
-    
-    if not all([product_id, from_outlet_id, to_outlet_id, quantity]):
+
+    raw_lines = request.data.get('lines')
+    if raw_lines is None and request.data.get('product_id'):
+        raw_lines = [{'product_id': request.data.get('product_id'), 'quantity': request.data.get('quantity')}]
+
+    if not all([from_outlet_id, to_outlet_id, raw_lines]):
         return Response(
-            {"detail": "product_id, from_outlet_id, to_outlet_id, and quantity are required"},
+            {"detail": "from_outlet_id, to_outlet_id and lines (or product_id and quantity) are required"},
             status=status.HTTP_400_BAD_REQUEST
         )
-    
-    if from_outlet_id == to_outlet_id:
+    if not isinstance(raw_lines, list) or len(raw_lines) > MAX_TRANSFER_LINES:
+        return Response(
+            {"lines": f"lines must be a list of at most {MAX_TRANSFER_LINES} entries"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if str(from_outlet_id) == str(to_outlet_id):
         return Response(
             {"detail": "Source and destination outlets must be different"},
             status=status.HTTP_400_BAD_REQUEST
         )
-    
+
     tenant = getattr(request, 'tenant', None) or request.user.tenant
     if not tenant:
         return Response({"detail": "User must have a tenant"}, status=status.HTTP_400_BAD_REQUEST)
-    
-    with transaction.atomic():
-        try:
-            # select_for_update must be inside the transaction
-            product = Product.objects.select_for_update().get(id=product_id, tenant=tenant)
-        except Product.DoesNotExist:
-            return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
-        from apps.outlets.models import Outlet
-        try:
-            source_outlet = Outlet.objects.get(id=from_outlet_id, tenant=tenant)
-            destination_outlet = Outlet.objects.get(id=to_outlet_id, tenant=tenant)
-            quantity = int(quantity)
-            if quantity <= 0:
-                raise ValueError
-        except (Outlet.DoesNotExist, TypeError, ValueError):
-            return Response({"detail": "Valid tenant outlets and a positive quantity are required"}, status=status.HTTP_400_BAD_REQUEST)
-
-        transfer_reference = return_number or f"TRF-{timezone.now().strftime('%Y%m%d%H%M%S')}-{product.id}"
-        transfer_reason = reason or ('Outlet return' if is_return else 'Outlet transfer')
-        deductions = deduct_stock(
-            product=product,
-            outlet=source_outlet,
-            quantity=quantity,
+
+    try:
+        requested = [(int(line['product_id']), int(line['quantity'])) for line in raw_lines]
+        if any(quantity <= 0 for _, quantity in requested):
+            raise ValueError
+    except (KeyError, TypeError, ValueError):
+        return Response(
+            {"detail": "Every line needs a product_id and a positive quantity"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    transfer_reference = (
+        return_number or request.data.get('reference')
+        or f"TRF-{timezone.now().strftime('%Y%m%d%H%M%S')}-{requested[0][0]}"
+    )
+    transfer_reason = reason or ('Outlet return' if is_return else 'Outlet transfer')
+
+    def report(processed, total, state='processing'):
+        StockTransferProgress.objects.record(tenant.id, transfer_reference, state, processed, total)
+
+    from apps.outlets.models import Outlet
+    # lock_products keeps concurrent transfers deadlock-free
+    products = lock_products(Product.objects.filter(
+        id__in={product_id for product_id, _ in requested}, tenant=tenant
+    ))
+    missing = sorted({product_id for product_id, _ in requested} - products.keys())
+    if missing:
+        return Response({"detail": "Product not found", "product_ids": missing}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        source_outlet = Outlet.objects.get(id=from_outlet_id, tenant=tenant)
+        destination_outlet = Outlet.objects.get(id=to_outlet_id, tenant=tenant)
+    except (Outlet.DoesNotExist, TypeError, ValueError):
+        return Response({"detail": "Valid tenant outlets and a positive quantity are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    report(0, len(requested))
+    try:
+        transfer_stock_lines(
+            [(products[product_id], quantity) for product_id, quantity in requested],
+            source_outlet,
+            destination_outlet,
             user=request.user,
             reference_id=transfer_reference,
             reason=transfer_reason,
-            movement_type='transfer_out',
+            progress=report,
         )
-        for batch, moved_quantity in deductions:
-            add_stock(
-                product=product,
-                outlet=destination_outlet,
-                quantity=moved_quantity,
-                batch_number=batch.batch_number if batch else f"{transfer_reference}-{product.id}",
-                expiry_date=batch.expiry_date if batch else timezone.now().date() + timedelta(days=365),
-                cost_price=batch.cost_price if batch else product.cost,
-                user=request.user,
-                movement_type='transfer_in',
-                reference_id=transfer_reference,
-                reason=transfer_reason,
-            )
-    
-    return Response({"message": "Stock transfer recorded"}, status=status.HTTP_201_CREATED)
+    except InsufficientStockError as e:
+        report(0, len(requested), 'failed')
+        return Response(
+            {"detail": str(e), "line_index": e.line_index, "product_id": e.product.id},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception:
+        report(0, len(requested), 'failed')
+        raise
+
+    transaction.on_commit(lambda: report(len(requested), len(requested), 'completed'))
+    return Response(
+        {"message": "Stock transfer recorded", "reference": transfer_reference, "lines": len(requested)},
+        status=status.HTTP_201_CREATED
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def transfer_progress(request):
+    """Report how many lines of a transfer document have been moved."""
+    reference = request.query_params.get('reference')
+    if not reference:
+        return Response({"detail": "reference query parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    tenant = getattr(request, 'tenant', None) or request.user.tenant
+    if not tenant:
+        return Response({"detail": "User must have a tenant"}, status=status.HTTP_400_BAD_REQUEST)
+
+    state = StockTransferProgress.objects.filter(tenant=tenant, reference=reference).first()
+    if state is None:
+        return Response({"detail": "No transfer in progress with this reference"}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'reference': reference,
+        'status': state.status,
+        'processed_lines': state.processed_lines,
+        'total_lines': state.total_lines,
+    })
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@retry_on_stock_contention
 def receive(request):
-    """Receive inventory from suppliers (purchase)"""
-    logger.info(f"Receiving request: {request.data}")
+    """Receive inventory from suppliers (purchase)
+
+    Lines come from 'items' or a 'delivery_note' (CSV upload, CSV text or JSON list),
+    see apps.inventory.goods_receipt. All valid lines are booked in one bulk pass.
+    """
+    logger.info(f"Receiving request for outlet {request.data.get('outlet_id')}")
     
     outlet_id = request.data.get('outlet_id')
     supplier = request.data.get('supplier', '')
-    items = request.data.get('items', [])
     reason = request.data.get('reason', '')
     
     if not outlet_id:
@@ -859,117 +1087,53 @@ def receive(request):
             {"detail": "outlet_id is required"},
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    try:
+        items = parse_delivery_note(request.data, request.FILES)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    if not items or not isinstance(items, list) or len(items) == 0:
+    if not items:
         logger.error("Missing or empty items list")
         return Response(
             {"detail": "items list is required and must not be empty"},
             status=status.HTTP_400_BAD_REQUEST
         )
+    if len(items) > MAX_RECEIPT_LINES:
+        return Response(
+            {"detail": f"At most {MAX_RECEIPT_LINES} lines can be received per request"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     tenant = getattr(request, 'tenant', None) or request.user.tenant
     if not tenant:
         logger.error("User must have a tenant")
         return Response({"detail": "User must have a tenant"}, status=status.HTTP_400_BAD_REQUEST)
-    
-    logger.info(f"Processing receiving for tenant={tenant.id} (name: {tenant.name}), outlet={outlet_id}, items={len(items)}, supplier={supplier}")
-    
-    results = []
-    errors = []
-    
-    with transaction.atomic():
-        for item in items:
-            product_id = item.get('product_id')
-            quantity = item.get('quantity')
-            cost = item.get('cost')  # Optional: update product cost
-            
-            if not all([product_id, quantity]):
-                errors.append({
-                    "product_id": product_id,
-                    "error": "product_id and quantity are required"
-                })
-                continue
-            
-            try:
-                quantity = int(quantity)
-                if quantity <= 0:
-                    errors.append({
-                        "product_id": product_id,
-                        "error": "quantity must be positive"
-                    })
-                    continue
-            except (ValueError, TypeError):
-                errors.append({
-                    "product_id": product_id,
-                    "error": "quantity must be a valid integer"
-                })
-                continue
-            
-            try:
-                # select_for_update must be inside the transaction
-                product = Product.objects.select_for_update().get(id=product_id, tenant=tenant)
-                logger.info(f"Found product: {product.name}, current stock: {product.stock}")
-            except Product.DoesNotExist:
-                logger.error(f"Product {product_id} not found for tenant {tenant.id}")
-                errors.append({
-                    "product_id": product_id,
-                    "error": "Product not found"
-                })
-                continue
-            
-            # Get outlet
-            from apps.outlets.models import Outlet
-            try:
-                outlet = Outlet.objects.get(id=outlet_id, tenant=tenant)
-            except Outlet.DoesNotExist:
-                errors.append({
-                    "product_id": product_id,
-                    "error": f"Outlet {outlet_id} not found"
-                })
-                continue
-            
-            # Validate the purchase cost before creating the batch/movement snapshot.
-            cost_decimal = None
-            if cost is not None:
-                try:
-                    cost_decimal = Decimal(str(cost))
-                    if cost_decimal < 0:
-                        raise ValueError("cost must not be negative")
-                except (InvalidOperation, ValueError, TypeError):
-                    errors.append({"product_id": product_id, "error": "cost must be a valid non-negative decimal"})
-                    continue
-            
-            try:
-                movement_reason = reason or (f"Purchase from {supplier}" if supplier else "Purchase")
-                batch_number = item.get('batch_number') or f"PUR-{timezone.now().strftime('%Y%m%d%H%M%S')}-{product.id}"
-                expiry_date = item.get('expiry_date') or (timezone.now().date() + timedelta(days=365))
-                if isinstance(expiry_date, str):
-                    expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d').date()
 
-                batch = add_stock(
-                    product=product,
-                    outlet=outlet,
-                    quantity=quantity,
-                    batch_number=batch_number,
-                    expiry_date=expiry_date,
-                    user=request.user,
-                    movement_type='purchase',
-                    reason=movement_reason,
-                    cost_price=cost_decimal,
-                )
-                movement = StockMovement.objects.filter(batch=batch, movement_type='purchase').latest('created_at')
-                serializer = StockMovementSerializer(movement)
-                results.append(serializer.data)
-            except Exception as e:
-                logger.error(f"Failed to create StockMovement: {e}", exc_info=True)
-                errors.append({
-                    "product_id": product_id,
-                    "error": str(e)
-                })
+    from apps.outlets.models import Outlet
+    try:
+        outlet = Outlet.objects.get(id=outlet_id, tenant=tenant)
+    except (Outlet.DoesNotExist, TypeError, ValueError):
+        return Response({"detail": f"Outlet {outlet_id} not found"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    logger.info(f"Processing receiving for tenant={tenant.id} (name: {tenant.name}), outlet={outlet.id}, items={len(items)}, supplier={supplier}")
+
+    movements, errors = receive_goods(
+        tenant,
+        outlet,
+        items,
+        user=request.user,
+        reason=reason or (f"Purchase from {supplier}" if supplier else "Purchase"),
+    )
+    results = StockMovementSerializer(
+        StockMovement.objects.filter(id__in=[movement.id for movement in movements])
+        .select_related('batch', 'batch__outlet', 'product', 'outlet', 'user')
+        .order_by('id'),
+        many=True,
+    ).data
     
     # Log final summary
     logger.info(f"Receiving completed: {len(results)} successful, {len(errors)} failed")
-    logger.info(f"Total StockMovement records for tenant {tenant.id} with type 'purchase': {StockMovement.objects.filter(tenant=tenant, movement_type='purchase').count()}")
     
     if errors and not results:
         return Response(
@@ -1191,10 +1355,14 @@ class BatchViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
     serializer_class = BatchSerializer
     permission_classes = [IsAuthenticated, HasTenantModuleAccess]
     required_tenant_permissions = ['allow_inventory']
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # Ordering is part of the keyset, so it is applied by the paginator
+    filter_backends = [DjangoFilterBackend, SearchFilter]
     filterset_fields = ['tenant', 'product', 'outlet', 'batch_number']
     search_fields = ['batch_number', 'product__name']
-    ordering_fields = ['expiry_date', 'created_at', 'quantity']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('expiry_date', 'id')
+    # Only columns a batch never changes: a cursor on quantity would skip or repeat rows as stock moves
+    ordering_fields = ['expiry_date', 'created_at']
     ordering = ['expiry_date']
     
     def get_queryset(self):
@@ -1295,7 +1463,11 @@ class BatchViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
                     status=status.HTTP_404_NOT_FOUND
                 )
         
-        expired_count = mark_expired_batches(outlet=outlet)
+        tenant = getattr(request, 'tenant', None) or request.user.tenant
+        if not tenant or request.user.is_saas_admin:
+            tenant = None
+
+        expired_count = mark_expired_batches(outlet=outlet, tenant=tenant)
         
         return Response({
             "detail": f"Marked {expired_count} batches as expired",
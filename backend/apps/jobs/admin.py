@@ -0,0 +1,18 @@
+from django.contrib import admin
+
+from .models import Job
+from .queue import retry_dead_jobs
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "attempts", "max_attempts", "run_at", "locked_by", "created_at")
+    list_filter = ("status", "name")
+    search_fields = ("name", "idempotency_key")
+    readonly_fields = ("created_at", "updated_at", "finished_at", "locked_at", "locked_by", "last_error")
+    actions = ("retry_dead",)
+
+    @admin.action(description="Requeue selected dead jobs")
+    def retry_dead(self, request, queryset):
+        requeued = retry_dead_jobs(job_ids=list(queryset.values_list("id", flat=True)))
+        self.message_user(request, f"Requeued {requeued} dead jobs")
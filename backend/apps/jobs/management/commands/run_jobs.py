@@ -0,0 +1,101 @@
+"""
+Management command to run queued background jobs from the jobs table
+Run one long-lived worker per host (several can share the table), or
+schedule `run_jobs --once` from cron where a resident process is not an option
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from apps.jobs.models import Job
+from apps.jobs.queue import retry_dead_jobs, run_pending, worker_name
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (receipts, notifications, stock take completion)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run every job that is currently due, then exit',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Jobs claimed per poll (default: 10)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=None,
+            help='Seconds to wait when the queue is empty (default: JOBS_POLL_SECONDS)',
+        )
+        parser.add_argument(
+            '--name',
+            action='append',
+            dest='names',
+            help='Only run jobs with this handler name (repeatable)',
+        )
+        parser.add_argument(
+            '--retry-dead',
+            action='store_true',
+            help='Requeue dead-lettered jobs (optionally limited by --name or --job) and exit',
+        )
+        parser.add_argument(
+            '--job',
+            type=int,
+            action='append',
+            dest='job_ids',
+            help='Job ID for --retry-dead (repeatable)',
+        )
+        parser.add_argument(
+            '--purge-days',
+            type=int,
+            default=None,
+            help='Delete succeeded jobs finished more than this many days ago and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['purge_days'])
+            deleted, _ = Job.objects.filter(status=Job.STATUS_SUCCEEDED, finished_at__lt=cutoff).delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} succeeded jobs'))
+            return
+
+        if options['retry_dead']:
+            names = options.get('names') or []
+            if len(names) > 1:
+                self.stderr.write(self.style.ERROR('--retry-dead takes at most one --name'))
+                return
+            requeued = retry_dead_jobs(job_ids=options.get('job_ids'), name=names[0] if names else None)
+            self.stdout.write(self.style.SUCCESS(f'Requeued {requeued} dead jobs'))
+            return
+
+        batch_size = max(1, options['batch_size'])
+        sleep = options['sleep'] if options['sleep'] is not None else settings.JOBS_POLL_SECONDS
+        worker = worker_name()
+        total = 0
+
+        if not options['once']:
+            self.stdout.write(f'Job worker {worker} polling every {sleep}s')
+        try:
+            while True:
+                ran = run_pending(limit=batch_size, worker=worker, names=options.get('names'))
+                total += ran
+                if ran:
+                    continue
+                if options['once']:
+                    break
+                # Drop broken or expired connections while idle, as the request cycle would
+                close_old_connections()
+                time.sleep(sleep)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {total} jobs'))
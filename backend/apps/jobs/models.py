@@ -0,0 +1,55 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    Durable background job
+    Rows are written in the same transaction as the change that needs them,
+    so a job exists exactly when its sale (or stock take) committed. Workers
+    claim due rows, retry failures with exponential backoff and move jobs
+    that keep failing to the dead-letter state for inspection.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_DEAD, 'Dead'),
+    ]
+
+    name = models.CharField(max_length=120, help_text="Registered handler name, e.g. 'sales.generate_receipt'")
+    payload = models.JSONField(default=dict, blank=True, help_text="Keyword arguments passed to the handler")
+    idempotency_key = models.CharField(
+        max_length=200, null=True, blank=True, unique=True,
+        help_text="Enqueueing the same key again returns the existing job"
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now, help_text="Earliest time the job may run")
+    locked_by = models.CharField(max_length=120, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'jobs_job'
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        ordering = ['id']
+        indexes = [
+            # Workers only ever scan due queued rows
+            models.Index(fields=['run_at', 'id'], name='jobs_due_idx', condition=Q(status='queued')),
+            models.Index(fields=['locked_at'], name='jobs_running_idx', condition=Q(status='running')),
+            models.Index(fields=['status', 'updated_at'], name='jobs_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
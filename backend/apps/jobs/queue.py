@@ -0,0 +1,231 @@
+"""
+Enqueueing and running background jobs
+enqueue() writes a Job row inside the caller's transaction. How it then
+gets run depends on JOBS_BACKEND:
+
+- 'database': a `manage.py run_jobs` worker polls the table. Needs nothing
+  beyond the database, so it is the default and what local setups use.
+- 'celery': the job id is sent to a Celery worker once the transaction
+  commits. The row stays the source of truth, so a lost message is picked
+  up by run_jobs and a duplicate one finds the job already claimed.
+- 'inline': the job runs in-process right after commit (development and
+  tests that want side effects without a worker).
+"""
+import logging
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .registry import UnknownJobError, get_handler
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('database', 'celery', 'inline')
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retry number attempts, with jitter so failed batches spread out."""
+    base = settings.JOBS_BACKOFF_SECONDS * (2 ** max(0, attempts - 1))
+    return min(settings.JOBS_BACKOFF_MAX_SECONDS, base) * (1 + random.random() / 4)
+
+
+def enqueue(name, payload=None, idempotency_key=None, run_at=None, max_attempts=None):
+    """
+    Queue a job to run after the current transaction commits
+    With an idempotency_key, enqueueing again returns the existing job
+    instead of adding another; a dead-lettered job with that key is queued
+    again, since asking for it again is a deliberate retry.
+
+    Raises:
+        UnknownJobError: If no handler is registered for name
+    """
+    handler = get_handler(name)
+    fields = {
+        'name': name,
+        'payload': payload or {},
+        'run_at': run_at or timezone.now(),
+        'max_attempts': max_attempts or handler.max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    }
+
+    if idempotency_key is None:
+        job = Job.objects.create(**fields)
+    else:
+        # get_or_create re-reads the row if a concurrent enqueue inserts the key first
+        job, created = Job.objects.get_or_create(idempotency_key=idempotency_key, defaults=fields)
+        if not created:
+            if job.status != Job.STATUS_DEAD:
+                return job
+            Job.objects.filter(id=job.id, status=Job.STATUS_DEAD).update(
+                status=Job.STATUS_QUEUED, attempts=0, run_at=fields['run_at'], last_error='',
+                finished_at=None, updated_at=timezone.now(),
+            )
+            job.refresh_from_db()
+
+    _dispatch_on_commit(job)
+    return job
+
+
+def _dispatch_on_commit(job, countdown=None):
+    backend = settings.JOBS_BACKEND
+    if backend not in BACKENDS:
+        raise ImproperlyConfigured(f"JOBS_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}")
+    if backend == 'celery':
+        transaction.on_commit(lambda job_id=job.id: _send_to_celery(job_id, countdown))
+    elif backend == 'inline':
+        transaction.on_commit(lambda job_id=job.id: run_job(job_id))
+
+
+def _send_to_celery(job_id, countdown=None):
+    try:
+        from primepos.celery import app
+
+        app.send_task('apps.jobs.tasks.run_job', args=[job_id], countdown=countdown)
+    except Exception:
+        # The row is still queued; the run_jobs sweep will pick it up
+        logger.exception(f"Could not hand job {job_id} to Celery")
+
+
+def release_stale_jobs(now=None):
+    """
+    Return jobs whose worker died mid-run to the queue
+    A job counts its attempt when claimed, so one that keeps killing its
+    worker still ends up dead-lettered.
+    """
+    now = now or timezone.now()
+    stale = Job.objects.filter(
+        status=Job.STATUS_RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+    )
+    dead = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_DEAD, locked_by='', locked_at=None, finished_at=now, updated_at=now,
+        last_error='Worker lease expired on the final attempt',
+    )
+    requeued = stale.update(status=Job.STATUS_QUEUED, locked_by='', locked_at=None, run_at=now, updated_at=now)
+    if dead or requeued:
+        logger.warning(f"Released stale jobs: {requeued} requeued, {dead} dead-lettered")
+    return requeued + dead
+
+
+def claim_jobs(limit=10, worker=None, names=None):
+    """
+    Claim up to limit due jobs for this worker
+    SKIP LOCKED lets several workers poll the table without blocking on, or
+    double-claiming, each other's rows.
+    """
+    now = timezone.now()
+    worker = worker or worker_name()
+    with transaction.atomic():
+        due = Job.objects.select_for_update(skip_locked=True).filter(status=Job.STATUS_QUEUED, run_at__lte=now)
+        if names:
+            due = due.filter(name__in=names)
+        ids = list(due.order_by('run_at', 'id').values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids).update(
+            status=Job.STATUS_RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1, updated_at=now
+        )
+    return list(Job.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+
+def _claim_one(job_id, worker):
+    now = timezone.now()
+    claimed = Job.objects.filter(id=job_id, status=Job.STATUS_QUEUED, run_at__lte=now).update(
+        status=Job.STATUS_RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1, updated_at=now
+    )
+    return Job.objects.get(id=job_id) if claimed else None
+
+
+def execute_job(job):
+    """
+    Run a claimed job and record the outcome
+    Handlers manage their own transactions; a failure is retried after
+    backoff_delay() until max_attempts, then the job is dead-lettered.
+
+    Returns:
+        The job's new status
+    """
+    try:
+        get_handler(job.name)(**job.payload)
+    except Exception as exc:
+        return _record_failure(job, exc)
+
+    now = timezone.now()
+    Job.objects.filter(id=job.id, locked_by=job.locked_by, status=Job.STATUS_RUNNING).update(
+        status=Job.STATUS_SUCCEEDED, locked_by='', locked_at=None, last_error='', finished_at=now, updated_at=now
+    )
+    return Job.STATUS_SUCCEEDED
+
+
+def _record_failure(job, exc):
+    now = timezone.now()
+    error = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))[-4000:]
+    owned = Job.objects.filter(id=job.id, locked_by=job.locked_by, status=Job.STATUS_RUNNING)
+
+    if isinstance(exc, UnknownJobError) or job.attempts >= job.max_attempts:
+        owned.update(
+            status=Job.STATUS_DEAD, locked_by='', locked_at=None, last_error=error, finished_at=now, updated_at=now
+        )
+        logger.error(f"Job {job.name} #{job.id} dead-lettered after {job.attempts} attempt(s): {exc}")
+        return Job.STATUS_DEAD
+
+    delay = backoff_delay(job.attempts)
+    owned.update(
+        status=Job.STATUS_QUEUED, locked_by='', locked_at=None, last_error=error,
+        run_at=now + timedelta(seconds=delay), updated_at=now,
+    )
+    logger.warning(
+        f"Job {job.name} #{job.id} failed (attempt {job.attempts}/{job.max_attempts}), "
+        f"retrying in {delay:.0f}s: {exc}"
+    )
+    if settings.JOBS_BACKEND == 'celery':
+        _send_to_celery(job.id, countdown=delay)
+    return Job.STATUS_QUEUED
+
+
+def run_job(job_id, worker=None):
+    """
+    Claim and run one job by id (Celery tasks and the inline backend)
+    Does nothing if the job is not due or another worker already has it.
+    """
+    job = _claim_one(job_id, worker or worker_name())
+    if job is None:
+        return None
+    return execute_job(job)
+
+
+def run_pending(limit=10, worker=None, names=None):
+    """Release stale leases, then claim and run one batch of due jobs. Returns the number run."""
+    release_stale_jobs()
+    jobs = claim_jobs(limit=limit, worker=worker, names=names)
+    for job in jobs:
+        execute_job(job)
+    return len(jobs)
+
+
+def retry_dead_jobs(job_ids=None, name=None):
+    """Put dead-lettered jobs back in the queue with a fresh attempt budget."""
+    now = timezone.now()
+    dead = Job.objects.filter(status=Job.STATUS_DEAD)
+    if job_ids:
+        dead = dead.filter(id__in=job_ids)
+    if name:
+        dead = dead.filter(name=name)
+    jobs = list(dead)
+    dead.filter(id__in=[job.id for job in jobs]).update(
+        status=Job.STATUS_QUEUED, attempts=0, run_at=now, finished_at=None, updated_at=now
+    )
+    for job in jobs:
+        _dispatch_on_commit(job)
+    return len(jobs)
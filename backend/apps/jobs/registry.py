@@ -0,0 +1,45 @@
+"""
+Job handler registry
+Apps declare handlers in their own jobs.py module, which JobsConfig imports
+at startup:
+
+    @register('sales.generate_receipt', max_attempts=8)
+    def generate_receipt(sale_id, format='pdf', user_id=None):
+        ...
+
+Handlers receive the job payload as keyword arguments and may run more
+than once (after a crash mid-job, or a retry), so they must be idempotent.
+"""
+
+_handlers = {}
+
+
+class JobHandler:
+    def __init__(self, name, func, max_attempts=None):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+
+    def __call__(self, **payload):
+        return self.func(**payload)
+
+
+class UnknownJobError(LookupError):
+    """Raised when a job names a handler that is not registered."""
+
+
+def register(name, max_attempts=None):
+    """Register func as the handler for jobs called name."""
+    def decorator(func):
+        if name in _handlers and _handlers[name].func is not func:
+            raise ValueError(f"Job handler {name!r} is already registered")
+        _handlers[name] = JobHandler(name, func, max_attempts=max_attempts)
+        return func
+    return decorator
+
+
+def get_handler(name):
+    try:
+        return _handlers[name]
+    except KeyError:
+        raise UnknownJobError(f"No job handler registered for {name!r}") from None
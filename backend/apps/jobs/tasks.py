@@ -0,0 +1,12 @@
+"""
+Celery entry point for the 'celery' JOBS_BACKEND
+Only imported by Celery workers, so Celery stays optional everywhere else.
+"""
+from celery import shared_task
+
+from .queue import run_job as run_queued_job
+
+
+@shared_task(name='apps.jobs.tasks.run_job', ignore_result=True)
+def run_job(job_id):
+    run_queued_job(job_id)
@@ -0,0 +1,181 @@
+"""
+Tests for the database-backed job queue: idempotency, retries, dead-lettering and sale side effects
+"""
+
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.models import Batch
+from apps.jobs.models import Job
+from apps.jobs.queue import claim_jobs, enqueue, release_stale_jobs, run_pending
+from apps.jobs.registry import register
+from apps.notifications.models import Notification
+from apps.outlets.models import Outlet, Till
+from apps.products.models import Product
+from apps.sales.models import Receipt
+from apps.shifts.models import Shift
+from apps.tenants.models import Tenant
+
+calls = []
+
+
+@register('tests.record')
+def record(value, fail_times=0):
+    calls.append(value)
+    if calls.count(value) <= fail_times:
+        raise RuntimeError(f"failure {calls.count(value)}")
+
+
+def _make_due(job):
+    Job.objects.filter(id=job.id).update(run_at=timezone.now() - timedelta(seconds=1))
+
+
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_idempotency_key_returns_the_existing_job(self):
+        first = enqueue('tests.record', {'value': 'a'}, idempotency_key='record:a')
+        second = enqueue('tests.record', {'value': 'a'}, idempotency_key='record:a')
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, ['a'])
+        # A finished job still absorbs duplicates
+        self.assertEqual(enqueue('tests.record', {'value': 'a'}, idempotency_key='record:a').status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(run_pending(), 0)
+
+    @override_settings(JOBS_BACKOFF_SECONDS=10, JOBS_BACKOFF_MAX_SECONDS=60)
+    def test_failures_back_off_then_succeed(self):
+        job = enqueue('tests.record', {'value': 'b', 'fail_times': 2})
+
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, 1))
+        self.assertIn("failure 1", job.last_error)
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=9))
+        # Not due yet
+        self.assertEqual(run_pending(), 0)
+
+        _make_due(job)
+        run_pending()
+        job.refresh_from_db()
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=19))
+
+        _make_due(job)
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), (Job.STATUS_SUCCEEDED, 3, ''))
+
+    def test_exhausted_job_is_dead_lettered_until_retried(self):
+        job = enqueue('tests.record', {'value': 'c', 'fail_times': 5}, idempotency_key='record:c', max_attempts=2)
+        run_pending()
+        _make_due(job)
+        run_pending()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_DEAD, 2))
+        _make_due(job)
+        self.assertEqual(run_pending(), 0)
+
+        call_command('run_jobs', '--retry-dead', '--name', 'tests.record', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, 0))
+
+    @override_settings(JOBS_LEASE_SECONDS=60)
+    def test_stale_running_job_is_released(self):
+        job = enqueue('tests.record', {'value': 'd'})
+        self.assertEqual([claimed.id for claimed in claim_jobs(worker='crashed')], [job.id])
+        self.assertEqual(claim_jobs(worker='other'), [])
+
+        Job.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(release_stale_jobs(), 1)
+        self.assertEqual(run_pending(worker='other'), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_SUCCEEDED, 2))
+
+    @override_settings(JOBS_BACKEND='inline')
+    def test_inline_backend_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = enqueue('tests.record', {'value': 'e'})
+            self.assertEqual(calls, [])
+
+        self.assertEqual(calls, ['e'])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_ROOT=tempfile.gettempdir()
+)
+class SaleSideEffectJobsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.tenant = Tenant.objects.create(name="Jobs Tenant")
+        self.user = User.objects.create_user(
+            username="jobs", email="jobs@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.client.force_authenticate(user=self.user)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Jobs Store")
+        self.client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+        till = Till.objects.create(outlet=self.outlet, name="Till 1")
+        self.shift = Shift.objects.create(
+            outlet=self.outlet, till=till, user=self.user, operating_date=timezone.now().date(),
+            opening_cash_balance=Decimal("0.00"), status="OPEN"
+        )
+        self.product = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Bread", retail_price=Decimal("3.00"), cost=Decimal("1.00")
+        )
+        Batch.objects.create(
+            tenant=self.tenant, product=self.product, outlet=self.outlet, batch_number="BR-1", quantity=20,
+            cost_price=Decimal("1.00"), expiry_date=timezone.now().date() + timedelta(days=10)
+        )
+
+    def test_checkout_queues_receipts_and_worker_renders_them(self):
+        response = self.client.post('/api/v1/sales/checkout-cash/', {
+            'outlet': self.outlet.id,
+            'shift': self.shift.id,
+            'items': [{'product_id': self.product.id, 'quantity': 2, 'price': '3.00'}],
+            'cash_received': '10.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        sale_id = response.json()['sale_id']
+
+        self.assertFalse(Receipt.objects.filter(sale_id=sale_id).exists())
+        self.assertEqual(
+            sorted(Job.objects.filter(status=Job.STATUS_QUEUED).values_list('idempotency_key', flat=True)),
+            [f'sales.receipt:{sale_id}:escpos', f'sales.receipt:{sale_id}:pdf'],
+        )
+
+        call_command('run_jobs', '--once', stdout=StringIO())
+
+        self.assertEqual(
+            sorted(Receipt.objects.filter(sale_id=sale_id).values_list('format', flat=True)), ['escpos', 'pdf']
+        )
+        self.assertFalse(Job.objects.exclude(status=Job.STATUS_SUCCEEDED).exists())
+
+    def test_create_queues_notification_with_the_sale(self):
+        response = self.client.post('/api/v1/sales/', {
+            'outlet': self.outlet.id,
+            'shift': self.shift.id,
+            'payment_method': 'cash',
+            'subtotal': '3.00',
+            'total': '3.00',
+            'items_data': [{'product_id': self.product.id, 'quantity': 1, 'price': '3.00'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        sale_id = response.json()['id']
+        self.assertFalse(Notification.objects.filter(resource_id=str(sale_id)).exists())
+
+        run_pending(limit=10)
+
+        self.assertTrue(Notification.objects.filter(resource_type='Sale', resource_id=str(sale_id)).exists())
+        self.assertTrue(Receipt.objects.filter(sale_id=sale_id, format='pdf').exists())
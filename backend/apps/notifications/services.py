@@ -31,8 +31,12 @@ class NotificationService:
         )
     
     @staticmethod
-    def notify_low_stock(product_or_unit, outlet=None):
-        """Create notification when stock is low (product or product unit)"""
+    def notify_low_stock(product_or_unit, outlet=None, current_stock=None):
+        """Create notification when stock is low (product or product unit)
+
+        Stock writes call this only when a (product, outlet) crosses into low
+        stock, passing the sellable stock they already computed.
+        """
         # Support both ProductUnit (unit) and Product
         try:
             product = product_or_unit.product
@@ -41,12 +45,13 @@ class NotificationService:
 
         product_name = product.name
         # Determine current stock and threshold from the given object if available
-        try:
-            current_stock = product_or_unit.get_total_stock(outlet) if outlet else product_or_unit.get_total_stock()
-        except Exception:
-            # Fallback to inventory helpers
-            from apps.inventory.stock_helpers import get_available_stock
-            current_stock = get_available_stock(product, outlet) if outlet else get_available_stock(product, None)
+        if current_stock is None:
+            try:
+                current_stock = product_or_unit.get_total_stock(outlet) if outlet else product_or_unit.get_total_stock()
+            except Exception:
+                # Fallback to inventory helpers
+                from apps.inventory.stock_helpers import get_available_stock
+                current_stock = get_available_stock(product, outlet) if outlet else get_available_stock(product, None)
 
         threshold = getattr(product_or_unit, 'low_stock_threshold', getattr(product, 'low_stock_threshold', None))
 
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:40
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_product_archive_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('tenant'), models.F('outlet'), django.db.models.functions.text.Upper('barcode'), name='products_barcode_upper_idx'),
+        ),
+    ]
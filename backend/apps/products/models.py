@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Upper
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 from django.conf import settings
@@ -104,6 +105,8 @@ class Product(models.Model):
             models.Index(fields=['category']),
             models.Index(fields=['sku']),
             models.Index(fields=['barcode']),
+            # Case-insensitive barcode scans within an outlet (stock take counts)
+            models.Index('tenant', 'outlet', Upper('barcode'), name='products_barcode_upper_idx'),
         ]
         # Note: unique_together doesn't work well with blank values
         # SKU uniqueness is enforced in the serializer
@@ -113,47 +116,44 @@ class Product(models.Model):
 
     def get_total_stock(self, outlet=None):
         """Get total stock using get_sellable_stock as single source of truth."""
-        from apps.inventory.stock_helpers import get_sellable_stock
+        from apps.inventory.stock_helpers import get_sellable_stock, get_sellable_stock_totals
         from apps.outlets.models import Outlet
 
         if outlet:
             return get_sellable_stock(self, outlet)
 
         # Sum across all outlets
-        outlets = Outlet.objects.filter(tenant=self.tenant)
-        if not outlets.exists():
+        if not Outlet.objects.filter(tenant=self.tenant).exists():
             return int(self.stock or 0)
-        return sum(get_sellable_stock(self, o) for o in outlets)
+        return get_sellable_stock_totals([self])[self.id]
     
-    def get_is_low_stock_for_outlet(self, outlet):
+    def get_is_low_stock_for_outlet(self, outlet, sellable_stock=None):
         """Check if product is low on stock for a specific outlet.
 
-        Uses get_sellable_stock as the single source of truth so this always
-        agrees with the sellable_stock value shown in the POS.
+        Uses the sellable stock resolver as the single source of truth so this
+        always agrees with the sellable_stock value shown in the POS. Pass
+        ``sellable_stock`` when it was already resolved in bulk.
         """
         if self.low_stock_threshold <= 0:
             return False
-        from apps.inventory.stock_helpers import get_sellable_stock
-        return get_sellable_stock(self, outlet) <= self.low_stock_threshold
+        if sellable_stock is None:
+            from apps.inventory.stock_helpers import get_sellable_stock_many
+            sellable_stock = get_sellable_stock_many([self], outlet).get(self.id, 0)
+        return sellable_stock <= self.low_stock_threshold
 
     @property
     def is_low_stock(self):
         """Check if product is low on stock across any outlet.
 
-        Uses get_sellable_stock as the single source of truth so this always
-        agrees with the sellable_stock value shown in the POS.
+        Reads the per-outlet LocationStock.is_low_stock flag, which stock writes
+        keep in step with the sellable_stock value shown in the POS.
         """
         if self.low_stock_threshold <= 0:
             return False
-        from apps.inventory.stock_helpers import get_sellable_stock
         from apps.outlets.models import Outlet
-        outlets = Outlet.objects.filter(tenant=self.tenant)
-        if not outlets.exists():
+        if not Outlet.objects.filter(tenant=self.tenant).exists():
             return int(self.stock or 0) <= self.low_stock_threshold
-        for outlet in outlets:
-            if get_sellable_stock(self, outlet) <= self.low_stock_threshold:
-                return True
-        return False
+        return self.location_stocks.filter(is_low_stock=True).exists()
     
     @property
     def base_unit(self):
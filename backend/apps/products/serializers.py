@@ -71,6 +71,20 @@ class ProductUnitSerializer(serializers.ModelSerializer):
         return value
 
 
+class ProductListSerializer(serializers.ListSerializer):
+    """Resolves sellable stock for a whole page of products in one pass."""
+
+    def to_representation(self, data):
+        from apps.inventory.stock_helpers import get_sellable_stock_many
+
+        outlet = self.context.get('outlet')
+        if outlet is not None:
+            products = list(data.all() if hasattr(data, 'all') else data)
+            self.context['sellable_stock_map'] = get_sellable_stock_many(products, outlet)
+            data = products
+        return super().to_representation(data)
+
+
 class ProductSerializer(serializers.ModelSerializer):
     """Product serializer - UNITS ONLY ARCHITECTURE
     
@@ -116,6 +130,7 @@ class ProductSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Product
+        list_serializer_class = ProductListSerializer
         fields = (
             'id', 'tenant', 'outlet', 'category', 'category_id', 'name', 'description', 
             'sku', 'barcode', 'retail_price', 'price', 'cost', 'cost_price', 
@@ -140,11 +155,19 @@ class ProductSerializer(serializers.ModelSerializer):
             'stock': {'required': False, 'allow_null': True, 'min_value': 0},
         }
     
+    def _get_outlet_sellable_stock(self, obj, outlet):
+        """Read sellable stock from the bulk map, resolving single objects on demand."""
+        stock_map = self.context.setdefault('sellable_stock_map', {})
+        if obj.id not in stock_map:
+            from apps.inventory.stock_helpers import get_sellable_stock_many
+            stock_map.update(get_sellable_stock_many([obj], outlet))
+        return stock_map[obj.id]
+
     def get_is_low_stock(self, obj):
         """Check if product has low stock for the resolved request outlet only."""
         outlet = self.context.get('outlet')
         if outlet:
-            return obj.get_is_low_stock_for_outlet(outlet)
+            return obj.get_is_low_stock_for_outlet(outlet, sellable_stock=self._get_outlet_sellable_stock(obj, outlet))
         return False
     
     def get_price(self, obj):
@@ -157,13 +180,11 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def get_sellable_stock(self, obj):
         """Get outlet sellable stock from non-expired batches only."""
-        from apps.inventory.stock_helpers import get_sellable_stock
-
         outlet = self.context.get('outlet')
         if not outlet:
             return 0
 
-        return get_sellable_stock(obj, outlet)
+        return self._get_outlet_sellable_stock(obj, outlet)
     
     def validate(self, data):
         """Validate that product configuration is valid"""
@@ -540,6 +540,8 @@ class ProductViewSet(viewsets.ModelViewSet, TenantFilterMixin):
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
         """Get products with low stock"""
+        from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+        from django.db.models.functions import Coalesce
         from apps.inventory.models import LocationStock
         from apps.outlets.models import Outlet
         
@@ -561,14 +563,25 @@ class ProductViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             except Outlet.DoesNotExist:
                 pass
         
-        low_stock_products = []
-        
-        for product in queryset:
-            # Check product-level stock (UNITS ONLY ARCHITECTURE)
-            if product.low_stock_threshold > 0:
-                total_stock = product.get_total_stock(outlet=outlet)
-                if total_stock <= product.low_stock_threshold:
-                    low_stock_products.append(product)
+        low_stock_products = queryset.filter(low_stock_threshold__gt=0)
+        if outlet:
+            # Stock writes maintain LocationStock.is_low_stock per (product, outlet)
+            low_stock_products = low_stock_products.filter(
+                id__in=LocationStock.objects.filter(is_low_stock=True, tenant=tenant, outlet=outlet).values('product_id'),
+            )
+        elif not Outlet.objects.filter(tenant=tenant).exists():
+            low_stock_products = low_stock_products.filter(stock__lte=F('low_stock_threshold'))
+        else:
+            # Without an outlet the tenant-wide total is compared, summed in the same query
+            # (same precedence as get_sellable_stock_totals)
+            total_stock = LocationStock.objects.filter(
+                tenant=tenant, product=OuterRef('pk'),
+            ).values('product').annotate(
+                total=Sum(Case(When(batch_tracked=True, then='sellable_quantity'), default='quantity')),
+            ).values('total')
+            low_stock_products = low_stock_products.annotate(
+                total_stock=Coalesce(Subquery(total_stock), 0),
+            ).filter(total_stock__lte=F('low_stock_threshold'))
         
         page = self.paginate_queryset(low_stock_products)
         if page is not None:
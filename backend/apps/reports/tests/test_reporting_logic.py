@@ -6,7 +6,7 @@ from django.utils import timezone
 from rest_framework.test import APIClient
 
 from apps.accounts.models import User
-from apps.inventory.models import Batch, StockMovement, StockTake, StockTakeItem
+from apps.inventory.models import Batch, StockMovement, StockOpeningBalance, StockTake, StockTakeItem
 from apps.outlets.models import Outlet, Till
 from apps.products.models import Category, Product
 from apps.shifts.models import Shift
@@ -107,6 +107,39 @@ class ReportingLogicTestCase(TestCase):
         self.assertEqual(payload["meta"]["tenant_id"], self.tenant.id)
         self.assertEqual(payload["meta"]["outlet_id"], str(self.outlet.id))
 
+    def test_inventory_valuation_opening_starts_from_compacted_balance(self):
+        today = timezone.now().date()
+        start_date = today - timedelta(days=7)
+        boundary_date = start_date - timedelta(days=15)
+
+        # Movements before the boundary live only in the opening balance (e.g. a detached partition).
+        StockOpeningBalance.objects.create(
+            tenant=self.tenant,
+            outlet=self.outlet,
+            product=self.product,
+            period_start=boundary_date,
+            quantity=40,
+            acquired_quantity=40,
+            acquired_cost=Decimal("320.00"),
+            movement_count=3,
+        )
+        self._create_movement("sale", 4, 10)
+        self._create_movement("purchase", 10, 2)
+
+        response = self.client.get(
+            "/api/v1/reports/inventory-valuation/",
+            {
+                "outlet": self.outlet.id,
+                "start_date": start_date.isoformat(),
+                "end_date": today.isoformat(),
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        item = response.json()["items"][0]
+        self.assertEqual(item["open_qty"], 36)
+        self.assertEqual(item["received_qty"], 10)
+
     def test_inventory_valuation_zero_count_reports_negative_discrepancy(self):
         today = timezone.now().date()
         start_date = today - timedelta(days=7)
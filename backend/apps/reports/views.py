@@ -10,11 +10,12 @@ from django.http import HttpResponse
 from datetime import datetime, timedelta, date
 from decimal import Decimal
 from io import BytesIO
-from apps.sales.models import Sale, SaleItem
+from apps.sales.models import COGS_TOTAL_EXPRESSION, Sale, SaleItem
 from apps.products.models import Product, Category
 from apps.customers.models import Customer
-from apps.inventory.models import StockMovement, StockTake, StockTakeItem
-from apps.inventory.stock_helpers import get_sellable_stock
+from apps.inventory.ledger_partitions import boundary
+from apps.inventory.models import StockMovement, StockOpeningBalance, StockTake, StockTakeItem
+from apps.inventory.stock_helpers import get_sellable_stock_many
 from apps.outlets.models import Outlet
 from apps.shifts.models import Shift
 from apps.expenses.models import Expense
@@ -196,7 +197,6 @@ def products_report(request):
         return Response({"detail": "Outlet is required. Please specify X-Outlet-ID header or ?outlet=id query parameter."}, status=400)
 
     from apps.outlets.models import Outlet
-    from apps.inventory.stock_helpers import get_sellable_stock
     outlet = Outlet.objects.filter(id=outlet_id, tenant=tenant).first()
     
     start_date = request.query_params.get('start_date')
@@ -249,6 +249,8 @@ def products_report(request):
 
     paginator = Paginator(products_qs, page_size)
     page_obj = paginator.get_page(page_num)
+    page_products = list(page_obj)
+    stock_map = get_sellable_stock_many(page_products, outlet) if outlet else {}
 
     product_performance = [
         {
@@ -258,10 +260,10 @@ def products_report(request):
             'category': p.category.name if p.category else 'Uncategorized',
             'total_sold': float(p.total_sold),
             'total_revenue': float(p.total_revenue_ann),
-            'current_stock': get_sellable_stock(p, outlet) if outlet else 0,
-            'is_low_stock': p.is_low_stock,
+            'current_stock': stock_map.get(p.id, 0),
+            'is_low_stock': p.get_is_low_stock_for_outlet(outlet, sellable_stock=stock_map.get(p.id, 0)) if outlet else False,
         }
-        for p in page_obj
+        for p in page_products
     ]
 
     return Response({
@@ -358,15 +360,11 @@ def profit_loss_report(request):
     total_revenue = sales_queryset.aggregate(total=Sum('total'))['total'] or Decimal('0')
 
     # --- PHASE 2 FIX: COGS via single DB aggregation (no Python loop) ---
-    # Uses only the immutable cost snapshot captured at sale time.
-    # cost * quantity_in_base_units mirrors effective_cogs_total on SaleItem.
-    cogs_expr = ExpressionWrapper(
-        Coalesce(F('cost'), Decimal('0')) * F('quantity_in_base_units'),
-        output_field=DecimalField(max_digits=20, decimal_places=2),
-    )
+    # Sums the realized FIFO cost recorded at deduction time, falling back to
+    # the sale-time snapshot exactly as effective_cogs_total does.
     total_cost = (
         SaleItem.objects.filter(sale__in=sales_queryset)
-        .aggregate(total=Sum(cogs_expr))['total'] or Decimal('0')
+        .aggregate(total=Sum(COGS_TOTAL_EXPRESSION))['total'] or Decimal('0')
     )
     
     # Expenses – only approved, filtered by expense_date (not approval date)
@@ -786,61 +784,78 @@ def inventory_valuation_report(request):
     if category_id:
         products = products.filter(category_id=category_id)
     
-    products = products.select_related('category').order_by('category__name', 'name')
+    products = list(products.select_related('category').order_by('category__name', 'name'))
+    sellable_stock_map = get_sellable_stock_many(products, outlet)
     
     # Get stock movements for the period
     movements = StockMovement.objects.filter(
         tenant=tenant,
         outlet_id=outlet_id,
-        created_at__date__gte=start_dt,
-        created_at__date__lte=end_dt
+        created_at__gte=boundary(start_dt),
+        created_at__lt=boundary(end_dt + timedelta(days=1)),
     )
 
-    # Get all movements before the period to compute opening stock from ledger.
+    # Opening stock starts from the nearest compacted balance at or before the
+    # period start, so only movements after that boundary are read.
+    opening_boundary = StockOpeningBalance.objects.nearest_boundary(tenant.id, outlet_id, start_dt)
+    opening_balances = StockOpeningBalance.objects.balances_at(tenant.id, outlet_id, opening_boundary)
     pre_period_movements = StockMovement.objects.filter(
         tenant=tenant,
         outlet_id=outlet_id,
-        created_at__date__lt=start_dt
+        created_at__lt=boundary(start_dt),
     )
+    if opening_boundary:
+        pre_period_movements = pre_period_movements.filter(created_at__gte=boundary(opening_boundary))
 
     # Pre-aggregate movement quantities once to avoid N x movement-type queries.
     period_movement_totals = {
         (row['product_id'], row['movement_type']): row['qty']
         for row in movements.values('product_id', 'movement_type').annotate(qty=Sum('quantity'))
     }
-    pre_period_movement_totals = {
-        (row['product_id'], row['movement_type']): row['qty']
-        for row in pre_period_movements.values('product_id', 'movement_type').annotate(qty=Sum('quantity'))
-    }
     period_movement_deltas = {
         (row['product_id'], row['movement_type']): row['qty']
         for row in movements.values('product_id', 'movement_type').annotate(qty=Sum('quantity_delta'))
     }
     pre_period_stock_totals = {
-        row['product_id']: row['qty']
-        for row in pre_period_movements.values('product_id').annotate(qty=Sum('quantity_delta'))
+        product_id: balance.quantity for product_id, balance in opening_balances.items()
     }
+    for row in pre_period_movements.values('product_id').annotate(qty=Sum('quantity_delta')):
+        pre_period_stock_totals[row['product_id']] = pre_period_stock_totals.get(row['product_id'], 0) + (row['qty'] or 0)
     period_stock_totals = {
         row['product_id']: row['qty']
         for row in movements.values('product_id').annotate(qty=Sum('quantity_delta'))
     }
+    acquisition_boundary = StockOpeningBalance.objects.nearest_boundary(
+        tenant.id, outlet_id, end_dt + timedelta(days=1)
+    )
     acquisition_cost_totals = {
-        row['product_id']: (row['quantity'] or 0, row['value'] or Decimal('0'))
-        for row in StockMovement.objects.filter(
-            tenant=tenant,
-            outlet_id=outlet_id,
-            created_at__date__lte=end_dt,
-            quantity_delta__gt=0,
-        ).values('product_id').annotate(
-            quantity=Sum('quantity_delta'),
-            value=Sum(
-                ExpressionWrapper(
-                    F('quantity_delta') * Coalesce(F('unit_cost'), Decimal('0.00')),
-                    output_field=DecimalField(max_digits=20, decimal_places=2),
-                )
-            ),
-        )
+        product_id: (balance.acquired_quantity, balance.acquired_cost)
+        for product_id, balance in StockOpeningBalance.objects.balances_at(
+            tenant.id, outlet_id, acquisition_boundary
+        ).items()
     }
+    acquisition_movements = StockMovement.objects.filter(
+        tenant=tenant,
+        outlet_id=outlet_id,
+        created_at__lt=boundary(end_dt + timedelta(days=1)),
+        quantity_delta__gt=0,
+    )
+    if acquisition_boundary:
+        acquisition_movements = acquisition_movements.filter(created_at__gte=boundary(acquisition_boundary))
+    for row in acquisition_movements.values('product_id').annotate(
+        quantity=Sum('quantity_delta'),
+        value=Sum(
+            ExpressionWrapper(
+                F('quantity_delta') * Coalesce(F('unit_cost'), Decimal('0.00')),
+                output_field=DecimalField(max_digits=20, decimal_places=2),
+            )
+        ),
+    ):
+        opening_quantity, opening_value = acquisition_cost_totals.get(row['product_id'], (0, Decimal('0')))
+        acquisition_cost_totals[row['product_id']] = (
+            opening_quantity + (row['quantity'] or 0),
+            opening_value + (row['value'] or Decimal('0')),
+        )
     
     # Get latest stock take (if any)
     latest_stock_take = StockTake.objects.filter(
@@ -886,15 +901,6 @@ def inventory_valuation_report(request):
         )
 
         # Opening stock from ledger before start date.
-        pre_received = movement_qty(pre_period_movement_totals, product.id, 'purchase')
-        pre_transferred_in = movement_qty(pre_period_movement_totals, product.id, 'transfer_in')
-        pre_transferred_out = movement_qty(pre_period_movement_totals, product.id, 'transfer_out')
-        pre_adjusted = movement_qty(pre_period_movement_totals, product.id, 'adjustment')
-        pre_sold = movement_qty(pre_period_movement_totals, product.id, 'sale')
-        pre_returns = movement_qty(pre_period_movement_totals, product.id, 'return')
-        pre_damage = movement_qty(pre_period_movement_totals, product.id, 'damage')
-        pre_expiry = movement_qty(pre_period_movement_totals, product.id, 'expiry')
-
         opening_stock = pre_period_stock_totals.get(product.id, 0) or 0
         
         # Calculate quantities by movement type
@@ -915,7 +921,7 @@ def inventory_valuation_report(request):
         ledger_closing_stock = opening_stock + period_net_movement
 
         # Align with product listing by using the same sellable stock source.
-        current_stock = get_sellable_stock(product, outlet)
+        current_stock = sellable_stock_map.get(product.id, 0)
         
         # Get stock take data if available
         counted_qty = 0
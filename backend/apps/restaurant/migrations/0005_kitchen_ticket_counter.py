@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:20
+
+import re
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+KOT_NUMBER = re.compile(r'^KOT-(\d{8})-(\d+)$')
+
+
+def seed_recent_counters(apps, schema_editor):
+    """Start each outlet's recent daily counters after the tickets it already has."""
+    KitchenOrderTicket = apps.get_model('restaurant', 'KitchenOrderTicket')
+    KitchenTicketCounter = apps.get_model('restaurant', 'KitchenTicketCounter')
+    since = timezone.now() - timedelta(days=2)
+    highest = {}
+    recent = KitchenOrderTicket.objects.filter(created_at__gte=since, outlet__isnull=False)
+    for outlet_id, kot_number in recent.values_list('outlet_id', 'kot_number').iterator():
+        match = KOT_NUMBER.match(kot_number or '')
+        if not match:
+            continue
+        key = (outlet_id, match.group(1))
+        highest[key] = max(highest.get(key, 0), int(match.group(2)))
+    KitchenTicketCounter.objects.bulk_create([
+        KitchenTicketCounter(
+            outlet_id=outlet_id,
+            business_date=f"{day[:4]}-{day[4:6]}-{day[6:]}",
+            last_value=last_value,
+        )
+        for (outlet_id, day), last_value in highest.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0012_remove_outlet_distribution_active'),
+        ('restaurant', '0004_restaurantorder_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KitchenTicketCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('business_date', models.DateField()),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Kitchen Ticket Counter',
+                'verbose_name_plural': 'Kitchen Ticket Counters',
+                'db_table': 'restaurant_kitchenticketcounter',
+            },
+        ),
+        migrations.AlterField(
+            model_name='kitchenorderticket',
+            name='kot_number',
+            field=models.CharField(db_index=True, help_text='Kitchen Order Ticket number, unique per outlet', max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='kitchenorderticket',
+            constraint=models.UniqueConstraint(fields=('outlet', 'kot_number'), name='uniq_kot_number_per_outlet'),
+        ),
+        migrations.AddField(
+            model_name='kitchenticketcounter',
+            name='outlet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kitchen_ticket_counters', to='outlets.outlet'),
+        ),
+        migrations.AddConstraint(
+            model_name='kitchenticketcounter',
+            constraint=models.UniqueConstraint(fields=('outlet', 'business_date'), name='uniq_kot_counter_per_day'),
+        ),
+        migrations.RunPython(seed_recent_counters, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import connection, models
+from django.utils import timezone
 from apps.tenants.models import Tenant
 from apps.outlets.models import Outlet
 
@@ -56,7 +57,7 @@ class KitchenOrderTicket(models.Model):
     sale = models.ForeignKey('sales.Sale', on_delete=models.CASCADE, related_name='kitchen_tickets')
     table = models.ForeignKey(Table, on_delete=models.SET_NULL, null=True, blank=True, related_name='kitchen_orders')
     
-    kot_number = models.CharField(max_length=50, unique=True, db_index=True, help_text="Kitchen Order Ticket number")
+    kot_number = models.CharField(max_length=50, db_index=True, help_text="Kitchen Order Ticket number, unique per outlet")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     priority = models.CharField(max_length=20, choices=[('normal', 'Normal'), ('high', 'High'), ('urgent', 'Urgent')], default='normal')
     
@@ -74,6 +75,9 @@ class KitchenOrderTicket(models.Model):
         verbose_name = 'Kitchen Order Ticket'
         verbose_name_plural = 'Kitchen Order Tickets'
         ordering = ['-sent_to_kitchen_at']
+        constraints = [
+            models.UniqueConstraint(fields=['outlet', 'kot_number'], name='uniq_kot_number_per_outlet'),
+        ]
         indexes = [
             models.Index(fields=['tenant']),
             models.Index(fields=['outlet']),
@@ -88,6 +92,48 @@ class KitchenOrderTicket(models.Model):
 
 
 
+class KitchenTicketCounterManager(models.Manager):
+    ALLOCATE_SQL = (
+        "INSERT INTO restaurant_kitchenticketcounter (outlet_id, business_date, last_value, updated_at) "
+        "VALUES (%s, %s, 1, %s) "
+        "ON CONFLICT (outlet_id, business_date) DO UPDATE "
+        "SET last_value = restaurant_kitchenticketcounter.last_value + 1, updated_at = EXCLUDED.updated_at "
+        "RETURNING last_value"
+    )
+
+    def allocate(self, outlet, business_date=None):
+        """Next ticket number for the outlet's day, from one upsert; rolls back with the caller's transaction."""
+        business_date = business_date or timezone.localdate()
+        with connection.cursor() as cursor:
+            cursor.execute(self.ALLOCATE_SQL, [getattr(outlet, 'id', outlet), business_date, timezone.now()])
+            return cursor.fetchone()[0]
+
+    def next_kot_number(self, outlet, business_date=None):
+        business_date = business_date or timezone.localdate()
+        return f"KOT-{business_date:%Y%m%d}-{self.allocate(outlet, business_date):04d}"
+
+
+class KitchenTicketCounter(models.Model):
+    """Last kitchen ticket number issued at an outlet on a business day"""
+    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, related_name='kitchen_ticket_counters')
+    business_date = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = KitchenTicketCounterManager()
+
+    class Meta:
+        db_table = 'restaurant_kitchenticketcounter'
+        verbose_name = 'Kitchen Ticket Counter'
+        verbose_name_plural = 'Kitchen Ticket Counters'
+        constraints = [
+            models.UniqueConstraint(fields=['outlet', 'business_date'], name='uniq_kot_counter_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.outlet_id} {self.business_date}: {self.last_value}"
+
+
 class RestaurantOrder(models.Model):
     "Restaurant Order model for persistent order session tracking"
     STATUS_CHOICES = [
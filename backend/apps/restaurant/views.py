@@ -192,13 +192,13 @@ class KitchenOrderTicketViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             from rest_framework.exceptions import ValidationError
             raise ValidationError("Sale does not belong to your tenant.")
         
-        # Generate KOT number
-        import random
-        kot_number = f"KOT-{timezone.now().strftime('%Y%m%d')}-{random.randint(1000, 9999)}"
-        
         # Get outlet from sale
         outlet = sale.outlet
 
+        # Next number from the outlet's daily ticket counter
+        from .models import KitchenTicketCounter
+        kot_number = KitchenTicketCounter.objects.next_kot_number(outlet)
+
         # Get table from sale or from serializer
         table_id = requested_table_id or (sale.table.id if sale.table else None)
         table = None
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Sale, SaleItem, Receipt
+from .models import Sale, SaleItem, Receipt, ReceiptArtifact
 
 
 class SaleItemInline(admin.TabularInline):
@@ -29,13 +29,13 @@ class ReceiptAdmin(admin.ModelAdmin):
     list_display = ('receipt_number', 'sale', 'tenant', 'format', 'is_sent', 'sent_via', 'access_count', 'generated_at')
     list_filter = ('tenant', 'format', 'is_sent', 'sent_via', 'generated_at')
     search_fields = ('receipt_number', 'sale__receipt_number')
-    readonly_fields = ('receipt_number', 'generated_at', 'access_count', 'last_accessed_at')
+    readonly_fields = ('receipt_number', 'artifact', 'generated_at', 'access_count', 'last_accessed_at')
     fieldsets = (
         ('Basic Information', {
             'fields': ('tenant', 'sale', 'receipt_number', 'format')
         }),
         ('Content', {
-            'fields': ('content', 'pdf_file')
+            'fields': ('content', 'pdf_file', 'artifact')
         }),
         ('Metadata', {
             'fields': ('generated_at', 'generated_by')
@@ -48,3 +48,10 @@ class ReceiptAdmin(admin.ModelAdmin):
         }),
     )
 
+
+@admin.register(ReceiptArtifact)
+class ReceiptArtifactAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'backend', 'content_type', 'size', 'created_at')
+    list_filter = ('backend', 'content_type')
+    search_fields = ('sha256',)
+    readonly_fields = ('sha256', 'backend', 'location', 'content_type', 'size', 'created_at')
@@ -0,0 +1,61 @@
+"""
+Background jobs for sale side effects
+Receipts and notifications used to run in the request thread after commit,
+so every checkout waited on rendering and storage uploads. They are now
+enqueued with the sale and run by the job worker.
+"""
+import logging
+
+from apps.jobs.queue import enqueue
+from apps.jobs.registry import register
+
+logger = logging.getLogger(__name__)
+
+
+@register('sales.generate_receipt', max_attempts=8)
+def generate_receipt(sale_id, format='pdf', user_id=None):
+    """Create the sale's receipt (a PDF snapshot or ESC/POS payload); reruns return the existing one."""
+    from apps.accounts.models import User
+    from .models import Sale
+    from .services import ReceiptService
+
+    sale = Sale.objects.select_related('tenant', 'user', 'outlet', 'customer').prefetch_related(
+        'items__product'
+    ).filter(pk=sale_id).first()
+    if sale is None:
+        logger.warning(f"Receipt job skipped: sale {sale_id} not found")
+        return
+    user = User.objects.filter(pk=user_id).first() if user_id else None
+    ReceiptService.generate_receipt(sale, format=format, user=user)
+
+
+@register('sales.notify_sale_completed')
+def notify_sale_completed(sale_id):
+    from apps.notifications.services import NotificationService
+    from .models import Sale
+
+    sale = Sale.objects.select_related('tenant', 'outlet').filter(pk=sale_id).first()
+    if sale is None:
+        logger.warning(f"Sale notification skipped: sale {sale_id} not found")
+        return
+    NotificationService.notify_sale_completed(sale)
+
+
+def enqueue_receipt(sale, format='pdf', user=None):
+    """Queue one receipt render per sale and format; repeat calls reuse the queued job."""
+    return enqueue(
+        'sales.generate_receipt',
+        {'sale_id': sale.id, 'format': format, 'user_id': getattr(user, 'id', None)},
+        idempotency_key=f'sales.receipt:{sale.id}:{format}',
+    )
+
+
+def enqueue_post_sale_jobs(sale, user=None):
+    """Queue the receipt (for completed sales) and sale notification for a sale in this transaction."""
+    if sale.status == 'completed':
+        enqueue_receipt(sale, format='pdf', user=user)
+    enqueue(
+        'sales.notify_sale_completed',
+        {'sale_id': sale.id},
+        idempotency_key=f'sales.notify:{sale.id}:{sale.status}',
+    )
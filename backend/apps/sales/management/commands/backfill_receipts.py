@@ -1,13 +1,31 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from django.db.models import Q
 from apps.sales.models import Sale, Receipt
+from apps.sales.receipt_store import store_artifact
 from apps.sales.services import ReceiptService
 
 
 class Command(BaseCommand):
-    help = "Backfill missing PDF receipts for completed sales"
+    help = "Backfill missing PDF receipts for completed sales, or move stored PDFs into the artifact store"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--artifacts',
+            action='store_true',
+            help='Move PDFs kept in pdf_file or base64 content into the receipt artifact store',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500, help='Receipts moved per transaction with --artifacts (default: 500)'
+        )
 
     def handle(self, *args, **options):
+        if options['artifacts']:
+            if options['chunk_size'] < 1:
+                raise CommandError('--chunk-size must be at least 1.')
+            self._move_to_artifacts(options['chunk_size'])
+            return
+
         self.stdout.write("Backfilling receipts for completed sales...")
         qs = Sale.objects.filter(status='completed')
         total = qs.count()
@@ -26,3 +44,40 @@ class Command(BaseCommand):
                 self.stderr.write(f"Failed to generate receipt for sale {sale.id}: {exc}")
 
         self.stdout.write(f"Backfill complete. Generated {created} of {total} sales.")
+
+    def _move_to_artifacts(self, chunk_size):
+        """
+        Walk legacy PDF receipts in id order, one chunk per transaction
+        Rows already moved are skipped, so an interrupted run can simply be restarted.
+        """
+        self.stdout.write("Moving receipt PDFs into the artifact store...")
+        pending = Receipt.objects.filter(format='pdf', artifact__isnull=True).filter(
+            ~Q(content='') | (Q(pdf_file__isnull=False) & ~Q(pdf_file=''))
+        ).only('id', 'receipt_number', 'format', 'content', 'pdf_file', 'artifact', 'snapshot')
+        last_id = 0
+        moved = 0
+        failed = 0
+
+        while True:
+            chunk = list(pending.filter(id__gt=last_id).order_by('id')[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            updated = []
+            with transaction.atomic():
+                for receipt in chunk:
+                    pdf_bytes = ReceiptService.read_pdf_receipt(receipt)
+                    if not pdf_bytes:
+                        failed += 1
+                        self.stderr.write(f"Receipt {receipt.id} has no readable PDF, left as is")
+                        continue
+                    # Same document, new home: bypasses Receipt.save's immutability check on purpose
+                    receipt.artifact = store_artifact(pdf_bytes, content_type='application/pdf')
+                    receipt.content = ''
+                    updated.append(receipt)
+                Receipt.objects.bulk_update(updated, ['artifact', 'content'])
+            moved += len(updated)
+            self.stdout.write(f"  {moved} moved, through receipt {last_id}")
+
+        self.stdout.write(f"Artifact backfill complete. Moved {moved} receipts, {failed} unreadable.")
@@ -0,0 +1,119 @@
+"""
+Management command to benchmark receipt rendering
+Renders the same sale repeatedly with compiled layouts off (every receipt
+builds its own stylesheet, table styles and headings, as before) and on, and
+reports receipts per second for each. With --format escpos it prints the
+thermal payload instead, with and without compiled printer profiles.
+
+    python manage.py bench_receipt_rendering --receipts 500 --items 8
+    python manage.py bench_receipt_rendering --mode cached --json
+    python manage.py bench_receipt_rendering --format escpos --receipts 20000
+
+The sale lives under a throwaway tenant that is deleted afterwards.
+"""
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+
+class Command(BaseCommand):
+    help = "Benchmark receipt PDF or ESC/POS rendering with and without compiled layouts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receipts', type=int, default=300, help='Receipts rendered per mode (default: 300)')
+        parser.add_argument('--items', type=int, default=8, help='Lines on the benchmark sale (default: 8)')
+        parser.add_argument(
+            '--format', choices=['pdf', 'escpos'], default='pdf', help='Receipt format rendered (default: pdf)'
+        )
+        parser.add_argument(
+            '--mode',
+            choices=['both', 'uncached', 'cached'],
+            default='both',
+            help="'uncached' compiles the layout for every receipt like the old renderer (default: both)",
+        )
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark tenant and its rows')
+
+    def handle(self, *args, **options):
+        from apps.sales.models import Sale
+        from apps.sales.receipt_escpos import clear_escpos_profiles
+        from apps.sales.receipt_layouts import clear_receipt_layouts
+
+        tenant, sale_id = self._seed(options)
+        sale = Sale.objects.select_related('tenant', 'outlet', 'user', 'customer').prefetch_related('items').get(
+            pk=sale_id
+        )
+        modes = ['uncached', 'cached'] if options['mode'] == 'both' else [options['mode']]
+
+        report = {'format': options['format'], 'receipts': options['receipts'], 'items': options['items']}
+        try:
+            for mode in modes:
+                clear_receipt_layouts()
+                clear_escpos_profiles()
+                with override_settings(RECEIPT_LAYOUT_CACHE=(mode == 'cached')):
+                    report[f'{mode}_receipts_per_second'] = self._render(sale, options['receipts'], options['format'])
+        finally:
+            if not options['keep']:
+                tenant.delete()
+
+        if options['mode'] == 'both':
+            report['speedup'] = round(report['cached_receipts_per_second'] / report['uncached_receipts_per_second'], 2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+
+        self.stdout.write(self.style.WARNING('\n=== Receipt Rendering Benchmark ===\n'))
+        for key, value in report.items():
+            self.stdout.write(f'{key}: {value}')
+
+    def _render(self, sale, receipts, format):
+        from apps.sales.services import ReceiptService
+
+        if format == 'escpos':
+            render = ReceiptService._generate_escpos_receipt
+        else:
+            def render(sale):
+                ReceiptService._generate_pdf_receipt(sale).close()
+
+        # Warm up imports, fonts and (when cached) the layout itself
+        render(sale)
+        started = time.perf_counter()
+        for _ in range(receipts):
+            render(sale)
+        elapsed = time.perf_counter() - started
+        return round(receipts / elapsed, 1) if elapsed else 0.0
+
+    def _seed(self, options):
+        from apps.accounts.models import User
+        from apps.outlets.models import Outlet
+        from apps.sales.models import Sale, SaleItem
+        from apps.tenants.models import Tenant
+
+        stamp = int(time.time())
+        tenant = Tenant.objects.create(name=f"Receipt rendering benchmark {stamp}")
+        outlet = Outlet.objects.create(
+            tenant=tenant, name="Benchmark Outlet", address="1 Benchmark Road", phone="+265 000 000",
+            email="bench@example.com",
+        )
+        user = User.objects.create_user(
+            username=f"receipt-bench-{stamp}", email=f"receipt-bench-{stamp}@example.com", password=None,
+            tenant=tenant, first_name="Bench", last_name="Cashier",
+        )
+        subtotal = Decimal('7.00') * options['items']
+        # bulk_create skips post_save, so no receipt jobs are queued for the benchmark sale
+        sale = Sale.objects.bulk_create([Sale(
+            tenant=tenant, outlet=outlet, user=user, receipt_number=f"BENCH-{stamp}", subtotal=subtotal,
+            total=subtotal, payment_method='cash', cash_received=subtotal, change_given=Decimal('0.00'),
+        )])[0]
+        SaleItem.objects.bulk_create([
+            SaleItem(
+                sale=sale, product_name=f"Benchmark product {index}", quantity=2, price=Decimal('3.50'),
+                total=Decimal('7.00'),
+            )
+            for index in range(options['items'])
+        ])
+        return tenant, sale.id
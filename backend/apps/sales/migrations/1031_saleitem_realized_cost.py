@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:54
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F
+
+
+def backfill_realized_cost(apps, schema_editor):
+    # Historical lines keep the figure effective_cogs_total already reported for them
+    SaleItem = apps.get_model('sales', 'SaleItem')
+    RefundItem = apps.get_model('sales', 'RefundItem')
+    cost_total = ExpressionWrapper(
+        F('cost') * F('quantity_in_base_units'),
+        output_field=DecimalField(max_digits=15, decimal_places=2),
+    )
+    SaleItem.objects.filter(realized_cost_total__isnull=True, cost__isnull=False).update(
+        realized_unit_cost=F('cost'),
+        realized_cost_total=cost_total,
+    )
+    RefundItem.objects.update(realized_cost_total=cost_total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '1030_alter_sale_payment_method'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refunditem',
+            name='realized_cost_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=15, validators=[django.core.validators.MinValueValidator(Decimal('0'))]),
+        ),
+        migrations.AddField(
+            model_name='saleitem',
+            name='realized_cost_total',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Total batch cost consumed when stock was deducted (realized COGS)', max_digits=15, null=True),
+        ),
+        migrations.AddField(
+            model_name='saleitem',
+            name='realized_unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Batch cost consumed per base unit when stock was deducted (FIFO)', max_digits=15, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='saleitem',
+            index=models.Index(fields=['sale', 'realized_cost_total'], name='sales_item_realized_cogs_idx'),
+        ),
+        migrations.RunPython(backfill_realized_cost, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0014_backfill_tenant_subdomain_domain'),
+        ('outlets', '0012_remove_outlet_distribution_active'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sales', '1031_saleitem_realized_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(blank=True, default='', max_length=20)),
+                ('last_value', models.BigIntegerField(default=0, help_text='Last number handed out (sales or reserved blocks)')),
+                ('gap_free', models.BooleanField(default=True, help_text='Allocate inside the sale transaction so rollbacks leave no gaps')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('outlet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_sequences', to='outlets.outlet')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_sequences', to='tenants.tenant')),
+            ],
+            options={
+                'verbose_name': 'Receipt Sequence',
+                'verbose_name_plural': 'Receipt Sequences',
+                'db_table': 'sales_receiptsequence',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReceiptNumberBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(blank=True, default='', max_length=20)),
+                ('device_id', models.CharField(blank=True, default='', max_length=100)),
+                ('first_number', models.BigIntegerField()),
+                ('last_number', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('outlet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_number_blocks', to='outlets.outlet')),
+                ('reserved_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reserved_receipt_blocks', to=settings.AUTH_USER_MODEL)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_number_blocks', to='tenants.tenant')),
+            ],
+            options={
+                'verbose_name': 'Receipt Number Block',
+                'verbose_name_plural': 'Receipt Number Blocks',
+                'db_table': 'sales_receiptnumberblock',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='receiptsequence',
+            constraint=models.UniqueConstraint(fields=('tenant', 'outlet', 'prefix'), name='uniq_receipt_sequence_scope'),
+        ),
+        migrations.AddIndex(
+            model_name='receiptnumberblock',
+            index=models.Index(fields=['tenant', 'outlet', 'prefix', 'last_number'], name='sales_rnb_scope_idx'),
+        ),
+    ]
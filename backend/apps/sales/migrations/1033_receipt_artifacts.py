@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '1032_receipt_sequences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptArtifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(help_text='Hex SHA-256 of the body', max_length=64, unique=True)),
+                ('content_type', models.CharField(default='application/pdf', max_length=100)),
+                ('size', models.PositiveIntegerField(help_text='Body size in bytes')),
+                ('backend', models.CharField(choices=[('database', 'Database'), ('filesystem', 'Local Filesystem'), ('storage', 'Object Storage')], max_length=20)),
+                ('location', models.CharField(blank=True, help_text='File path or storage key, outside the database', max_length=255)),
+                ('data', models.BinaryField(blank=True, help_text='Body, for the database backend only', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'base_manager_name': 'objects',
+                'verbose_name': 'Receipt Artifact',
+                'verbose_name_plural': 'Receipt Artifacts',
+                'db_table': 'sales_receiptartifact',
+            },
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='artifact',
+            field=models.ForeignKey(blank=True, help_text='Stored PDF body (replaces pdf_file and base64 content)', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='receipts', to='sales.receiptartifact'),
+        ),
+    ]
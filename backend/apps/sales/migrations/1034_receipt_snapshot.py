@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '1033_receipt_artifacts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='snapshot',
+            field=models.JSONField(blank=True, help_text='What the receipt shows, captured at sale time; the PDF is rendered from it', null=True),
+        ),
+    ]
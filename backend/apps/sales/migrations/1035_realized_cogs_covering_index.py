@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '1034_receipt_snapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='saleitem',
+            name='sales_item_realized_cogs_idx',
+        ),
+        migrations.AddIndex(
+            model_name='saleitem',
+            index=models.Index(fields=['sale', 'realized_cost_total'], include=('cost', 'quantity_in_base_units'), name='sales_item_realized_cogs_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
@@ -238,6 +239,36 @@ class Sale(models.Model):
         self.save(update_fields=['payment_status', 'status'])
 
 
+# SQL form of SaleItem.effective_cogs_total, for aggregating COGS in the database
+COGS_TOTAL_EXPRESSION = Coalesce(
+    models.F('realized_cost_total'),
+    models.F('cost') * models.F('quantity_in_base_units'),
+    models.Value(Decimal('0')),
+    output_field=models.DecimalField(max_digits=20, decimal_places=2),
+)
+
+
+class SaleItemManager(models.Manager):
+    def record_realized_costs(self, realized):
+        """Persist the stock cost consumed by sale lines in one bulk update.
+
+        realized is an iterable of (sale_item, cost) pairs where cost is the
+        total batch cost deducted for the line (see deduction_cost).
+        """
+        updated = []
+        for sale_item, cost in realized:
+            cost = Decimal(str(cost))
+            base_units = int(sale_item.quantity_in_base_units or sale_item.quantity or 0)
+            sale_item.realized_cost_total = cost.quantize(Decimal('0.01'))
+            sale_item.realized_unit_cost = (
+                (cost / Decimal(base_units)).quantize(Decimal('0.0001')) if base_units else Decimal('0')
+            )
+            updated.append(sale_item)
+        if updated:
+            self.bulk_update(updated, ['realized_unit_cost', 'realized_cost_total'], batch_size=100)
+        return updated
+
+
 class SaleItem(models.Model):
     """Sale line item model"""
     KITCHEN_STATUS_CHOICES = [
@@ -265,6 +296,20 @@ class SaleItem(models.Model):
         validators=[MinValueValidator(Decimal('0'))],
         help_text="Cost captured at time of sale"
     )
+    realized_unit_cost = models.DecimalField(
+        max_digits=15,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        help_text="Batch cost consumed per base unit when stock was deducted (FIFO)"
+    )
+    realized_cost_total = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Total batch cost consumed when stock was deducted (realized COGS)"
+    )
     discount = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -287,6 +332,8 @@ class SaleItem(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = SaleItemManager()
+
     class Meta:
         db_table = 'sales_saleitem'
         verbose_name = 'Sale Item'
@@ -295,6 +342,13 @@ class SaleItem(models.Model):
             models.Index(fields=['sale']),
             models.Index(fields=['product']),
             models.Index(fields=['unit']),
+            # Covers COGS_TOTAL_EXPRESSION sums per sale (realized total, else cost * base quantity)
+            # so they can be answered by an index-only scan on PostgreSQL
+            models.Index(
+                fields=['sale', 'realized_cost_total'],
+                include=['cost', 'quantity_in_base_units'],
+                name='sales_item_realized_cogs_idx',
+            ),
         ]
 
     def save(self, *args, **kwargs):
@@ -336,12 +390,16 @@ class SaleItem(models.Model):
     def effective_cogs_total(self):
         """
         PHASE 2 FIX – immutable COGS.
-        ONLY use the snapshot captured at sale time (self.cost).
+        Prefer the realized batch cost recorded when stock was deducted,
+        then the snapshot captured at sale time (self.cost) for lines whose
+        stock has not been deducted yet (e.g. pending deliveries).
         We deliberately do NOT fall back to product.cost so that changing
         a product's cost never retroactively changes historical P&L.
         If cost was not captured at sale time it is reported as 0 and
         should be investigated / corrected via a data-quality report.
         """
+        if self.realized_cost_total is not None:
+            return self.realized_cost_total
         effective_cost = self.effective_cost
         if effective_cost is not None:
             return effective_cost * Decimal(self.quantity_in_base_units)
@@ -458,6 +516,11 @@ class RefundItem(models.Model):
         max_digits=15, decimal_places=2, default=Decimal('0'),
         validators=[MinValueValidator(Decimal('0'))],
     )
+    # Share of the original line's realized COGS reversed by this refund.
+    realized_cost_total = models.DecimalField(
+        max_digits=15, decimal_places=2, default=Decimal('0'),
+        validators=[MinValueValidator(Decimal('0'))],
+    )
     total = models.DecimalField(
         max_digits=10, decimal_places=2,
         validators=[MinValueValidator(Decimal('0'))],
@@ -476,6 +539,47 @@ class RefundItem(models.Model):
         return f"{self.product_name} x{self.quantity} (Refund {self.refund.refund_number})"
 
 
+class ReceiptArtifactManager(models.Manager):
+    """Never loads the body; read it through apps.sales.receipt_store."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('data')
+
+
+class ReceiptArtifact(models.Model):
+    """Rendered receipt body (PDF bytes), addressed by its SHA-256.
+
+    Identical renders share one artifact. The bytes live in the backend named
+    on the row (a bytea column, the local filesystem or object storage), so
+    changing RECEIPT_ARTIFACT_BACKEND never strands older receipts.
+    """
+    BACKEND_CHOICES = [
+        ('database', 'Database'),
+        ('filesystem', 'Local Filesystem'),
+        ('storage', 'Object Storage'),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True, help_text="Hex SHA-256 of the body")
+    content_type = models.CharField(max_length=100, default='application/pdf')
+    size = models.PositiveIntegerField(help_text="Body size in bytes")
+    backend = models.CharField(max_length=20, choices=BACKEND_CHOICES)
+    location = models.CharField(max_length=255, blank=True, help_text="File path or storage key, outside the database")
+    data = models.BinaryField(null=True, blank=True, editable=False, help_text="Body, for the database backend only")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ReceiptArtifactManager()
+
+    class Meta:
+        db_table = 'sales_receiptartifact'
+        # Related access (receipt.artifact) goes through the base manager: keep the body deferred there too
+        base_manager_name = 'objects'
+        verbose_name = 'Receipt Artifact'
+        verbose_name_plural = 'Receipt Artifacts'
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.backend}, {self.size} bytes)"
+
+
 class Receipt(models.Model):
     """Digital receipt stored in database.
 
@@ -512,6 +616,13 @@ class Receipt(models.Model):
     format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='json', help_text="Format of stored receipt")
     content = models.TextField(help_text="Receipt content (HTML/JSON/ESC/POS base64)")
     pdf_file = models.FileField(upload_to='receipts/pdf/', null=True, blank=True, help_text="PDF file if format is PDF")
+    artifact = models.ForeignKey(
+        ReceiptArtifact, on_delete=models.PROTECT, null=True, blank=True, related_name='receipts',
+        help_text="Stored PDF body (replaces pdf_file and base64 content)"
+    )
+    snapshot = models.JSONField(
+        null=True, blank=True, help_text="What the receipt shows, captured at sale time; the PDF is rendered from it"
+    )
     
     # Versioning / immutability
     is_current = models.BooleanField(default=True, help_text="Whether this is the current receipt for the sale/format")
@@ -556,7 +667,10 @@ class Receipt(models.Model):
     def save(self, *args, **kwargs):
         """Enforce immutability for created receipts.
 
-        Once created, you must not change `sale`, `format` or `content` fields.
+        Once created, you must not change `sale`, `format`, `content`, `snapshot`
+        or `artifact` fields. The one exception is filling in the artifact of a
+        PDF rendered on first access, which ReceiptService.render_pdf_receipt does
+        with a guarded UPDATE rather than save().
         To update a receipt (e.g., regenerate), create a new Receipt record and
         mark the old one `voided=True` and `is_current=False`.
         """
@@ -564,7 +678,10 @@ class Receipt(models.Model):
             # Fetch current stored values and compare
             try:
                 orig = Receipt.objects.get(pk=self.pk)
-                if (orig.sale_id != self.sale_id) or (orig.format != self.format) or (orig.content != self.content):
+                if (
+                    orig.sale_id != self.sale_id or orig.format != self.format or orig.content != self.content
+                    or orig.snapshot != self.snapshot or orig.artifact_id != self.artifact_id
+                ):
                     raise ValueError('Receipts are immutable once created. Create a new receipt to replace an existing one.')
             except Receipt.DoesNotExist:
                 # Shouldn't happen, but allow save in that case
@@ -572,6 +689,66 @@ class Receipt(models.Model):
         super().save(*args, **kwargs)
 
 
+class ReceiptSequence(models.Model):
+    """Next receipt number for one (tenant, outlet, prefix).
+
+    Numbers are handed out by apps.sales.receipt_numbers with a single
+    UPDATE ... RETURNING on this row. Gap-free sequences allocate inside the
+    sale's transaction, so a rolled-back sale gives its number back but
+    checkouts at the outlet queue on the row; gap-tolerant sequences allocate
+    in their own short transaction and never hold the row for a checkout.
+    """
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='receipt_sequences')
+    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, related_name='receipt_sequences')
+    prefix = models.CharField(max_length=20, blank=True, default='')
+    last_value = models.BigIntegerField(default=0, help_text="Last number handed out (sales or reserved blocks)")
+    gap_free = models.BooleanField(default=True, help_text="Allocate inside the sale transaction so rollbacks leave no gaps")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'sales_receiptsequence'
+        verbose_name = 'Receipt Sequence'
+        verbose_name_plural = 'Receipt Sequences'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tenant', 'outlet', 'prefix'],
+                name='uniq_receipt_sequence_scope',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.outlet_id}:{self.prefix or '-'} @ {self.last_value}"
+
+
+class ReceiptNumberBlock(models.Model):
+    """A contiguous run of receipt numbers reserved for an offline device.
+
+    The run is taken out of the outlet's ReceiptSequence when reserved, so the
+    device can number sales while disconnected and the server accepts those
+    numbers when the sales sync.
+    """
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='receipt_number_blocks')
+    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, related_name='receipt_number_blocks')
+    prefix = models.CharField(max_length=20, blank=True, default='')
+    device_id = models.CharField(max_length=100, blank=True, default='')
+    first_number = models.BigIntegerField()
+    last_number = models.BigIntegerField()
+    reserved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reserved_receipt_blocks')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'sales_receiptnumberblock'
+        verbose_name = 'Receipt Number Block'
+        verbose_name_plural = 'Receipt Number Blocks'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', 'outlet', 'prefix', 'last_number'], name='sales_rnb_scope_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.prefix}{self.first_number}-{self.prefix}{self.last_number} ({self.device_id or 'any device'})"
+
+
 class ReceiptTemplate(models.Model):
     """Per-tenant editable receipt template.
 
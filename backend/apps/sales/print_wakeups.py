@@ -0,0 +1,200 @@
+"""
+Wake-ups for print connectors long-polling claim-next
+Instead of answering 204 at once, claim-next can park a connector's request
+until a print job may be waiting for its tenant. Saving a pending PrintJob
+announces the tenant:
+
+- PostgreSQL: NOTIFY on PRINT_JOB_CHANNEL, which the database delivers to
+  every process when the saving transaction commits (and never if it rolls
+  back). Each process keeps one listener thread on its own connection doing
+  LISTEN, so parked requests issue no queries while they wait.
+- Other databases: an in-process condition, signalled after commit. SQLite
+  deployments are a single process, so that reaches every waiter.
+
+Every wake-up bumps a per-tenant generation. A request reads the generation
+before it looks for a job and then waits for it to move, so a job committed
+between the look and the wait is never missed. While the listener is down
+(database restart, lost connection) parked requests fall back to checking
+every PRINT_CLAIM_FALLBACK_POLL_SECONDS.
+
+A parked request holds a server thread, so each process parks at most
+PRINT_CLAIM_MAX_PARKED of them; beyond that claim-next answers at once and the
+connector simply polls again.
+"""
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+PRINT_JOB_CHANNEL = 'primepos_print_jobs'
+
+# Seconds a first long-poll waits for the listener to start before falling back
+_LISTEN_TIMEOUT = 2.0
+# Seconds between keepalive queries on an idle listener connection
+_KEEPALIVE_SECONDS = 60.0
+_RECONNECT_SECONDS = 1.0
+
+_condition = threading.Condition()
+_generations = defaultdict(int)
+_parked = 0
+_listener_lock = threading.Lock()
+_listener = None
+
+
+def _uses_listen():
+    return connections[DEFAULT_DB_ALIAS].vendor == 'postgresql'
+
+
+def _wake(tenant_ids=None):
+    """Bump the generation of the given tenants, or of every tenant being watched, and wake waiters."""
+    with _condition:
+        for tenant_id in (_generations if tenant_ids is None else tenant_ids):
+            _generations[tenant_id] += 1
+        _condition.notify_all()
+
+
+class _Listener(threading.Thread):
+    """LISTENs for print job announcements on a dedicated connection and turns them into wake-ups."""
+
+    def __init__(self):
+        super().__init__(name='print-job-listener', daemon=True)
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self._stop_read, self._stop_write = os.pipe()
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                try:
+                    self._listen()
+                except Exception as exc:
+                    if not self.stopping.is_set():
+                        logger.warning("Print job listener lost its connection, reconnecting: %s", exc)
+                self.ready.clear()
+                self.stopping.wait(_RECONNECT_SECONDS)
+        finally:
+            os.close(self._stop_read)
+            os.close(self._stop_write)
+
+    def _listen(self):
+        wrapper = connections[DEFAULT_DB_ALIAS]
+        raw = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN "{PRINT_JOB_CHANNEL}"')
+            self.ready.set()
+            # Announcements made while nobody was listening are lost; let every waiter look again
+            _wake()
+
+            while not self.stopping.is_set():
+                readable, _, _ = select.select([raw, self._stop_read], [], [], _KEEPALIVE_SECONDS)
+                if self._stop_read in readable:
+                    return
+                if not readable:
+                    with raw.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    continue
+                raw.poll()
+                tenant_ids = set()
+                while raw.notifies:
+                    payload = raw.notifies.pop(0).payload
+                    if payload.isdigit():
+                        tenant_ids.add(int(payload))
+                if tenant_ids:
+                    _wake(tenant_ids)
+        finally:
+            self.ready.clear()
+            raw.close()
+
+    def stop(self):
+        self.stopping.set()
+        os.write(self._stop_write, b'\0')
+
+
+def _ensure_listener():
+    """Start this process's listener on first use; True once it is listening."""
+    global _listener
+    listener = _listener
+    if listener is None or not listener.is_alive():
+        with _listener_lock:
+            listener = _listener
+            if listener is None or not listener.is_alive():
+                listener = _listener = _Listener()
+                listener.start()
+    return listener.ready.wait(_LISTEN_TIMEOUT)
+
+
+def stop_print_job_listener():
+    """Stop this process's listener and close its connection (tests, before dropping the database)."""
+    global _listener
+    with _listener_lock:
+        listener, _listener = _listener, None
+    if listener is not None and listener.is_alive():
+        listener.stop()
+        listener.join()
+
+
+def announce_print_job(tenant_id):
+    """Wake connectors waiting for the tenant's print jobs once the current transaction commits."""
+    if _uses_listen():
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [PRINT_JOB_CHANNEL, str(tenant_id)])
+    else:
+        transaction.on_commit(lambda: _wake([tenant_id]))
+
+
+def print_job_generation(tenant_id):
+    """
+    The tenant's wake-up generation, to read before looking for a job
+    On PostgreSQL this also starts the process's listener, so that anything
+    committed after the look is heard.
+    """
+    if _uses_listen():
+        _ensure_listener()
+    with _condition:
+        return _generations[tenant_id]
+
+
+@contextmanager
+def parking_slot():
+    """
+    Reserve one of this process's PRINT_CLAIM_MAX_PARKED long-poll slots
+    Yields True while the slot is held, or False at once when every slot is
+    taken and the caller should answer without waiting.
+    """
+    global _parked
+    with _condition:
+        granted = _parked < settings.PRINT_CLAIM_MAX_PARKED
+        if granted:
+            _parked += 1
+    try:
+        yield granted
+    finally:
+        if granted:
+            with _condition:
+                _parked -= 1
+
+
+def wait_for_print_job(tenant_id, generation, timeout):
+    """
+    Block until the tenant's generation moves past generation, or timeout seconds pass
+    Returns True when the caller should look for a job again, False when the
+    wait simply ran out.
+    """
+    limit = timeout
+    if _uses_listen() and not (_listener is not None and _listener.ready.is_set()):
+        limit = min(timeout, settings.PRINT_CLAIM_FALLBACK_POLL_SECONDS)
+
+    started = time.monotonic()
+    with _condition:
+        woken = _condition.wait_for(lambda: _generations[tenant_id] != generation, limit)
+    return woken or (limit < timeout and time.monotonic() - started < timeout)
@@ -0,0 +1,407 @@
+"""
+Compiled ESC/POS receipt profiles
+Everything about a thermal receipt that does not depend on the sale - the
+paper width and its column count, the print area and code page commands, the
+optional logo raster and QR code, the rule line and the footer - is compiled
+once per printer profile (paper width, code page, logo, QR code) and kept for
+the life of the process. Printing a receipt then only formats the sale's own
+lines, encodes them once and joins them with the compiled byte blocks.
+
+The profile is resolved from the requested paper width, the printer's name
+and the outlet's settings; the parsed settings are kept per outlet and
+reparsed when the outlet's updated_at moves. Header blocks are keyed on their
+text, so a renamed outlet simply compiles a new one.
+"""
+import logging
+import re
+import threading
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+INITIALIZE = b"\x1b@"
+CUT = b"\n\n\n\n\x1dV\x01\n"
+BOLD_ON = "\x1bE\x01"
+BOLD_OFF = "\x1bE\x00"
+ALIGN_CENTER = b"\x1ba\x01"
+ALIGN_LEFT = b"\x1ba\x00"
+
+DEFAULT_PAPER = '80'
+# Characters per line and GS W print area (in dots at 203 dpi) of each roll width
+PAPER_COLUMNS = {'58': 32, '80': 48}
+PAPER_DOTS = {'58': 464, '80': 640}
+
+# ESC t page numbers of the code pages common thermal printers ship with; 'utf-8'
+# sends text as UTF-8 without selecting a page, which is what receipts always did
+CODE_PAGES = {
+    'utf-8': None, 'cp437': 0, 'cp850': 2, 'cp860': 3, 'cp863': 4, 'cp865': 5, 'cp1252': 16, 'cp866': 17,
+    'cp852': 18, 'cp858': 19,
+}
+DEFAULT_CODE_PAGE = 'utf-8'
+
+FOOTER_LINES = ('Thank you for your business!', 'Powered by PRIMEPOS 0997575865')
+QR_MAX_BYTES = 7089
+SETTINGS_SECTIONS = ('receipt', 'receipts', 'printing')
+
+# Outlets, headers and logos each cache keeps before it starts over
+_MAX_ENTRIES = 1024
+
+_lock = threading.Lock()
+_profiles = {}
+_outlet_options = {}
+_rasters = {}
+
+
+def normalize_paper_width(value):
+    """'58' or '80' for the spellings receipts accept, '' for anything else."""
+    if value is None:
+        return ''
+    raw = str(value).strip().lower()
+    if raw in ('80', '80mm'):
+        return '80'
+    if raw in ('58', '58mm'):
+        return '58'
+    return ''
+
+
+@lru_cache(maxsize=256)
+def paper_width_from_name(text):
+    """Roll width spelled out in a printer name such as 'EPSON TM-T20 58mm', or ''."""
+    if not text:
+        return ''
+    lowered = text.lower()
+    if any(token in lowered for token in ('80mm', '80 mm', '3inch', '3 inch', '3"')):
+        return '80'
+    if any(token in lowered for token in ('58mm', '58 mm', '2.25inch', '2.28 inch')):
+        return '58'
+    if re.search(r'(^|\D)80(\D|$)', lowered):
+        return '80'
+    if re.search(r'(^|\D)58(\D|$)', lowered):
+        return '58'
+    return ''
+
+
+def _section_values(outlet_settings, key):
+    for section in SETTINGS_SECTIONS:
+        values = outlet_settings.get(section)
+        if isinstance(values, dict):
+            yield values.get(key)
+
+
+def _parse_print_options(outlet_settings):
+    paper_width = ''
+    top_level = (outlet_settings.get(key) for key in ('paper_width', 'printer_paper_width', 'receipt_paper_width'))
+    for value in (*top_level, *_section_values(outlet_settings, 'paper_width')):
+        paper_width = normalize_paper_width(value)
+        if paper_width:
+            break
+
+    code_page = DEFAULT_CODE_PAGE
+    for value in _section_values(outlet_settings, 'code_page'):
+        if value:
+            code_page = str(value).strip().lower().replace('_', '-')
+            if code_page not in CODE_PAGES:
+                logger.warning("Unknown receipt code page %r, printing UTF-8", value)
+                code_page = DEFAULT_CODE_PAGE
+            break
+
+    print_logo = any(value is True for value in _section_values(outlet_settings, 'print_logo'))
+    qr_code = next((str(value) for value in _section_values(outlet_settings, 'qr_code') if value), '')
+    return paper_width, code_page, print_logo, qr_code
+
+
+def outlet_print_options(outlet):
+    """
+    (paper width, code page, print logo, QR code text) from the outlet's settings
+    Parsed once per saved version of the outlet; unsaved outlets are parsed every time.
+    """
+    outlet_settings = outlet.settings if outlet and isinstance(outlet.settings, dict) else {}
+    outlet_id = getattr(outlet, 'id', None)
+    version = getattr(outlet, 'updated_at', None)
+    if not settings.RECEIPT_LAYOUT_CACHE or outlet_id is None or version is None:
+        return _parse_print_options(outlet_settings)
+
+    cached = _outlet_options.get(outlet_id)
+    if cached is None or cached[0] != version:
+        if len(_outlet_options) >= _MAX_ENTRIES:
+            _outlet_options.clear()
+        cached = _outlet_options[outlet_id] = (version, _parse_print_options(outlet_settings))
+    return cached[1]
+
+
+def wrap_text(text, max_width):
+    """Word-wrap text into lines of at most max_width characters, splitting words that cannot fit."""
+    text = (text or '').strip()
+    if not text:
+        return ['']
+    if len(text) <= max_width:
+        return [text]
+
+    words = text.split()
+    if not words:
+        return [text[:max_width]]
+
+    lines = []
+    current = ''
+    for word in words:
+        if len(word) > max_width:
+            if current:
+                lines.append(current)
+                current = ''
+            start = 0
+            while start < len(word):
+                lines.append(word[start:start + max_width])
+                start += max_width
+            continue
+
+        candidate = f"{current} {word}".strip()
+        if len(candidate) <= max_width:
+            current = candidate
+        else:
+            lines.append(current)
+            current = word
+
+    if current:
+        lines.append(current)
+    return lines or ['']
+
+
+def align_columns(left, right, max_width):
+    """left flush left and right flush right on one line, wrapping left when both do not fit."""
+    left = (left or '').strip()
+    right = (right or '').strip()
+    if not right:
+        return wrap_text(left, max_width)
+
+    min_gap = 1
+    if len(left) + min_gap + len(right) <= max_width:
+        return [left + (' ' * (max_width - len(left) - len(right))) + right]
+
+    wrapped_left = wrap_text(left, max(1, max_width - len(right) - min_gap)) or ['']
+    lines = wrapped_left[:-1]
+    last_left = wrapped_left[-1]
+    if len(last_left) + min_gap + len(right) <= max_width:
+        lines.append(last_left + (' ' * (max_width - len(last_left) - len(right))) + right)
+    else:
+        lines.append(last_left)
+        lines.append((' ' * max(0, max_width - len(right))) + right)
+    return lines
+
+
+def bold(text):
+    return BOLD_ON + text + BOLD_OFF
+
+
+def raster_image(image, max_dots):
+    """GS v 0 raster command printing a PIL image, scaled down to at most max_dots wide."""
+    image = image.convert('RGBA')
+    # Transparent areas print as paper, not as black
+    canvas = Image.new('RGBA', image.size, 'white')
+    canvas.alpha_composite(image)
+    gray = canvas.convert('L')
+
+    width = max(8, min(gray.width, max_dots) // 8 * 8)
+    if width != gray.width:
+        gray = gray.resize((width, max(1, round(gray.height * width / gray.width))))
+    # Inverted so that dark pixels become set bits, then dithered to one bit per dot
+    dots = gray.point(lambda value: 255 - value).convert('1')
+    width_bytes = width // 8
+    return (
+        b"\x1dv0\x00" + bytes((width_bytes & 0xFF, width_bytes >> 8, dots.height & 0xFF, dots.height >> 8))
+        + dots.tobytes()
+    )
+
+
+def logo_raster(logo, max_dots):
+    """The cached raster command of an uploaded logo, or b'' when it cannot be read."""
+    key = (logo.name, max_dots)
+    raster = _rasters.get(key)
+    if raster is None:
+        try:
+            with logo.open('rb') as handle:
+                raster = raster_image(Image.open(handle), max_dots)
+        except Exception as exc:
+            logger.warning("Receipt logo %s could not be rasterized: %s", logo.name, exc)
+            raster = b''
+        if len(_rasters) >= _MAX_ENTRIES:
+            _rasters.clear()
+        _rasters[key] = raster
+    return raster
+
+
+def qr_code_command(data, module_size=6):
+    """Model 2 QR code symbol commands (GS ( k), printed by the printer itself."""
+    payload = data.encode('utf-8')
+    if len(payload) > QR_MAX_BYTES:
+        logger.warning("Receipt QR code of %s bytes is too long to print, skipped", len(payload))
+        return b''
+    stored = len(payload) + 3
+    return (
+        b"\x1d(k\x04\x001A2\x00"
+        + b"\x1d(k\x03\x001C" + bytes((module_size,))
+        + b"\x1d(k\x03\x001E1"
+        + b"\x1d(k" + bytes((stored & 0xFF, stored >> 8)) + b"1P0" + payload
+        + b"\x1d(k\x03\x001Q0"
+    )
+
+
+class EscposProfile:
+    """Column count, encoding and precompiled byte blocks of one thermal printer profile."""
+
+    def __init__(self, paper_width=DEFAULT_PAPER, code_page=DEFAULT_CODE_PAGE, logo=b'', qr_code=''):
+        self.key = (paper_width, code_page, qr_code)
+        self.columns = PAPER_COLUMNS[paper_width]
+        self.encoding = code_page
+        # Code pages cannot hold every character; those print as '?' instead of failing the receipt
+        self.errors = 'strict' if code_page == DEFAULT_CODE_PAGE else 'replace'
+        self.rule = '-' * self.columns
+        self._headers = {}
+
+        dots = PAPER_DOTS[paper_width]
+        prologue = INITIALIZE + b"\x1dW" + bytes((dots & 0xFF, dots >> 8))
+        if CODE_PAGES[code_page] is not None:
+            prologue += b"\x1bt" + bytes((CODE_PAGES[code_page],))
+        if logo:
+            prologue += ALIGN_CENTER + logo + ALIGN_LEFT
+        self.prologue = prologue
+
+        footer = ['']
+        for line in FOOTER_LINES:
+            footer.extend(wrap_text(line, self.columns))
+        self.footer = self.encode_lines(footer)
+        if qr_code:
+            symbol = qr_code_command(qr_code)
+            if symbol:
+                self.footer += ALIGN_CENTER + symbol + b"\n" + ALIGN_LEFT
+        self.footer += CUT
+
+    def encode_lines(self, lines):
+        return ("\n".join(lines) + "\n").encode(self.encoding, self.errors)
+
+    def align(self, left, right):
+        left = (left or '').strip()
+        right = (right or '').strip()
+        if right and len(left) + len(right) < self.columns:
+            return [left + (' ' * (self.columns - len(left) - len(right))) + right]
+        return align_columns(left, right, self.columns)
+
+    def header(self, tenant, outlet):
+        """Centered business and outlet heading, compiled once per distinct text."""
+        business = tenant.name if tenant else "Business"
+        key = (
+            business,
+            outlet.name if outlet else "",
+            outlet.address if outlet and outlet.address else "",
+            outlet.phone if outlet and outlet.phone else "",
+            outlet.email if outlet and outlet.email else "",
+        )
+        compiled = self._headers.get(key)
+        if compiled is None:
+            name, address, phone, email = key[1:]
+            texts = [business.upper()]
+            texts.extend(text for text in (name, address) if text)
+            if phone:
+                texts.append(f"Tel: {phone}")
+            if email:
+                texts.append(f"Email: {email}")
+            compiled = self.encode_lines([
+                line.center(self.columns) for text in texts for line in wrap_text(text, self.columns)
+            ])
+            if len(self._headers) >= _MAX_ENTRIES:
+                self._headers.clear()
+            self._headers[key] = compiled
+        return compiled
+
+    def render(self, sale, currency, cashier_name=''):
+        """The complete ESC/POS payload of a sale."""
+        align = self.align
+        lines = align("Receipt #:", str(sale.receipt_number))
+        lines += align("Date:", sale.created_at.strftime('%Y-%m-%d %H:%M:%S'))
+        if cashier_name:
+            lines += align("Cashier:", cashier_name)
+
+        if sale.customer:
+            lines += align("Customer:", sale.customer.name or 'Walk-in')
+            if sale.customer.phone:
+                lines += align("Phone:", sale.customer.phone)
+            if sale.customer.email:
+                lines += align("Email:", sale.customer.email)
+        else:
+            lines += align("Customer:", "Walk-in")
+
+        lines.append(self.rule)
+        for item in sale.items.all():
+            name = item.product_name or (item.product.name if item.product else "Item")
+            qty = item.quantity or 0
+            total = item.total or (item.price or Decimal('0')) * Decimal(qty)
+            lines += align(f"{name} x{qty}", f"{currency} {total:,.2f}")
+
+        lines.append(self.rule)
+        lines += align("Subtotal:", f"{currency} {sale.subtotal:,.2f}")
+        if sale.tax and sale.tax > 0:
+            lines.extend(bold(line) for line in align("Total VAT:", f"{currency} {sale.tax:,.2f}"))
+        if sale.discount and sale.discount > 0:
+            lines += align("Discount:", f"-{currency} {sale.discount:,.2f}")
+        lines.extend(bold(line) for line in align("Total:", f"{currency} {sale.total:,.2f}"))
+        lines += align("Payment:", sale.get_payment_method_display())
+
+        try:
+            raw_lines = getattr(sale, 'payment_lines', None)
+            if raw_lines and isinstance(raw_lines, (list, tuple)):
+                lines.append("-")
+                lines += wrap_text("Payment Breakdown:", self.columns)
+                for payment in raw_lines:
+                    method = payment.get('payment_method') if isinstance(payment, dict) else None
+                    other = payment.get('other_payment_method_name') if isinstance(payment, dict) else None
+                    amount = payment.get('amount') if isinstance(payment, dict) else None
+                    try:
+                        amount = Decimal(str(amount)) if amount is not None else Decimal('0')
+                    except Exception:
+                        amount = Decimal('0')
+                    lines += align(str(method or other or 'Unknown'), f"{currency} {amount:,.2f}")
+        except Exception:
+            # The breakdown is informational; the receipt prints without it
+            pass
+
+        return b''.join((self.prologue, self.header(sale.tenant, sale.outlet), self.encode_lines(lines), self.footer))
+
+
+def get_escpos_profile(outlet, tenant=None, paper_width='auto', printer_name=''):
+    """
+    The compiled profile for a print on the outlet's printer
+    The roll width is the requested one, else the one in the printer's name,
+    else the outlet's setting, else 80mm. With RECEIPT_LAYOUT_CACHE off every
+    call compiles a fresh profile, which is what each print used to pay.
+    """
+    outlet_width, code_page, print_logo, qr_code = outlet_print_options(outlet)
+    resolved = (
+        normalize_paper_width(paper_width) or paper_width_from_name(printer_name) or outlet_width or DEFAULT_PAPER
+    )
+    logo = getattr(tenant, 'logo', None) if print_logo else None
+
+    if not settings.RECEIPT_LAYOUT_CACHE:
+        raster = logo_raster(logo, PAPER_DOTS[resolved]) if logo else b''
+        return EscposProfile(resolved, code_page, raster, qr_code)
+
+    key = (resolved, code_page, logo.name if logo else '', qr_code)
+    profile = _profiles.get(key)
+    if profile is None:
+        with _lock:
+            profile = _profiles.get(key)
+            if profile is None:
+                if len(_profiles) >= _MAX_ENTRIES:
+                    _profiles.clear()
+                raster = logo_raster(logo, PAPER_DOTS[resolved]) if logo else b''
+                profile = _profiles[key] = EscposProfile(resolved, code_page, raster, qr_code)
+    return profile
+
+
+def clear_escpos_profiles():
+    with _lock:
+        _profiles.clear()
+        _outlet_options.clear()
+        _rasters.clear()
@@ -0,0 +1,197 @@
+"""
+Compiled receipt PDF layouts
+The ReportLab stylesheet, paragraph and table styles and the static headings
+and footer of a receipt cost as much to build as filling in a small sale, so
+they are compiled once per paper width and kept for the life of the process.
+Rendering a receipt then only formats the sale's own rows into copies of the
+compiled pieces.
+
+The PDF layout does not depend on the tenant's ReceiptTemplate (that drives
+the text receipts), so every tenant shares it. Outlet header blocks are keyed
+on their text as captured in the receipt snapshot, and saving an outlet drops
+the headers compiled for it.
+"""
+import copy
+import threading
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import Paragraph, TableStyle
+
+# PDF receipts are A4 documents; roll widths only apply to ESC/POS output
+PAPER_SIZES = {'a4': A4}
+DEFAULT_PAPER = 'a4'
+
+BRAND_COLOR = colors.HexColor('#1e3a8a')
+FOOTER_LINES = ('Thank you for your business!', 'Powered by PRIMEPOS +265 997575865')
+
+# Outlets whose headers one layout keeps before it starts over
+_MAX_HEADERS = 1024
+
+_lock = threading.Lock()
+_layouts = {}
+
+
+class ReceiptLayout:
+    """Styles, table styles and static flowables of one receipt PDF layout."""
+
+    def __init__(self, paper_width=DEFAULT_PAPER):
+        self.key = paper_width
+        self.pagesize = PAPER_SIZES[paper_width]
+        self.margin = 20 * mm
+        self._headers = {}
+
+        styles = getSampleStyleSheet()
+        self.title_style = ParagraphStyle(
+            'CustomTitle', parent=styles['Heading1'], fontSize=18, textColor=BRAND_COLOR, alignment=TA_CENTER,
+            spaceAfter=12,
+        )
+        self.outlet_style = ParagraphStyle('outlet', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER)
+        self.contact_style = ParagraphStyle('contact', parent=styles['Normal'], fontSize=9, alignment=TA_CENTER)
+        section_style = ParagraphStyle('section', parent=styles['Heading2'], fontSize=12, textColor=BRAND_COLOR)
+        payment_style = ParagraphStyle(
+            'payment_header', parent=styles['Heading3'], fontSize=12, textColor=BRAND_COLOR
+        )
+        footer_header_style = ParagraphStyle(
+            'footer_header', parent=styles['Heading3'], fontSize=10, alignment=TA_CENTER, textColor=BRAND_COLOR,
+        )
+        footer_style = ParagraphStyle(
+            'footer', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER,
+            textColor=colors.HexColor('#4b5563'), fontName='Helvetica-Bold', leading=12, spaceAfter=2,
+        )
+
+        # Fixed column widths (mm) of the receipt tables
+        self.info_widths = [40 * mm, 120 * mm]
+        self.items_widths = [80 * mm, 25 * mm, 30 * mm, 35 * mm]
+        self.totals_widths = [80 * mm, 80 * mm]
+        self.rule_widths = [160 * mm]
+
+        self.info_style = TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('TEXTCOLOR', (0, 0), (0, -1), colors.grey),
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ])
+        self.customer_style = TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('TEXTCOLOR', (0, 0), (0, -1), colors.grey),
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f3f4f6')),
+            ('PADDING', (0, 0), (-1, -1), 6),
+        ])
+        self.items_style = TableStyle([
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('BACKGROUND', (0, 0), (-1, 0), BRAND_COLOR),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+            ('PADDING', (0, 0), (-1, -1), 6),
+        ])
+        self.totals_style = TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('PADDING', (0, 0), (-1, -1), 4),
+        ])
+        self.payments_style = TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('PADDING', (0, 0), (-1, -1), 4),
+        ])
+        self.rule_style = TableStyle([
+            ('LINEABOVE', (0, 0), (-1, -1), 0.5, colors.grey, 1),
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+            ('TOPPADDING', (0, 0), (-1, -1), 2),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ])
+
+        # Markup is parsed once here; renders take shallow copies (see flowable)
+        self.customer_heading = Paragraph('CUSTOMER', section_style)
+        self.items_heading = Paragraph('ITEMS', section_style)
+        self.payments_heading = Paragraph('Payment Breakdown', payment_style)
+        self.footer = [Paragraph('Footer', footer_header_style)]
+        self.footer.extend(Paragraph(line, footer_style) for line in FOOTER_LINES)
+
+    @staticmethod
+    def flowable(compiled):
+        """
+        A render's own copy of a compiled flowable
+        Wrapping stores the measured size on the flowable, so concurrent renders
+        must not share one; the copy still shares the parsed markup.
+        """
+        return copy.copy(compiled)
+
+    def total_row_style(self, row):
+        """Emphasis for the TOTAL row, whose index depends on the sale."""
+        return [
+            ('FONTSIZE', (0, row), (-1, row), 12),
+            ('FONTNAME', (0, row), (-1, row), 'Helvetica-Bold'),
+            ('TEXTCOLOR', (0, row), (-1, row), BRAND_COLOR),
+            ('LINEABOVE', (0, row), (-1, row), 1, BRAND_COLOR),
+        ]
+
+    def header(self, snapshot):
+        """Business and outlet heading paragraphs of a receipt snapshot, compiled once per distinct text."""
+        business_name = snapshot['business_name']
+        outlet = snapshot['outlet']
+        key = (outlet['id'], business_name, outlet['name'], outlet['address'], outlet['phone'], outlet['email'])
+        compiled = self._headers.get(key)
+        if compiled is None:
+            compiled = [Paragraph(business_name.upper(), self.title_style)]
+            if outlet['name']:
+                compiled.append(Paragraph(outlet['name'], self.outlet_style))
+            if outlet['address']:
+                compiled.append(Paragraph(outlet['address'], self.contact_style))
+            if outlet['phone']:
+                compiled.append(Paragraph(f"Tel: {outlet['phone']}", self.contact_style))
+            if outlet['email']:
+                compiled.append(Paragraph(f"Email: {outlet['email']}", self.contact_style))
+            if key[0] is None:
+                # Unsaved outlets cannot be forgotten by id, so they are not kept
+                return compiled
+            if len(self._headers) >= _MAX_HEADERS:
+                self._headers.clear()
+            self._headers[key] = compiled
+        return [self.flowable(paragraph) for paragraph in compiled]
+
+    def forget_outlet(self, outlet_id):
+        for key in [key for key in list(self._headers) if key[0] == outlet_id]:
+            self._headers.pop(key, None)
+
+
+def get_receipt_layout(paper_width=DEFAULT_PAPER):
+    """
+    The compiled layout for a paper width
+    With RECEIPT_LAYOUT_CACHE off every call compiles a fresh layout, which is
+    what each receipt used to pay.
+    """
+    if not settings.RECEIPT_LAYOUT_CACHE:
+        return ReceiptLayout(paper_width)
+
+    layout = _layouts.get(paper_width)
+    if layout is None:
+        with _lock:
+            layout = _layouts.get(paper_width)
+            if layout is None:
+                layout = _layouts[paper_width] = ReceiptLayout(paper_width)
+    return layout
+
+
+def forget_outlet(outlet_id):
+    """Drop the outlet's compiled headers from every layout."""
+    for layout in list(_layouts.values()):
+        layout.forget_outlet(outlet_id)
+
+
+def clear_receipt_layouts():
+    with _lock:
+        _layouts.clear()
@@ -0,0 +1,200 @@
+"""
+Receipt number allocation
+Each (tenant, outlet, prefix) has one ReceiptSequence row, and numbers are
+taken from it with a single UPDATE ... RETURNING instead of scanning the
+outlet's sales for the current maximum.
+
+Gap-free sequences advance inside the caller's transaction: a sale that rolls
+back returns its number, and concurrent checkouts at the outlet queue on the
+row (under the stock lock timeout, so they retry like any stock contention).
+Gap-tolerant sequences advance on the autocommit side connection
+(primepos.db), so the row is locked only for the one statement and a
+rolled-back sale leaves a gap.
+Offline devices reserve whole blocks out of the same sequence.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BigIntegerField, Max, Q
+from django.db.models.functions import Cast, Substr
+from django.utils import timezone
+
+from apps.inventory.stock_locks import set_lock_timeout
+from primepos.db import autocommit_connection
+
+logger = logging.getLogger(__name__)
+
+# Prefixes may not end in a digit, so "<prefix><number>" splits unambiguously
+PREFIX_PATTERN = re.compile(r'^([A-Za-z0-9/_-]{0,19}[A-Za-z/_-])?$')
+NUMBER_PATTERN = re.compile(r'^(?P<prefix>.*?)(?P<number>[0-9]+)$')
+
+ADVANCE_SQL = (
+    "UPDATE sales_receiptsequence SET last_value = last_value + %s, updated_at = %s "
+    "WHERE tenant_id = %s AND outlet_id = %s AND prefix = %s AND gap_free = %s "
+    "RETURNING last_value"
+)
+CREATE_SQL = (
+    "INSERT INTO sales_receiptsequence (tenant_id, outlet_id, prefix, last_value, gap_free, updated_at) "
+    "VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (tenant_id, outlet_id, prefix) DO NOTHING"
+)
+
+class ReceiptNumberError(Exception):
+    """Raised when a receipt number cannot be allocated or accepted."""
+
+
+def format_receipt_number(prefix, number):
+    return f"{prefix}{number}"
+
+
+def _check_prefix(prefix):
+    if not PREFIX_PATTERN.match(prefix or ''):
+        raise ReceiptNumberError(f"Invalid receipt prefix {prefix!r}")
+    return prefix or ''
+
+
+def _advance(conn, tenant_id, outlet_id, prefix, count, gap_free):
+    with conn.cursor() as cursor:
+        cursor.execute(ADVANCE_SQL, [count, timezone.now(), tenant_id, outlet_id, prefix, gap_free])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _advance_in_mode(tenant_id, outlet_id, prefix, count, gap_free):
+    if not gap_free:
+        return _advance(autocommit_connection(), tenant_id, outlet_id, prefix, count, False)
+    if connection.in_atomic_block:
+        set_lock_timeout()
+    return _advance(connection, tenant_id, outlet_id, prefix, count, True)
+
+
+def _highest_used(tenant_id, outlet_id, prefix):
+    """Highest number already issued under prefix at the outlet, by sales or reserved blocks."""
+    from .models import ReceiptNumberBlock, Sale
+
+    numbered = Sale.objects.filter(
+        tenant_id=tenant_id, outlet_id=outlet_id, receipt_number__regex=rf'^{re.escape(prefix)}[0-9]+$'
+    )
+    highest_sale = numbered.aggregate(
+        highest=Max(Cast(Substr('receipt_number', len(prefix) + 1), BigIntegerField()))
+    )['highest'] or 0
+    highest_block = ReceiptNumberBlock.objects.filter(
+        tenant_id=tenant_id, outlet_id=outlet_id, prefix=prefix
+    ).aggregate(highest=Max('last_number'))['highest'] or 0
+    return max(highest_sale, highest_block)
+
+
+def _create_sequence(tenant_id, outlet_id, prefix):
+    """First use at an outlet: start after whatever numbers it already has."""
+    gap_free = settings.RECEIPT_NUMBERS_GAP_FREE
+    conn = connection if gap_free else autocommit_connection()
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_SQL, [
+            tenant_id, outlet_id, prefix, _highest_used(tenant_id, outlet_id, prefix), gap_free, timezone.now(),
+        ])
+
+
+def allocate_receipt_numbers(tenant, outlet, count=1, prefix=''):
+    """
+    Take count consecutive numbers from the outlet's sequence
+    Returns the first number of the run. The sequence row is created on
+    first use, in the mode set by RECEIPT_NUMBERS_GAP_FREE.
+
+    Raises:
+        ReceiptNumberError: If the prefix or count is invalid
+    """
+    from .models import ReceiptSequence
+
+    prefix = _check_prefix(prefix)
+    if count < 1:
+        raise ReceiptNumberError("count must be at least 1")
+    tenant_id = getattr(tenant, 'id', tenant)
+    outlet_id = getattr(outlet, 'id', outlet)
+
+    for _ in range(2):
+        # Most rows are in the configured mode; only a miss pays for reading the row's own mode
+        last = _advance_in_mode(tenant_id, outlet_id, prefix, count, settings.RECEIPT_NUMBERS_GAP_FREE)
+        if last is None:
+            gap_free = ReceiptSequence.objects.filter(
+                tenant_id=tenant_id, outlet_id=outlet_id, prefix=prefix
+            ).values_list('gap_free', flat=True).first()
+            if gap_free is not None:
+                last = _advance_in_mode(tenant_id, outlet_id, prefix, count, gap_free)
+        if last is not None:
+            return last - count + 1
+        _create_sequence(tenant_id, outlet_id, prefix)
+    raise ReceiptNumberError(f"No receipt sequence for outlet {outlet_id} prefix {prefix!r}")
+
+
+def next_receipt_number(tenant, outlet, prefix=''):
+    """The next receipt number for the outlet, formatted with its prefix."""
+    return format_receipt_number(prefix, allocate_receipt_numbers(tenant, outlet, prefix=prefix))
+
+
+def sync_receipt_sequence(tenant, outlet, prefix=''):
+    """Move the sequence past numbers written without it (imports, legacy paths)."""
+    from .models import ReceiptSequence
+
+    prefix = _check_prefix(prefix)
+    tenant_id = getattr(tenant, 'id', tenant)
+    outlet_id = getattr(outlet, 'id', outlet)
+    highest = _highest_used(tenant_id, outlet_id, prefix)
+    updated = ReceiptSequence.objects.filter(
+        tenant_id=tenant_id, outlet_id=outlet_id, prefix=prefix, last_value__lt=highest
+    ).update(last_value=highest, updated_at=timezone.now())
+    if updated:
+        logger.warning(f"Receipt sequence for outlet {outlet_id} prefix {prefix!r} moved up to {highest}")
+    return highest
+
+
+def reserve_receipt_block(tenant, outlet, size, device_id='', prefix='', user=None):
+    """
+    Reserve size consecutive numbers for an offline device
+    The block is cut from the live sequence, so online sales never reuse it.
+
+    Raises:
+        ReceiptNumberError: If size is outside 1..RECEIPT_BLOCK_MAX_SIZE
+    """
+    from .models import ReceiptNumberBlock
+
+    if not 1 <= size <= settings.RECEIPT_BLOCK_MAX_SIZE:
+        raise ReceiptNumberError(f"Block size must be between 1 and {settings.RECEIPT_BLOCK_MAX_SIZE}")
+    first = allocate_receipt_numbers(tenant, outlet, count=size, prefix=prefix)
+    return ReceiptNumberBlock.objects.create(
+        tenant=tenant,
+        outlet=outlet,
+        prefix=prefix or '',
+        device_id=device_id or '',
+        first_number=first,
+        last_number=first + size - 1,
+        reserved_by=user,
+    )
+
+
+def claim_reserved_receipt_number(tenant, outlet, receipt_number, device_id=''):
+    """
+    Accept a number an offline device issued from one of its reserved blocks
+    Returns the receipt number to store.
+
+    Raises:
+        ReceiptNumberError: If the number is not inside a block reserved for
+            this outlet (and device, when the block names one)
+    """
+    from .models import ReceiptNumberBlock
+
+    match = NUMBER_PATTERN.match(str(receipt_number or '').strip())
+    if not match or not PREFIX_PATTERN.match(match['prefix']):
+        raise ReceiptNumberError(f"Invalid offline receipt number {receipt_number!r}")
+    number = int(match['number'])
+    reserved = ReceiptNumberBlock.objects.filter(
+        tenant=tenant,
+        outlet=outlet,
+        prefix=match['prefix'],
+        first_number__lte=number,
+        last_number__gte=number,
+    ).filter(Q(device_id='') | Q(device_id=device_id or ''))
+    if not reserved.exists():
+        raise ReceiptNumberError(f"Receipt number {receipt_number} was not reserved for this outlet or device")
+    return format_receipt_number(match['prefix'], number)
+
@@ -0,0 +1,147 @@
+"""
+Receipt artifact store
+Rendered receipt bodies (PDF bytes) are stored once per SHA-256 and referenced
+from Receipt.artifact, instead of base64 text in Receipt.content. Where the
+bytes go depends on RECEIPT_ARTIFACT_BACKEND:
+
+- 'database': a bytea column on the ReceiptArtifact row
+- 'filesystem': files under RECEIPT_ARTIFACT_ROOT
+- 'storage': DEFAULT_FILE_STORAGE (Cloudinary, S3, ...)
+
+Each artifact records its own backend, so reads keep working after the
+setting changes. ReceiptArtifact's manager defers the body, so only the
+functions here ever load it.
+"""
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+
+EXTENSIONS = {'application/pdf': 'pdf', 'text/plain': 'txt'}
+
+
+def artifact_path(digest, content_type):
+    """Relative path of a body: fanned out by the first two hex digits."""
+    return f"receipts/artifacts/{digest[:2]}/{digest}.{EXTENSIONS.get(content_type, 'bin')}"
+
+
+class DatabaseArtifactBackend:
+    name = 'database'
+
+    def save(self, digest, data, content_type):
+        return {'data': data}
+
+    def open(self, artifact):
+        from .models import ReceiptArtifact
+
+        data = ReceiptArtifact.objects.filter(pk=artifact.pk).values_list('data', flat=True).first()
+        return BytesIO(bytes(data or b''))
+
+    def url(self, artifact):
+        return None
+
+
+class FileSystemArtifactBackend:
+    name = 'filesystem'
+
+    def _full_path(self, location):
+        return os.path.join(settings.RECEIPT_ARTIFACT_ROOT, location)
+
+    def save(self, digest, data, content_type):
+        location = artifact_path(digest, content_type)
+        path = self._full_path(location)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so a reader never sees half a file
+            handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.incoming-')
+            try:
+                with os.fdopen(handle, 'wb') as output:
+                    output.write(data)
+                os.replace(temporary, path)
+            except BaseException:
+                if os.path.exists(temporary):
+                    os.unlink(temporary)
+                raise
+        return {'location': location}
+
+    def open(self, artifact):
+        return open(self._full_path(artifact.location), 'rb')
+
+    def url(self, artifact):
+        return None
+
+
+class StorageArtifactBackend:
+    name = 'storage'
+
+    @property
+    def storage(self):
+        from django.core.files.storage import default_storage
+
+        return default_storage
+
+    def save(self, digest, data, content_type):
+        location = artifact_path(digest, content_type)
+        if not self.storage.exists(location):
+            # Some storages rename on save; keep whatever key they report
+            location = self.storage.save(location, ContentFile(data))
+        return {'location': location}
+
+    def open(self, artifact):
+        return self.storage.open(artifact.location, 'rb')
+
+    def url(self, artifact):
+        return self.storage.url(artifact.location)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (DatabaseArtifactBackend(), FileSystemArtifactBackend(), StorageArtifactBackend())
+}
+
+
+def get_artifact_backend(name=None):
+    name = name or settings.RECEIPT_ARTIFACT_BACKEND
+    if name not in BACKENDS:
+        raise ImproperlyConfigured(f"RECEIPT_ARTIFACT_BACKEND must be one of {', '.join(BACKENDS)}, not {name!r}")
+    return BACKENDS[name]
+
+
+def store_artifact(data, content_type='application/pdf', backend=None):
+    """
+    The artifact holding data, storing the bytes only if no artifact has them yet
+    Concurrent stores of the same body converge on one row.
+    """
+    from .models import ReceiptArtifact
+
+    digest = hashlib.sha256(data).hexdigest()
+    existing = ReceiptArtifact.objects.filter(sha256=digest).first()
+    if existing is not None:
+        return existing
+
+    store = get_artifact_backend(backend)
+    fields = store.save(digest, data, content_type)
+    artifact, _ = ReceiptArtifact.objects.get_or_create(
+        sha256=digest,
+        defaults={'content_type': content_type, 'size': len(data), 'backend': store.name, **fields},
+    )
+    return artifact
+
+
+def open_artifact(artifact):
+    """Binary file object over the artifact's body."""
+    return get_artifact_backend(artifact.backend).open(artifact)
+
+
+def read_artifact(artifact):
+    with open_artifact(artifact) as body:
+        return body.read()
+
+
+def artifact_url(artifact):
+    """Public URL of the body, for backends that serve one."""
+    return get_artifact_backend(artifact.backend).url(artifact)
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from decimal import Decimal, InvalidOperation
 from .models import Sale, SaleItem, Receipt, PrintJob, PrintDevice, Printer, Refund, RefundItem
 from .models import ReceiptTemplate
+from .receipt_store import artifact_url
 from apps.products.serializers import ProductSerializer
 from apps.tenants.permissions import resolve_tenant_from_request
 
@@ -435,6 +436,8 @@ class ReceiptSerializer(serializers.ModelSerializer):
         return obj.generated_by.email if obj.generated_by else None
     
     def get_pdf_url(self, obj):
+        if obj.artifact_id:
+            return artifact_url(obj.artifact)
         if obj.pdf_file:
             request = self.context.get('request')
             if request:
@@ -488,7 +491,7 @@ class RefundItemSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'original_item', 'product', 'product_name',
             'quantity', 'quantity_in_base_units',
-            'price', 'cost', 'total',
+            'price', 'cost', 'realized_cost_total', 'total',
         )
         read_only_fields = fields
 
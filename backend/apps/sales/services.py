@@ -5,22 +5,19 @@ Supports: PDF (for download/view) and ESC/POS (for thermal printing)
 """
 import logging
 import hashlib
+from django.db import transaction
 from django.template import engines, TemplateSyntaxError
-from django.core.files.base import ContentFile
 import json
 from django.utils import timezone
 from decimal import Decimal
-from typing import List, Optional
-import re
+from typing import Optional
 from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.platypus import SimpleDocTemplate, Table, Spacer
 import base64
-from .models import Sale, Receipt
+from .models import Sale, Receipt, ReceiptArtifact
+from .receipt_escpos import get_escpos_profile
+from .receipt_layouts import get_receipt_layout
+from .receipt_store import read_artifact, store_artifact
 from apps.tenants.models import Tenant
 from apps.accounts.models import User
 
@@ -94,6 +91,69 @@ class ReceiptService:
 
         return ReceiptService._base64_decode(raw_content)
     
+    @staticmethod
+    def _store_pdf(pdf_bytes: bytes, receipt_id) -> ReceiptArtifact:
+        try:
+            return store_artifact(pdf_bytes, content_type='application/pdf')
+        except Exception as storage_error:
+            if not ReceiptService._is_storage_config_error(storage_error):
+                raise
+            logger.warning(
+                "Receipt PDF upload failed for receipt %s due to storage config. Falling back to the database.",
+                receipt_id,
+            )
+            return store_artifact(pdf_bytes, content_type='application/pdf', backend='database')
+
+    @staticmethod
+    def render_pdf_receipt(receipt: Receipt) -> Optional[ReceiptArtifact]:
+        """
+        The stored PDF of a receipt, rendering it from its snapshot on first access
+        Concurrent first requests queue on the receipt's row lock and find the
+        artifact the first one stored, so a stampede renders once. Returns None
+        for receipts without a snapshot (other formats, or PDFs from before
+        snapshots, which keep their pdf_file or content).
+        """
+        if receipt.artifact_id:
+            return receipt.artifact
+        if receipt.format != 'pdf':
+            return None
+
+        with transaction.atomic():
+            locked = Receipt.objects.select_for_update().only('id', 'artifact', 'snapshot').get(pk=receipt.pk)
+            if locked.artifact_id is None and locked.snapshot:
+                pdf_buffer = ReceiptService._render_pdf_snapshot(locked.snapshot)
+                artifact = ReceiptService._store_pdf(pdf_buffer.getvalue(), receipt.pk)
+                pdf_buffer.close()
+                # The artifact is the one field a receipt may gain after creation
+                Receipt.objects.filter(pk=receipt.pk, artifact__isnull=True).update(artifact=artifact)
+                locked.artifact_id = artifact.id
+                logger.info(f"Receipt {receipt.id} rendered on first access -> artifact {artifact.sha256[:12]}")
+
+        if locked.artifact_id is None:
+            return None
+        receipt.artifact = ReceiptArtifact.objects.get(pk=locked.artifact_id)
+        return receipt.artifact
+
+    @staticmethod
+    def read_pdf_receipt(receipt: Receipt) -> Optional[bytes]:
+        """
+        PDF bytes of a receipt, wherever they are kept
+        Receipts from before the artifact store hold them in pdf_file or as
+        base64 in content until backfill_receipts --artifacts moves them.
+        """
+        artifact = ReceiptService.render_pdf_receipt(receipt)
+        if artifact is not None:
+            return read_artifact(artifact)
+        if receipt.pdf_file:
+            try:
+                with receipt.pdf_file.open('rb') as pdf_file:
+                    return pdf_file.read()
+            except Exception as storage_error:
+                logger.warning(f"Failed to open receipt {receipt.id} PDF file from storage: {storage_error}")
+        if receipt.content:
+            return ReceiptService.decode_pdf_content(receipt.content)
+        return None
+
     @staticmethod
     def generate_receipt(sale: Sale, format: str = 'pdf', user: User = None) -> Receipt:
         """
@@ -119,63 +179,34 @@ class ReceiptService:
                 user = sale.user
 
             content = None
-            pdf_file = None
-            pdf_bytes = None
+            snapshot = None
 
             # Generate receipt content based on format
-            if format == 'pdf':
-                # Generate PDF and store as file
-                pdf_buffer = ReceiptService._generate_pdf_receipt(sale)
-                pdf_bytes = pdf_buffer.read()
-                pdf_file = ContentFile(pdf_bytes, name=f"receipt_{sale.receipt_number}.pdf")
-                pdf_buffer.close()
-            elif format == 'escpos':
+            if format == 'escpos':
                 # Return base64-encoded ESC/POS bytes as text payload
                 content = ReceiptService._generate_escpos_receipt(sale)
             else:
-                # Default to PDF
-                pdf_buffer = ReceiptService._generate_pdf_receipt(sale)
-                pdf_bytes = pdf_buffer.read()
-                pdf_file = ContentFile(pdf_bytes, name=f"receipt_{sale.receipt_number}.pdf")
-                pdf_buffer.close()
+                # PDF (the default): only the snapshot is kept now; the PDF is
+                # rendered on first download (see render_pdf_receipt)
                 format = 'pdf'
-            
+                snapshot = ReceiptService._build_receipt_snapshot(sale)
+
             # Create a new Receipt record (immutable once created)
             # Mark any existing current receipts for this sale+format as not current and voided
             previous = Receipt.objects.filter(sale=sale, format=format, is_current=True, voided=False)
             if previous.exists():
                 previous.update(is_current=False, voided=True)
 
-            create_kwargs = dict(
+            receipt = Receipt.objects.create(
                 tenant=sale.tenant,
                 sale=sale,
                 receipt_number=sale.receipt_number,
                 format=format,
                 content=content or '',
-                pdf_file=pdf_file,
+                snapshot=snapshot,
                 generated_by=user,
             )
 
-            try:
-                receipt = Receipt.objects.create(**create_kwargs)
-            except Exception as storage_error:
-                if format == 'pdf' and pdf_bytes and ReceiptService._is_storage_config_error(storage_error):
-                    logger.warning(
-                        "Receipt PDF upload failed for sale %s due to storage config. Falling back to inline PDF content.",
-                        sale.id,
-                    )
-                    create_kwargs['pdf_file'] = None
-                    create_kwargs['content'] = ReceiptService._encode_pdf_content(pdf_bytes)
-                    receipt = Receipt.objects.create(**create_kwargs)
-                else:
-                    raise
-            
-            # For PDF receipts, also store encoded bytes in content field as fallback
-            # in case file storage becomes inaccessible later (e.g., Cloudinary 401)
-            if format == 'pdf' and pdf_bytes and not receipt.content:
-                receipt.content = ReceiptService._encode_pdf_content(pdf_bytes)
-                receipt.save(update_fields=['content'])
-
             logger.info(f"Receipt generated for sale {sale.id}: {receipt.id} format={format} by user={getattr(user, 'id', None)}")
             return receipt
 
@@ -185,70 +216,41 @@ class ReceiptService:
             raise
     
     @staticmethod
-    def _generate_pdf_receipt(sale: Sale) -> BytesIO:
-        """Generate PDF receipt using ReportLab"""
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer, 
-            pagesize=A4, 
-            rightMargin=20*mm, 
-            leftMargin=20*mm, 
-            topMargin=20*mm, 
-            bottomMargin=20*mm
-        )
-        
-        # Container for PDF elements
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Get business/outlet information
-        business_name = sale.tenant.name if sale.tenant else "Business"
+    def _build_receipt_snapshot(sale: Sale) -> dict:
+        """
+        Everything a receipt shows, captured from the sale
+        Persisted on the Receipt at sale time, so a PDF rendered later (or
+        again) shows the sale, outlet and customer as they were then.
+        Amounts are kept as strings to survive JSON exactly.
+        """
         outlet = sale.outlet
-        outlet_name = outlet.name if outlet else ""
-        outlet_address = outlet.address if outlet and outlet.address else ""
-        outlet_phone = outlet.phone if outlet and outlet.phone else ""
-        outlet_email = outlet.email if outlet and outlet.email else ""
-        
-        # Get currency
-        currency = sale.tenant.currency if sale.tenant and sale.tenant.currency else "MWK"
-        
-        # Title Style
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#1e3a8a'),
-            alignment=TA_CENTER,
-            spaceAfter=12,
-        )
-        
-        elements.append(Paragraph(business_name.upper(), title_style))
-        
-        if outlet_name:
-            elements.append(Paragraph(outlet_name, ParagraphStyle(
-                'outlet', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER
-            )))
-        if outlet_address:
-            elements.append(Paragraph(outlet_address, ParagraphStyle(
-                'address', parent=styles['Normal'], fontSize=9, alignment=TA_CENTER
-            )))
-        if outlet_phone:
-            elements.append(Paragraph(f"Tel: {outlet_phone}", ParagraphStyle(
-                'phone', parent=styles['Normal'], fontSize=9, alignment=TA_CENTER
-            )))
-        if outlet_email:
-            elements.append(Paragraph(f"Email: {outlet_email}", ParagraphStyle(
-                'email', parent=styles['Normal'], fontSize=9, alignment=TA_CENTER
-            )))
-        
-        elements.append(Spacer(1, 12))
-        
-        # Receipt Info
-        info_data = [
-            ['Receipt #:', sale.receipt_number],
-            ['Date:', sale.created_at.strftime('%Y-%m-%d %H:%M:%S')],
-        ]
-        
+        snapshot = {
+            'version': 1,
+            'tenant_id': getattr(sale, 'tenant_id', None),
+            'business_name': sale.tenant.name if sale.tenant else "Business",
+            'currency': sale.tenant.currency if sale.tenant and sale.tenant.currency else "MWK",
+            'outlet': {
+                'id': getattr(outlet, 'id', None),
+                'name': outlet.name if outlet else "",
+                'address': outlet.address if outlet and outlet.address else "",
+                'phone': outlet.phone if outlet and outlet.phone else "",
+                'email': outlet.email if outlet and outlet.email else "",
+            },
+            'receipt_number': sale.receipt_number,
+            'created_at': sale.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'cashier': '',
+            'customer': None,
+            'items': [],
+            'subtotal': str(sale.subtotal),
+            'tax': str(sale.tax or 0),
+            'discount': str(sale.discount or 0),
+            'total': str(sale.total),
+            'payment_method': sale.get_payment_method_display(),
+            'cash_received': str(sale.cash_received) if sale.cash_received else None,
+            'change_given': str(sale.change_given) if sale.change_given else None,
+            'payment_lines': [],
+        }
+
         # Add cashier info - ensure it's always shown if user exists
         if sale.user:
             # Try to get full name, fall back to first_name + last_name, then email, then username
@@ -270,51 +272,15 @@ class ReceiptService:
             if not cashier_name and hasattr(sale.user, 'username') and sale.user.username:
                 cashier_name = sale.user.username
             
-            if cashier_name:
-                info_data.append(['Cashier:', cashier_name])
-        
-        info_table = Table(info_data, colWidths=[40*mm, 120*mm])
-        info_table.setStyle(TableStyle([
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.grey),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ]))
-        elements.append(info_table)
-        elements.append(Spacer(1, 12))
-        
-        # Customer info (show Walk-in if no customer)
-        elements.append(Paragraph('CUSTOMER', ParagraphStyle(
-            'customer_header', parent=styles['Heading2'], fontSize=12, textColor=colors.HexColor('#1e3a8a')
-        )))
+            snapshot['cashier'] = cashier_name or ''
 
-        customer_data = []
         if sale.customer:
-            customer_data.append(['Name:', sale.customer.name or 'Walk-in'])
-            if sale.customer.phone:
-                customer_data.append(['Phone:', sale.customer.phone])
-            if sale.customer.email:
-                customer_data.append(['Email:', sale.customer.email])
-        else:
-            customer_data.append(['Name:', 'Walk-in'])
-
-        customer_table = Table(customer_data, colWidths=[40*mm, 120*mm])
-        customer_table.setStyle(TableStyle([
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.grey),
-            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f3f4f6')),
-            ('PADDING', (0, 0), (-1, -1), 6),
-        ]))
-        elements.append(customer_table)
-        elements.append(Spacer(1, 12))
-        
-        # Items
-        elements.append(Paragraph('ITEMS', ParagraphStyle(
-            'items_header', parent=styles['Heading2'], fontSize=12, textColor=colors.HexColor('#1e3a8a')
-        )))
-        
-        items_data = [['Item', 'Qty', 'Price', 'Total']]
-        
+            snapshot['customer'] = {
+                'name': sale.customer.name or 'Walk-in',
+                'phone': sale.customer.phone or '',
+                'email': sale.customer.email or '',
+            }
+
         for item in sale.items.all():
             base_name = item.product_name or (item.product.name if item.product else "Item")
             item_name = base_name
@@ -324,132 +290,151 @@ class ReceiptService:
             safe_qty = item.quantity or 0
             safe_price = item.price or Decimal('0')
             safe_total = item.total or (safe_price * Decimal(safe_qty))
+            snapshot['items'].append({
+                'name': item_name, 'quantity': safe_qty, 'price': str(safe_price), 'total': str(safe_total),
+            })
 
-            items_data.append([
-                item_name,
-                str(safe_qty),
-                f"{currency} {safe_price:,.2f}",
-                f"{currency} {safe_total:,.2f}"
-            ])
+        # Payment breakdown (if multiple payment lines were used)
+        try:
+            raw_lines = getattr(sale, 'payment_lines', None)
+            if raw_lines and isinstance(raw_lines, (list, tuple)):
+                for pl in raw_lines:
+                    pm = pl.get('payment_method') if isinstance(pl, dict) else None
+                    other = pl.get('other_payment_method_name') if isinstance(pl, dict) else None
+                    amt = pl.get('amount') if isinstance(pl, dict) else None
+                    method_label = pm or other or 'Unknown'
+                    try:
+                        amt_num = Decimal(str(amt)) if amt is not None else Decimal('0')
+                    except Exception:
+                        amt_num = Decimal('0')
+                    snapshot['payment_lines'].append({'method': str(method_label), 'amount': str(amt_num)})
+        except Exception:
+            # Non-critical: continue rendering even if payment_lines parsing fails
+            snapshot['payment_lines'] = []
+
+        return snapshot
+
+    @staticmethod
+    def _generate_pdf_receipt(sale: Sale) -> BytesIO:
+        """Generate PDF receipt for the sale as it is now"""
+        return ReceiptService._render_pdf_snapshot(ReceiptService._build_receipt_snapshot(sale))
+
+    @staticmethod
+    def _render_pdf_snapshot(snapshot: dict) -> BytesIO:
+        """
+        Render a receipt snapshot to PDF using ReportLab
+        Styles, headings and the footer come precompiled from the shared
+        ReceiptLayout; this only fills in the snapshot's rows.
+        """
+        layout = get_receipt_layout()
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=layout.pagesize,
+            rightMargin=layout.margin,
+            leftMargin=layout.margin,
+            topMargin=layout.margin,
+            bottomMargin=layout.margin,
+            # No timestamps or random document id, so a re-render of an unchanged
+            # sale is byte-identical and shares its stored artifact
+            invariant=True,
+        )
+
+        # Container for PDF elements
+        elements = layout.header(snapshot)
+        currency = snapshot['currency']
+
+        def money(value):
+            return f"{currency} {Decimal(value):,.2f}"
+
+        elements.append(Spacer(1, 12))
         
-        items_table = Table(items_data, colWidths=[80*mm, 25*mm, 30*mm, 35*mm])
-        items_table.setStyle(TableStyle([
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-            ('PADDING', (0, 0), (-1, -1), 6),
-        ]))
+        # Receipt Info
+        info_data = [
+            ['Receipt #:', snapshot['receipt_number']],
+            ['Date:', snapshot['created_at']],
+        ]
+        if snapshot['cashier']:
+            info_data.append(['Cashier:', snapshot['cashier']])
+        
+        info_table = Table(info_data, colWidths=layout.info_widths)
+        info_table.setStyle(layout.info_style)
+        elements.append(info_table)
+        elements.append(Spacer(1, 12))
+        
+        # Customer info (show Walk-in if no customer)
+        elements.append(layout.flowable(layout.customer_heading))
+
+        customer = snapshot['customer']
+        customer_data = [['Name:', customer['name'] if customer else 'Walk-in']]
+        if customer and customer['phone']:
+            customer_data.append(['Phone:', customer['phone']])
+        if customer and customer['email']:
+            customer_data.append(['Email:', customer['email']])
+
+        customer_table = Table(customer_data, colWidths=layout.info_widths)
+        customer_table.setStyle(layout.customer_style)
+        elements.append(customer_table)
+        elements.append(Spacer(1, 12))
+        
+        # Items
+        elements.append(layout.flowable(layout.items_heading))
+        
+        items_data = [['Item', 'Qty', 'Price', 'Total']]
+        for item in snapshot['items']:
+            items_data.append([item['name'], str(item['quantity']), money(item['price']), money(item['total'])])
+        
+        items_table = Table(items_data, colWidths=layout.items_widths)
+        items_table.setStyle(layout.items_style)
         elements.append(items_table)
         elements.append(Spacer(1, 12))
         
         # Totals
         totals_data = [
-            ['Subtotal:', f"{currency} {sale.subtotal:,.2f}"],
+            ['Subtotal:', money(snapshot['subtotal'])],
         ]
         total_row_index = 1
         
-        if sale.tax and sale.tax > 0:
-            totals_data.append(['Total VAT:', f"{currency} {sale.tax:,.2f}"])
+        if Decimal(snapshot['tax']) > 0:
+            totals_data.append(['Total VAT:', money(snapshot['tax'])])
             total_row_index += 1
         
-        if sale.discount and sale.discount > 0:
-            totals_data.append(['Discount:', f"-{currency} {sale.discount:,.2f}"])
+        if Decimal(snapshot['discount']) > 0:
+            totals_data.append(['Discount:', f"-{money(snapshot['discount'])}"])
             total_row_index += 1
         
-        totals_data.append(['TOTAL:', f"{currency} {sale.total:,.2f}"])
+        totals_data.append(['TOTAL:', money(snapshot['total'])])
         total_row_index += 1
-        totals_data.append(['Payment Method:', sale.get_payment_method_display()])
+        totals_data.append(['Payment Method:', snapshot['payment_method']])
         
-        if sale.cash_received:
-            totals_data.append(['Cash Received:', f"{currency} {sale.cash_received:,.2f}"])
+        if snapshot['cash_received']:
+            totals_data.append(['Cash Received:', money(snapshot['cash_received'])])
         
-        if sale.change_given and sale.change_given > 0:
-            totals_data.append(['Change:', f"{currency} {sale.change_given:,.2f}"])
+        if snapshot['change_given'] and Decimal(snapshot['change_given']) > 0:
+            totals_data.append(['Change:', money(snapshot['change_given'])])
         
-        totals_table = Table(totals_data, colWidths=[80*mm, 80*mm])
-        totals_table.setStyle(TableStyle([
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('FONTSIZE', (0, total_row_index), (-1, total_row_index), 12),
-            ('FONTNAME', (0, total_row_index), (-1, total_row_index), 'Helvetica-Bold'),
-            ('TEXTCOLOR', (0, total_row_index), (-1, total_row_index), colors.HexColor('#1e3a8a')),
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('LINEABOVE', (0, total_row_index), (-1, total_row_index), 1, colors.HexColor('#1e3a8a')),
-            ('PADDING', (0, 0), (-1, -1), 4),
-        ]))
+        totals_table = Table(totals_data, colWidths=layout.totals_widths)
+        totals_table.setStyle(layout.totals_style)
+        totals_table.setStyle(layout.total_row_style(total_row_index))
         elements.append(totals_table)
         elements.append(Spacer(1, 20))
 
         # Payment breakdown (if multiple payment lines were used)
-        try:
-            raw_lines = getattr(sale, 'payment_lines', None)
-            if raw_lines and isinstance(raw_lines, (list, tuple)) and len(raw_lines) > 0:
-                elements.append(Paragraph('Payment Breakdown', ParagraphStyle(
-                    'payment_header', parent=styles['Heading3'], fontSize=12, textColor=colors.HexColor('#1e3a8a')
-                )))
-                pay_rows = []
-                for pl in raw_lines:
-                    pm = pl.get('payment_method') if isinstance(pl, dict) else None
-                    other = pl.get('other_payment_method_name') if isinstance(pl, dict) else None
-                    amt = pl.get('amount') if isinstance(pl, dict) else None
-                    method_label = pm or other or 'Unknown'
-                    try:
-                        amt_num = Decimal(str(amt)) if amt is not None else Decimal('0')
-                    except Exception:
-                        amt_num = Decimal('0')
-                    pay_rows.append([str(method_label), f"{currency} {amt_num:,.2f}"])
-
-                pay_table = Table(pay_rows, colWidths=[80*mm, 80*mm])
-                pay_table.setStyle(TableStyle([
-                    ('FONTSIZE', (0, 0), (-1, -1), 9),
-                    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-                    ('PADDING', (0, 0), (-1, -1), 4),
-                ]))
-                elements.append(pay_table)
-                elements.append(Spacer(1, 12))
-        except Exception:
-            # Non-critical: continue rendering even if payment_lines parsing fails
-            pass
-
-        dotted_line = Table([['']], colWidths=[160*mm])
-        dotted_line.setStyle(TableStyle([
-            ('LINEABOVE', (0, 0), (-1, -1), 0.5, colors.grey, 1),
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-            ('TOPPADDING', (0, 0), (-1, -1), 2),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
+        if snapshot['payment_lines']:
+            elements.append(layout.flowable(layout.payments_heading))
+            pay_rows = [[line['method'], money(line['amount'])] for line in snapshot['payment_lines']]
+            pay_table = Table(pay_rows, colWidths=layout.totals_widths)
+            pay_table.setStyle(layout.payments_style)
+            elements.append(pay_table)
+            elements.append(Spacer(1, 12))
+
+        dotted_line = Table([['']], colWidths=layout.rule_widths)
+        dotted_line.setStyle(layout.rule_style)
         elements.append(dotted_line)
         elements.append(Spacer(1, 8))
         
         # Footer
-        footer_header = ParagraphStyle(
-            'footer_header',
-            parent=styles['Heading3'],
-            fontSize=10,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#1e3a8a'),
-        )
-        footer_style = ParagraphStyle(
-            'footer',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#4b5563'),
-            fontName='Helvetica-Bold',
-            leading=12,
-            spaceAfter=2,
-        )
-        elements.append(Paragraph('Footer', footer_header))
-        elements.append(Paragraph('Thank you for your business!', footer_style))
-        elements.append(Paragraph('Powered by PRIMEPOS +265 997575865', footer_style))
+        elements.extend(layout.flowable(paragraph) for paragraph in layout.footer)
         
         # Build PDF
         doc.build(elements)
@@ -462,162 +447,14 @@ class ReceiptService:
 
         The backend does NOT send this to any printer. The frontend should request a receipt
         with format='escpos', decode the base64 payload and forward the bytes to QZ Tray.
+        The printer profile (paper width, code page, logo, footer) is compiled once and
+        reused, see receipt_escpos.
         """
-        def b(text: str = ""):
-            return (text + "\n").encode('utf-8')
-
-        def normalize_width(value) -> str:
-            if value is None:
-                return ''
-            raw = str(value).strip().lower()
-            if raw in ('80', '80mm'):
-                return '80'
-            if raw in ('58', '58mm'):
-                return '58'
-            return ''
-
-        def detect_width_from_text(text: str) -> str:
-            if not text:
-                return ''
-            lowered = text.lower()
-            if any(token in lowered for token in ('80mm', '80 mm', '3inch', '3 inch', '3"')):
-                return '80'
-            if any(token in lowered for token in ('58mm', '58 mm', '2.25inch', '2.28 inch')):
-                return '58'
-            if re.search(r'(^|\D)80(\D|$)', lowered):
-                return '80'
-            if re.search(r'(^|\D)58(\D|$)', lowered):
-                return '58'
-            return ''
-
-        def resolve_paper_width() -> str:
-            explicit = normalize_width(paper_width)
-            if explicit:
-                return explicit
-
-            from_printer_name = detect_width_from_text(printer_name)
-            if from_printer_name:
-                return from_printer_name
-
-            outlet_settings = sale.outlet.settings if sale.outlet and isinstance(sale.outlet.settings, dict) else {}
-            candidates = [
-                outlet_settings.get('paper_width'),
-                outlet_settings.get('printer_paper_width'),
-                outlet_settings.get('receipt_paper_width'),
-                (outlet_settings.get('receipt') or {}).get('paper_width') if isinstance(outlet_settings.get('receipt'), dict) else None,
-                (outlet_settings.get('receipts') or {}).get('paper_width') if isinstance(outlet_settings.get('receipts'), dict) else None,
-                (outlet_settings.get('printing') or {}).get('paper_width') if isinstance(outlet_settings.get('printing'), dict) else None,
-            ]
-
-            for value in candidates:
-                normalized = normalize_width(value)
-                if normalized:
-                    return normalized
-
-            # Safe fallback: always use 80mm.
-            return '80'
-
-        # Determine effective paper width and character columns
-        resolved = resolve_paper_width()
-        # Map logical paper width to character columns used for wrapping
-        if resolved == '58':
-            width = 32
-            # For 58mm, typical printable dots ~ 464 (203dpi * 58mm ≈ 464)
-            gs_w_command = b"\x1dW\xd0\x01"
-        else:
-            # default to 80mm
-            width = 48
-            # For 80mm, printable dots ~ 640 (203dpi * 80mm = 640)
-            gs_w_command = b"\x1dW\x80\x02"
-
-        def wrap_text(text: str, max_width: int) -> List[str]:
-            text = (text or '').strip()
-            if not text:
-                return ['']
-            if len(text) <= max_width:
-                return [text]
-
-            words = text.split()
-            if not words:
-                return [text[:max_width]]
-
-            lines: List[str] = []
-            current = ''
-            for word in words:
-                if len(word) > max_width:
-                    if current:
-                        lines.append(current)
-                        current = ''
-                    start = 0
-                    while start < len(word):
-                        lines.append(word[start:start + max_width])
-                        start += max_width
-                    continue
-
-                candidate = f"{current} {word}".strip()
-                if len(candidate) <= max_width:
-                    current = candidate
-                else:
-                    lines.append(current)
-                    current = word
-
-            if current:
-                lines.append(current)
-            return lines or ['']
-
-        def align_lr(left: str, right: str, max_width: int) -> List[str]:
-            left = (left or '').strip()
-            right = (right or '').strip()
-            if not right:
-                return wrap_text(left, max_width)
-
-            min_gap = 1
-            if len(left) + min_gap + len(right) <= max_width:
-                return [left + (' ' * (max_width - len(left) - len(right))) + right]
-
-            wrapped_left = wrap_text(left, max(1, max_width - len(right) - min_gap))
-            if not wrapped_left:
-                wrapped_left = ['']
-
-            lines = wrapped_left[:-1]
-            last_left = wrapped_left[-1]
-            if len(last_left) + min_gap + len(right) <= max_width:
-                lines.append(last_left + (' ' * (max_width - len(last_left) - len(right))) + right)
-            else:
-                lines.append(last_left)
-                lines.append((' ' * max(0, max_width - len(right))) + right)
-            return lines
-
-        # ESC/POS init
-        payload = bytearray()
-        payload.extend(b"\x1b@")  # initialize
-        try:
-            payload.extend(gs_w_command)  # GS W: set print area width to printer-specific dots
-        except Exception:
-            # Fallback: do nothing if command fails
-            pass
-        
+        profile = get_escpos_profile(sale.outlet, sale.tenant, paper_width, printer_name)
         currency = sale.tenant.currency if sale.tenant and sale.tenant.currency else "MWK"
-        for line in ReceiptService._build_escpos_receipt_lines(
-            sale=sale,
-            width=width,
-            currency=currency,
-            wrap_text=wrap_text,
-            align_lr=align_lr,
-        ):
-            payload.extend(b(line))
-
-        # Paper cut - add spacing and use full cut command for better compatibility
-        try:
-            payload.extend(b("\n"))  # Extra newline for cut positioning
-            payload.extend(b("\n"))  # Extra newline for cut positioning
-            payload.extend(b("\x1dV\x01"))  # ESC/POS full cut command
-        except Exception as e:
-            logger.warning(f"Failed to add cut command: {e}")
-            pass
-
+        payload = profile.render(sale, currency, ReceiptService._resolve_cashier_name(sale.user))
         # Return base64-encoded bytes so they can safely be stored/transferred as text
-        return base64.b64encode(bytes(payload)).decode('ascii')
+        return base64.b64encode(payload).decode('ascii')
 
     @staticmethod
     def _resolve_cashier_name(user) -> str:
@@ -643,94 +480,6 @@ class ReceiptService:
 
         return ""
 
-    @staticmethod
-    def _escpos_bold(text: str) -> str:
-        return "\x1bE\x01" + text + "\x1bE\x00"
-
-    @staticmethod
-    def _build_escpos_receipt_lines(sale: Sale, width: int, currency: str, wrap_text, align_lr) -> List[str]:
-        lines: List[str] = []
-
-        business = sale.tenant.name if sale.tenant else "Business"
-        outlet = sale.outlet.name if sale.outlet else ""
-
-        lines.extend([line.center(width) for line in wrap_text(business.upper(), width)])
-        if outlet:
-            lines.extend([line.center(width) for line in wrap_text(outlet, width)])
-
-        outlet_address = sale.outlet.address if sale.outlet and sale.outlet.address else ""
-        outlet_phone = sale.outlet.phone if sale.outlet and sale.outlet.phone else ""
-        outlet_email = sale.outlet.email if sale.outlet and sale.outlet.email else ""
-        if outlet_address:
-            lines.extend([line.center(width) for line in wrap_text(outlet_address, width)])
-        if outlet_phone:
-            lines.extend([line.center(width) for line in wrap_text(f"Tel: {outlet_phone}", width)])
-        if outlet_email:
-            lines.extend([line.center(width) for line in wrap_text(f"Email: {outlet_email}", width)])
-
-        lines.extend(align_lr("Receipt #:", str(sale.receipt_number), width))
-        lines.extend(align_lr("Date:", sale.created_at.strftime('%Y-%m-%d %H:%M:%S'), width))
-
-        cashier_name = ReceiptService._resolve_cashier_name(sale.user)
-        if cashier_name:
-            lines.extend(align_lr("Cashier:", cashier_name, width))
-
-        if sale.customer:
-            lines.extend(align_lr("Customer:", sale.customer.name or 'Walk-in', width))
-            if sale.customer.phone:
-                lines.extend(align_lr("Phone:", sale.customer.phone, width))
-            if sale.customer.email:
-                lines.extend(align_lr("Email:", sale.customer.email, width))
-        else:
-            lines.extend(align_lr("Customer:", "Walk-in", width))
-
-        lines.append("-" * width)
-        for item in sale.items.all():
-            name = item.product_name or (item.product.name if item.product else "Item")
-            qty = item.quantity or 0
-            total = item.total or (item.price or Decimal('0')) * Decimal(qty)
-            right = f"{currency} {total:,.2f}"
-            left = f"{name} x{qty}"
-            lines.extend(align_lr(left, right, width))
-
-        lines.append("-" * width)
-        lines.extend(align_lr("Subtotal:", f"{currency} {sale.subtotal:,.2f}", width))
-        if sale.tax and sale.tax > 0:
-            for line in align_lr("Total VAT:", f"{currency} {sale.tax:,.2f}", width):
-                lines.append(ReceiptService._escpos_bold(line))
-        if sale.discount and sale.discount > 0:
-            lines.extend(align_lr("Discount:", f"-{currency} {sale.discount:,.2f}", width))
-        for line in align_lr("Total:", f"{currency} {sale.total:,.2f}", width):
-            lines.append(ReceiptService._escpos_bold(line))
-        lines.extend(align_lr("Payment:", sale.get_payment_method_display(), width))
-
-        # If payment_lines present, include a breakdown section
-        try:
-            raw_lines = getattr(sale, 'payment_lines', None)
-            if raw_lines and isinstance(raw_lines, (list, tuple)) and len(raw_lines) > 0:
-                lines.append("-")
-                lines.extend(wrap_text("Payment Breakdown:", width))
-                for pl in raw_lines:
-                    pm = pl.get('payment_method') if isinstance(pl, dict) else None
-                    other = pl.get('other_payment_method_name') if isinstance(pl, dict) else None
-                    amt = pl.get('amount') if isinstance(pl, dict) else None
-                    method_label = pm or other or 'Unknown'
-                    try:
-                        amt_num = Decimal(str(amt)) if amt is not None else Decimal('0')
-                    except Exception:
-                        amt_num = Decimal('0')
-                    # Format as left-right aligned line
-                    lines.extend(align_lr(str(method_label), f"{currency} {amt_num:,.2f}", width))
-        except Exception:
-            # Non-critical
-            pass
-
-        lines.append("")
-        lines.extend(wrap_text("Thank you for your business!", width))
-        lines.extend(wrap_text("Powered by PRIMEPOS 0997575865", width))
-
-        return lines
-    
     @staticmethod
     def get_receipt_by_number(receipt_number: str) -> Receipt:
         """Retrieve the most recent non-voided receipt matching `receipt_number`"""
@@ -774,56 +523,27 @@ class ReceiptService:
                 user = old.generated_by
 
             content = None
-            pdf_file = None
-            pdf_bytes = None
+            snapshot = None
 
             # Generate new content according to requested format
-            if format == 'pdf':
-                pdf_buffer = ReceiptService._generate_pdf_receipt(sale)
-                pdf_bytes = pdf_buffer.read()
-                pdf_file = ContentFile(pdf_bytes, name=f"receipt_{sale.receipt_number}.pdf")
-                pdf_buffer.close()
-            elif format == 'escpos':
+            if format == 'escpos':
                 content = ReceiptService._generate_escpos_receipt(sale)
             else:
-                # Default to PDF
-                pdf_buffer = ReceiptService._generate_pdf_receipt(sale)
-                pdf_bytes = pdf_buffer.read()
-                pdf_file = ContentFile(pdf_bytes, name=f"receipt_{sale.receipt_number}.pdf")
-                pdf_buffer.close()
+                # Default to PDF, rendered from the new snapshot when first downloaded
                 format = 'pdf'
+                snapshot = ReceiptService._build_receipt_snapshot(sale)
 
-            create_kwargs = dict(
+            new_receipt = Receipt.objects.create(
                 tenant=old.tenant,
                 sale=sale,
                 receipt_number=sale.receipt_number,
                 format=format,
                 content=content or '',
-                pdf_file=pdf_file,
+                snapshot=snapshot,
                 generated_by=user,
                 superseded_by=None,
             )
 
-            try:
-                new_receipt = Receipt.objects.create(**create_kwargs)
-            except Exception as storage_error:
-                if format == 'pdf' and pdf_bytes and ReceiptService._is_storage_config_error(storage_error):
-                    logger.warning(
-                        "Receipt PDF upload failed during regeneration for sale %s. Falling back to inline PDF content.",
-                        sale.id,
-                    )
-                    create_kwargs['pdf_file'] = None
-                    create_kwargs['content'] = ReceiptService._encode_pdf_content(pdf_bytes)
-                    new_receipt = Receipt.objects.create(**create_kwargs)
-                else:
-                    raise
-            
-            # For PDF receipts, also store encoded bytes in content field as fallback
-            # in case file storage becomes inaccessible later
-            if format == 'pdf' and pdf_bytes and not new_receipt.content:
-                new_receipt.content = ReceiptService._encode_pdf_content(pdf_bytes)
-                new_receipt.save(update_fields=['content'])
-
             # Mark old as voided and not current only after new receipt exists
             old.voided = True
             old.is_current = False
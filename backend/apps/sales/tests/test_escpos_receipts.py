@@ -0,0 +1,225 @@
+"""
+Tests for the compiled ESC/POS receipt renderer
+The golden corpus in golden/escpos_receipts.json holds the payloads the
+per-print renderer produced for each case below; the compiled renderer must
+reproduce them byte for byte.
+"""
+
+import base64
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from apps.sales.receipt_escpos import CUT, clear_escpos_profiles, get_escpos_profile
+from apps.sales.services import ReceiptService
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'golden', 'escpos_receipts.json')
+SOLD_AT = datetime(2026, 3, 14, 9, 26, 53)
+
+
+def _item(name, quantity, price, total=None, product=None):
+    return SimpleNamespace(
+        product_name=name, product=product, quantity=quantity, price=Decimal(price),
+        total=Decimal(total) if total is not None else None,
+    )
+
+
+def _user(first='', last='', username='', email=''):
+    return SimpleNamespace(
+        first_name=first, last_name=last, username=username, email=email,
+        get_full_name=lambda: f"{first} {last}".strip(),
+    )
+
+
+def _sale(items, tenant=None, outlet=None, user=None, customer=None, payment='Cash', payment_lines=None, **amounts):
+    subtotal = sum((item.total or item.price * item.quantity for item in items), Decimal('0'))
+    values = {'subtotal': subtotal, 'tax': Decimal('0'), 'discount': Decimal('0'), 'total': subtotal}
+    values.update({key: Decimal(value) for key, value in amounts.items()})
+    return SimpleNamespace(
+        receipt_number="R-000123",
+        created_at=SOLD_AT,
+        tenant=tenant or SimpleNamespace(name="Acme Store", currency="MWK"),
+        outlet=outlet,
+        user=user,
+        customer=customer,
+        get_payment_method_display=lambda: payment,
+        payment_lines=payment_lines or [],
+        items=SimpleNamespace(all=lambda: items),
+        **values,
+    )
+
+
+def _outlet(settings=None, name="Main Outlet", address="", phone="", email="", **fields):
+    return SimpleNamespace(name=name, address=address, phone=phone, email=email, settings=settings or {}, **fields)
+
+
+# name -> (sale, paper_width, printer_name)
+GOLDEN_CASES = {
+    'walk_in_default_width': lambda: (
+        _sale([_item("Chambo", 2, "3500.00", "7000.00")], outlet=_outlet()), 'auto', '',
+    ),
+    'outlet_setting_58mm_with_customer': lambda: (
+        _sale(
+            [_item("Nsima", 1, "1500.00", "1500.00"), _item("Beef stew", 2, "4250.50", "8501.00")],
+            outlet=_outlet({'receipt': {'paper_width': '58mm'}}, address="Area 47, Lilongwe", phone="+265 111"),
+            user=_user("Tadala", "Banda"),
+            customer=SimpleNamespace(name="Chikondi Phiri", phone="+265 999 123", email="chikondi@example.com"),
+            tax="1350.15", discount="500.00", total="10351.15",
+        ),
+        'auto', '',
+    ),
+    'printer_name_58mm_long_text': lambda: (
+        _sale(
+            [
+                _item("Extra large family size pizza with everything on it", 1, "32000.00", "32000.00"),
+                _item("Supercalifragilisticexpialidocious-smoothie-combo", 3, "2500.00", "7500.00"),
+            ],
+            tenant=SimpleNamespace(name="The Very Long Named Lakeside Restaurant And Bar", currency="ZAR"),
+            outlet=_outlet(
+                name="Mangochi Lakeshore Branch", address="Plot 12, M3 Road, Next to the old fuel station",
+                email="lakeshore@example.com",
+            ),
+            user=_user(username="cashier7"),
+        ),
+        'auto', 'EPSON TM-T20 58mm',
+    ),
+    'explicit_80_overrides_outlet_with_split_payment': lambda: (
+        _sale(
+            [_item("Café crème", 2, "1200.00", "2400.00"), _item("Ndiwo — ñame", 1, "800.00", "800.00")],
+            outlet=_outlet({'paper_width': '58'}, phone="+265 222"),
+            user=_user(email="till@example.com"),
+            payment='Split',
+            payment_lines=[
+                {'payment_method': 'cash', 'amount': '2000'},
+                {'other_payment_method_name': 'Airtel Money', 'amount': 1200.5},
+                {'amount': 'not a number'},
+                'junk',
+            ],
+        ),
+        '80', '',
+    ),
+    'printing_setting_58_with_fallback_totals': lambda: (
+        _sale(
+            [
+                _item("", 4, "250.00", product=SimpleNamespace(name="Mandasi")),
+                _item("", 1, "99999999.99", "99999999.99"),
+                _item("Fanta", 0, "800.00", "0"),
+            ],
+            tenant=SimpleNamespace(name="Kiosk", currency=""),
+            outlet=_outlet({'printing': {'paper_width': 58}}),
+        ),
+        'auto', '',
+    ),
+    'printer_name_80_without_outlet': lambda: (
+        _sale([_item("Airtime bundle with a very long description", 1, "123456789.00", "123456789.00")]),
+        'auto', 'Receipt printer 80',
+    ),
+    'amount_wider_than_58mm_paper': lambda: (
+        _sale(
+            [_item("Bulk order", 1, "123456789012345678901234.00", "123456789012345678901234.00")],
+            outlet=_outlet({'receipt_paper_width': '58mm'}),
+        ),
+        'auto', '',
+    ),
+}
+
+
+def _golden():
+    with open(GOLDEN_PATH) as handle:
+        return json.load(handle)
+
+
+def _payload(sale, paper_width='auto', printer_name=''):
+    return base64.b64decode(ReceiptService._generate_escpos_receipt(sale, paper_width, printer_name))
+
+
+class EscposGoldenTestCase(SimpleTestCase):
+    def setUp(self):
+        clear_escpos_profiles()
+
+    def test_payloads_match_the_golden_corpus(self):
+        golden = _golden()
+        self.assertEqual(sorted(golden), sorted(GOLDEN_CASES))
+        for cached in (True, False):
+            with override_settings(RECEIPT_LAYOUT_CACHE=cached):
+                # Twice, so cached runs also print from the compiled profile and headers
+                for _ in range(2):
+                    for name, case in GOLDEN_CASES.items():
+                        with self.subTest(name, cached=cached):
+                            self.assertEqual(_payload(*case()), base64.b64decode(golden[name]))
+
+
+class EscposProfileTestCase(SimpleTestCase):
+    def setUp(self):
+        clear_escpos_profiles()
+
+    def test_profile_is_compiled_once_per_printer_profile(self):
+        outlet = _outlet({'receipt': {'paper_width': '58'}}, id=7, updated_at=SOLD_AT)
+        profile = get_escpos_profile(outlet)
+
+        self.assertEqual((profile.key, profile.columns), (('58', 'utf-8', ''), 32))
+        self.assertIs(get_escpos_profile(outlet, printer_name="Front counter"), profile)
+        self.assertIsNot(get_escpos_profile(outlet, paper_width='80mm'), profile)
+        self.assertEqual(get_escpos_profile(outlet, printer_name="XP-80 thermal").columns, 48)
+
+        # Settings are kept per outlet version, so an edit is picked up when updated_at moves
+        outlet.settings = {'receipt': {'paper_width': '80'}}
+        self.assertIs(get_escpos_profile(outlet), profile)
+        outlet.updated_at = datetime(2026, 3, 15)
+        self.assertEqual(get_escpos_profile(outlet).columns, 48)
+
+    def test_code_page_selects_the_page_and_replaces_missing_characters(self):
+        outlet = _outlet({'printing': {'code_page': 'CP437'}})
+        payload = _payload(_sale([_item("Café ₩on", 1, "5.00", "5.00")], outlet=outlet))
+
+        self.assertTrue(payload.startswith(b"\x1b@\x1dW\x80\x02\x1bt\x00"))
+        self.assertIn(b"Caf\x82 ?on x1", payload)
+
+        outlet.settings = {'printing': {'code_page': 'ebcdic'}}
+        with self.assertLogs('apps.sales.receipt_escpos', 'WARNING'):
+            self.assertEqual(get_escpos_profile(outlet).encoding, 'utf-8')
+
+    def test_logo_is_rasterized_once_and_printed_centered(self):
+        image = BytesIO()
+        Image.new('RGB', (100, 10), 'black').save(image, format='PNG')
+        logo = SimpleNamespace(
+            name='tenants/logos/acme.png', open=mock.Mock(side_effect=lambda mode: BytesIO(image.getvalue()))
+        )
+        tenant = SimpleNamespace(name="Acme Store", currency="MWK", logo=logo)
+        outlet = _outlet({'receipt': {'print_logo': True}}, id=8, updated_at=SOLD_AT)
+
+        first = _payload(_sale([_item("Tea", 1, "1.00", "1.00")], tenant=tenant, outlet=outlet))
+        second = _payload(_sale([_item("Tea", 1, "1.00", "1.00")], tenant=tenant, outlet=outlet))
+
+        self.assertEqual(logo.open.call_count, 1)
+        self.assertEqual(first, second)
+        # Scaled to a whole number of bytes: 96 dots (12 bytes) by 10 rows, all black
+        raster = b"\x1ba\x01\x1dv0\x00\x0c\x00\x0a\x00" + b"\xff" * 120 + b"\x1ba\x00"
+        self.assertEqual(first[:len(raster) + 6], b"\x1b@\x1dW\x80\x02" + raster)
+
+    def test_unreadable_logo_prints_without_it(self):
+        logo = SimpleNamespace(name='tenants/logos/missing.png', open=mock.Mock(side_effect=FileNotFoundError))
+        tenant = SimpleNamespace(name="Acme Store", currency="MWK", logo=logo)
+        outlet = _outlet({'receipt': {'print_logo': True}})
+        sale = _sale([_item("Tea", 1, "1.00", "1.00")], tenant=tenant, outlet=outlet)
+
+        with self.assertLogs('apps.sales.receipt_escpos', 'WARNING'):
+            payload = _payload(sale)
+        self.assertTrue(payload.startswith(b"\x1b@\x1dW\x80\x02" + b"ACME STORE".center(48)))
+
+    def test_qr_code_is_printed_before_the_cut(self):
+        outlet = _outlet({'receipt': {'qr_code': 'https://example.com/r'}})
+        sale = _sale([_item("Tea", 1, "1.00", "1.00")], outlet=outlet)
+        payload = _payload(sale)
+
+        store = b"\x1d(k\x18\x001P0https://example.com/r"
+        self.assertIn(store, payload)
+        self.assertTrue(payload.endswith(b"\x1d(k\x03\x001Q0\n\x1ba\x00" + CUT))
+        self.assertLess(payload.index(b"Powered by PRIMEPOS"), payload.index(store))
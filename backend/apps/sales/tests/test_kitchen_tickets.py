@@ -0,0 +1,113 @@
+"""
+Tests for the per-outlet daily kitchen order ticket counter
+"""
+
+import tempfile
+import threading
+import unittest
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.models import Batch
+from apps.outlets.models import Outlet
+from apps.products.models import Product
+from apps.restaurant.models import KitchenOrderTicket, KitchenTicketCounter, Table
+from apps.tenants.models import Tenant
+from primepos.db import close_side_connection
+
+
+class KitchenTicketCounterTestCase(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Kitchen Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Kitchen One")
+        self.other = Outlet.objects.create(tenant=self.tenant, name="Kitchen Two")
+
+    def test_numbers_run_per_outlet_and_day(self):
+        day = date(2026, 10, 17)
+
+        self.assertEqual(KitchenTicketCounter.objects.next_kot_number(self.outlet, day), "KOT-20261017-0001")
+        self.assertEqual(KitchenTicketCounter.objects.next_kot_number(self.outlet, day), "KOT-20261017-0002")
+        self.assertEqual(KitchenTicketCounter.objects.next_kot_number(self.other, day), "KOT-20261017-0001")
+        self.assertEqual(
+            KitchenTicketCounter.objects.next_kot_number(self.outlet, day + timedelta(days=1)), "KOT-20261018-0001"
+        )
+
+    def test_rolled_back_ticket_returns_its_number(self):
+        self.assertEqual(KitchenTicketCounter.objects.allocate(self.outlet), 1)
+        try:
+            with transaction.atomic():
+                self.assertEqual(KitchenTicketCounter.objects.allocate(self.outlet), 2)
+                raise RuntimeError("order failed")
+        except RuntimeError:
+            pass
+
+        self.assertEqual(KitchenTicketCounter.objects.allocate(self.outlet), 2)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Concurrent orders need PostgreSQL row locks')
+@override_settings(
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_ROOT=tempfile.gettempdir(),
+    STOCK_LOCK_TIMEOUT_MS=30000,
+)
+class ConcurrentKitchenOrderTestCase(TransactionTestCase):
+    ORDERS = 50
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Rush Kitchen")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Rush Kitchen Store")
+        self.user = User.objects.create_user(
+            username="waiter", email="waiter@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.table = Table.objects.create(tenant=self.tenant, outlet=self.outlet, number="T1")
+        self.products = []
+        for index in range(5):
+            product = Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=f"Dish {index}", retail_price=Decimal("8.00"),
+                cost=Decimal("3.00")
+            )
+            Batch.objects.create(
+                tenant=self.tenant, product=product, outlet=self.outlet, batch_number=f"D-{index}", quantity=100,
+                cost_price=Decimal("3.00"), expiry_date=timezone.now().date() + timedelta(days=30)
+            )
+            self.products.append(product)
+
+    def _fire_order(self, index, barrier, responses):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+        try:
+            barrier.wait()
+            responses[index] = client.post('/api/v1/sales/', {
+                'outlet': self.outlet.id,
+                'table_id': self.table.id,
+                'payment_method': 'tab',
+                'subtotal': '8.00',
+                'total': '8.00',
+                'items_data': [{'product_id': self.products[index % 5].id, 'quantity': 1, 'price': '8.00'}],
+            }, format='json')
+        finally:
+            close_side_connection()
+            connection.close()
+
+    def test_concurrent_orders_get_unique_contiguous_tickets(self):
+        barrier = threading.Barrier(self.ORDERS)
+        responses = [None] * self.ORDERS
+        threads = [
+            threading.Thread(target=self._fire_order, args=(index, barrier, responses)) for index in range(self.ORDERS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [201] * self.ORDERS)
+        numbers = sorted(KitchenOrderTicket.objects.filter(outlet=self.outlet).values_list('kot_number', flat=True))
+        prefix = f"KOT-{timezone.localdate():%Y%m%d}-"
+        self.assertEqual(numbers, [f"{prefix}{value:04d}" for value in range(1, self.ORDERS + 1)])
+        self.assertEqual(KitchenTicketCounter.objects.get(outlet=self.outlet).last_value, self.ORDERS)
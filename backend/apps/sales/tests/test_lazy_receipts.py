@@ -0,0 +1,121 @@
+"""
+Tests for rendering receipt PDFs on first access from their sale-time snapshot
+"""
+
+import threading
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.outlets.models import Outlet
+from apps.sales.models import Receipt, ReceiptArtifact, Sale, SaleItem
+from apps.sales.services import ReceiptService
+from apps.tenants.models import Tenant
+
+
+def _sale(tenant, outlet, user, receipt_number):
+    # bulk_create keeps the signal's receipt jobs out of the way
+    sale = Sale.objects.bulk_create([Sale(
+        tenant=tenant, outlet=outlet, user=user, receipt_number=receipt_number, subtotal=Decimal("6.00"),
+        total=Decimal("6.00"), cash_received=Decimal("10.00"), change_given=Decimal("4.00"),
+    )])[0]
+    SaleItem.objects.create(sale=sale, product_name="Chambo", quantity=2, price=Decimal("3.00"), total=Decimal("6.00"))
+    return Sale.objects.select_related('tenant', 'outlet', 'user', 'customer').get(pk=sale.pk)
+
+
+def _counting_renders():
+    return mock.patch.object(ReceiptService, '_render_pdf_snapshot', wraps=ReceiptService._render_pdf_snapshot)
+
+
+class LazyReceiptTestCase(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Lazy Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Lazy Store")
+        self.user = User.objects.create_user(
+            username="lazy", email="lazy@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.sale = _sale(self.tenant, self.outlet, self.user, "Z-1")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_sale_time_receipt_is_a_snapshot_without_a_render(self):
+        with _counting_renders() as render:
+            receipt = ReceiptService.generate_receipt(self.sale, format='pdf')
+
+        render.assert_not_called()
+        self.assertIsNone(receipt.artifact_id)
+        self.assertEqual(receipt.snapshot['receipt_number'], "Z-1")
+        self.assertEqual(receipt.snapshot['items'], [
+            {'name': "Chambo", 'quantity': 2, 'price': "3.00", 'total': "6.00"},
+        ])
+
+        # The snapshot keeps the outlet as it was when the sale was made
+        self.outlet.name = "Renamed Store"
+        self.outlet.save()
+        self.assertEqual(Receipt.objects.get(pk=receipt.pk).snapshot['outlet']['name'], "Lazy Store")
+
+    def test_download_renders_once_and_matches_an_eager_render(self):
+        receipt = ReceiptService.generate_receipt(self.sale, format='pdf')
+
+        with _counting_renders() as render:
+            first = self.client.get(f'/api/v1/receipts/{receipt.id}/download/')
+            second = self.client.get(f'/api/v1/receipts/{receipt.id}/download/')
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        body = b''.join(first.streaming_content)
+        self.assertEqual(body, b''.join(second.streaming_content))
+        self.assertEqual(body, ReceiptService._generate_pdf_receipt(self.sale).getvalue())
+
+    def test_by_number_renders_the_pdf(self):
+        receipt = ReceiptService.generate_receipt(self.sale, format='pdf')
+
+        response = self.client.get('/api/v1/receipts/by-number/Z-1/')
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNotNone(Receipt.objects.get(pk=receipt.pk).artifact_id)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Collapsing concurrent renders needs PostgreSQL row locks')
+class ConcurrentFirstDownloadTestCase(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Stampede Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Stampede Store")
+        self.user = User.objects.create_user(
+            username="stampede", email="stampede@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.receipt = ReceiptService.generate_receipt(_sale(self.tenant, self.outlet, self.user, "S-1"), format='pdf')
+
+    def test_concurrent_first_requests_render_once(self):
+        barrier = threading.Barrier(self.THREADS)
+        artifacts, errors = [], []
+
+        def first_request():
+            try:
+                receipt = Receipt.objects.get(pk=self.receipt.pk)
+                barrier.wait()
+                artifacts.append(ReceiptService.render_pdf_receipt(receipt).pk)
+            except Exception as exc:  # pragma: no cover - surfaced by the assertion below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        with _counting_renders() as render:
+            threads = [threading.Thread(target=first_request) for _ in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(len(set(artifacts)), 1)
+        self.assertEqual(ReceiptArtifact.objects.count(), 1)
+        self.assertEqual(Receipt.objects.get(pk=self.receipt.pk).artifact_id, artifacts[0])
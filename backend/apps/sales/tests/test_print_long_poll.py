@@ -0,0 +1,118 @@
+"""
+Tests for long-polling claim-next, woken by PostgreSQL LISTEN/NOTIFY or an in-process condition
+"""
+
+import threading
+import time
+from unittest import mock
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.sales.models import PrintJob
+from apps.sales.print_wakeups import stop_print_job_listener
+from apps.sales.views import PrintJobViewSet
+from apps.tenants.models import Tenant
+
+CLAIM_URL = '/api/v1/print-jobs/claim-next/'
+
+
+class LongPollClaimTestCase(TransactionTestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Long Poll Tenant")
+        self.other_tenant = Tenant.objects.create(name="Other Tenant")
+        self.user = User.objects.create_user(
+            username="longpoll", email="longpoll@example.com", password="pass1234", tenant=self.tenant
+        )
+
+    def tearDown(self):
+        # The listener's connection would otherwise keep the test database open
+        stop_print_job_listener()
+
+    def _client(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        return client
+
+    def _claim_in_background(self, wait):
+        result = {}
+
+        def claim():
+            try:
+                started = time.monotonic()
+                result['response'] = self._client().post(CLAIM_URL, {'wait': wait}, format='json')
+                result['elapsed'] = time.monotonic() - started
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=claim)
+        thread.start()
+        return thread, result
+
+    def _assert_parked_claim_wakes_for_a_new_job(self):
+        thread, result = self._claim_in_background(wait=10)
+        time.sleep(0.3)
+        # Another tenant's job is not a reason to answer
+        PrintJob.objects.create(tenant=self.other_tenant, payload={'content_base64': 'G0A='})
+        time.sleep(0.2)
+        self.assertTrue(thread.is_alive())
+
+        job = PrintJob.objects.create(tenant=self.tenant, payload={'content_base64': 'G0A='})
+        thread.join(timeout=5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(result['response'].status_code, 200)
+        self.assertEqual(result['response'].data['id'], job.id)
+        self.assertLess(result['elapsed'], 3)
+        self.assertEqual(PrintJob.objects.get(pk=job.pk).status, 'claimed')
+
+    def test_parked_claim_is_woken_by_notify(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('LISTEN/NOTIFY needs PostgreSQL')
+        self._assert_parked_claim_wakes_for_a_new_job()
+
+    def test_parked_claim_is_woken_in_process_without_postgresql(self):
+        with mock.patch('apps.sales.print_wakeups._uses_listen', return_value=False):
+            self._assert_parked_claim_wakes_for_a_new_job()
+
+    def test_idle_long_poll_looks_for_a_job_once(self):
+        claim = PrintJobViewSet._claim_pending_job
+        with mock.patch.object(
+            PrintJobViewSet, '_claim_pending_job', autospec=True, side_effect=claim
+        ) as claimed:
+            started = time.monotonic()
+            response = self._client().post(CLAIM_URL, {'wait': 0.5}, format='json')
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(response.status_code, 204)
+        self.assertGreaterEqual(elapsed, 0.5)
+        self.assertEqual(claimed.call_count, 1)
+
+    @override_settings(PRINT_CLAIM_MAX_PARKED=1)
+    def test_claim_beyond_the_parking_limit_is_not_blocked(self):
+        thread, result = self._claim_in_background(wait=2)
+        time.sleep(0.3)
+        self.assertTrue(thread.is_alive())
+
+        started = time.monotonic()
+        response = self._client().post(CLAIM_URL, {'wait': 10}, format='json')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertLess(time.monotonic() - started, 1)
+        thread.join(timeout=5)
+        self.assertEqual(result['response'].status_code, 204)
+
+        # The slot is free again once the parked request has answered
+        started = time.monotonic()
+        self._client().post(CLAIM_URL, {'wait': 0.5}, format='json')
+        self.assertGreaterEqual(time.monotonic() - started, 0.5)
+
+    @override_settings(PRINT_CLAIM_MAX_WAIT_SECONDS=0)
+    def test_wait_is_capped(self):
+        started = time.monotonic()
+        response = self._client().post(CLAIM_URL, {'wait': 30}, format='json')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertLess(time.monotonic() - started, 1)
@@ -0,0 +1,99 @@
+"""
+Tests for FIFO realized COGS captured on SaleItem when stock is deducted
+"""
+
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.models import Batch, StockMovement
+from apps.inventory.stock_helpers import deduct_stock
+from apps.outlets.models import Outlet, Till
+from apps.products.models import Product
+from apps.sales.models import RefundItem, SaleItem
+from apps.shifts.models import Shift
+from apps.tenants.models import Tenant
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_ROOT=tempfile.gettempdir()
+)
+class RealizedCogsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.tenant = Tenant.objects.create(name="Margin Tenant")
+        self.user = User.objects.create_user(
+            username="cashier", email="cashier@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.client.force_authenticate(user=self.user)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Margin Store")
+        self.client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+        till = Till.objects.create(outlet=self.outlet, name="Till 1")
+        self.shift = Shift.objects.create(
+            outlet=self.outlet, till=till, user=self.user, operating_date=timezone.now().date(),
+            opening_cash_balance=Decimal("0.00"), status="OPEN"
+        )
+        self.product = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Coffee", retail_price=Decimal("20.00"), cost=Decimal("10.00")
+        )
+        today = timezone.now().date()
+        for batch_number, quantity, cost_price, days in (('OLD', 3, "4.00", 10), ('NEW', 10, "6.00", 90)):
+            Batch.objects.create(
+                tenant=self.tenant, product=self.product, outlet=self.outlet, batch_number=batch_number,
+                quantity=quantity, cost_price=Decimal(cost_price), expiry_date=today + timedelta(days=days)
+            )
+
+    def _checkout(self, quantity):
+        response = self.client.post('/api/v1/sales/checkout-cash/', {
+            'outlet': self.outlet.id,
+            'shift': self.shift.id,
+            'items': [{'product_id': self.product.id, 'quantity': quantity, 'price': '20.00'}],
+            'cash_received': '500.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return SaleItem.objects.get(sale_id=response.json()['sale_id'])
+
+    def test_sale_records_fifo_batch_cost(self):
+        item = self._checkout(5)
+
+        # 3 units from the 4.00 batch, 2 from the 6.00 batch
+        self.assertEqual(item.realized_cost_total, Decimal("24.00"))
+        self.assertEqual(item.realized_unit_cost, Decimal("4.8000"))
+        self.assertEqual(item.effective_cogs_total, Decimal("24.00"))
+
+    def test_profit_loss_ignores_later_cost_edits(self):
+        self._checkout(5)
+        Product.objects.filter(pk=self.product.pk).update(cost=Decimal("50.00"))
+
+        response = self.client.get('/api/v1/reports/profit-loss/')
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['total_revenue'], 100.0)
+        self.assertEqual(response.json()['total_cost'], 24.0)
+
+        chart = self.client.get('/api/v1/sales/chart_data/').json()
+        self.assertEqual(chart[-1]['profit'], 76.0)
+
+    def test_refund_reverses_the_realized_cost(self):
+        item = self._checkout(5)
+
+        response = self.client.post(
+            f'/api/v1/sales/{item.sale_id}/refund/', {'items': [{'sale_item_id': item.id, 'quantity': 2}]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(RefundItem.objects.get(original_item=item).realized_cost_total, Decimal("9.60"))
+        movement = StockMovement.objects.get(product=self.product, movement_type='return')
+        self.assertEqual(movement.unit_cost, Decimal("4.80"))
+
+    def test_deduct_stock_returns_consumed_cost(self):
+        deductions, cost = deduct_stock(self.product, self.outlet, 4, user=self.user, with_cost=True)
+
+        self.assertEqual([(batch.batch_number, quantity) for batch, quantity in deductions], [('OLD', 3), ('NEW', 1)])
+        self.assertEqual(cost, Decimal("18.00"))
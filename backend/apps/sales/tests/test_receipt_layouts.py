@@ -0,0 +1,69 @@
+"""
+Tests for compiled receipt PDF layouts and their invalidation
+"""
+
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from apps.outlets.models import Outlet
+from apps.sales.models import ReceiptTemplate, Sale, SaleItem
+from apps.sales.receipt_layouts import clear_receipt_layouts, get_receipt_layout
+from apps.sales.services import ReceiptService
+from apps.tenants.models import Tenant
+
+
+class ReceiptLayoutCacheTestCase(TestCase):
+    def setUp(self):
+        clear_receipt_layouts()
+        self.tenant = Tenant.objects.create(name="Layout Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Layout Store", phone="+265 111")
+        # bulk_create keeps the receipt jobs of the post_save signal out of the way
+        self.sale = Sale.objects.bulk_create([Sale(
+            tenant=self.tenant, outlet=self.outlet, receipt_number="L-1", subtotal=Decimal("7.00"),
+            total=Decimal("7.00"),
+        )])[0]
+        SaleItem.objects.create(
+            sale=self.sale, product_name="Samosa", quantity=2, price=Decimal("3.50"), total=Decimal("7.00")
+        )
+
+    def _sale(self):
+        return Sale.objects.select_related('tenant', 'outlet').get(pk=self.sale.pk)
+
+    def test_layout_is_compiled_once_and_renders(self):
+        layout = get_receipt_layout()
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_receipt_layout(), layout)
+        self.assertEqual(layout.key, 'a4')
+        self.assertTrue(ReceiptService._generate_pdf_receipt(self._sale()).getvalue().startswith(b"%PDF"))
+        self.assertIs(get_receipt_layout(), layout)
+
+    def test_template_changes_keep_the_layout(self):
+        layout = get_receipt_layout()
+        template = ReceiptTemplate.objects.create(tenant=self.tenant, name="Main", is_default=True)
+        template.content = "Come again"
+        template.save()
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_receipt_layout(), layout)
+
+    def test_outlet_changes_recompile_the_header(self):
+        snapshot = ReceiptService._build_receipt_snapshot(self._sale())
+        layout = get_receipt_layout()
+        self.assertEqual(
+            [paragraph.text for paragraph in layout.header(snapshot)],
+            ["LAYOUT TENANT", "Layout Store", "Tel: +265 111"],
+        )
+
+        self.outlet.name = "Renamed Store"
+        self.outlet.settings = {'paper_width': '58'}
+        self.outlet.save()
+        renamed = ReceiptService._build_receipt_snapshot(self._sale())
+
+        self.assertEqual([paragraph.text for paragraph in layout.header(renamed)][1], "Renamed Store")
+        self.assertEqual(len(layout._headers), 1)
+
+    @override_settings(RECEIPT_LAYOUT_CACHE=False)
+    def test_cache_can_be_switched_off(self):
+        self.assertIsNot(get_receipt_layout(), get_receipt_layout())
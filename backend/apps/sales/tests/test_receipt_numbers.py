@@ -0,0 +1,266 @@
+"""
+Tests for per-outlet receipt sequences, gap-free/gap-tolerant allocation and offline blocks
+"""
+
+import tempfile
+import threading
+import time
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from django.core.signals import request_finished
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.models import Batch
+from apps.inventory.stock_locks import lock_products
+from apps.outlets.models import Outlet, Till
+from apps.products.models import Product
+from apps.sales.models import ReceiptSequence, Sale
+from apps.sales.receipt_numbers import (
+    ReceiptNumberError, allocate_receipt_numbers, next_receipt_number, reserve_receipt_block,
+)
+from apps.shifts.models import Shift
+from apps.tenants.models import Tenant
+from primepos.db import close_side_connection, side_connection
+
+
+def _sale(tenant, outlet, receipt_number):
+    return Sale.objects.create(
+        tenant=tenant, outlet=outlet, receipt_number=receipt_number, subtotal=Decimal("1.00"), total=Decimal("1.00")
+    )
+
+
+class ReceiptSequenceTestCase(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Numbering Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Numbering Store")
+        self.branch = Outlet.objects.create(tenant=self.tenant, name="Numbering Branch")
+
+    def test_first_use_continues_after_existing_numbers(self):
+        for receipt_number in ("7", "12", "A-3", "legacy-20260101-0099"):
+            _sale(self.tenant, self.outlet, receipt_number)
+
+        self.assertEqual(next_receipt_number(self.tenant, self.outlet), "13")
+        self.assertEqual(next_receipt_number(self.tenant, self.outlet), "14")
+        self.assertEqual(next_receipt_number(self.tenant, self.outlet, prefix="A-"), "A-4")
+        self.assertEqual(next_receipt_number(self.tenant, self.branch), "1")
+        self.assertEqual(ReceiptSequence.objects.get(outlet=self.outlet, prefix="").last_value, 14)
+
+    def test_gap_free_allocation_is_returned_on_rollback(self):
+        self.assertEqual(next_receipt_number(self.tenant, self.outlet), "1")
+        try:
+            with transaction.atomic():
+                self.assertEqual(next_receipt_number(self.tenant, self.outlet), "2")
+                raise RuntimeError("checkout failed")
+        except RuntimeError:
+            pass
+
+        self.assertEqual(next_receipt_number(self.tenant, self.outlet), "2")
+
+    def test_invalid_prefix_and_block_size_are_rejected(self):
+        with self.assertRaises(ReceiptNumberError):
+            next_receipt_number(self.tenant, self.outlet, prefix="A1")
+        with self.assertRaises(ReceiptNumberError):
+            reserve_receipt_block(self.tenant, self.outlet, 0)
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_ROOT=tempfile.gettempdir()
+)
+class OfflineReceiptBlockTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.tenant = Tenant.objects.create(name="Offline Tenant")
+        self.user = User.objects.create_user(
+            username="offline", email="offline@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.client.force_authenticate(user=self.user)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Offline Store")
+        self.client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+        till = Till.objects.create(outlet=self.outlet, name="Till 1")
+        self.shift = Shift.objects.create(
+            outlet=self.outlet, till=till, user=self.user, operating_date=timezone.now().date(),
+            opening_cash_balance=Decimal("0.00"), status="OPEN"
+        )
+        self.product = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Tea", retail_price=Decimal("5.00"), cost=Decimal("2.00")
+        )
+        Batch.objects.create(
+            tenant=self.tenant, product=self.product, outlet=self.outlet, batch_number="T-1", quantity=50,
+            cost_price=Decimal("2.00"), expiry_date=timezone.now().date() + timezone.timedelta(days=90)
+        )
+
+    def _checkout(self, **extra):
+        return self.client.post('/api/v1/sales/checkout-cash/', {
+            'outlet': self.outlet.id,
+            'shift': self.shift.id,
+            'items': [{'product_id': self.product.id, 'quantity': 1, 'price': '5.00'}],
+            'cash_received': '5.00',
+            **extra,
+        }, format='json')
+
+    def test_reserved_block_is_skipped_online_and_accepted_on_sync(self):
+        self.assertEqual(self._checkout().json()['receipt_number'], "1")
+        reserved = self.client.post(
+            '/api/v1/sales/reserve-receipt-numbers/', {'count': 5, 'device_id': 'till-7'}, format='json'
+        )
+        self.assertEqual(reserved.status_code, 201, reserved.content)
+        self.assertEqual((reserved.json()['first_number'], reserved.json()['last_number']), (2, 6))
+
+        self.assertEqual(self._checkout().json()['receipt_number'], "7")
+
+        synced = self._checkout(offline_receipt_number="4", device_id="till-7")
+        self.assertEqual(synced.status_code, 201, synced.content)
+        self.assertEqual(synced.json()['receipt_number'], "4")
+
+        self.assertEqual(self._checkout(offline_receipt_number="4", device_id="till-7").status_code, 400)
+        self.assertEqual(self._checkout(offline_receipt_number="5", device_id="till-8").status_code, 400)
+        self.assertEqual(self._checkout(offline_receipt_number="8", device_id="till-7").status_code, 400)
+        self.assertEqual(self._checkout().json()['receipt_number'], "8")
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Concurrent allocation needs PostgreSQL row locks')
+class ConcurrentReceiptAllocationTestCase(TransactionTestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Rush Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Rush Store")
+
+    def _allocate_concurrently(self, workers=10, per_worker=5, fail_every=0):
+        numbers, errors = [], []
+
+        def worker(index):
+            try:
+                for attempt in range(per_worker):
+                    try:
+                        with transaction.atomic():
+                            number = allocate_receipt_numbers(self.tenant, self.outlet)
+                            if fail_every and attempt % fail_every == 0:
+                                raise RuntimeError("rolled back")
+                            numbers.append(number)
+                    except RuntimeError:
+                        pass
+            except Exception as exc:  # pragma: no cover - surfaced by the assertion below
+                errors.append(exc)
+            finally:
+                close_side_connection()
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return numbers
+
+    def test_gap_free_numbers_are_unique_and_contiguous(self):
+        numbers = self._allocate_concurrently(fail_every=2)
+
+        self.assertEqual(sorted(numbers), list(range(1, len(numbers) + 1)))
+        self.assertEqual(len(numbers), 20)
+
+    @override_settings(RECEIPT_NUMBERS_GAP_FREE=False)
+    def test_gap_tolerant_numbers_are_unique_and_survive_rollbacks(self):
+        numbers = self._allocate_concurrently(fail_every=2)
+
+        self.assertEqual(len(numbers), len(set(numbers)))
+        self.assertEqual(len(numbers), 20)
+        sequence = ReceiptSequence.objects.get(outlet=self.outlet)
+        self.assertFalse(sequence.gap_free)
+        # Rolled-back allocations are gaps, not reused numbers
+        self.assertEqual(sequence.last_value, 50)
+
+    @override_settings(RECEIPT_NUMBERS_GAP_FREE=False)
+    def test_side_connection_is_closed_at_request_end_once_obsolete(self):
+        self.addCleanup(close_side_connection)
+        with transaction.atomic():
+            allocate_receipt_numbers(self.tenant, self.outlet)
+        side = side_connection()
+        self.assertIsNotNone(side.connection)
+
+        request_finished.send(sender=self.__class__)
+        self.assertIsNotNone(side.connection)
+
+        side.close_at = time.monotonic() - 1
+        request_finished.send(sender=self.__class__)
+        self.assertIsNone(side.connection)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Lock ordering needs PostgreSQL row locks')
+@override_settings(
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_ROOT=tempfile.gettempdir(),
+    STOCK_LOCK_TIMEOUT_MS=30000, STOCK_LOCK_RETRIES=1,
+)
+class ReceiptSequenceLockOrderTestCase(TransactionTestCase):
+    """The receipt sequence row is the last lock a sale takes, after its basket"""
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Two Tills")
+        self.user = User.objects.create_user(
+            username="twotills", email="twotills@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Two Tills Store")
+        till = Till.objects.create(outlet=self.outlet, name="Till 1")
+        self.shift = Shift.objects.create(
+            outlet=self.outlet, till=till, user=self.user, operating_date=timezone.now().date(),
+            opening_cash_balance=Decimal("0.00"), status="OPEN"
+        )
+        self.product = Product.objects.create(
+            tenant=self.tenant, outlet=self.outlet, name="Tea", retail_price=Decimal("5.00"), cost=Decimal("2.00")
+        )
+        Batch.objects.create(
+            tenant=self.tenant, product=self.product, outlet=self.outlet, batch_number="T-1", quantity=50,
+            cost_price=Decimal("2.00"), expiry_date=timezone.now().date() + timezone.timedelta(days=90)
+        )
+        # The outlet's sequence row exists, so both requests update the same row
+        next_receipt_number(self.tenant, self.outlet)
+
+    def _post(self, url, data, barrier, responses, key):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+        try:
+            barrier.wait()
+            responses[key] = client.post(url, data, format='json')
+        finally:
+            connection.close()
+
+    def test_create_and_cash_checkout_at_one_outlet_do_not_deadlock(self):
+        def slow_lock(*args, **kwargs):
+            # Hold the basket long enough for the other till to reach its next lock
+            locked = lock_products(*args, **kwargs)
+            time.sleep(0.5)
+            return locked
+
+        item = {'product_id': self.product.id, 'quantity': 1, 'price': '5.00'}
+        requests = {
+            'create': ('/api/v1/sales/', {
+                'outlet': self.outlet.id, 'shift': self.shift.id, 'payment_method': 'cash',
+                'subtotal': '5.00', 'total': '5.00', 'items_data': [item],
+            }),
+            'checkout': ('/api/v1/sales/checkout-cash/', {
+                'outlet': self.outlet.id, 'shift': self.shift.id, 'items': [item], 'cash_received': '5.00',
+            }),
+        }
+        barrier = threading.Barrier(len(requests))
+        responses = {}
+        with mock.patch('apps.sales.views.lock_products', side_effect=slow_lock):
+            threads = [
+                threading.Thread(target=self._post, args=(url, data, barrier, responses, key))
+                for key, (url, data) in requests.items()
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        for key, response in responses.items():
+            self.assertEqual(response.status_code, 201, f"{key}: {response.content}")
+        self.assertEqual(
+            sorted(response.json()['receipt_number'] for response in responses.values()), ["2", "3"]
+        )
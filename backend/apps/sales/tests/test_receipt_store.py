@@ -0,0 +1,125 @@
+"""
+Tests for the content-addressed receipt artifact store
+"""
+
+import hashlib
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.outlets.models import Outlet
+from apps.sales.models import Receipt, ReceiptArtifact, Sale, SaleItem
+from apps.sales.receipt_store import read_artifact, store_artifact
+from apps.sales.services import ReceiptService
+from apps.tenants.models import Tenant
+
+
+class ArtifactStoreTestCase(TestCase):
+    def test_database_bodies_are_deduplicated(self):
+        first = store_artifact(b"%PDF-1.4 one", backend='database')
+        again = store_artifact(b"%PDF-1.4 one", backend='filesystem')
+
+        self.assertEqual(first.pk, again.pk)
+        self.assertEqual(first.sha256, hashlib.sha256(b"%PDF-1.4 one").hexdigest())
+        self.assertEqual(ReceiptArtifact.objects.count(), 1)
+        self.assertEqual(read_artifact(ReceiptArtifact.objects.get(pk=first.pk)), b"%PDF-1.4 one")
+        self.assertIn('data', ReceiptArtifact.objects.get(pk=first.pk).get_deferred_fields())
+
+    def test_filesystem_bodies_live_outside_the_row(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(RECEIPT_ARTIFACT_ROOT=root):
+            artifact = store_artifact(b"%PDF-1.4 two", backend='filesystem')
+
+            self.assertEqual(artifact.backend, 'filesystem')
+            self.assertTrue(artifact.location.endswith(f"{artifact.sha256}.pdf"))
+            self.assertIsNone(ReceiptArtifact.objects.filter(pk=artifact.pk).values_list('data', flat=True)[0])
+            self.assertEqual(read_artifact(artifact), b"%PDF-1.4 two")
+
+    @override_settings(RECEIPT_ARTIFACT_BACKEND='floppy')
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            store_artifact(b"%PDF-1.4 three")
+
+
+class ReceiptArtifactTestCase(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Artifact Tenant")
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Artifact Store")
+        self.user = User.objects.create_user(
+            username="artifact", email="artifact@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.sales = Sale.objects.bulk_create([
+            Sale(
+                tenant=self.tenant, outlet=self.outlet, user=self.user, receipt_number=f"A-{index}",
+                subtotal=Decimal("5.00"), total=Decimal("5.00"),
+            )
+            for index in range(3)
+        ])
+        for sale in self.sales:
+            SaleItem.objects.create(
+                sale=sale, product_name="Mandasi", quantity=1, price=Decimal("5.00"), total=Decimal("5.00")
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_pdf_receipts_reference_a_shared_artifact(self):
+        receipt = ReceiptService.generate_receipt(self.sales[0], format='pdf')
+        artifact = ReceiptService.render_pdf_receipt(receipt)
+
+        self.assertEqual(receipt.content, '')
+        self.assertFalse(receipt.pdf_file)
+        self.assertTrue(read_artifact(artifact).startswith(b"%PDF"))
+
+        # Re-rendering an unchanged sale produces the same bytes, so the body is stored once
+        regenerated = ReceiptService.regenerate_receipt(receipt.id, format='pdf')
+        self.assertNotEqual(regenerated.id, receipt.id)
+        self.assertEqual(ReceiptService.render_pdf_receipt(regenerated).pk, artifact.pk)
+        self.assertEqual(ReceiptArtifact.objects.count(), 1)
+
+    def test_listing_never_loads_bodies_and_download_streams_them(self):
+        for sale in self.sales:
+            ReceiptService.render_pdf_receipt(ReceiptService.generate_receipt(sale, format='pdf'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/receipts/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse([query for query in queries if '"sales_receiptartifact"."data"' in query['sql']])
+
+        receipt = Receipt.objects.get(sale=self.sales[0])
+        download = self.client.get(f'/api/v1/receipts/{receipt.id}/download/')
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(download['ETag'], f'"{receipt.artifact.sha256}"')
+        self.assertEqual(b''.join(download.streaming_content), read_artifact(receipt.artifact))
+
+    def test_backfill_moves_legacy_rows_in_chunks(self):
+        legacy = []
+        for sale in self.sales:
+            pdf_bytes = ReceiptService._generate_pdf_receipt(sale).getvalue()
+            legacy.append(Receipt.objects.create(
+                tenant=self.tenant, sale=sale, receipt_number=sale.receipt_number, format='pdf',
+                content=ReceiptService._encode_pdf_content(pdf_bytes),
+            ))
+        Receipt.objects.create(
+            tenant=self.tenant, sale=self.sales[0], receipt_number="A-0", format='escpos', content='G0A=',
+        )
+
+        out = StringIO()
+        call_command('backfill_receipts', '--artifacts', '--chunk-size', '2', stdout=out)
+
+        self.assertIn("Moved 3 receipts", out.getvalue())
+        self.assertIn("through receipt", out.getvalue())
+        for receipt in legacy:
+            moved = Receipt.objects.get(pk=receipt.pk)
+            self.assertEqual(moved.content, '')
+            self.assertEqual(read_artifact(moved.artifact), ReceiptService.decode_pdf_content(receipt.content))
+        self.assertEqual(Receipt.objects.get(format='escpos').content, 'G0A=')
+
+        call_command('backfill_receipts', '--artifacts', stdout=out)
+        self.assertIn("Moved 0 receipts", out.getvalue())
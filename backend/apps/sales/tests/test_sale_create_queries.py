@@ -0,0 +1,137 @@
+"""
+Tests that sale creation resolves the basket with a fixed number of queries
+"""
+
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.inventory.models import Batch, LocationStock
+from apps.outlets.models import Outlet, Till
+from apps.products.models import Product, ProductUnit
+from apps.sales.models import Sale, SaleItem
+from apps.shifts.models import Shift
+from apps.tenants.models import Tenant
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_ROOT=tempfile.gettempdir()
+)
+class SaleCreateQueryCountTestCase(TestCase):
+    PRODUCTS = 40
+
+    def setUp(self):
+        self.client = APIClient()
+        self.tenant = Tenant.objects.create(name="Basket Tenant")
+        self.user = User.objects.create_user(
+            username="basket", email="basket@example.com", password="pass1234", tenant=self.tenant
+        )
+        self.client.force_authenticate(user=self.user)
+        self.outlet = Outlet.objects.create(tenant=self.tenant, name="Basket Store")
+        self.client.credentials(HTTP_X_OUTLET_ID=str(self.outlet.id))
+        till = Till.objects.create(outlet=self.outlet, name="Till 1")
+        self.shift = Shift.objects.create(
+            outlet=self.outlet, till=till, user=self.user, operating_date=timezone.now().date(),
+            opening_cash_balance=Decimal("0.00"), status="OPEN"
+        )
+        expiry = timezone.now().date() + timedelta(days=60)
+        self.products, self.units = [], []
+        for index in range(self.PRODUCTS):
+            product = Product.objects.create(
+                tenant=self.tenant, outlet=self.outlet, name=f"Basket Item {index}",
+                retail_price=Decimal("4.00"), cost=Decimal("1.50")
+            )
+            if index % 2:
+                Batch.objects.create(
+                    tenant=self.tenant, product=product, outlet=self.outlet, batch_number=f"B-{index}",
+                    quantity=100, cost_price=Decimal("1.50"), expiry_date=expiry
+                )
+            else:
+                # Stock held only on the outlet projection
+                LocationStock.objects.create(tenant=self.tenant, product=product, outlet=self.outlet, quantity=100)
+            self.products.append(product)
+            self.units.append(ProductUnit.objects.create(
+                product=product, unit_name="pair", conversion_factor=Decimal("2"), retail_price=Decimal("8.00")
+            ))
+
+    def _lines(self, count):
+        lines = []
+        for index in range(count):
+            line = {'product_id': self.products[index].id, 'quantity': 1, 'price': '8.00'}
+            if index % 3 == 0:
+                line['unit_id'] = self.units[index].id
+            lines.append(line)
+        return lines
+
+    def _create(self, lines):
+        return self.client.post('/api/v1/sales/', {
+            'outlet': self.outlet.id,
+            'shift': self.shift.id,
+            'payment_method': 'cash',
+            'subtotal': '1.00',
+            'total': '1.00',
+            'items_data': lines,
+        }, format='json')
+
+    def _checkout(self, lines):
+        return self.client.post('/api/v1/sales/checkout-cash/', {
+            'outlet': self.outlet.id,
+            'shift': self.shift.id,
+            'items': [{key: value for key, value in line.items() if key != 'unit_id'} for line in lines],
+            'cash_received': '1000.00',
+        }, format='json')
+
+    def _assert_constant_queries(self, post):
+        # Seed the per-outlet sequence and ledger snapshot rows so both runs start from the same state
+        self.assertEqual(post(self._lines(self.PRODUCTS)).status_code, 201)
+        # Two lines already take every branch: a unit, a batch-tracked and a projection-only product
+        with CaptureQueriesContext(connection) as small:
+            response = post(self._lines(2))
+        self.assertEqual(response.status_code, 201, response.content)
+
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = post(self._lines(self.PRODUCTS))
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        return Sale.objects.get(id=body.get('id') or body['sale_id'])
+
+    def test_create_query_count_is_independent_of_basket_size(self):
+        sale = self._assert_constant_queries(self._create)
+
+        items = list(sale.items.order_by('id'))
+        self.assertEqual(len(items), self.PRODUCTS)
+        self.assertEqual(items[0].unit_id, self.units[0].id)
+        self.assertEqual(items[0].quantity_in_base_units, 2)
+        self.assertEqual(items[1].quantity_in_base_units, 1)
+        self.assertTrue(all(item.realized_cost_total is not None for item in items))
+        self.assertEqual(sale.subtotal, Decimal("320.00"))
+
+    def test_checkout_cash_query_count_is_independent_of_basket_size(self):
+        sale = self._assert_constant_queries(self._checkout)
+
+        self.assertEqual(SaleItem.objects.filter(sale=sale).count(), self.PRODUCTS)
+
+    def test_repeated_product_is_checked_against_its_running_total(self):
+        product = self.products[1]
+        lines = [{'product_id': product.id, 'quantity': 60, 'price': '4.00'}] * 2
+
+        response = self._create(lines)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Item 2: Insufficient stock", str(response.content))
+        self.assertFalse(Sale.objects.filter(tenant=self.tenant).exists())
+
+    def test_unit_from_another_product_is_rejected(self):
+        response = self._create([
+            {'product_id': self.products[0].id, 'quantity': 1, 'price': '8.00', 'unit_id': self.units[1].id},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unit", str(response.content))
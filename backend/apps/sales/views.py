@@ -6,22 +6,40 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.throttling import AnonRateThrottle
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db import transaction, models, IntegrityError, connection
-from django.db.models import Max
+from django.conf import settings
+from django.db import transaction, models, IntegrityError
+from django.db.models import Max, prefetch_related_objects
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.template import engines
 import json
 import logging
 import secrets
+from collections import defaultdict
+from contextlib import nullcontext
 from datetime import timedelta, datetime, time
 from decimal import Decimal, InvalidOperation
-from .models import Sale, SaleItem, Receipt, ReceiptTemplate, PrintJob, PrintDevice, Printer, ConnectorPairingSession, Refund, RefundItem
+from time import monotonic
+from .models import COGS_TOTAL_EXPRESSION, Sale, SaleItem, Receipt, ReceiptTemplate, PrintJob, PrintDevice, Printer, ConnectorPairingSession, Refund, RefundItem
 from .serializers import SaleSerializer, SaleItemSerializer, ReceiptSerializer, ReceiptTemplateSerializer, PrintJobSerializer, PrintDeviceSerializer, PrinterSerializer, RefundSerializer, RefundItemInputSerializer
 from .services import ReceiptService
+from .jobs import enqueue_post_sale_jobs, enqueue_receipt
+from .print_wakeups import parking_slot, print_job_generation, wait_for_print_job
+from .receipt_numbers import (
+    ReceiptNumberError, claim_reserved_receipt_number, format_receipt_number, next_receipt_number,
+    reserve_receipt_block, sync_receipt_sequence,
+)
 from apps.products.models import Product, ProductUnit
 from apps.inventory.models import StockMovement, LocationStock, Batch
-from apps.inventory.stock_helpers import get_sellable_stock, deduct_stock, restore_stock_for_refund
+from apps.inventory.stock_helpers import (
+    get_sellable_stock,
+    get_sellable_stock_many,
+    deduct_stock_for_lines,
+    deduction_cost,
+    restore_stock_for_refund,
+    InsufficientStockError,
+)
+from apps.inventory.stock_locks import lock_products, retry_on_stock_contention
 from apps.tenants.permissions import TenantFilterMixin, HasTenantModuleAccess
 
 
@@ -170,6 +188,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         products_by_id = {
             p.id: p for p in Product.objects.filter(id__in=product_ids, tenant=tenant, outlet=outlet)
         }
+        stock_map = get_sellable_stock_many(products_by_id.values(), outlet)
 
         rows = []
         for row in aggregated_rows:
@@ -182,7 +201,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             if sold_qty <= 0:
                 continue
 
-            current_stock = int(get_sellable_stock(product, outlet))
+            current_stock = int(stock_map.get(product.id, 0))
             rows.append({
                 'product_id': str(product.id),
                 'product_name': product.name,
@@ -309,39 +328,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         
         return super().destroy(request, *args, **kwargs)
 
-    @staticmethod
-    def _run_post_sale_commit_tasks(sale_id: int, user_id: int = None):
-        """Run non-critical side effects after the sale transaction commits."""
-        logger = logging.getLogger(__name__)
-
-        try:
-            sale = Sale.objects.get(id=sale_id)
-        except Sale.DoesNotExist:
-            logger.warning(f"Post-commit tasks skipped: sale {sale_id} not found")
-            return
-
-        user = None
-        if user_id:
-            try:
-                from apps.accounts.models import User
-                user = User.objects.get(id=user_id)
-            except Exception:
-                user = None
-
-        if sale.status == 'completed':
-            try:
-                from .services import ReceiptService
-                ReceiptService.generate_receipt(sale, format='pdf', user=user)
-            except Exception as e:
-                logger.error(f"Failed to auto-generate receipt for sale {sale.id}: {str(e)}")
-
-        try:
-            from apps.notifications.services import NotificationService
-            NotificationService.notify_sale_completed(sale)
-        except Exception as e:
-            logger.error(f"Failed to create sale notification: {str(e)}")
-    
-    @transaction.atomic
+    @retry_on_stock_contention
     def create(self, request, *args, **kwargs):
         """Create sale with atomic stock deduction"""
         import logging
@@ -419,10 +406,21 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             except Table.DoesNotExist:
                 logger.warning(f"Table {table_id} not found, continuing without table")
         
+        # Lock the whole basket in id order before touching stock; the receipt sequence row comes after
+        basket_ids = set()
+        for item_data in items_data:
+            try:
+                basket_ids.add(int(item_data.get('product_id')))
+            except (TypeError, ValueError):
+                continue
+        locked_products = lock_products(Product.objects.filter(id__in=basket_ids, tenant=tenant, outlet=outlet))
+
         # Create sale
         sale = self._create_sale_with_unique_receipt(
             tenant=tenant,
             outlet=outlet,
+            offline_receipt_number=request.data.get('offline_receipt_number'),
+            device_id=str(request.data.get('device_id') or ''),
             user=request.user,
             shift=shift,
             customer=customer,
@@ -440,7 +438,31 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         # Process items and deduct stock
         total_subtotal = Decimal('0')
         sale_type = request.data.get('sale_type', 'retail')  # 'retail' or 'wholesale'
-        
+        stock_lines = []
+        stock_line_items = []
+        stock_sale_items = []
+
+        # Resolve every unit and the basket's sellable stock up front: one query each
+        unit_ids = set()
+        for item_data in items_data:
+            try:
+                unit_ids.add(int(item_data.get('unit_id')))
+            except (TypeError, ValueError):
+                continue
+        units_by_id = {}
+        if unit_ids and locked_products:
+            units_by_id = {
+                unit.id: unit
+                for unit in ProductUnit.objects.filter(id__in=unit_ids, product_id__in=locked_products, is_active=True)
+            }
+        available_stock = get_sellable_stock_many(locked_products.values(), outlet)
+        requested_stock = defaultdict(int)
+        sale_items = []
+
+        # Option B for delivery-required sales:
+        # reserve/deduct is handled by Distribution delivery workflow, not instant POS deduction.
+        should_deduct_now = not bool(getattr(sale, 'delivery_required', False))
+
         for idx, item_data in enumerate(items_data):
             product_id = item_data.get('product_id')
             variation_id = item_data.get('variation_id')
@@ -463,8 +485,8 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 raise serializers.ValidationError(f"Item {idx + 1}: Quantity must be greater than 0")
             
             try:
-                product = Product.objects.select_for_update().get(id=product_id, tenant=tenant, outlet=outlet)
-            except Product.DoesNotExist:
+                product = locked_products[int(product_id)]
+            except (KeyError, TypeError, ValueError):
                 raise serializers.ValidationError(f"Item {idx + 1}: Product {product_id} not found or does not belong to your tenant/outlet")
             
             # UNITS ONLY ARCHITECTURE: No variations, use units instead
@@ -477,29 +499,29 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             
             if unit_id:
                 try:
-                    unit = ProductUnit.objects.get(id=unit_id, product=product, is_active=True)
-                    # Convert quantity to base units using conversion_factor
-                    quantity_in_base_units = unit.convert_to_base_units(quantity)
-                    unit_name = unit.unit_name
-                    # Use unit price if not explicitly provided
-                    if not price_str or price_str == '0':
-                        price = unit.get_price(sale_type)
-                except ProductUnit.DoesNotExist:
+                    unit = units_by_id[int(unit_id)]
+                except (KeyError, TypeError, ValueError):
+                    unit = None
+                if unit is None or unit.product_id != product.id:
                     raise serializers.ValidationError(f"Item {idx + 1}: Unit {unit_id} not found or inactive")
+                # Convert quantity to base units using conversion_factor
+                quantity_in_base_units = unit.convert_to_base_units(quantity)
+                unit_name = unit.unit_name
+                # Use unit price if not explicitly provided
+                if not price_str or price_str == '0':
+                    price = unit.get_price(sale_type)
             
-            # Sellable stock is always derived from non-expired batches.
-            available = get_sellable_stock(product, outlet)
+            # Sellable stock is always derived from non-expired batches; a product
+            # repeated across lines is checked against its running total.
+            requested_stock[product.id] += quantity_in_base_units
+            available = available_stock.get(product.id, 0)
 
-            if available < quantity_in_base_units:
+            if available < requested_stock[product.id]:
                 raise serializers.ValidationError(
                     f"Item {idx + 1}: Insufficient stock for {product.name}. "
-                    f"Available: {available} {product.unit}, Requested: {quantity_in_base_units} {product.unit}"
+                    f"Available: {available} {product.unit}, Requested: {requested_stock[product.id]} {product.unit}"
                 )
 
-            # Option B for delivery-required sales:
-            # reserve/deduct is handled by Distribution delivery workflow, not instant POS deduction.
-            should_deduct_now = not bool(getattr(sale, 'delivery_required', False))
-
             # Calculate item total - round to 2 decimal places
             item_total = (price * Decimal(quantity)).quantize(Decimal('0.01'))
             total_subtotal += item_total
@@ -511,8 +533,9 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             # Snapshot cost before any mutation so COGS is always immutable.
             cost_snapshot = self._snapshot_cost(product, unit)
 
-            # Create sale item (UNITS ONLY ARCHITECTURE - no variations)
-            sale_item = SaleItem.objects.create(
+            # Sale items are inserted together once every line has validated
+            # (UNITS ONLY ARCHITECTURE - no variations)
+            sale_item = SaleItem(
                 sale=sale,
                 product=product,
                 unit=unit,
@@ -528,24 +551,35 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 notes=item_notes,
                 kitchen_status=kitchen_status
             )
+            sale_items.append(sale_item)
 
-            # --- PHASE 1 FIX: single authoritative deduction path ---
-            # deduct_stock handles: batch FIFO, StockMovement creation,
-            # LocationStock sync, and Product.stock sync in one atomic call.
             if should_deduct_now:
-                try:
-                    deduct_stock(
-                        product=product,
-                        outlet=outlet,
-                        quantity=quantity_in_base_units,
-                        user=request.user,
-                        reference_id=str(sale.id),
-                        reason=f"Sale {sale.receipt_number}",
-                    )
-                except ValueError as e:
-                    raise serializers.ValidationError(
-                        f"Item {idx + 1}: Stock deduction failed for {product.name}. {str(e)}"
-                    )
+                stock_lines.append((product, quantity_in_base_units))
+                stock_line_items.append(idx)
+                stock_sale_items.append(sale_item)
+
+        SaleItem.objects.bulk_create(sale_items, batch_size=100)
+
+        # --- PHASE 1 FIX: single authoritative deduction path ---
+        # deduct_stock_for_lines handles the whole cart: batch FIFO, StockMovement
+        # creation, LocationStock sync, and Product.stock sync in one atomic call.
+        if stock_lines:
+            try:
+                deductions = deduct_stock_for_lines(
+                    stock_lines,
+                    outlet,
+                    user=request.user,
+                    reference_id=str(sale.id),
+                    reason=f"Sale {sale.receipt_number}",
+                )
+            except InsufficientStockError as e:
+                raise serializers.ValidationError(
+                    f"Item {stock_line_items[e.line_index] + 1}: Stock deduction failed for {e.product.name}. {str(e)}"
+                )
+            SaleItem.objects.record_realized_costs(
+                (sale_item, deduction_cost(line_deductions, product))
+                for sale_item, (product, _), line_deductions in zip(stock_sale_items, stock_lines, deductions)
+            )
         
         # Calculate totals - round to 2 decimal places to match DecimalField precision
         tax = sale.tax or Decimal('0')
@@ -675,31 +709,16 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         sale.save()
         logger.info(f"Sale saved: ID={sale.id}, Receipt={sale.receipt_number}, Status={sale.status}, Total={sale.total}, Payment={sale.payment_method}")
 
-        transaction.on_commit(
-            lambda sale_id=sale.id, user_id=request.user.id: self._run_post_sale_commit_tasks(sale_id, user_id)
-        )
+        # Receipt and notification run on the job worker once this sale commits
+        enqueue_post_sale_jobs(sale, user=request.user)
         
         # Create Kitchen Order Ticket (KOT) if this is a restaurant order with a table
         if table and sale.status == 'pending':
-            from apps.restaurant.models import KitchenOrderTicket
-            
-            # Generate unique KOT number (deterministic based on timestamp and count)
-            # After a sale is created and saved, don't block on generating receipts here; we use a post-commit
-            # signal to generate receipts. We also provide an on-demand endpoint for cases where the client
-            # needs to trigger generation synchronously (e.g., print attempts from POS).
-            date_str = timezone.now().strftime('%Y%m%d')
-            # Get count of KOTs for today to ensure uniqueness
-            today_kot_count = KitchenOrderTicket.objects.filter(
-                kot_number__startswith=f"KOT-{date_str}"
-            ).count()
-            kot_number = f"KOT-{date_str}-{today_kot_count + 1:04d}"
-            
-            # Ensure KOT number is unique (in case of race condition)
-            counter = 1
-            while KitchenOrderTicket.objects.filter(kot_number=kot_number).exists():
-                kot_number = f"KOT-{date_str}-{today_kot_count + 1 + counter:04d}"
-                counter += 1
-            
+            from apps.restaurant.models import KitchenOrderTicket, KitchenTicketCounter
+
+            # Per-outlet daily ticket counter; the number returns to the counter if this sale rolls back
+            kot_number = KitchenTicketCounter.objects.next_kot_number(sale.outlet)
+
             KitchenOrderTicket.objects.create(
                 tenant=tenant,
                 outlet=sale.outlet,
@@ -711,6 +730,8 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 notes=sale.notes
             )
         
+        # One query each for the lines and their products, whatever the basket size
+        prefetch_related_objects([sale], 'items__product')
         response_serializer = SaleSerializer(sale)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
@@ -895,7 +916,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             },
         })
 
-    @transaction.atomic
+    @retry_on_stock_contention
     @action(detail=False, methods=['post'], url_path='reconcile-stock-from-sales/apply')
     def reconcile_stock_from_sales_apply(self, request):
         tenant, outlet, start_dt, end_dt, error_response = self._parse_sales_reconciliation_request(request)
@@ -942,19 +963,14 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             return Response({"detail": "No sold items found for the selected filter."}, status=status.HTTP_400_BAD_REQUEST)
 
         lock_ids = [int(row['product_id']) for row in preview_rows]
-        locked_products = {
-            product.id: product
-            for product in Product.objects.select_for_update().filter(
-                id__in=lock_ids,
-                tenant=tenant,
-                outlet=outlet,
-            )
-        }
+        locked_products = lock_products(Product.objects.filter(id__in=lock_ids, tenant=tenant, outlet=outlet))
 
         total_deducted = 0
         applied_products = 0
         clamped_products = []
         skipped_products = []
+        stock_lines = []
+        sellable_stock_map = get_sellable_stock_many(locked_products.values(), outlet)
         for row in preview_rows:
             product = locked_products.get(int(row['product_id']))
             if not product:
@@ -969,7 +985,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             if requested_quantity <= 0:
                 continue
 
-            available_quantity = max(0, int(get_sellable_stock(product, outlet) or 0))
+            available_quantity = max(0, int(sellable_stock_map.get(product.id) or 0))
             quantity_to_deduct = min(available_quantity, requested_quantity)
 
             if available_quantity < requested_quantity:
@@ -985,10 +1001,14 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             if quantity_to_deduct <= 0:
                 continue
 
-            deduct_stock(
-                product=product,
-                outlet=outlet,
-                quantity=quantity_to_deduct,
+            stock_lines.append((product, quantity_to_deduct))
+            total_deducted += quantity_to_deduct
+            applied_products += 1
+
+        if stock_lines:
+            deduct_stock_for_lines(
+                stock_lines,
+                outlet,
                 user=request.user,
                 reference_id=reference_id,
                 reason=(
@@ -997,8 +1017,6 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 ),
                 movement_type='sale',
             )
-            total_deducted += quantity_to_deduct
-            applied_products += 1
 
         try:
             from apps.audit.models import ActivityLog
@@ -1039,7 +1057,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
     # PHASE 3: Refund endpoint
     # ------------------------------------------------------------------
 
-    @transaction.atomic
+    @retry_on_stock_contention
     @action(detail=True, methods=['post'], url_path='refund')
     def refund_sale(self, request, pk=None):
         """
@@ -1060,7 +1078,8 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         Rules:
         - Sale must be 'completed' (not voided, not already refunded).
         - Per item: refund quantity ≤ original quantity minus already-refunded qty.
-        - COGS reversal uses the immutable cost snapshot from the original SaleItem.
+        - COGS reversal uses the realized FIFO cost recorded on the original SaleItem
+          (the sale-time cost snapshot for lines recorded before it existed).
         - Stock is restored via restore_stock_for_refund() (StockMovement type='return').
         - If all items are fully refunded the original sale status flips to 'refunded'.
         - The refund number format is REF-{YYYYMMDD}-{sale.receipt_number}.
@@ -1185,6 +1204,17 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             else:
                 base_units = refund_qty
 
+            # Reverse the realized FIFO cost of the returned share so stock comes
+            # back at the cost it left with; legacy lines fall back to the snapshot.
+            if sale_item.realized_cost_total is not None and sale_item.quantity_in_base_units:
+                restore_unit_cost = sale_item.realized_unit_cost
+                realized_cost = (
+                    sale_item.realized_cost_total * Decimal(base_units) / Decimal(sale_item.quantity_in_base_units)
+                ).quantize(Decimal('0.01'))
+            else:
+                restore_unit_cost = unit_cost
+                realized_cost = (unit_cost * Decimal(base_units)).quantize(Decimal('0.01'))
+
             item_total = (sale_item.price * Decimal(refund_qty)).quantize(Decimal('0.01'))
             subtotal += item_total
 
@@ -1193,6 +1223,8 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 'refund_qty': refund_qty,
                 'base_units': base_units,
                 'unit_cost': unit_cost,
+                'restore_unit_cost': restore_unit_cost,
+                'realized_cost': realized_cost,
                 'item_total': item_total,
             })
 
@@ -1250,11 +1282,13 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 quantity_in_base_units=entry['base_units'],
                 price=si.price,
                 cost=entry['unit_cost'],
+                realized_cost_total=entry['realized_cost'],
                 total=entry['item_total'],
             )
 
         # --- Restore stock ------------------------------------------------
         if restore_stock:
+            lock_products(entry['sale_item'].product_id for entry in parsed_refund_items if entry['sale_item'].product_id)
             for entry in parsed_refund_items:
                 si = entry['sale_item']
                 if si.product and entry['base_units'] > 0:
@@ -1265,7 +1299,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                         user=request.user,
                         reference_id=str(refund.id),
                         reason=f"Refund {refund_number}",
-                        unit_cost=entry['unit_cost'],
+                        unit_cost=entry['restore_unit_cost'],
                     )
             refund.stock_restored = True
             refund.save(update_fields=['stock_restored'])
@@ -1479,7 +1513,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         logger.info("POS payment initiated: sale_id=%s receipt=%s user=%s", sale.id, sale.receipt_number, request.user.id)
         return Response(SaleSerializer(sale).data, status=status.HTTP_201_CREATED)
 
-    @transaction.atomic
+    @retry_on_stock_contention
     @action(detail=True, methods=['post'], url_path='finalize-payment')
     def finalize_payment(self, request, pk=None):
         """Finalize an initiated sale after cashier confirms payment."""
@@ -1590,26 +1624,38 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
 
         # Deduct stock only once, at finalization time.
         if not bool(sale.delivery_required):
-            for item in sale.items.select_related('product').all():
-                if not item.product:
-                    continue
-
-                product = Product.objects.select_for_update().get(id=item.product.id, tenant=sale.tenant, outlet=sale.outlet)
-                required = int(item.quantity_in_base_units or item.quantity)
-                try:
-                    deduct_stock(
-                        product=product,
-                        outlet=sale.outlet,
-                        quantity=required,
-                        user=request.user,
-                        reference_id=str(sale.id),
-                        reason=f"Sale {sale.receipt_number} finalized",
-                    )
-                except ValueError as e:
-                    return Response(
-                        {"detail": f"Insufficient stock for {product.name}. {str(e)}"},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
+            sale_items = [item for item in sale.items.all() if item.product_id]
+            locked_products = lock_products(Product.objects.filter(
+                id__in={item.product_id for item in sale_items},
+                tenant=sale.tenant,
+                outlet=sale.outlet,
+            ))
+            missing = [item for item in sale_items if item.product_id not in locked_products]
+            if missing:
+                return Response(
+                    {"detail": f"Product {missing[0].product_id} not found in sale outlet."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            try:
+                deductions = deduct_stock_for_lines(
+                    [
+                        (locked_products[item.product_id], int(item.quantity_in_base_units or item.quantity))
+                        for item in sale_items
+                    ],
+                    sale.outlet,
+                    user=request.user,
+                    reference_id=str(sale.id),
+                    reason=f"Sale {sale.receipt_number} finalized",
+                )
+            except InsufficientStockError as e:
+                return Response(
+                    {"detail": f"Insufficient stock for {e.product.name}. {str(e)}"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            SaleItem.objects.record_realized_costs(
+                (item, deduction_cost(line_deductions, locked_products[item.product_id]))
+                for item, line_deductions in zip(sale_items, deductions)
+            )
 
         sale.payment_method = payment_method
         if normalized_method in ['cash', 'card', 'mobile', 'airtel', 'tnm',
@@ -1666,9 +1712,8 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         sale.notes = f"{(sale.notes or '').strip()} {finalized_note}".strip()
         sale.save()
 
-        transaction.on_commit(
-            lambda sale_id=sale.id, user_id=request.user.id: self._run_post_sale_commit_tasks(sale_id, user_id)
-        )
+        # Receipt and notification run on the job worker once this sale commits
+        enqueue_post_sale_jobs(sale, user=request.user)
 
         logger.info("POS payment finalized: sale_id=%s receipt=%s user=%s method=%s", sale.id, sale.receipt_number, request.user.id, payment_method)
         return Response(SaleSerializer(sale).data)
@@ -1702,7 +1747,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         logger.info("POS transaction voided: sale_id=%s receipt=%s user=%s reason=%s", sale.id, sale.receipt_number, request.user.id, reason)
         return Response(SaleSerializer(sale).data)
     
-    @transaction.atomic
+    @retry_on_stock_contention
     @action(detail=False, methods=['post'], url_path='checkout-cash')
     def checkout_cash(self, request):
         """
@@ -1813,6 +1858,17 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         # Process items and validate stock
         total_subtotal = Decimal('0')
         sale_items_data = []
+
+        # Lock the whole basket in id order before touching stock
+        basket_ids = set()
+        for item in items:
+            try:
+                basket_ids.add(int(item.get('product_id')))
+            except (TypeError, ValueError):
+                continue
+        locked_products = lock_products(Product.objects.filter(id__in=basket_ids, tenant=tenant, outlet=outlet))
+        sellable_stock_map = get_sellable_stock_many(locked_products.values(), outlet)
+        requested_stock = defaultdict(int)
         
         for idx, item in enumerate(items):
             product_id = item.get('product_id')
@@ -1846,10 +1902,10 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Get product with lock for stock check
+            # Product was locked with the rest of the basket
             try:
-                product = Product.objects.select_for_update().get(id=product_id, tenant=tenant, outlet=outlet)
-            except Product.DoesNotExist:
+                product = locked_products[int(product_id)]
+            except (KeyError, TypeError, ValueError):
                 return Response(
                     {"detail": f"Item {idx + 1}: Product {product_id} not found or does not belong to your tenant/outlet"},
                     status=status.HTTP_400_BAD_REQUEST
@@ -1857,11 +1913,12 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             
             # UNITS ONLY ARCHITECTURE: use strict sellable stock checks
             variation = None
-            available_stock = get_sellable_stock(product, outlet)
+            requested_stock[product.id] += quantity
+            available_stock = sellable_stock_map.get(product.id, 0)
 
-            if available_stock < quantity:
+            if available_stock < requested_stock[product.id]:
                 return Response(
-                    {"detail": f"Item {idx + 1}: Insufficient stock for {product.name}. Available: {available_stock}, Requested: {quantity}"},
+                    {"detail": f"Item {idx + 1}: Insufficient stock for {product.name}. Available: {available_stock}, Requested: {requested_stock[product.id]}"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
@@ -1907,6 +1964,8 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         sale = self._create_sale_with_unique_receipt(
             tenant=tenant,
             outlet=outlet,
+            offline_receipt_number=request.data.get('offline_receipt_number'),
+            device_id=str(request.data.get('device_id') or ''),
             user=request.user,
             shift=shift,
             customer=customer,
@@ -1927,13 +1986,11 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             notes=request.data.get('notes', '')
         )
         
-        # Create sale items and deduct stock
+        # Create sale items in one insert and deduct stock
         for item_data in sale_items_data:
-            product = item_data['product']
-            
-            SaleItem.objects.create(
+            item_data['sale_item'] = SaleItem(
                 sale=sale,
-                product=product,
+                product=item_data['product'],
                 product_name=item_data['product_name'],
                 variation_name='',
                 quantity=item_data['quantity'],
@@ -1943,47 +2000,36 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 tax_rate_at_sale=Decimal('0'),
                 total=item_data['total'],
             )
-            
-            # Deduct stock using batch-aware logic
-            if product:
-                try:
-                    deduct_stock(
-                        product=product,
-                        outlet=outlet,
-                        quantity=item_data['quantity'],
-                        user=request.user,
-                        reference_id=str(sale.id),
-                        reason=f"Cash sale {sale.receipt_number}"
-                    )
-                except ValueError as e:
-                    # This shouldn't happen since we checked earlier, but handle gracefully
-                    logger.error(f"Stock deduction failed: {str(e)}")
-                    return Response(
-                        {"detail": f"Stock deduction failed: {str(e)}"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                # Legacy fallback: use the shared inventory helper so stock stays in sync.
-                deduct_stock(
-                    product=product,
-                    outlet=outlet,
-                    quantity=item_data['quantity'],
-                    user=request.user,
-                    reference_id=str(sale.id),
-                    reason=f"Cash sale {sale.receipt_number}",
-                    movement_type='sale',
-                )
+        SaleItem.objects.bulk_create([item_data['sale_item'] for item_data in sale_items_data], batch_size=100)
+        
+        # Deduct stock for the whole cart using batch-aware logic
+        try:
+            deductions = deduct_stock_for_lines(
+                [(item_data['product'], item_data['quantity']) for item_data in sale_items_data],
+                outlet,
+                user=request.user,
+                reference_id=str(sale.id),
+                reason=f"Cash sale {sale.receipt_number}",
+            )
+        except ValueError as e:
+            # This shouldn't happen since we checked earlier, but handle gracefully
+            logger.error(f"Stock deduction failed: {str(e)}")
+            return Response(
+                {"detail": f"Stock deduction failed: {str(e)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        SaleItem.objects.record_realized_costs(
+            (item_data['sale_item'], deduction_cost(line_deductions, item_data['product']))
+            for item_data, line_deductions in zip(sale_items_data, deductions)
+        )
         
         # Cash movement creation removed - new payment system will handle this
         
-        # Auto-generate receipt PDF for completed cash sales
-        try:
-            from .services import ReceiptService
-            ReceiptService.generate_receipt(sale, format='pdf', user=request.user)
-        except Exception as e:
-            logger.error(f"Failed to auto-generate receipt for cash sale {sale.id}: {str(e)}")
+        # Receipt PDF for the completed cash sale is rendered by the job worker
+        enqueue_receipt(sale, format='pdf', user=request.user)
 
         # Return response
+        prefetch_related_objects([sale], 'items__product')
         response_serializer = SaleSerializer(sale)
         shift_serializer = None
         try:
@@ -2003,27 +2049,22 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         }, status=status.HTTP_201_CREATED)
     
     def _generate_receipt_number(self, tenant, outlet=None):
-        """Generate the next numeric receipt number per tenant/outlet scope."""
+        """Take the next receipt number from the outlet's receipt sequence."""
         if not outlet:
             raise serializers.ValidationError("Outlet is required for receipt generation.")
+        return next_receipt_number(tenant, outlet)
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT COALESCE(MAX(CASE WHEN receipt_number ~ '^[0-9]+$' "
-                "THEN receipt_number::bigint ELSE 0 END), 0) "
-                "FROM sales_sale WHERE tenant_id = %s AND outlet_id = %s",
-                [tenant.id, outlet.id],
-            )
-            max_num = int(cursor.fetchone()[0])
-
-        return str(max_num + 1)
-
-    def _create_sale_with_unique_receipt(self, tenant, outlet, **sale_kwargs):
-        """Create a sale with retries to avoid receipt number race collisions."""
-        max_attempts = 5
-
-        for _ in range(max_attempts):
+    def _create_sale_with_unique_receipt(self, tenant, outlet, offline_receipt_number=None, device_id='', **sale_kwargs):
+        """Create a sale numbered from the outlet's sequence, or with a number reserved by an offline device."""
+        if offline_receipt_number:
+            try:
+                receipt_number = claim_reserved_receipt_number(tenant, outlet, offline_receipt_number, device_id=device_id)
+            except ReceiptNumberError as exc:
+                raise serializers.ValidationError({"offline_receipt_number": str(exc)})
+        else:
             receipt_number = self._generate_receipt_number(tenant, outlet=outlet)
+
+        for attempt in range(2):
             try:
                 with transaction.atomic():
                     return Sale.objects.create(
@@ -2033,7 +2074,7 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                         **sale_kwargs,
                     )
             except IntegrityError as exc:
-                # Retry only for receipt_number unique collisions; re-raise all others.
+                # Only receipt_number unique collisions are recoverable; re-raise all others.
                 err_msg = str(exc).lower()
                 is_receipt_unique_collision = (
                     "receipt_number" in err_msg
@@ -2041,9 +2082,46 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
                 )
                 if not is_receipt_unique_collision:
                     raise
-                continue
+                if offline_receipt_number:
+                    raise serializers.ValidationError({"offline_receipt_number": "This receipt number has already been used."})
+                # A number was written outside the sequence (imports, legacy paths): skip past it once
+                sync_receipt_sequence(tenant, outlet)
+                receipt_number = self._generate_receipt_number(tenant, outlet=outlet)
 
         raise serializers.ValidationError("Could not generate a unique receipt number. Please retry.")
+
+    @action(detail=False, methods=['post'], url_path='reserve-receipt-numbers')
+    def reserve_receipt_numbers(self, request):
+        """Reserve a block of receipt numbers an offline device can issue while disconnected."""
+        tenant = self.get_tenant_for_request(request)
+        outlet = self.get_outlet_for_request(request)
+        if not tenant or not outlet:
+            return Response({"detail": "Tenant and outlet are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = int(request.data.get("count") or 0)
+        except (TypeError, ValueError):
+            return Response({"detail": "count must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            block = reserve_receipt_block(
+                tenant,
+                outlet,
+                size,
+                device_id=str(request.data.get("device_id") or ""),
+                prefix=str(request.data.get("prefix") or ""),
+                user=request.user,
+            )
+        except ReceiptNumberError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "id": block.id,
+            "outlet": outlet.id,
+            "device_id": block.device_id,
+            "prefix": block.prefix,
+            "first_number": block.first_number,
+            "last_number": block.last_number,
+            "first_receipt_number": format_receipt_number(block.prefix, block.first_number),
+            "last_receipt_number": format_receipt_number(block.prefix, block.last_number),
+        }, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'], url_path='generate-receipt')
     def generate_receipt(self, request, pk=None):
@@ -2295,13 +2373,12 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
             count=Count('id')
         ).order_by('date')
 
-        daily_costs = {}
-        sale_items = SaleItem.objects.filter(sale__in=queryset).select_related('product').annotate(
-            date=TruncDate('sale__created_at')
-        )
-        for item in sale_items:
-            item_date = str(item.date)
-            daily_costs[item_date] = daily_costs.get(item_date, Decimal('0.00')) + item.effective_cogs_total
+        daily_costs = {
+            str(row['date']): row['cogs'] or Decimal('0.00')
+            for row in SaleItem.objects.filter(sale__in=queryset).annotate(
+                date=TruncDate('sale__created_at')
+            ).values('date').annotate(cogs=Sum(COGS_TOTAL_EXPRESSION)).order_by()
+        }
         
         # Create a map of date -> stats
         stats_map = {str(item['date']): item for item in daily_stats}
@@ -2378,7 +2455,9 @@ class SaleViewSet(viewsets.ModelViewSet, TenantFilterMixin):
 
 class ReceiptViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
     """Receipt ViewSet - Read-only for retrieving receipts"""
-    queryset = Receipt.objects.select_related('sale', 'tenant', 'generated_by', 'sale__outlet', 'sale__customer')
+    queryset = Receipt.objects.select_related(
+        'sale', 'tenant', 'generated_by', 'sale__outlet', 'sale__customer', 'artifact'
+    ).defer('snapshot', 'artifact__data')
     serializer_class = ReceiptSerializer
     permission_classes = [IsAuthenticated, HasTenantModuleAccess]
     required_tenant_permissions = ['allow_sales']
@@ -2406,9 +2485,10 @@ class ReceiptViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
         user_tenant = getattr(user, 'tenant', None)
         tenant = request_tenant or user_tenant
         
+        # The artifact join carries its metadata only; snapshots and bodies are read on download
         queryset = Receipt.objects.select_related(
-            'sale', 'tenant', 'generated_by', 'sale__outlet', 'sale__customer'
-        ).all()
+            'sale', 'tenant', 'generated_by', 'sale__outlet', 'sale__customer', 'artifact'
+        ).defer('snapshot', 'artifact__data')
         
         if not is_saas_admin:
             if tenant:
@@ -2453,6 +2533,8 @@ class ReceiptViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
                         status=status.HTTP_404_NOT_FOUND
                     )
 
+            # First access renders the PDF, so pdf_url points at a stored artifact
+            ReceiptService.render_pdf_receipt(receipt)
             serializer = self.get_serializer(receipt)
             return Response(serializer.data)
         except Receipt.DoesNotExist:
@@ -2510,32 +2592,38 @@ class ReceiptViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
         receipt = self.get_object()
 
         from django.http import HttpResponse, FileResponse
+        from apps.sales.receipt_store import open_artifact
         from apps.sales.services import ReceiptService
         import logging
 
         logger = logging.getLogger(__name__)
 
-        # If PDF file exists, try to serve it. If storage fails, fall back to embedded content.
-        if receipt.pdf_file:
+        # PDFs are rendered from the receipt snapshot on first download, then
+        # streamed from the artifact store; the ETag is the content hash
+        if receipt.format == 'pdf' and not receipt.artifact_id:
+            ReceiptService.render_pdf_receipt(receipt)
+        if receipt.artifact_id:
             try:
-                receipt.increment_access()
-                return FileResponse(
-                    receipt.pdf_file.open('rb'),
-                    as_attachment=True,
-                    filename=f"receipt_{receipt.receipt_number}.pdf",
-                    content_type='application/pdf'
-                )
+                body = open_artifact(receipt.artifact)
             except Exception as storage_error:
                 logger.warning(
-                    f"Failed to open receipt {receipt.id} PDF file from storage: {str(storage_error)}. Falling back to embedded content.",
+                    f"Failed to open receipt {receipt.id} artifact {receipt.artifact.sha256}: {str(storage_error)}",
                     exc_info=True
                 )
-                # Fall through to the content-based fallback below
+            else:
+                receipt.increment_access()
+                response = FileResponse(
+                    body,
+                    as_attachment=True,
+                    filename=f"receipt_{receipt.receipt_number}.pdf",
+                    content_type=receipt.artifact.content_type
+                )
+                response['ETag'] = f'"{receipt.artifact.sha256}"'
+                return response
 
-        # Fallback for environments without configured file storage:
-        # serve PDF bytes embedded in receipt.content.
-        if receipt.format == 'pdf' and receipt.content:
-            pdf_bytes = ReceiptService.decode_pdf_content(receipt.content)
+        # Receipts not yet moved to the artifact store: pdf_file, then base64 content
+        if receipt.format == 'pdf':
+            pdf_bytes = ReceiptService.read_pdf_receipt(receipt)
             if pdf_bytes:
                 receipt.increment_access()
                 response = HttpResponse(pdf_bytes, content_type='application/pdf')
@@ -2636,7 +2724,14 @@ class PrintJobViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
         throttle_classes=[ConnectorThrottle],
     )
     def claim_next(self, request):
-        """Atomically claim next pending print job for a device."""
+        """Atomically claim next pending print job for a device.
+
+        With `wait` (seconds, capped at PRINT_CLAIM_MAX_WAIT_SECONDS) the request
+        long-polls: when nothing is pending it is parked until a job is queued for
+        the tenant or the wait runs out, and only then answers 204. Once
+        PRINT_CLAIM_MAX_PARKED requests are parked in this process, further
+        ones answer 204 without waiting.
+        """
         tenant, user, authenticated_device = self._request_actor(request)
         if not tenant:
             return Response({'detail': 'Authentication required (JWT or API key).'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -2660,6 +2755,27 @@ class PrintJobViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
         if requested_printer_type not in ['receipt', 'kitchen', 'bar']:
             requested_printer_type = ''
 
+        try:
+            wait = float(request.data.get('wait', request.query_params.get('wait', 0)) or 0)
+        except (TypeError, ValueError):
+            wait = 0
+        wait = min(wait, settings.PRINT_CLAIM_MAX_WAIT_SECONDS) if wait > 0 else 0
+
+        with parking_slot() if wait else nullcontext(False) as parked:
+            # Without a slot the request must not tie up another server thread
+            wait = wait if parked else 0
+            deadline = monotonic() + wait
+            while True:
+                # Read before looking, so a job queued right after the look still wakes the wait
+                generation = print_job_generation(tenant.id) if wait else None
+                job = self._claim_pending_job(tenant, outlet, channel, requested_printer_type, device_id, device)
+                if job:
+                    return Response(PrintJobSerializer(job).data)
+                remaining = deadline - monotonic()
+                if remaining <= 0 or not wait_for_print_job(tenant.id, generation, remaining):
+                    return Response({'detail': 'No pending jobs'}, status=status.HTTP_204_NO_CONTENT)
+
+    def _claim_pending_job(self, tenant, outlet, channel, requested_printer_type, device_id, device):
         with transaction.atomic():
             # skip_locked=True: skip any rows already locked by a concurrent transaction
             # instead of blocking, preventing the FOR UPDATE outer-join error and
@@ -2686,7 +2802,7 @@ class PrintJobViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
 
             job = qs.order_by('created_at').first()
             if not job:
-                return Response({'detail': 'No pending jobs'}, status=status.HTTP_204_NO_CONTENT)
+                return None
 
             job.status = 'claimed'
             job.claimed_at = timezone.now()
@@ -2696,8 +2812,7 @@ class PrintJobViewSet(viewsets.ReadOnlyModelViewSet, TenantFilterMixin):
             if not job.printer_identifier and device and device.printer_identifier:
                 job.printer_identifier = device.printer_identifier
             job.save(update_fields=['status', 'claimed_at', 'attempts', 'device_id', 'printer_identifier', 'updated_at'])
-
-        return Response(PrintJobSerializer(job).data)
+        return job
 
     @action(detail=False, methods=['post'], url_path='register-device', throttle_classes=[ConnectorThrottle])
     def register_device(self, request):
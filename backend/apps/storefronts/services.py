@@ -2,13 +2,12 @@ import secrets
 from decimal import Decimal
 from urllib.parse import quote_plus
 
-from django.db import transaction
-from django.db.models import Max
-
-from apps.inventory.stock_helpers import get_sellable_stock
+from apps.inventory.stock_helpers import get_sellable_stock_many
+from apps.inventory.stock_locks import lock_products, retry_on_stock_contention
 from apps.products.models import Product, ProductUnit
 from apps.sales.models import Sale, SaleItem
-from apps.sales.services import ReceiptService
+from apps.sales.receipt_numbers import next_receipt_number
+from apps.sales.jobs import enqueue_receipt
 
 from .models import Storefront, StorefrontOrder
 
@@ -24,25 +23,11 @@ def _build_whatsapp_url(phone: str, message: str) -> str:
     return f"https://wa.me/{clean_phone}?text={quote_plus(message)}"
 
 
-def _generate_sale_receipt_number() -> str:
-    recent_numbers = Sale.objects.order_by('-created_at').values_list('receipt_number', flat=True)[:1000]
-    max_numeric = 0
-    for number in recent_numbers:
-        if number and str(number).isdigit():
-            max_numeric = max(max_numeric, int(number))
-
-    if max_numeric == 0:
-        max_id = Sale.objects.aggregate(max_id=Max('id')).get('max_id') or 0
-        max_numeric = max_id
-
-    next_number = max_numeric + 1
-    while Sale.objects.filter(receipt_number=str(next_number)).exists():
-        next_number += 1
+def _generate_sale_receipt_number(tenant, outlet) -> str:
+    return next_receipt_number(tenant, outlet)
 
-    return str(next_number)
 
-
-@transaction.atomic
+@retry_on_stock_contention
 def create_whatsapp_order(storefront: Storefront, payload: dict):
     items = payload.get('items', [])
     if not items:
@@ -54,43 +39,55 @@ def create_whatsapp_order(storefront: Storefront, payload: dict):
     subtotal = Decimal('0.00')
     sale_items = []
 
+    parsed_items = []
     for index, item in enumerate(items):
         product_id = int(item.get('product_id'))
         quantity = int(item.get('quantity', 1))
         if quantity <= 0:
             raise ValueError(f'Item {index + 1}: quantity must be greater than 0.')
+        unit_id = item.get('unit_id')
+        parsed_items.append((index, product_id, quantity, int(unit_id) if unit_id else None))
 
-        try:
-            product = Product.objects.select_for_update().get(
-                id=product_id,
-                tenant=tenant,
-                outlet=outlet,
-                is_active=True,
-            )
-        except Product.DoesNotExist as exc:
-            raise ValueError(f'Item {index + 1}: invalid product.') from exc
+    # Lock every ordered product in id order and resolve units and stock once for the whole cart.
+    products_by_id = lock_products(Product.objects.filter(
+        id__in={product_id for _, product_id, _, _ in parsed_items},
+        tenant=tenant,
+        outlet=outlet,
+        is_active=True,
+    ))
+    unit_ids = {unit_id for _, _, _, unit_id in parsed_items if unit_id}
+    units_by_id = {
+        unit.id: unit
+        for unit in ProductUnit.objects.filter(id__in=unit_ids, product_id__in=products_by_id, is_active=True)
+    } if unit_ids else {}
+    stock_map = get_sellable_stock_many(products_by_id.values(), outlet)
+    requested_by_product = {}
+
+    for index, product_id, quantity, unit_id in parsed_items:
+        product = products_by_id.get(product_id)
+        if product is None:
+            raise ValueError(f'Item {index + 1}: invalid product.')
 
-        unit_id = item.get('unit_id')
         unit = None
         quantity_in_base_units = quantity
         unit_name = product.unit
         price = product.retail_price
 
         if unit_id:
-            try:
-                unit = ProductUnit.objects.get(id=int(unit_id), product=product, is_active=True)
-            except ProductUnit.DoesNotExist as exc:
-                raise ValueError(f'Item {index + 1}: invalid unit.') from exc
+            unit = units_by_id.get(unit_id)
+            if unit is None or unit.product_id != product.id:
+                raise ValueError(f'Item {index + 1}: invalid unit.')
             quantity_in_base_units = unit.convert_to_base_units(quantity)
             unit_name = unit.unit_name
             price = unit.retail_price
 
-        available_stock = get_sellable_stock(product, outlet)
+        available_stock = stock_map.get(product.id, 0) - requested_by_product.get(product.id, 0)
         if available_stock < quantity_in_base_units:
             raise ValueError(
                 f"Item {index + 1}: insufficient stock for {product.name}. "
                 f"Available: {available_stock}, requested: {quantity_in_base_units}."
             )
+        requested_by_product[product.id] = requested_by_product.get(product.id, 0) + quantity_in_base_units
 
         line_total = (Decimal(quantity) * price).quantize(Decimal('0.01'))
         subtotal += line_total
@@ -105,7 +102,7 @@ def create_whatsapp_order(storefront: Storefront, payload: dict):
             'total': line_total,
         })
 
-    receipt_number = _generate_sale_receipt_number()
+    receipt_number = _generate_sale_receipt_number(tenant, outlet)
     notes = (payload.get('notes') or '').strip()
 
     sale = Sale.objects.create(
@@ -182,6 +179,6 @@ def create_whatsapp_order(storefront: Storefront, payload: dict):
         whatsapp_message=message,
     )
 
-    transaction.on_commit(lambda: ReceiptService.generate_receipt(sale, format='pdf', user=None))
+    enqueue_receipt(sale, format='pdf')
 
     return order, whatsapp_url
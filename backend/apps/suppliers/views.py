@@ -4,7 +4,6 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db import transaction
 from django.utils import timezone
 from .models import (
     Supplier, PurchaseOrder, SupplierInvoice,
@@ -15,6 +14,7 @@ from .serializers import (
     SupplierInvoiceSerializer, PurchaseReturnSerializer,
     ProductSupplierSerializer
 )
+from apps.inventory.stock_locks import retry_on_stock_contention
 from apps.tenants.permissions import TenantFilterMixin, HasTenantModuleAccess, is_admin_user
 import logging
 
@@ -197,22 +197,66 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet, TenantFilterMixin):
         serializer = self.get_serializer(po)
         return Response(serializer.data)
     
+    @retry_on_stock_contention
     @action(detail=True, methods=['post'])
     def receive(self, request, pk=None):
-        """Mark purchase order as received"""
-        po = self.get_object()
+        """Receive a purchase order, booking the delivered lines into stock
+
+        Delivered lines come from 'items' or a 'delivery_note' (CSV upload, CSV
+        text or JSON list) and are booked at the PO outlet with the PO number as
+        reference. Send partial=true for a part delivery; the PO stays open as
+        'partial' until a final receipt. Without lines only the status changes.
+        """
+        from apps.inventory.goods_receipt import MAX_RECEIPT_LINES, parse_delivery_note, receive_goods
+
+        # Lock the PO so two concurrent receipts cannot both book the same delivery
+        po = PurchaseOrder.objects.select_for_update().get(pk=self.get_object().pk)
         if po.status not in ['approved', 'ordered', 'partial']:
             return Response(
                 {"detail": f"Cannot receive PO with status '{po.status}'"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        po.status = 'received'
-        po.received_at = timezone.now()
+
+        try:
+            items = parse_delivery_note(request.data, request.FILES)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_RECEIPT_LINES:
+            return Response(
+                {"detail": f"At most {MAX_RECEIPT_LINES} lines can be received per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        partial = str(request.data.get('partial', '')).lower() in ['true', '1', 'yes']
+
+        movements, errors = [], []
+        if items:
+            supplier_name = po.supplier.name if po.supplier else ''
+            movements, errors = receive_goods(
+                po.tenant,
+                po.outlet,
+                items,
+                user=request.user,
+                reference_id=po.po_number,
+                reason=f"Purchase order {po.po_number}" + (f" from {supplier_name}" if supplier_name else ''),
+            )
+            if errors and not movements:
+                return Response(
+                    {"detail": "All items failed", "errors": errors},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        po.status = 'partial' if partial else 'received'
+        if not partial:
+            po.received_at = timezone.now()
         po.save()
-        
-        serializer = self.get_serializer(po)
-        return Response(serializer.data)
+
+        data = dict(self.get_serializer(po).data)
+        data['receipt'] = {
+            'lines_received': len(movements),
+            'quantity_received': sum(movement.quantity for movement in movements),
+            'errors': errors,
+        }
+        return Response(data)
 
 
 class SupplierInvoiceViewSet(viewsets.ModelViewSet, TenantFilterMixin):
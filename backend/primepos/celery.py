@@ -0,0 +1,18 @@
+"""
+Celery application for the optional 'celery' JOBS_BACKEND
+
+    celery -A primepos worker
+
+Only job ids travel through the broker; the jobs table stays the source
+of truth, so the database backend (`manage.py run_jobs`) can take over at
+any time.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'primepos.settings.production')
+
+app = Celery('primepos')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -0,0 +1,54 @@
+"""
+Autocommit side connection
+Some writes must be visible to other sessions while the request's own
+transaction is still open: gap-tolerant receipt numbers, progress of long
+stock transfers. They go through a second, per-thread connection to the
+default database. Like Django's own connections it is closed at request
+boundaries once it is unusable or older than CONN_MAX_AGE.
+"""
+import threading
+
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+_side = threading.local()
+
+
+def side_connection():
+    """This thread's autocommit connection to the default database."""
+    side = getattr(_side, 'connection', None)
+    if side is None:
+        side = connections.create_connection(DEFAULT_DB_ALIAS)
+        _side.connection = side
+    side.close_if_unusable_or_obsolete()
+    return side
+
+
+def autocommit_connection():
+    """
+    Connection for a write that must commit on its own
+    The side connection while a PostgreSQL transaction is open, else the
+    default connection. SQLite has a single writer, so a second connection
+    would only wait on this one.
+    """
+    if connection.vendor == 'postgresql' and connection.in_atomic_block:
+        return side_connection()
+    return connection
+
+
+def close_side_connection():
+    side = getattr(_side, 'connection', None)
+    if side is not None:
+        side.close()
+        _side.connection = None
+
+
+def close_obsolete_side_connection(**kwargs):
+    """request_started/request_finished receiver mirroring django.db.close_old_connections."""
+    side = getattr(_side, 'connection', None)
+    if side is not None:
+        side.close_if_unusable_or_obsolete()
+
+
+request_started.connect(close_obsolete_side_connection)
+request_finished.connect(close_obsolete_side_connection)
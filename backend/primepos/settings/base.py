@@ -63,6 +63,7 @@ INSTALLED_APPS = [
     'apps.distribution',
     'apps.sync',
     'apps.storefronts',
+    'apps.jobs',
     'apps.admin.apps.AdminConfig',  # Use explicit config to avoid label conflict
 ]
 
@@ -199,6 +200,8 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
+    # Maps stock lock contention to 409 + Retry-After, then defers to DRF
+    'EXCEPTION_HANDLER': 'apps.inventory.stock_locks.exception_handler',
     'DEFAULT_THROTTLE_CLASSES': (
         'rest_framework.throttling.AnonRateThrottle',
         'rest_framework.throttling.UserRateThrottle',
@@ -260,6 +263,48 @@ CORS_ALLOW_HEADERS = [
 OFFLINE_MODE_ENABLED = config('OFFLINE_MODE_ENABLED', default=False, cast=bool)
 OFFLINE_MODE_PHASE = config('OFFLINE_MODE_PHASE', default=0, cast=int)
 
+# Stock locking: bounded lock waits and retries for stock-mutating transactions
+STOCK_LOCK_TIMEOUT_MS = config('STOCK_LOCK_TIMEOUT_MS', default=3000, cast=int)
+STOCK_LOCK_RETRIES = config('STOCK_LOCK_RETRIES', default=3, cast=int)
+STOCK_LOCK_BACKOFF_MS = config('STOCK_LOCK_BACKOFF_MS', default=50, cast=int)
+
+# Receipt numbering: mode for newly created per-outlet sequences and offline block limit
+RECEIPT_NUMBERS_GAP_FREE = config('RECEIPT_NUMBERS_GAP_FREE', default=True, cast=bool)
+RECEIPT_BLOCK_MAX_SIZE = config('RECEIPT_BLOCK_MAX_SIZE', default=500, cast=int)
+
+# Receipts: reuse compiled PDF layouts (styles, headings, footer) and ESC/POS printer
+# profiles (columns, print area, code page, logo, footer) across renders
+RECEIPT_LAYOUT_CACHE = config('RECEIPT_LAYOUT_CACHE', default=True, cast=bool)
+
+# Receipt artifacts (rendered PDFs), stored once per SHA-256: 'database' keeps the
+# bytes in a bytea column, 'filesystem' under RECEIPT_ARTIFACT_ROOT, 'storage' in
+# DEFAULT_FILE_STORAGE. Existing rows move over with `backfill_receipts --artifacts`.
+RECEIPT_ARTIFACT_BACKEND = config('RECEIPT_ARTIFACT_BACKEND', default='database')
+RECEIPT_ARTIFACT_ROOT = config('RECEIPT_ARTIFACT_ROOT', default=os.path.join(BASE_DIR, 'receipt_artifacts'))
+
+# Background jobs (receipts, notifications, stock take completion): 'database'
+# runs them from `manage.py run_jobs`, 'celery' hands job ids to a Celery worker,
+# 'inline' runs them in-process after commit. Retries back off exponentially
+# and jobs that exhaust JOBS_MAX_ATTEMPTS are dead-lettered.
+JOBS_BACKEND = config('JOBS_BACKEND', default='database')
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=5, cast=int)
+JOBS_BACKOFF_SECONDS = config('JOBS_BACKOFF_SECONDS', default=10, cast=int)
+JOBS_BACKOFF_MAX_SECONDS = config('JOBS_BACKOFF_MAX_SECONDS', default=3600, cast=int)
+JOBS_LEASE_SECONDS = config('JOBS_LEASE_SECONDS', default=600, cast=int)
+JOBS_POLL_SECONDS = config('JOBS_POLL_SECONDS', default=1.0, cast=float)
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TASK_IGNORE_RESULT = True
+
+# Print connectors may long-poll claim-next by posting `wait` (seconds): the request
+# is parked until a print job is queued for the tenant (PostgreSQL LISTEN/NOTIFY, an
+# in-process condition elsewhere) or the wait runs out. Keep the cap below the proxy
+# timeout, and serve with threaded workers so parked requests do not block others.
+PRINT_CLAIM_MAX_WAIT_SECONDS = config('PRINT_CLAIM_MAX_WAIT_SECONDS', default=25, cast=int)
+PRINT_CLAIM_FALLBACK_POLL_SECONDS = config('PRINT_CLAIM_FALLBACK_POLL_SECONDS', default=2.0, cast=float)
+# Long-polls parked at once per process; keep it below the worker's thread count
+# (gunicorn --threads) so idle connectors can never take every thread from the API.
+PRINT_CLAIM_MAX_PARKED = config('PRINT_CLAIM_MAX_PARKED', default=4, cast=int)
+
 # QZ Tray signing configuration
 # Set these in environment for production. Example:
 # QZ_CERT_PATH=/etc/primepos/qz_cert.pem
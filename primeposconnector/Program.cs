@@ -234,6 +234,7 @@ sealed class CloudOptions
     public string? PrinterType { get; set; } = "receipt";
     public string? Channel { get; set; } = "agent";
     public int PollIntervalSeconds { get; set; } = 2;
+    public int LongPollSeconds { get; set; } = 20;
     public string? DefaultPrinter { get; set; }
 }
 
@@ -368,9 +369,11 @@ static class CloudPoller
         }
         var printerType = NormalizePrinterType(cloud.PrinterType);
         var pollSeconds = cloud.PollIntervalSeconds <= 0 ? 5 : Math.Max(3, cloud.PollIntervalSeconds);
+        // Seconds the backend may park claim-next until a job is queued (0 disables long polling)
+        var longPollSeconds = Math.Clamp(cloud.LongPollSeconds, 0, 25);
 
         using var http = new HttpClient();
-        http.Timeout = TimeSpan.FromSeconds(20);
+        http.Timeout = TimeSpan.FromSeconds(Math.Max(20, longPollSeconds + 15));
         if (!string.IsNullOrWhiteSpace(cloud.TenantId))
         {
             http.DefaultRequestHeaders.Add("X-Tenant-ID", cloud.TenantId.Trim());
@@ -577,7 +580,8 @@ static class CloudPoller
                     }
 
                     pollCount++;
-                    var claimed = await ClaimNextAsync(http, apiBase, channel, deviceId, printerType, stoppingToken);
+                    var claimStartedAt = DateTime.UtcNow;
+                    var claimed = await ClaimNextAsync(http, apiBase, channel, deviceId, printerType, longPollSeconds, stoppingToken);
                     if (claimed is null)
                     {
                         // Log every 60 polls (~5 min at 5s interval) so operator knows it's alive
@@ -585,7 +589,13 @@ static class CloudPoller
                         {
                             Console.WriteLine($"[CloudPoller] Waiting for jobs... (polls: {pollCount})");
                         }
-                        await Task.Delay(TimeSpan.FromSeconds(pollSeconds), stoppingToken);
+                        // A long poll already waited; an immediate empty answer (long polling off,
+                        // or a backend without it) falls back to the poll interval
+                        var waited = DateTime.UtcNow - claimStartedAt;
+                        if (waited < TimeSpan.FromSeconds(pollSeconds))
+                        {
+                            await Task.Delay(TimeSpan.FromSeconds(pollSeconds) - waited, stoppingToken);
+                        }
                         continue;
                     }
 
@@ -675,10 +685,11 @@ static class CloudPoller
         string channel,
         string deviceId,
         string printerType,
+        int waitSeconds,
         CancellationToken ct)
     {
         var endpoint = $"{apiBase}/print-jobs/claim-next/";
-        var payload = new { channel, device_id = deviceId, printer_type = printerType };
+        var payload = new { channel, device_id = deviceId, printer_type = printerType, wait = waitSeconds };
         using var response = await http.PostAsJsonAsync(endpoint, payload, ct);
 
         if ((int)response.StatusCode == 204)